@@ -26,8 +26,15 @@ from osgeo import gdal
 from osgeo import ogr,osr
 import whitebox
 
+from DSHub_Storage_Placement import getPlacementFolder, releasePlacement, loadPlacementMap, placementSummary
+from DSHub_Terrain_Derivatives import createNeighborReader
+from DSHub_Terrain_Derivatives import main as createDerivativesMain
+
 wbt = whitebox.WhiteboxTools()
 
+# EBS volumes eligible for derivative and temp outputs
+derivVolumes = ["/data06/gisdata/elev","/data07/gisdata/elev","/data08/gisdata/elev","/data09/gisdata/elev"]
+
 ## ===================================================================================
 def AddMsgAndPrint(msg,msgList=list()):
     
@@ -299,6 +306,65 @@ def createBuffer(bndryDriver, bndryDriverAttr, bufferDist):
     except:
         errorMsg()
         
+## ================================================================================================================
+def createEnvelopeIndex(envelopes):
+    """ This function creates a simple bin index of envelopes so that only the envelopes
+        near a search envelope have to be tested.  Envelopes are OGR tuples (minX, maxX, minY, maxY).
+        The bin size is the median envelope width so most envelopes fall in 1-4 bins.
+        
+        returns a tuple (binDict, binSize) where binDict = {(col,row): [envelope positions]}
+    """
+    
+    widths = sorted(max(env[1] - env[0], env[3] - env[2]) for env in envelopes)
+    binSize = widths[len(widths) // 2] if widths else 1.0
+    if binSize <= 0:
+        binSize = 1.0
+    
+    binDict = dict()
+    for i,env in enumerate(envelopes):
+        for col in range(int(env[0] // binSize), int(env[1] // binSize) + 1):
+            for row in range(int(env[2] // binSize), int(env[3] // binSize) + 1):
+                if (col,row) in binDict:
+                    binDict[(col,row)].append(i)
+                else:
+                    binDict[(col,row)] = [i]
+    
+    return binDict,binSize
+
+## ================================================================================================================
+def queryEnvelopeIndex(binDict, binSize, envelopes, searchEnv):
+    """ Returns a sorted list of positions of the envelopes whose bbox overlaps
+        searchEnv (minX, maxX, minY, maxY) using the bins created by createEnvelopeIndex."""
+    
+    candidates = set()
+    for col in range(int(searchEnv[0] // binSize), int(searchEnv[1] // binSize) + 1):
+        for row in range(int(searchEnv[2] // binSize), int(searchEnv[3] // binSize) + 1):
+            candidates.update(binDict.get((col,row), []))
+    
+    # bbox prefilter
+    return sorted(i for i in candidates
+                  if not (envelopes[i][0] > searchEnv[1] or envelopes[i][1] < searchEnv[0] or
+                          envelopes[i][2] > searchEnv[3] or envelopes[i][3] < searchEnv[2]))
+
+## ================================================================================================================
+def intersectCandidates(bufferWkb, candidateList):
+    """ Exact intersection test between 1 buffered polygon and its candidate grids.
+        Geometries are passed as WKB so that every thread works on its own OGR objects.
+        candidateList is a list of tuples (gridWkb, gridAttribute)
+        
+        returns a list of grid attributes that intersect the buffered polygon
+    """
+    
+    geom1 = ogr.CreateGeometryFromWkb(bufferWkb)
+    
+    intersectList = list()
+    for gridWkb,attribute2 in candidateList:
+        geom2 = ogr.CreateGeometryFromWkb(gridWkb)
+        if geom2.Intersects(geom1):
+            intersectList.append(attribute2)
+    
+    return intersectList
+
 ## ================================================================================================================
 def createOverlay(bufferLayer, bufferAtr, gridIndex, gridAttr, metaFileDict, bVerbose=False):
     """ This function will create a reference dictionary between the bufferLayer and gridIndex
@@ -308,6 +374,9 @@ def createOverlay(bufferLayer, bufferAtr, gridIndex, gridAttr, metaFileDict, bVe
         return dictionary with huc as keys and list of grids that interest that huc.
         {11040006: [pathTo366,pathTo399,pathTo400,pathTo401]}
         
+        Grid envelopes are loaded once into a bin index so that every buffered polygon is only
+        tested against grids whose bbox overlaps it.  The exact intersection tests of each
+        buffered polygon are run in a thread pool.
     """
     try:
         
@@ -329,39 +398,66 @@ def createOverlay(bufferLayer, bufferAtr, gridIndex, gridAttr, metaFileDict, bVe
         bufferLyr = bufferShp.GetLayer()
         gridLyr = gridShp.GetLayer()
         
-        # Iterate through buffered polygons
+        # Pre-load grid envelopes, geometries and attributes; the grid layer is only read once
+        gridEnvelopes = list()
+        gridItems = list()   # [(gridWkb, gridAttribute)]
+        for feature2 in gridLyr:
+            geom2 = feature2.GetGeometryRef()
+            gridEnvelopes.append(geom2.GetEnvelope())
+            gridItems.append((geom2.ExportToWkb(), str(feature2.GetField(gridAttr))))
+        
+        binDict,binSize = createEnvelopeIndex(gridEnvelopes)
+        
+        # Collect buffered polygons and their bbox candidates; keep layer order for the output
+        bufferItems = list()   # [(attribute1, bufferWkb, [candidates])]
+        candidateCount = 0
         for feature1 in bufferLyr:
+            geom1 = feature1.GetGeometryRef()
+            candidates = [gridItems[i] for i in queryEnvelopeIndex(binDict, binSize, gridEnvelopes, geom1.GetEnvelope())]
+            candidateCount += len(candidates)
+            bufferItems.append((feature1.GetField(bufferAtr), geom1.ExportToWkb(), candidates))
+        
+        if bVerbose:AddMsgAndPrint(f"\t{len(bufferItems):,} polygons; {candidateCount:,} bbox candidates out of {len(bufferItems) * len(gridItems):,} pairs")
+        
+        bufferShp = None
+        gridShp = None
+        
+        # Exact intersection tests in a thread pool; keyed by feature index since buffered
+        # polygons (i.e. multipart HUCs) can share the same attribute
+        # {0: ['366','399','400','401']}
+        intersectDict = dict()
+        with ThreadPoolExecutor(max_workers=psutil.cpu_count(logical = False)) as executor:
+            intersectTests = {executor.submit(intersectCandidates, bufferWkb, candidates): i for i,(attribute1,bufferWkb,candidates) in enumerate(bufferItems)}
+            
+            for future in as_completed(intersectTests):
+                intersectDict[intersectTests[future]] = future.result()
+        
+        # Iterate through buffered polygons; the grids of polygons that share an attribute are merged
+        for i,(attribute1,bufferWkb,candidates) in enumerate(bufferItems):
             
-           geom1 = feature1.GetGeometryRef()
-           attribute1 = feature1.GetField(bufferAtr)
-           
            if bVerbose:AddMsgAndPrint(f"\n\tHUC {attribute1}")
            
            # Log the grids that intersect with buffered polygon X
-           for feature2 in gridLyr:
-               
-              geom2 = feature2.GetGeometryRef()
-              attribute2 = str(feature2.GetField(gridAttr))
-              
-              # select only the intersections
-              if geom2.Intersects(geom1): 
+           for attribute2 in intersectDict[i]:
                   
-                  if not attribute2 in metaFileDict:
-                      if bVerbose:AddMsgAndPrint(f"\t\tGrid {attribute2} does not exist in elevation metadata file")
-                      continue
-                  
-                    # concatenate dem_path and dem_name from elevation metadata file
-                  dem = f"{metaFileDict[attribute2][demPath]}{os.sep}{metaFileDict[attribute2][demName]}"
-                  
-                  # Add info to urlDownloadDict
-                  if attribute1 in overlayDict:
+              if not attribute2 in metaFileDict:
+                  if bVerbose:AddMsgAndPrint(f"\t\tGrid {attribute2} does not exist in elevation metadata file")
+                  continue
+              
+              # concatenate dem_path and dem_name from elevation metadata file
+              dem = f"{metaFileDict[attribute2][demPath]}{os.sep}{metaFileDict[attribute2][demName]}"
+              
+              # Add info to urlDownloadDict
+              if attribute1 in overlayDict:
+                  if not dem in overlayDict[attribute1]:
                       overlayDict[attribute1].append(dem)
-                  else:
-                      overlayDict[attribute1] = [dem]
-                        
-                  #intersection = geom2.Intersection(geom1)
-                  if bVerbose:AddMsgAndPrint(f"\t\tGrid {attribute2}")
+              else:
+                  overlayDict[attribute1] = [dem]
                     
+              if bVerbose:AddMsgAndPrint(f"\t\tGrid {attribute2}")
+        
+        # Attributes where none of the polygons overlap a grid
+        for attribute1,bufferWkb,candidates in bufferItems:
            if not attribute1 in overlayDict:
                overlayDict[attribute1] = [None]
                noOverlap.append(attribute1)
@@ -376,10 +472,72 @@ def createOverlay(bufferLayer, bufferAtr, gridIndex, gridAttr, metaFileDict, bVe
         errorMsg()
         
 ## ================================================================================================================
-def extractDEMs(items, bufferLayer, bndryDriverAttr, bufferExtents, bReplace):
+def createCatalogHaloSource(metaFileDict):
+    """ This function will create a haloSource function for DSHub_Terrain_Derivatives using the
+        bbox (rds_left, rds_right, rds_bottom, rds_top) of every DEM in the elevation metadata file.
+        For a given DEM the haloSource returns a neighborReader that reads the halo pixels from
+        the adjacent DEMs with the same EPSG, or None if the DEM has no neighbors.
+    """
+    try:
+        headerValues = metaFileDict['headers']
+        demName = headerValues.index('dem_name')
+        demPath = headerValues.index('dem_path')
+        epsgCode = headerValues.index('epsg_code')
+        top = headerValues.index('rds_top')
+        left = headerValues.index('rds_left')
+        right = headerValues.index('rds_right')
+        bottom = headerValues.index('rds_bottom')
+        
+        catalogDEMs = list()   # [(dem, epsg)]
+        envelopes = list()     # [(minX, maxX, minY, maxY)]
+        demLookup = dict()     # dem: position in catalogDEMs
+        
+        for sourceID,items in metaFileDict.items():
+            if sourceID == 'headers':
+                continue
+            try:
+                env = (float(items[left]), float(items[right]), float(items[bottom]), float(items[top]))
+            except:
+                continue
+            
+            dem = f"{items[demPath]}{os.sep}{items[demName]}"
+            demLookup[dem] = len(catalogDEMs)
+            catalogDEMs.append((dem, items[epsgCode]))
+            envelopes.append(env)
+        
+        binDict,binSize = createEnvelopeIndex(envelopes)
+        
+        def haloSource(dem):
+            
+            if not dem in demLookup:
+                return None
+            
+            i = demLookup[dem]
+            neighbors = [catalogDEMs[j][0] for j in queryEnvelopeIndex(binDict, binSize, envelopes, envelopes[i])
+                         if j != i and catalogDEMs[j][1] == catalogDEMs[i][1]]
+            
+            if not neighbors:
+                return None
+            
+            return createNeighborReader(dem, neighbors)
+        
+        return haloSource
+    
+    except:
+        errorMsg()
+        return None
+        
+## ================================================================================================================
+def extractDEMs(items, bufferLayer, bndryDriverAttr, bufferExtents, bReplace, extractMode='tif'):
     """ This function will create a raster from 1 or more DEMs using the bufferlayer polygon as a mask.
         items is a tuple = ('11040006', [366, 399, 400, 401])
-    
+        
+        extractMode determines what is written:
+            'tif'    - tmp_<id>_DEM.tif in the Temp folder; DEFLATE compressed BIGTIFF
+            'vrt'    - tmp_<id>_DEM.vrt in the Temp folder; a warped VRT that references the source
+                       DEMs and applies the buffer cutline when it is read.  Only a few KB are written.
+        The VRT can be opened by any GDAL consumer in place of the tif and skips the
+        compress/decompress cycle on the scratch disk.
     """
     try:
         extractStart = tic()
@@ -397,43 +555,67 @@ def extractDEMs(items, bufferLayer, bndryDriverAttr, bufferExtents, bReplace):
         # tuple (minX, maxX, minY, maxY)
         extent = bufferExtents[driverCode]
         
-        returnDict['msgs'].append(f"\n\tExtracting DEM for ID: {driverCode} -- # of DEMs to extract from {len(listOfDEMs)}")
+        returnDict['msgs'].append(f"\n\tExtracting DEM for ID: {driverCode} -- # of DEMs to extract from {len(listOfDEMs)} -- Mode: {extractMode}")
+        
+        # Only the Temp folders on the EBS volumes go through placement
+        bPlaced = os.name != 'nt'
+        ext = 'vrt' if extractMode == 'vrt' else 'tif'
         
         if os.name == 'nt':
             folder = r'F:\DSHub\WB_BreachDepressions_out'
         else:
-            folder = getDownloadFolder(driverCode,None,True)
+            folder = getDownloadFolder(driverCode,None,True,f"tmp_{driverCode}_DEM.{ext}")
     
-        mergeRaster = os.path.join(folder,f"tmp_{driverCode}_DEM.tif")
+        mergeRaster = os.path.join(folder,f"tmp_{driverCode}_DEM.{ext}")
     
-        if os.path.exists(mergeRaster):
+        if gdal.VSIStatL(mergeRaster) is not None:
             try:
                 if bReplace:
-                    os.remove(mergeRaster)
+                    gdal.Unlink(mergeRaster)
                     returnDict['msgs'].append(f"\t\tSuccessfully Deleted {os.path.basename(mergeRaster)}")
                     
                 else:
                     returnDict['msgs'].append(f"\t\t{'Temp DEM Exists:':<15} {os.path.basename(mergeRaster):<60}")
+                    if bPlaced:
+                        releasePlacement(folder)
                     return returnDict
             except:
                 returnDict['fail'].append(f"\t\t{'Failed to Delete':<35} {mergeRaster:<60}")
+                if bPlaced:
+                    releasePlacement(folder)
                 return returnDict
     
-        # [Left, Bottom, Right, Top]
-        args = gdal.WarpOptions(format="GTiff",
-                                srcNodata=-999999.0,
-                                dstNodata=-999999.0,
-                                outputBounds=extent,
-                                cutlineDSName=bufferLayer,
-                                cutlineWhere=f"{bndryDriverAttr}='{driverCode}'",
-                                cropToCutline=True,
-                                creationOptions=["COMPRESS=DEFLATE", "TILED=YES","PREDICTOR=2","ZLEVEL=9",
-                                                  "BIGTIFF=YES","PROFILE=GeoTIFF"],
-                                multithread=True)
+        # outputBounds = [Left, Bottom, Right, Top]
+        outputBounds = [extent[0], extent[2], extent[1], extent[3]]
+        
+        if extractMode == 'vrt':
+            args = gdal.WarpOptions(format="VRT",
+                                    srcNodata=-999999.0,
+                                    dstNodata=-999999.0,
+                                    outputBounds=outputBounds,
+                                    cutlineDSName=bufferLayer,
+                                    cutlineWhere=f"{bndryDriverAttr}='{driverCode}'",
+                                    cropToCutline=True,
+                                    multithread=True)
+            
+        else:
+            args = gdal.WarpOptions(format="GTiff",
+                                    srcNodata=-999999.0,
+                                    dstNodata=-999999.0,
+                                    outputBounds=outputBounds,
+                                    cutlineDSName=bufferLayer,
+                                    cutlineWhere=f"{bndryDriverAttr}='{driverCode}'",
+                                    cropToCutline=True,
+                                    creationOptions=["COMPRESS=DEFLATE", "TILED=YES","PREDICTOR=2","ZLEVEL=9",
+                                                      "BIGTIFF=YES","PROFILE=GeoTIFF"],
+                                    multithread=True)
 
         g = gdal.Warp(mergeRaster, listOfDEMs, options=args)
         g = None
         
+        if bPlaced:
+            releasePlacement(folder)
+        
         returnDict['msgs'].append(f"\t\tOutput File: {mergeRaster}")
         returnDict['msgs'].append(f"\t\tProcessing Time: {toc(extractStart)}")
         returnDict['pTime'].append(f"{toc(extractStart)}")
@@ -441,40 +623,29 @@ def extractDEMs(items, bufferLayer, bndryDriverAttr, bufferExtents, bReplace):
         return returnDict
 
     except:
+        if 'bPlaced' in locals() and bPlaced and 'folder' in locals() and folder:
+            releasePlacement(folder)
         returnDict['msgs'].append(errorMsg(errorOption=2))
         returnDict['msgs'].append(f"\t\t-Process Time: {toc(extractStart)}")
         returnDict['fail'].append(items)
         return returnDict                
                     
 ## ===================================================================================
-def getDownloadFolder(id,abbreviation,tempDir=False):
-    # Create 8-digit huc Directory structure in the designated EBS mount volume
-    # '07060002' --> ['07', '06', '00', '02'] --> '07\\06\\00\\02'
-    # /data03/gisdata/elev/09/0904/090400/09040004/
+def getDownloadFolder(id,abbreviation,tempDir=False,fileName=None):
+    # Returns the Temp or <abbreviation> folder on one of the derivative EBS volumes
+    # /data07/gisdata/elev/Temp
+    # The volume used to be picked by the last digit of the id.  It is now picked by
+    # DSHub_Storage_Placement using free space and the number of in-flight writers.
+    # releasePlacement must be called with the returned folder once the write is done.
 
     try:
 
-        # last digit
-        ld = str(id[-1])
-
-        if ld in ["1","9","0"]:
-            root = "/data06/gisdata/elev"
-        elif ld in ["2","7","8"]:
-            root = "/data07/gisdata/elev"
-        elif ld in ["3","6"]:
-            root = "/data08/gisdata/elev"
-        elif ld in ["4","5"]:
-            root = "/data09/gisdata/elev"
-            
         if tempDir:
-            downloadFolder = f"{root}{os.sep}Temp"
+            subFolder = "Temp"
         else:
-            downloadFolder = f"{root}{os.sep}{abbreviation}"
-            
-        if not os.path.exists(downloadFolder):
-            os.makedirs(downloadFolder)
+            subFolder = abbreviation
 
-        return downloadFolder
+        return getPlacementFolder(id, subFolder, derivVolumes, namespace=f"deriv_{subFolder}", fileName=fileName)
 
     except:
         errorMsg()
@@ -496,6 +667,15 @@ if __name__ == '__main__':
     elevationMetadataFile = r'D:\projects\DSHub\elevationDers\USGS_3DEP_DSH3M_Step5_Mosaic_Elevation_Metadata.txt'
     bReplace = False
     bMultiProcess = True
+    bExtractDEMs = False
+    extractMode = 'vrt'   # 'tif' or 'vrt'; see extractDEMs
+    bSeamlessDerivatives = True
+    derivatives = ['slope','aspect','tpi','tri','roughness']
+    placementMapFile = f"{os.path.dirname(elevationMetadataFile)}{os.sep}DSHub_Derivatives_PlacementMap.json"
+    
+    # Outputs are placed on the EBS volumes using a persisted placement map
+    if os.name != 'nt':
+        loadPlacementMap(placementMapFile)
     
     # Step 1 - Get Boundary Driver Shapefile information
     driver = ogr.GetDriverByName('ESRI Shapefile')
@@ -523,38 +703,66 @@ if __name__ == '__main__':
     overlayDict = createOverlay(bufferLayer,bndryDriverAttr,gridIndex,gridAttr, metaFileDict, False)
 
     # Step 5 - Extract DEMs using the buffered bndryDriver as a mask; tmpID.tif
-    listOfExtractedDEMs = list()
-    failToExtract = list()
-    processTimes = list()
-    extractStart = tic()
-    numOfCores = psutil.cpu_count(logical = False)
-    tracker = 0
-
-    if bMultiProcess:
-        AddMsgAndPrint(f"\nExtracting DEMs for {bndryDriverCount} {os.path.basename(bndryDriver)} features - Multi-threading Mode")
-        
-        # Execute in Multi-threading mode
-        with ThreadPoolExecutor(max_workers=numOfCores) as executor:
-            ndProcessing = {executor.submit(extractDEMs, items, bufferLayer, bndryDriverAttr, bufferExtents, bReplace): items for items in overlayDict.items()}
-    
-            # yield future objects as they are done.
-            for future in as_completed(ndProcessing):
-                returnDict = future.result()
+    # Not needed for seamless derivatives; halos are read from the adjacent DEMs instead
+    if bExtractDEMs:
+        listOfExtractedDEMs = list()
+        failToExtract = list()
+        processTimes = list()
+        extractStart = tic()
+        numOfCores = psutil.cpu_count(logical = False)
+        tracker = 0
+
+        if bMultiProcess:
+            AddMsgAndPrint(f"\nExtracting DEMs for {bndryDriverCount} {os.path.basename(bndryDriver)} features - Multi-threading Mode")
+        
+            # Execute in Multi-threading mode
+            with ThreadPoolExecutor(max_workers=numOfCores) as executor:
+                ndProcessing = {executor.submit(extractDEMs, items, bufferLayer, bndryDriverAttr, bufferExtents, bReplace, extractMode): items for items in overlayDict.items()}
+    
+                # yield future objects as they are done.
+                for future in as_completed(ndProcessing):
+                    returnDict = future.result()
+                
+                    tracker+=1
+                    j=1
+                    batchMsgs = list()
                 
+                    for printMessage in returnDict['msgs']:
+    
+                        if j==1:
+                            batchMsgs.append(f"{printMessage} -- ({tracker:,} of {bndryDriverCount:,})")
+                        else:
+                            batchMsgs.append(printMessage)
+                        j+=1
+    
+                    AddMsgAndPrint(None,msgList=batchMsgs)
+    
+                    # Arrange results
+                    if returnDict['rast']:
+                        listOfExtractedDEMs.append(returnDict['rast'][0])
+                    if returnDict['fail']:
+                        failToExtract.append(returnDict['fail'][0])
+                    if returnDict['pTime']:
+                        processTimes.append(returnDict['pTime'][0])
+                
+        else:
+            AddMsgAndPrint(f"\nExtracting DEMs for {bndryDriverCount} {os.path.basename(bndryDriver)} features - Single Processing Mode")
+            for items in overlayDict.items():
+                returnDict = extractDEMs(items, bufferLayer, bndryDriverAttr, bufferExtents, bReplace, extractMode)
+            
                 tracker+=1
                 j=1
                 batchMsgs = list()
-                
+            
                 for printMessage in returnDict['msgs']:
-    
                     if j==1:
                         batchMsgs.append(f"{printMessage} -- ({tracker:,} of {bndryDriverCount:,})")
                     else:
                         batchMsgs.append(printMessage)
                     j+=1
-    
+
                 AddMsgAndPrint(None,msgList=batchMsgs)
-    
+
                 # Arrange results
                 if returnDict['rast']:
                     listOfExtractedDEMs.append(returnDict['rast'][0])
@@ -562,34 +770,24 @@ if __name__ == '__main__':
                     failToExtract.append(returnDict['fail'][0])
                 if returnDict['pTime']:
                     processTimes.append(returnDict['pTime'][0])
-                
-    else:
-        AddMsgAndPrint(f"\nExtracting DEMs for {bndryDriverCount} {os.path.basename(bndryDriver)} features - Single Processing Mode")
-        for items in overlayDict.items():
-            returnDict = extractDEMs(items, bufferLayer, bndryDriverAttr, bufferExtents, bReplace)
-            
-            tracker+=1
-            j=1
-            batchMsgs = list()
-            
-            for printMessage in returnDict['msgs']:
-                if j==1:
-                    batchMsgs.append(f"{printMessage} -- ({tracker:,} of {bndryDriverCount:,})")
-                else:
-                    batchMsgs.append(printMessage)
-                j+=1
 
-            AddMsgAndPrint(None,msgList=batchMsgs)
-
-            # Arrange results
-            if returnDict['rast']:
-                listOfExtractedDEMs.append(returnDict['rast'][0])
-            if returnDict['fail']:
-                failToExtract.append(returnDict['fail'][0])
-            if returnDict['pTime']:
-                processTimes.append(returnDict['pTime'][0])
-
-    extractStop = toc(extractStart)
+        extractStop = toc(extractStart)
+    
+        if os.name != 'nt':
+            AddMsgAndPrint("\nEBS Volume Placement:")
+            AddMsgAndPrint(None,msgList=placementSummary(derivVolumes))
+    
+    # Step 6 - Create derivatives for every DEM that intersects the buffered bndryDriver polys.
+    # The 1-pixel halo at tile edges is read from the adjacent DEMs in the catalog so outputs
+    # are seamless without creating buffered mosaics first.
+    if bSeamlessDerivatives:
+        derivStart = tic()
+        demList = sorted(set(dem for dems in overlayDict.values() for dem in dems if dem))
+        haloSource = createCatalogHaloSource(metaFileDict)
+        
+        derivativeFiles = createDerivativesMain(demList, derivatives, None, bReplace, False, haloSource,
+                                                listFolder=os.path.dirname(elevationMetadataFile))
+        AddMsgAndPrint(f"\n\tDerivative Processing Time: {toc(derivStart)}")
          
     AddMsgAndPrint(f"\n{toc(funStarts)}")
           
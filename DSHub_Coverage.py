@@ -0,0 +1,353 @@
+# -*- coding: utf-8 -*-
+"""
+Script Name: DSHub_Coverage.py
+Created on Mon Oct 19 2026
+
+@author: Adolfo.Diaz
+GIS Business Analyst
+USDA - NRCS - SPSD - Soil Services and Information
+email address: adolfo.diaz@usda.gov
+cell: 608.215.7291
+
+The purpose of this module is to build the dissolved coverage of every resolution; the
+"where do we have 1M/3M/10M data" polygons.  Until now only the per-tile footprints existed
+(metadata.{region}_elevation_{resolution}_{epsg}_footprint_dshub; the "value" = 2 polygons)
+so answering "is there 1M data here" meant searching hundreds of thousands of overlapping
+tile polygons.
+
+How the coverage is built (dissolveFootprints):
+    1) partitionFootprints - every footprint is assigned to the grid cell (cellSize in units
+       of the EPSG) that holds the center of its envelope.
+    2) unionCell - the footprints of each cell are dissolved with a cascaded union.  Cells are
+       independent so they are dissolved in parallel (DSHub_Footprints.runFootprintTasks with
+       threads; GDAL releases the GIL while GEOS works) as they arrive (dissolveCells).
+    3) The cell unions are dissolved into 1 MultiPolygon with a second cascaded union and
+       optionally simplified with SimplifyPreserveTopology.
+
+Coverage tables (updateCoverage):
+    metadata.{region}_elevation_{epsg}_coverage         1 row per resolution with the
+                                                        dissolved MultiPolygon
+    metadata.{region}_elevation_{epsg}_coverage_parts   the coverage cut into small polygons
+                                                        with ST_Subdivide and a GiST index;
+                                                        this is what point checks
+                                                        (coverageContains) search
+    metadata.{region}_elevation_{epsg}_coverage_tiles   the tiles already dissolved into the
+                                                        coverage of each resolution
+
+    Updates are incremental: only the tiles of the footprint table that are not in
+    coverage_tiles are streamed (server side cursor ordered by grid cell) and dissolved.
+    Only that new material is simplified, and it is unioned and re-subdivided only with the
+    coverage_parts it intersects; the rest of the coverage is left as is.  Removing or
+    replacing tiles requires a rebuild (bRebuild=True).
+"""
+
+## ========================================== Import modules ===============================================================
+import sys, traceback, time, math, itertools
+
+from osgeo import gdal, ogr
+
+from DSHub_Footprints import runFootprintTasks
+
+gdal.UseExceptions()
+
+## ===================================================================================
+def AddMsgAndPrint(msg):
+
+    # Print message to python message console
+    print(msg)
+
+## ===================================================================================
+def errorMsg(errorOption=1):
+
+    """ By default, error messages will be printed immediately.
+        If errorOption is set to 2, return the message back to the function that it
+        was called from."""
+
+    try:
+
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        theMsg = "\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[1] + "\n\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[-1]
+
+        if errorOption==1:
+            AddMsgAndPrint(theMsg)
+        else:
+            return theMsg
+
+    except:
+        AddMsgAndPrint("Unhandled error in unHandledException method")
+        pass
+
+## ===================================================================================
+def getCoverageTables(region, epsg):
+    """ Names of the coverage, coverage_parts and coverage_tiles tables of a region/EPSG """
+
+    coverageTable = f"metadata.{region}_elevation_{epsg}_coverage"
+    return coverageTable, f"{coverageTable}_parts", f"{coverageTable}_tiles"
+
+## ===================================================================================
+def partitionFootprints(footprints, cellSize):
+    """ Groups footprint WKBs by the grid cell that holds the center of their envelope.
+
+        footprints - iterable of WKB Polygons/MultiPolygons
+        cellSize   - size of a grid cell in units of the footprints (i.e. 100000 for 5070)
+
+        returns {(column,row): [wkb]}
+    """
+
+    cells = dict()
+
+    for wkb in footprints:
+        minX,maxX,minY,maxY = ogr.CreateGeometryFromWkb(wkb).GetEnvelope()
+        cell = (math.floor((minX + maxX) / 2 / cellSize), math.floor((minY + maxY) / 2 / cellSize))
+        cells.setdefault(cell, []).append(wkb)
+
+    return cells
+
+## ===================================================================================
+def addPolygonParts(multiPolygon, geom):
+    """ Adds the polygons of geom to multiPolygon.  Buffer(0) of an invalid footprint can
+        return a GeometryCollection (polygons plus stray lines/points) or an empty geometry;
+        only the non empty Polygon parts are added. """
+
+    if geom is None or geom.IsEmpty():
+        return
+
+    if ogr.GT_Flatten(geom.GetGeometryType()) == ogr.wkbPolygon:
+        multiPolygon.AddGeometry(geom)
+    else:
+        for i in range(geom.GetGeometryCount()):
+            addPolygonParts(multiPolygon, geom.GetGeometryRef(i))
+
+## ===================================================================================
+def unionCell(footprints):
+    """ Cascaded union of a list of WKB Polygons/MultiPolygons.  Returns the WKB of the
+        dissolved MultiPolygon or None if there are no polygons. """
+
+    multiPolygon = ogr.Geometry(ogr.wkbMultiPolygon)
+
+    for wkb in footprints:
+        geom = ogr.CreateGeometryFromWkb(wkb)
+        if not geom.IsValid():
+            geom = geom.Buffer(0)
+
+        addPolygonParts(multiPolygon, geom)
+
+    if multiPolygon.IsEmpty():
+        return None
+
+    return ogr.ForceToMultiPolygon(multiPolygon.UnionCascaded()).ExportToWkb()
+
+## ===================================================================================
+def dissolveCells(cells, simplifyTolerance=None, maxWorkers=None):
+    """ Dissolves grid cells of footprints into 1 MultiPolygon.  Cells are dissolved in
+        parallel as they are read from cells so only the cells in flight and the cell unions
+        are held in memory.
+
+        cells             - iterable of lists of WKB Polygons/MultiPolygons; 1 list per cell
+        simplifyTolerance - SimplifyPreserveTopology tolerance of the merged MultiPolygon
+        maxWorkers        - number of threads that dissolve cells; cpu count by default
+
+        returns {'wkb','footprints','cells','seconds'}
+    """
+
+    start = time.time()
+    counts = {'footprints':0, 'cells':0}
+
+    def cellArgs():
+        for footprints in cells:
+            counts['footprints'] += len(footprints)
+            counts['cells'] += 1
+            yield (footprints,)
+
+    cellUnions = [wkb for wkb in runFootprintTasks(unionCell, cellArgs(), 'threads', maxWorkers) if wkb]
+    wkb = unionCell(cellUnions)
+
+    if wkb and simplifyTolerance:
+        geom = ogr.ForceToMultiPolygon(ogr.CreateGeometryFromWkb(wkb).SimplifyPreserveTopology(simplifyTolerance))
+        wkb = geom.ExportToWkb()
+
+    return {'wkb':wkb, 'footprints':counts['footprints'], 'cells':counts['cells'], 'seconds':round(time.time() - start, 3)}
+
+## ===================================================================================
+def dissolveFootprints(footprints, cellSize=100000, simplifyTolerance=None, maxWorkers=None):
+    """ Dissolves footprints into 1 coverage MultiPolygon with a grid partitioned cascaded
+        union (partitionFootprints, dissolveCells).
+
+        footprints        - iterable of WKB Polygons/MultiPolygons
+        cellSize          - grid cell size in units of the footprints
+        simplifyTolerance - SimplifyPreserveTopology tolerance of the merged coverage
+        maxWorkers        - number of threads that dissolve cells; cpu count by default
+
+        returns {'wkb','footprints','cells','seconds'}
+    """
+
+    return dissolveCells(partitionFootprints(footprints, cellSize).values(), simplifyTolerance, maxWorkers)
+
+## ===================================================================================
+def createCoverageTables(cursor, region, epsg):
+    """ Creates the coverage tables of a region/EPSG if they don't exist """
+
+    coverageTable,partsTable,tilesTable = getCoverageTables(region, epsg)
+    partsIndex = partsTable.split('.')[-1]
+
+    cursor.execute(f"""CREATE TABLE IF NOT EXISTS {coverageTable}
+                           (resolution varchar PRIMARY KEY, tiles integer, updated timestamp,
+                            geom geometry(MULTIPOLYGON, {epsg}));
+                       CREATE TABLE IF NOT EXISTS {partsTable}
+                           (resolution varchar, geom geometry(POLYGON, {epsg}));
+                       CREATE INDEX IF NOT EXISTS {partsIndex}_idx ON {partsTable} USING GIST (geom);
+                       CREATE INDEX IF NOT EXISTS {partsIndex}_res_idx ON {partsTable} (resolution);
+                       CREATE TABLE IF NOT EXISTS {tilesTable}
+                           (resolution varchar, tile_id varchar, PRIMARY KEY (resolution, tile_id));""")
+
+## ===================================================================================
+def updateCoverage(dbParams, region, resolution, epsg, cellSize=100000, simplifyTolerance=None,
+                   maxWorkers=None, bRebuild=False, maxVertices=256, itersize=10000):
+    """ Adds the tiles of metadata.{region}_elevation_{resolution}_{epsg}_footprint_dshub that
+        are not in the coverage yet to the coverage of resolution.  bRebuild dissolves every
+        tile again.
+
+        The new footprints are streamed with a server side cursor (itersize rows per fetch)
+        ordered by the grid cell of partitionFootprints and each cell is dissolved as soon as
+        its last footprint is read.  Only the dissolved new material is simplified.  It is
+        unioned with the coverage_parts it intersects, which are replaced by the ST_Subdivide
+        parts (maxVertices) of that union, and with the coverage row.  The coverage row, its
+        parts and the list of dissolved tiles are updated in 1 transaction.
+
+        returns {'resolution','tiles','footprints','cells','status','seconds','error'}
+    """
+
+    import psycopg2
+
+    start = time.time()
+    resolution = resolution.lower()
+    footprintTable = f"metadata.{region}_elevation_{resolution}_{epsg}_footprint_dshub"
+    coverageTable,partsTable,tilesTable = getCoverageTables(region, epsg)
+
+    result = {'resolution':resolution, 'tiles':0, 'footprints':0, 'cells':0, 'status':'Success', 'seconds':0, 'error':None}
+
+    conn = psycopg2.connect(**dbParams)
+    try:
+        with conn.cursor() as cursor:
+            createCoverageTables(cursor, region, epsg)
+
+            if bRebuild:
+                cursor.execute(f"DELETE FROM {coverageTable} WHERE resolution = %s", (resolution,))
+                cursor.execute(f"DELETE FROM {partsTable} WHERE resolution = %s", (resolution,))
+                cursor.execute(f"DELETE FROM {tilesTable} WHERE resolution = %s", (resolution,))
+
+        # Only the tiles that are not in the coverage yet; grouped by the grid cell that holds
+        # the center of their envelope (same cells as partitionFootprints)
+        tileIDs = set()
+        with conn.cursor(name=f"coverage_{resolution}") as streamCursor:
+            streamCursor.itersize = itersize
+            streamCursor.execute(f"""SELECT fp.tile_id, ST_AsBinary(fp.geom),
+                                            floor((ST_XMin(fp.geom) + ST_XMax(fp.geom)) / 2 / %s) AS col,
+                                            floor((ST_YMin(fp.geom) + ST_YMax(fp.geom)) / 2 / %s) AS row
+                                     FROM {footprintTable} fp
+                                     WHERE fp."value" = 2 AND NOT EXISTS
+                                         (SELECT 1 FROM {tilesTable} ct
+                                          WHERE ct.resolution = %s AND ct.tile_id = fp.tile_id)
+                                     ORDER BY col, row""", (cellSize, cellSize, resolution))
+
+            def streamCells():
+                for cell,rows in itertools.groupby(streamCursor, key=lambda row: (row[2], row[3])):
+                    footprints = list()
+                    for tileID,wkb,col,row in rows:
+                        tileIDs.add(tileID)
+                        footprints.append(bytes(wkb))
+                    yield footprints
+
+            dissolved = dissolveCells(streamCells(), simplifyTolerance, maxWorkers)
+
+        if not tileIDs:
+            conn.rollback()
+            result['seconds'] = round(time.time() - start, 3)
+            return result
+
+        result.update({'tiles':len(tileIDs), 'footprints':dissolved['footprints'], 'cells':dissolved['cells']})
+
+        with conn.cursor() as cursor:
+            # The new tiles are recorded even if all of their footprints were empty
+            if dissolved['wkb']:
+                newGeom = psycopg2.Binary(dissolved['wkb'])
+
+                # Replace only the parts the new material touches with the subdivided union of them
+                cursor.execute(f"""WITH hit AS (DELETE FROM {partsTable}
+                                                WHERE resolution = %s AND ST_Intersects(geom, ST_GeomFromWKB(%s, {epsg}))
+                                                RETURNING geom)
+                                   INSERT INTO {partsTable} (resolution, geom)
+                                   SELECT %s, ST_Subdivide(ST_Union(geom), %s)
+                                   FROM (SELECT geom FROM hit
+                                         UNION ALL
+                                         SELECT ST_GeomFromWKB(%s, {epsg})) parts""",
+                               (resolution, newGeom, resolution, maxVertices, newGeom))
+
+                cursor.execute(f"""INSERT INTO {coverageTable} (resolution, tiles, updated, geom)
+                                   VALUES (%s, %s, now(), ST_Multi(ST_GeomFromWKB(%s, {epsg})))
+                                   ON CONFLICT (resolution) DO UPDATE SET
+                                       tiles = {coverageTable.split('.')[-1]}.tiles + excluded.tiles,
+                                       updated = excluded.updated,
+                                       geom = ST_Multi(ST_Union({coverageTable.split('.')[-1]}.geom, excluded.geom))""",
+                               (resolution, len(tileIDs), newGeom))
+
+            cursor.executemany(f"INSERT INTO {tilesTable} (resolution, tile_id) VALUES (%s, %s) ON CONFLICT DO NOTHING",
+                               [(resolution, tileID) for tileID in tileIDs])
+
+        conn.commit()
+
+    except:
+        conn.rollback()
+        result.update({'status':'Error', 'error':errorMsg(errorOption=2)})
+
+    finally:
+        conn.close()
+
+    result['seconds'] = round(time.time() - start, 3)
+    return result
+
+## ===================================================================================
+def coverageContains(cursor, region, epsg, resolution, x, y, srid=4326):
+    """ True if the coverage of resolution has data at x,y (in srid).  Searches the
+        subdivided coverage parts so only a few small polygons are tested. """
+
+    partsTable = getCoverageTables(region, epsg)[1]
+
+    cursor.execute(f"""SELECT EXISTS (SELECT 1 FROM {partsTable}
+                                      WHERE resolution = %s AND
+                                            ST_Intersects(geom, ST_Transform(ST_SetSRID(ST_Point(%s, %s), %s), {epsg})))""",
+                   (resolution.lower(), x, y, srid))
+
+    return cursor.fetchone()[0]
+
+## ====================================== Main Body ==================================
+def main(dbParams, region, epsg, resolutions, cellSize=100000, simplifyTolerance=None, bRebuild=False):
+
+    try:
+        for resolution in resolutions:
+            AddMsgAndPrint(f"\nUpdating {resolution} Coverage of {region.upper()} EPSG:{epsg}")
+            result = updateCoverage(dbParams, region, resolution, epsg, cellSize, simplifyTolerance, bRebuild=bRebuild)
+
+            if result['status'] == 'Error':
+                AddMsgAndPrint(f"\tFailed to update the {resolution} coverage:\n{result['error']}")
+            elif result['tiles']:
+                AddMsgAndPrint(f"\tAdded {result['tiles']:,} tiles ({result['footprints']:,} footprints in {result['cells']:,} grid cells) in {result['seconds']} seconds")
+            else:
+                AddMsgAndPrint(f"\tThe {resolution} coverage is up to date")
+
+    except:
+        errorMsg()
+
+if __name__ == '__main__':
+
+    # DSHub_Coverage.py conus 5070 1m,3m,10m [cellSize] [simplifyTolerance] [rebuild]
+    region = sys.argv[1]
+    epsg = int(sys.argv[2])
+    resolutions = sys.argv[3].split(',')
+    cellSize = float(sys.argv[4]) if len(sys.argv) > 4 else 100000
+    simplifyTolerance = float(sys.argv[5]) if len(sys.argv) > 5 and float(sys.argv[5]) > 0 else None
+    bRebuild = len(sys.argv) > 6 and sys.argv[6].lower() in ('true','rebuild')
+
+    dbParams = {'host':'10.11.11.214', 'port':6432, 'user':'elevation', 'password':'itsnotflat', 'dbname':'elevation'}
+
+    main(dbParams, region, epsg, resolutions, cellSize, simplifyTolerance, bRebuild)
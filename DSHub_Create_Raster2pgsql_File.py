@@ -5,7 +5,9 @@ Created on Tue Jan 23 15:02:05 2024
 @author: Adolfo.Diaz
 """
 
-import os, traceback, sys, re, subprocess
+import os, traceback, sys
+
+from DSHub_Registration_Jobs import createRegistrationJobs, exportRaster2pgsqlFile
 
 ## ===================================================================================
 def errorMsg():
@@ -28,95 +30,29 @@ def errorMsg():
     
 ## ===================================================================================
 def createRaster2pgSQLFile(file,schema,table):
-
-    # Mutually exclusive options
-    # -a Append raster(s) to an existing table.
-
-    # Raster processing: Optional parameters used to manipulate input raster dataset
-    # -s - <SRID> Assign output raster with specified SRID.
-    # -b - Index (1-based) of band to extract from raster.
-    # -t - Tile Size; Cut raster into tiles to be inserted one per table row.
-    # -R - Register; Register the raster as a filesystem (out-db) raster.
-
-    # Optional parameters used to manipulate database objects
-    # -F - Add a column with the name of the file (necessary for elevation but not others)
-    #     This will be handy when you merge tilesets together
-    # -I - Create a GiST index on the raster column.
-    # -R  Register the raster as a filesystem (out-db) raster.
-    #     Only the metadata of the raster and path location to the raster is
-    #     stored in the database (not the pixels).
-
-    # STDOUT parameters
-    # | - A pipe is a form of redirection in Linux used to connect the STDOUT
-    #     of one command into the STDIN of a second command.
-    # PGPASSWORD = itsnotflat
-    # -U elevation - user in the schemas
-    # -d elevation - database name
-    # -h 10.11.11.10 host - localhost
-    # -p port
-
-    # raster2pgsql -s 4269 -b 1 -t 507x507 -F -R -I /data03/gisdata/dsmgroup/aspct_16.tif elevation.$name | PGPASSWORD=itsnotflat psql -U elevation -d elevation -h 10.11.11.10 -p 5432
-
-    # raster2pgsql -s 5070 -b 1 -I -t 560x560 -F -R /data03/gisdata/dsmgroup/aspct_16.tif
-    # covariate.conus_aspect_16 | PGPASSWORD=itsnotflat psql -U covariate -d elevation -h 10.11.11.10 -p 5432
-
-    # Before
+    """ Appends the raster2pgsql commands of the derivative rasters listed in file to
+        ElevDerivative_<table>_raster2pgsql.txt.  file has no header; the DEM name, path and
+        EPSG are the 12th, 13th and 22nd fields.  Registration jobs come from
+        DSHub_Registration_Jobs. """
 
     try:
-        total = len(open(file).readlines())
-        recCount = 0
-        missingElements = 0
-        
         # Ouput Raster2pgsql file
         r2pgsqlFilePath = f"{os.path.dirname(file)}{os.sep}ElevDerivative_{table}_raster2pgsql.txt"
-        g = open(r2pgsqlFilePath,'a+')
-        
-        # Raster2pgsql parameters
-        tileSize = '512x512'
-        dbName = 'elevation_derivatives'
-        username = 'elevation'
-        password = 'itsnotflat'
-        localHost = '10.11.11.214'
-        port = '6432'
-
-        """ ------------------- Open Master Elevation File and write raster2pgsql statements ---------------------"""
-        with open(file, 'r') as fp:
-            for line in fp:
-                
-                items = line.strip().split(',')
-                demPath = f"{items[12]}/{items[11]}"
-                srid = items[21]
-                
-                try:
-                    #srid = line.split('_')[-2]
-                    int(srid)
-                except:
-                    print("WARNING: SRID Could not be determined")
-                    srid = '#'
-                    missingElements +=1 
-                
-                r2pgsqlCommand = f"raster2pgsql -s {srid} -b 1 -t {tileSize} -F -a -R {demPath} {schema}.{table} | PGPASSWORD={password} psql -U {username} -d {dbName} -h {localHost} -p {port}"
-                #r2pgsqlCommand = f"raster2pgsql -s {srid} -b 1 -t {tileSize} -F -a -R {line.strip()} {schema}.{table} | PGPASSWORD={password} psql -U {username} -d {dbName} -h {localHost} -p {port}"
-
-                if recCount == total:
-                    g.write(r2pgsqlCommand)
-                else:
-                    g.write(r2pgsqlCommand + "\n")
-                    
-                recCount+=1
-
-        print(f"\t\tSuccessfully wrote raster2pgsql command -- ({recCount:,} of {total:,})")
-        
-        if missingElements:
-            print(f"\t\tThere are {missingElements} raster2pgsql commands with missing elements")
 
-        g.close()
+        fieldIndex = {'dem_name':11, 'dem_path':12, 'epsg_code':21}
+        jobs,invalidJobs = createRegistrationJobs(file, 'derivatives', schema=schema, table=table, fieldIndex=fieldIndex)
+
+        exportRaster2pgsqlFile(jobs, r2pgsqlFilePath, 'a+')
+        print(f"\t\tSuccessfully wrote {len(jobs):,} raster2pgsql commands")
+
+        if invalidJobs:
+            print(f"\t\tThere are {len(invalidJobs)} rasters with missing elements")
 
         return r2pgsqlFilePath
 
     except:
-        errorMsg()
-        
+        print(errorMsg())
+
 ## ===================================================================================
 if __name__ == '__main__':
 
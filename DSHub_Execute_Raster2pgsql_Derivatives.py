@@ -5,7 +5,16 @@ Created on 1/26/2024
 @author: Adolfo.Diaz
 """
 
-import os, traceback, sys, re, subprocess
+import os, traceback, sys
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from DSHub_Raster_Loader import createLoadBatches, runRaster2pgsqlBatch, runLoadJob
+from DSHub_Raster_Loader import preparePartitionedTargets, interleaveBatches
+
+# Hard coded Raster2pgsql parameters
+tileSize = (512,512)
+dbParams = {'host':'10.11.11.214', 'port':6432, 'user':'elevation', 'password':'itsnotflat',
+            'dbname':'elevation_derivatives'}
 
 ## ===================================================================================
 def errorMsg():
@@ -42,71 +51,97 @@ def runRaster2pgsql(input_file,schema,table):
         messageList = list()
         rasterFileName = os.path.basename(input_file)
         
-        # Hard coded Raster2pgsql parameters
-        tileSize = '512x512'
-        dbName = 'elevation_derivatives'
-        username = 'elevation'
-        password = 'itsnotflat'
-        localHost = '10.11.11.214'
-        port = '6432'
-        
         try:
             srid = rasterFileName.split('_')[-2]
             int(srid)
         except:
             messageList.append(f"\nWARNING: SRID Could not be determined for {rasterFileName}")
-            srid = '#'
-            
-        r2pgsqlCommand = f"raster2pgsql -s {srid} -b 1 -t {tileSize} -F -a -R {input_file.strip()} {schema}.{table} | PGPASSWORD={password} psql -U {username} -d {dbName} -h {localHost} -p {port}"
+            return messageList
 
-        # Send command to operating system
-        execCmd = subprocess.Popen(r2pgsqlCommand, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,universal_newlines=True)
+        job = {'raster':input_file.strip(), 'srid':srid, 'band':1, 'tileSize':tileSize, 'schema':schema,
+               'table':table, 'filename':True, 'cmd':None, 'db':dbParams}
 
-        """ ------------------------ Assess Messages,Warnings,Errors --------------------------"""
-        # returns a tuple (stdout_data, stderr_data)
-        msgs, errors = execCmd.communicate()
-        errors = ','.join(errors.strip().split('\n')).lower()  # some errors return mutliple carriage returns
-        
-        errorList = ['error','failed','fail','uncommit','aborted','notice','memory',
-                     'warning','unable','not recognized','inoperable','syntax', 'cannot']
-        words_re = re.compile("|".join(errorList))
+        # Structured result: exit status, tiles inserted, ERROR and WARNING lines
+        result = runLoadJob(job)
 
-        # Collect messages from subprocess
-        # 0 = completed, however there may be warnings
-        errorResults = words_re.search(errors)
+        if result['status'] == 'Warning':
+            messageList.append(f"\nWARNING -- {rasterFileName} -- {result['warnings'][0]}")
+        elif result['status'] == 'Error':
+            messageList.append(f"\nERROR -- {rasterFileName} -- {result['error']}")
+        else:
+            messageList.append(f"\nSUCCESS -- {rasterFileName} -- {result['rows']:,} tiles in {result['seconds']} secs")
 
-        if errorResults:
-            errorGroup = errorResults.group()
+        return messageList
 
-            # Warning messages
-            if errorGroup in ('warning') and execCmd.returncode == 0:
+    except:
+        messageList.append(f"\nERROR -- {rasterFileName} -- Error encountered running raster2pgsql")
+        return messageList
 
-                # number of warnings; isolate 1 message
-                # If there are multiple warnings I should compare them to see if they are unique;
-                # Assumption is that the warnings are duplicated
-                warningCounts = re.findall(r'\b(?:' + '|'.join(['warning']) + r')\b', errors)
-                warningIndices = [m.start() for m in re.finditer(r"\bwarning\b", errors)]
+## ===================================================================================
+def runRaster2pgsqlBatches(input_files,schema,table,maxTiles=50000,bTransaction=True,maxWorkers=4,partitionBy=None):
+    """ This function will load a list of raster files in batches.  Rasters are grouped into
+        batches of at most maxTiles tiles and each batch is loaded with 1 raster2pgsql | psql
+        session.  With bTransaction each batch is 1 transaction so a failure only rolls back
+        the rasters of that batch.
 
-                # Extract warning message
-                if len(warningCounts) > 1:
-                    warningMessage = errors[warningIndices[0]:warningIndices[1]]
-                else:
-                    warningMessage = errors[warningIndices[0]:]
+    Parameter 1 - list of absolute file paths of raster files
+    Parameter 2 - String name of Database Schema Name; i.e. slope
+    Paramter 3 -  String name of Database Schema Table name; i.e. conus_slope_10m_5070
+    partitionBy - 'srid' or 'grid' to load the table through partitions so the workers write
+                  to separate partitions (DSHub_Raster_Loader.preparePartitionedTargets)
 
-                messageList.append(f"\nWARNING -- {rasterFileName} -- {warningMessage}")
+    returns a list of messages produced; 1 SUCCESS, WARNING or ERROR message per batch and the
+    list of rasters that need to be rerun (rasters of ERROR batches only; a WARNING batch
+    inserted every tile).
+    """
 
-            # Error messages; What is the error group here? Investigate after more errors arise
-            else:
-                messageList.append(f"\nERROR -- {rasterFileName} -- {errors}")
+    messageList = list()
+    failedFiles = list()
 
-        else:
-            messageList.append(f"\nSUCCESS -- {rasterFileName}")
+    try:
+        jobs = list()
+        for input_file in input_files:
+            input_file = input_file.strip()
+            rasterFileName = os.path.basename(input_file)
+
+            try:
+                srid = rasterFileName.split('_')[-2]
+                int(srid)
+            except:
+                messageList.append(f"\nWARNING: SRID Could not be determined for {rasterFileName}")
+                failedFiles.append(input_file)
+                continue
+
+            jobs.append({'raster':input_file, 'srid':srid, 'band':1, 'tileSize':tileSize, 'schema':schema,
+                         'table':table, 'filename':True, 'cmd':None, 'db':dbParams})
+
+        if partitionBy:
+            messageList.extend(preparePartitionedTargets(jobs, partitionBy))
+
+        batches = interleaveBatches(createLoadBatches(jobs, maxTiles))
+
+        with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+            runBatch = {executor.submit(runRaster2pgsqlBatch, batch, bTransaction): batch for batch in batches}
+
+            for future in as_completed(runBatch):
+                batch = runBatch[future]
+                result = future.result()
+                firstFile = os.path.basename(batch[0]['raster'])
+
+                if result['status'] == 'Success':
+                    messageList.append(f"\nSUCCESS -- batch of {len(batch):,} rasters beginning with {firstFile} -- {result['rows']:,} tiles in {result['seconds']} secs")
+                elif result['status'] == 'Warning':
+                    # Every tile was inserted; rerunning it with -a would append the tiles again
+                    messageList.append(f"\nWARNING -- batch of {len(batch):,} rasters beginning with {firstFile} -- {result['rows']:,} tiles in {result['seconds']} secs -- {','.join(result['warnings'])}")
+                else:
+                    messageList.append(f"\nERROR -- batch of {len(batch):,} rasters beginning with {firstFile} -- {result['error']}")
+                    failedFiles.extend([job['raster'] for job in batch])
 
-        return messageList
+        return messageList,failedFiles
 
     except:
-        messageList.append(f"\nERROR -- {rasterFileName} -- Error encountered running raster2pgsql")
-        return messageList
+        messageList.append(f"\nERROR -- Error encountered running raster2pgsql batches\n{errorMsg()}")
+        return messageList,failedFiles
 
 ## ===================================================================================
 if __name__ == '__main__':
@@ -117,11 +152,13 @@ if __name__ == '__main__':
                     r'/data02/gisdata/elev/10m/0/USGS_13_n28w100_20201228_5070_slope.tif',
                     r'/data02/gisdata/elev/10m/0/USGS_13_n29w100_20201228_5070_slope.tif']
         
-        for file in testList:
-            msgList = runRaster2pgsql(file,'slope','slope_junk')
-            
-            for msg in msgList:
-                print(f"\n{msg}")
+        msgList,failedFiles = runRaster2pgsqlBatches(testList,'slope','slope_junk')
+
+        for msg in msgList:
+            print(f"\n{msg}")
+
+        for file in failedFiles:
+            print(f"\nRerun: {file}")
             
     except:
         print(errorMsg())
\ No newline at end of file
@@ -0,0 +1,1032 @@
+# -*- coding: utf-8 -*-
+"""
+Script Name: DSHub_Footprints.py
+Created on Mon Oct 19 2026
+
+@author: Adolfo.Diaz
+GIS Business Analyst
+USDA - NRCS - SPSD - Soil Services and Information
+email address: adolfo.diaz@usda.gov
+cell: 608.215.7291
+
+The purpose of this module is to hold the data/nodata footprint stages that are shared by
+the footprint scripts (USGS_4_Create_Elevation_Spatial_Footprint*, footprints-ray and the
+v12/v14 ndras scripts).
+
+Data mask (createDataMask):
+    The footprint scripts used to read the entire DEM with band.ReadAsArray() and build the
+    data mask with np.where(arr > nd, 2, 1).  For a 10012 x 10012 1M DEM that is a 400 MB
+    float32 array plus an 800 MB int64 result for every worker.  createDataMask reads the DEM
+    in windows aligned to its internal block size (blk_xsize, blk_ysize), thresholds each
+    window and writes it to a Byte raster before reading the next one so a worker only holds
+    1 window (maxWindowBytes; 4 MB by default) no matter how large the DEM is.
+
+In-memory footprints (createFootprint, polygonizeMask, writeFootprints):
+    Every footprint used to cost a temp Byte GeoTIFF, a shapefile written by Polygonize, a
+    second shapefile written by an ogr2ogr subprocess to reproject it and a glob to delete
+    them.  The mask is now written to /vsimem/, polygonized into an OGR Memory layer and
+    reprojected in process with osr.CoordinateTransformation.  The footprint polygons are
+    returned as WKB (picklable, so they can be returned from threads, processes or Ray
+    workers) and the only thing written is the final output.
+
+Footprint attributes (createFootprintFeature):
+    The footprint writers used to polygonize first and then loop over every feature with
+    GetFeature/SetFeature to set the 31 catalog fields (or the tile_id) one at a time.  File
+    outputs now set the catalog fields once on a template feature that every polygon is
+    cloned from.  Database outputs only COPY (tile_id, "value", geom) into a staging table;
+    the catalog attributes are joined once in bulk with INSERT ... SELECT from the metadata
+    table (footprints-ray generate_q2).
+
+Reduced-resolution footprints (footprintRes):
+    Footprints are used at catalog scale but a 1M DEM polygonized at full resolution is a
+    staircase with tens of thousands of vertices that all have to be reprojected and stored.
+    With footprintRes (i.e. 30 for a 1M DEM) the mask is read decimated so it has 1 cell per
+    footprintRes; GDAL reads from the overviews of the DEM when it has them.  Every polygon is
+    then simplified on its own with SimplifyPreserveTopology (by 1 mask cell by default); a
+    polygon stays valid but the edges it shares with its neighbours are simplified separately
+    on each side, so with bDataOnly=False neighbouring data/nodata polygons can overlap or
+    leave gaps of up to the tolerance.
+
+Loading footprints (loadFootprints):
+    footprints-ray and the ndras scripts used to shell out 'shp2pgsql -a | psql' per DEM; 1
+    database connection and a stream of SQL INSERT text per DEM.  loadFootprints takes the
+    footprints as workers finish them and streams them as EWKB with a binary COPY over 1 pooled
+    connection (DSHub_Raster_Loader.createConnectionPool).  Rows are buffered and flushed as 1
+    COPY per batchBytes; each flush is 1 transaction.
+
+Merging footprints (mergeFootprints):
+    USGS_4 used to write a WGS84 shapefile per DEM and then append them into 1 merged
+    shapefile field by field with a SyncToDisk after every feature; the merge was also capped
+    by the 2 GB shapefile limit.  mergeFootprints writes a GeoPackage or FlatGeobuf and takes
+    the footprints as workers finish them (no per-DEM shapefiles).  Features are written in
+    large transactions and the spatial index is built once after the last feature.
+
+Two-tier footprints (catalogBboxFootprints, createTieredFootprint):
+    Most DEMs are full rectangles of data and their footprint is the rectangle that the
+    catalog already holds (rds_left, rds_right, rds_top, rds_bottom in epsg_code).  Tier 1 is
+    that bbox for every DEM, built from the catalog without opening a raster.  Tier 2, the
+    exact polygonized footprint, is only built for DEMs whose valid-pixel fraction is below
+    validFraction.  The fraction comes from 1 decimated read of the DEM (validPixelFraction;
+    from the overviews when it has them) so DEMs without irregular nodata edges skip the
+    mask and polygonize stages entirely.
+
+Executors (runFootprintTasks, benchmarkExecutors):
+    The footprint scripts each hardcoded how DEMs are spread over the CPUs; threads in USGS_4
+    MP, Ray plus threads in _splitFunctions, Ray in footprints-ray and v14, threads in v12.
+    runFootprintTasks runs any footprint function with the executor named in
+    footprintExecutors ('serial','threads','processes','ray') and yields the results as they
+    finish so the merge/load stages above consume them the same way.  benchmarkExecutors
+    times createFootprint over a sample of DEMs with every executor so the fastest one can be
+    picked per resolution (python DSHub_Footprints.py catalogFile [catalogFile ...]); the
+    sample is read once before timing and the executors are repeated in a random order so
+    the page cache favours none of them.
+"""
+
+## ========================================== Import modules ===============================================================
+import sys, os, traceback, time, uuid, struct, io, random
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+from osgeo import gdal, ogr, osr
+
+gdal.UseExceptions()
+
+# Binary COPY framing: signature, flags, header extension length / end of data
+COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+COPY_TRAILER = struct.pack('!h', -1)
+
+# Executors that runFootprintTasks can spread footprint tasks over
+footprintExecutors = ('serial', 'threads', 'processes', 'ray')
+
+# EWKB: geometry type flag that a 4 byte SRID follows the type
+EWKB_SRID_FLAG = 0x20000000
+
+# Catalog (master elevation file) fields written to footprint outputs and their OGR types
+catalogFields = {'poly_code':ogr.OFTString,
+                 'prod_title':ogr.OFTString,
+                 'pub_date':ogr.OFTDate,
+                 'lastupdate':ogr.OFTDate,
+                 'rds_size':ogr.OFTInteger,
+                 'format':ogr.OFTString,
+                 'sourceid':ogr.OFTString,
+                 'meta_url':ogr.OFTString,
+                 'downld_url':ogr.OFTString,
+                 'dem_name':ogr.OFTString,
+                 'dem_path':ogr.OFTString,
+                 'rds_column':ogr.OFTInteger,
+                 'rds_rows':ogr.OFTInteger,
+                 'bandCount':ogr.OFTInteger,
+                 'cellSize':ogr.OFTReal,
+                 'rdsformat':ogr.OFTString,
+                 'bitdepth':ogr.OFTString,
+                 'nodataval':ogr.OFTReal,
+                 'srs_type':ogr.OFTString,
+                 'epsg_code':ogr.OFTInteger,
+                 'srs_name':ogr.OFTString,
+                 'rds_top':ogr.OFTReal,
+                 'rds_left':ogr.OFTReal,
+                 'rds_right':ogr.OFTReal,
+                 'rds_bottom':ogr.OFTReal,
+                 'rds_min':ogr.OFTReal,
+                 'rds_mean':ogr.OFTReal,
+                 'rds_max':ogr.OFTReal,
+                 'rds_stdev':ogr.OFTReal,
+                 'blk_xsize':ogr.OFTInteger,
+                 'blk_ysize':ogr.OFTInteger}
+
+## ===================================================================================
+def AddMsgAndPrint(msg):
+
+    # Print message to python message console
+    print(msg)
+
+## ===================================================================================
+def errorMsg(errorOption=1):
+
+    """ By default, error messages will be printed immediately.
+        If errorOption is set to 2, return the message back to the function that it
+        was called from."""
+
+    try:
+
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        theMsg = "\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[1] + "\n\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[-1]
+
+        if errorOption==1:
+            AddMsgAndPrint(theMsg)
+        else:
+            return theMsg
+
+    except:
+        AddMsgAndPrint("Unhandled error in unHandledException method")
+        pass
+
+## ===================================================================================
+def iterBlockWindows(band, maxWindowBytes=4194304, multiple=1):
+    """ Generator of (xoff, yoff, xsize, ysize) windows that cover a band.  Windows are
+        aligned to the internal block size so every block is read once:
+            Tiled TIFF   (i.e. 256x256 blocks) - 1 or more whole blocks side by side
+            Striped TIFF (i.e. 10012x1 strips) - as many whole strips as fit in maxWindowBytes
+
+        multiple - window sizes are rounded up to a multiple of this (the decimation factor
+                   of createDataMask) so every window maps to whole cells of the mask
+    """
+
+    cols = band.XSize
+    rows = band.YSize
+    blkX,blkY = band.GetBlockSize()
+    blkX = min(blkX, cols)
+    blkY = min(blkY, rows)
+    pixelBytes = max(gdal.GetDataTypeSize(band.DataType) // 8, 1)
+
+    # Whole blocks per window; at least 1 block
+    blocksPerWindow = max(maxWindowBytes // (blkX * blkY * pixelBytes), 1)
+
+    if blkX >= cols:
+        # Strips: stack strips
+        winX = cols
+        winY = min(blkY * blocksPerWindow, rows)
+    else:
+        # Tiles: extend across a row of blocks first
+        winX = min(blkX * blocksPerWindow, cols)
+        winY = blkY
+
+    winX = -(-winX // multiple) * multiple
+    winY = -(-winY // multiple) * multiple
+
+    for yoff in range(0, rows, winY):
+        ysize = min(winY, rows - yoff)
+        for xoff in range(0, cols, winX):
+            yield xoff, yoff, min(winX, cols - xoff), ysize
+
+## ===================================================================================
+def getDataPixels(arr, threshold, noData=None):
+    """ Boolean array of the pixels of arr that are data: greater than threshold and not the
+        nodata value (NaN is never greater than threshold) """
+
+    bData = arr > threshold
+    if noData is not None and noData > threshold:
+        bData &= arr != noData
+
+    return bData
+
+## ===================================================================================
+def createDataMask(inputRaster, outputRaster, threshold=None, dataValue=2, nodataValue=1, band=1,
+                   driverName=None, creationOptions=None, maxWindowBytes=4194304, decimation=1):
+    """ Writes a Byte raster where every pixel of inputRaster greater than threshold is
+        dataValue and every other pixel (nodata, NaN) is nodataValue.  threshold defaults to
+        the nodata value of the band; if the band has no nodata value every pixel is data.
+        Like gdal_calc --calc="A>threshold", nodata pixels are never data even when the nodata
+        value is greater than threshold.
+
+        Same result as np.where(band.ReadAsArray() > nd, 2, 1) but the DEM is read and the mask
+        is written 1 block-aligned window at a time (see iterBlockWindows).  The mask is tiled
+        with the block size of the DEM when it is tiled.
+
+        inputRaster     - DEM path
+        outputRaster    - mask path; may be a /vsimem/ path
+        driverName      - GDAL driver of the mask; defaults to the driver of the DEM
+        creationOptions - list of creation options i.e. ['COMPRESS=LZW']
+        decimation      - 1 mask cell per decimation x decimation DEM cells.  Windows are read
+                          decimated (nearest neighbour; from the overviews of the DEM when it
+                          has them).  The last mask row/column may extend past the DEM by less
+                          than 1 mask cell.
+
+        returns {'cols','rows','dataPixels','windows','seconds'} of the mask
+    """
+
+    start = time.time()
+
+    ds = gdal.Open(inputRaster)
+    srcBand = ds.GetRasterBand(band)
+    cols = ds.RasterXSize
+    rows = ds.RasterYSize
+
+    decimation = max(int(decimation), 1)
+    maskCols = -(-cols // decimation)
+    maskRows = -(-rows // decimation)
+
+    noData = srcBand.GetNoDataValue()
+    if threshold is None:
+        threshold = noData
+
+    driver = gdal.GetDriverByName(driverName) if driverName else ds.GetDriver()
+    options = list(creationOptions or [])
+
+    # Keep the mask blocks lined up with the DEM blocks unless the tiling is set in options
+    blkX,blkY = srcBand.GetBlockSize()
+    if decimation == 1 and driver.ShortName == 'GTiff' and blkX < cols and blkX % 16 == 0 and blkY % 16 == 0 and \
+            not any(option.upper() in ('TILED=NO','TILED=FALSE') or option.upper().startswith('BLOCK') for option in options):
+        options = [option for option in options if not option.upper().startswith('TILED')]
+        options += ['TILED=YES', f'BLOCKXSIZE={blkX}', f'BLOCKYSIZE={blkY}']
+
+    geoTransform = list(ds.GetGeoTransform())
+    for i in (1, 2, 4, 5):
+        geoTransform[i] *= decimation
+
+    ods = driver.Create(outputRaster, maskCols, maskRows, 1, gdal.GDT_Byte, options)
+    ods.SetGeoTransform(geoTransform)
+    ods.SetProjection(ds.GetProjection())
+    outBand = ods.GetRasterBand(1)
+
+    dataPixels = 0
+    windows = 0
+
+    try:
+        for xoff,yoff,xsize,ysize in iterBlockWindows(srcBand, maxWindowBytes, decimation):
+            if decimation == 1:
+                arr = srcBand.ReadAsArray(xoff, yoff, xsize, ysize)
+            else:
+                arr = srcBand.ReadAsArray(xoff, yoff, xsize, ysize, buf_xsize=-(-xsize // decimation),
+                                          buf_ysize=-(-ysize // decimation))
+
+            mask = np.full(arr.shape, nodataValue, dtype=np.uint8)
+            if threshold is None:
+                mask[:] = dataValue
+                dataPixels += arr.size
+            else:
+                bData = getDataPixels(arr, threshold, noData)
+                mask[bData] = dataValue
+                dataPixels += int(np.count_nonzero(bData))
+
+            outBand.WriteArray(mask, xoff // decimation, yoff // decimation)
+            windows += 1
+
+        outBand.FlushCache()
+        ods.FlushCache()
+
+    finally:
+        outBand = None
+        ods = None
+        srcBand = None
+        ds = None
+
+    return {'cols':maskCols, 'rows':maskRows, 'dataPixels':dataPixels, 'windows':windows,
+            'seconds':round(time.time() - start, 3)}
+
+## ===================================================================================
+def getMemoryDriver():
+    """ OGR in-memory vector driver; 'MEM' as of GDAL 3.11, 'Memory' before that """
+
+    return ogr.GetDriverByName('MEM') or ogr.GetDriverByName('Memory')
+
+## ===================================================================================
+def getSpatialReference(srs):
+    """ osr.SpatialReference from an EPSG code or WKT with x,y (lon,lat) axis order """
+
+    spatialRef = osr.SpatialReference()
+    if isinstance(srs, int) or str(srs).isdigit():
+        spatialRef.ImportFromEPSG(int(srs))
+    else:
+        spatialRef.ImportFromWkt(srs)
+
+    spatialRef.SetAxisMappingStrategy(osr.OAMS_TRADITIONAL_GIS_ORDER)
+    return spatialRef
+
+## ===================================================================================
+def polygonizeMask(maskRaster, outputEPSG=None, bDataOnly=True, band=1, simplifyTolerance=None):
+    """ Polygonizes a mask raster (a file or /vsimem/ path) into an OGR Memory layer and
+        returns its polygons reprojected to outputEPSG (the mask SRS if None).
+
+        bDataOnly - 0 pixels are masked out so only the data polygons are returned; the
+                    mask must use 0 for nodata.  Otherwise every value gets polygons.
+        simplifyTolerance - SimplifyPreserveTopology tolerance in mask SRS units applied to
+                    each polygon on its own before it is reprojected; shared edges are not
+                    kept shared.  None or 0 does not simplify
+
+        returns ([{'value','wkb'}], WKT of the output SRS)
+    """
+
+    ds = gdal.Open(maskRaster)
+    maskBand = ds.GetRasterBand(band)
+    srcSRS = getSpatialReference(ds.GetProjection())
+
+    memDS = getMemoryDriver().CreateDataSource('footprint')
+    memLayer = memDS.CreateLayer('footprint', srs=srcSRS, geom_type=ogr.wkbPolygon)
+    memLayer.CreateField(ogr.FieldDefn('value', ogr.OFTInteger))
+
+    gdal.Polygonize(maskBand, maskBand if bDataOnly else None, memLayer, 0, [], callback=None)
+
+    dstSRS = srcSRS
+    transform = None
+    if outputEPSG:
+        dstSRS = getSpatialReference(int(outputEPSG))
+        if not srcSRS.IsSame(dstSRS):
+            transform = osr.CoordinateTransformation(srcSRS, dstSRS)
+
+    footprints = list()
+    for feature in memLayer:
+        geom = feature.GetGeometryRef()
+        if simplifyTolerance:
+            geom = geom.SimplifyPreserveTopology(simplifyTolerance)
+        if transform:
+            geom.Transform(transform)
+        footprints.append({'value':feature.GetField(0), 'wkb':bytes(geom.ExportToWkb())})
+
+    memLayer = None
+    memDS = None
+    maskBand = None
+    ds = None
+
+    return footprints, dstSRS.ExportToWkt()
+
+## ===================================================================================
+def createFootprint(demPath, outputEPSG=None, threshold=None, dataValue=1, nodataValue=0, bDataOnly=True,
+                    maxWindowBytes=4194304, footprintRes=None, simplifyTolerance=None):
+    """ Data/nodata footprint of a DEM built entirely in memory: the mask (createDataMask)
+        is written to /vsimem/, polygonized into a Memory layer and reprojected to outputEPSG.
+        Nothing is written to disk.
+
+        threshold  - pixels greater than threshold are data; defaults to the nodata value
+                     (USGS_4 uses rds_min floored to 100; the gdal_calc "A>calcValue" mask)
+        bDataOnly  - only return data polygons (nodataValue must be 0)
+        footprintRes      - cell size of the mask in DEM units i.e. 30 for a 1M DEM; None
+                            builds the mask at the resolution of the DEM
+        simplifyTolerance - SimplifyPreserveTopology tolerance in DEM units; defaults to 1
+                            mask cell when footprintRes is set.  0 does not simplify.
+
+        returns {'footprints':[{'value','wkb'}],'srs':WKT,'cols','rows','dataPixels','decimation','seconds'}
+    """
+
+    start = time.time()
+
+    decimation = 1
+    if footprintRes:
+        ds = gdal.Open(demPath)
+        cellSize = abs(ds.GetGeoTransform()[1])
+        ds = None
+
+        decimation = max(int(round(float(footprintRes) / cellSize)), 1)
+        if simplifyTolerance is None:
+            simplifyTolerance = cellSize * decimation
+
+    maskPath = f"/vsimem/{uuid.uuid4().hex}_{os.path.splitext(os.path.basename(demPath))[0]}_mask.tif"
+
+    try:
+        # /vsimem/ is RAM and is not limited by GDAL_CACHEMAX; a compressed tiled Byte mask of
+        # a mostly uniform DEM is a few MB instead of 1 byte per cell
+        maskInfo = createDataMask(demPath, maskPath, threshold, dataValue, nodataValue, driverName='GTiff',
+                                  creationOptions=['COMPRESS=DEFLATE', 'TILED=YES'],
+                                  maxWindowBytes=maxWindowBytes, decimation=decimation)
+        footprints,srsWkt = polygonizeMask(maskPath, outputEPSG, bDataOnly, simplifyTolerance=simplifyTolerance)
+
+    finally:
+        gdal.Unlink(maskPath)
+
+    return {'footprints':footprints, 'srs':srsWkt, 'cols':maskInfo['cols'], 'rows':maskInfo['rows'],
+            'dataPixels':maskInfo['dataPixels'], 'decimation':decimation, 'seconds':round(time.time() - start, 3)}
+
+## ===================================================================================
+def bboxFootprint(attributes, outputEPSG=None, dataValue=1, densifyPoints=16):
+    """ Tier 1 footprint of a DEM: the rectangle of its catalog record (rds_left, rds_right,
+        rds_top, rds_bottom in epsg_code) reprojected to outputEPSG.  Every edge is densified
+        to densifyPoints segments first so it follows the curve of the reprojected edge.
+
+        returns ([{'value','wkb'}], WKT of the output SRS) like polygonizeMask
+    """
+
+    fields = {field.lower():value for field,value in attributes.items()}
+    left,right,top,bottom = [float(fields[field]) for field in ('rds_left','rds_right','rds_top','rds_bottom')]
+
+    if not (right > left and top > bottom):
+        raise ValueError(f"Invalid catalog extent: left {left}, right {right}, top {top}, bottom {bottom}")
+
+    ring = ogr.Geometry(ogr.wkbLinearRing)
+    for x,y in ((left,top), (right,top), (right,bottom), (left,bottom), (left,top)):
+        ring.AddPoint_2D(x, y)
+
+    geom = ogr.Geometry(ogr.wkbPolygon)
+    geom.AddGeometry(ring)
+
+    srcSRS = getSpatialReference(int(float(fields['epsg_code'])))
+    dstSRS = srcSRS
+
+    if outputEPSG:
+        dstSRS = getSpatialReference(int(outputEPSG))
+        if not srcSRS.IsSame(dstSRS):
+            geom.Segmentize(max(right - left, top - bottom) / densifyPoints)
+            geom.Transform(osr.CoordinateTransformation(srcSRS, dstSRS))
+
+    return [{'value':dataValue, 'wkb':bytes(geom.ExportToWkb())}], dstSRS.ExportToWkt()
+
+## ===================================================================================
+def catalogBboxFootprints(records, outputEPSG=None, dataValue=1, invalidRecords=None):
+    """ Generator of the tier 1 (bbox) footprints of every catalog record; no raster is
+        opened.  The output can be handed straight to mergeFootprints.
+
+        records        - catalog records as dictionaries (DSHub_Registration_Jobs.readCatalogRecords)
+        invalidRecords - list that (record, reason) of every record without a valid extent
+                         is appended to
+
+        yields (record, footprints)
+    """
+
+    for record in records:
+        try:
+            footprints,srsWkt = bboxFootprint(record, outputEPSG, dataValue)
+        except Exception as e:
+            if invalidRecords is not None:
+                invalidRecords.append((record, str(e)))
+            continue
+
+        yield record, footprints
+
+## ===================================================================================
+def validPixelFraction(demPath, threshold=None, band=1, sampleSize=512):
+    """ Fraction of the pixels of a DEM that are data (getDataPixels) from 1 read decimated
+        to at most sampleSize x sampleSize cells.  GDAL answers the read from the overviews
+        of the DEM when it has them.  threshold defaults to the nodata value. """
+
+    ds = gdal.Open(demPath)
+    srcBand = ds.GetRasterBand(band)
+    cols = ds.RasterXSize
+    rows = ds.RasterYSize
+
+    try:
+        noData = srcBand.GetNoDataValue()
+        if threshold is None:
+            threshold = noData
+
+        scale = max(cols / sampleSize, rows / sampleSize, 1)
+        arr = srcBand.ReadAsArray(0, 0, cols, rows, buf_xsize=max(int(cols / scale), 1),
+                                  buf_ysize=max(int(rows / scale), 1))
+
+        if threshold is None:
+            return 1.0 if arr.dtype.kind != 'f' else float(np.count_nonzero(~np.isnan(arr))) / arr.size
+
+        return float(np.count_nonzero(getDataPixels(arr, threshold, noData))) / arr.size
+
+    finally:
+        srcBand = None
+        ds = None
+
+## ===================================================================================
+def createTieredFootprint(demPath, attributes, outputEPSG=None, validFraction=0.999, threshold=None,
+                          dataValue=1, sampleSize=512, **footprintOptions):
+    """ Tier 1 (catalog bbox) footprint of a DEM if at least validFraction of its pixels are
+        data; otherwise the tier 2 (exact) footprint of createFootprint.  validFraction None
+        always builds the exact footprint.
+
+        attributes       - catalog record of the DEM (bboxFootprint)
+        footprintOptions - passed to createFootprint (nodataValue, bDataOnly, footprintRes ...)
+
+        returns {'footprints','srs','tier','validFraction','seconds'}; tier 2 also has the
+        keys of createFootprint
+    """
+
+    start = time.time()
+    fraction = None
+
+    if validFraction is not None:
+        fraction = validPixelFraction(demPath, threshold, sampleSize=sampleSize)
+
+        if fraction >= validFraction:
+            footprints,srsWkt = bboxFootprint(attributes, outputEPSG, dataValue)
+            return {'footprints':footprints, 'srs':srsWkt, 'tier':1, 'validFraction':fraction,
+                    'seconds':round(time.time() - start, 3)}
+
+    footprint = createFootprint(demPath, outputEPSG, threshold, dataValue, **footprintOptions)
+    footprint.update({'tier':2, 'validFraction':fraction, 'seconds':round(time.time() - start, 3)})
+    return footprint
+
+## ===================================================================================
+def createFootprintFeature(layerDefn, attributes=None, fields=None):
+    """ Template feature with the attributes shared by every polygon of a DEM (the catalog
+        record) already set.  Footprint writers Clone() it for each polygon so the catalog
+        fields are set once per DEM instead of once per polygon.
+
+        attributes - {field name: value}; field names are matched without regard to case
+                     (i.e. the catalog header 'bandcount' sets 'bandCount').  Values that are
+                     empty or 'None' are left null.
+        fields     - field names to set; defaults to every field of layerDefn
+    """
+
+    feature = ogr.Feature(layerDefn)
+    if not attributes:
+        return feature
+
+    attributeValues = {str(fieldName).lower():value for fieldName,value in attributes.items()}
+
+    if fields is None:
+        fields = [layerDefn.GetFieldDefn(i).GetName() for i in range(layerDefn.GetFieldCount())]
+
+    for fieldName in fields:
+        value = attributeValues.get(fieldName.lower())
+        if not value in (None, '', 'None'):
+            feature.SetField(layerDefn.GetFieldIndex(fieldName), value)
+
+    return feature
+
+## ===================================================================================
+def writeFootprints(outPath, footprints, srs, attributes=None, fields=None, valueField='rastValue',
+                    driverName='ESRI Shapefile'):
+    """ Writes footprint polygons (createFootprint) to a new vector file.  The catalog
+        attributes are set once on a template feature (createFootprintFeature) that every
+        polygon is cloned from; there is no GetFeature/SetFeature pass after the polygons
+        are written.
+
+        srs        - WKT or EPSG code of the footprints
+        attributes - {field name: value} written to every polygon i.e. the catalog record of the DEM
+        fields     - {field name: OGR type}; defaults to catalogFields
+        valueField - field that gets the mask value of each polygon
+
+        returns the number of polygons written
+    """
+
+    fields = catalogFields if fields is None else fields
+
+    driver = ogr.GetDriverByName(driverName)
+    if os.path.exists(outPath):
+        driver.DeleteDataSource(outPath)
+
+    outDS = driver.CreateDataSource(outPath)
+    outLayer = outDS.CreateLayer(os.path.splitext(os.path.basename(outPath))[0], srs=getSpatialReference(srs),
+                                 geom_type=ogr.wkbPolygon)
+
+    for fieldName,fieldType in fields.items():
+        outLayer.CreateField(ogr.FieldDefn(fieldName, fieldType))
+    if valueField:
+        outLayer.CreateField(ogr.FieldDefn(valueField, ogr.OFTInteger))
+
+    outLayerDefn = outLayer.GetLayerDefn()
+    valueIndex = outLayerDefn.GetFieldIndex(valueField) if valueField else -1
+
+    # Attribute values are the same for every polygon of the DEM
+    template = createFootprintFeature(outLayerDefn, attributes, list(fields))
+
+    outLayer.StartTransaction()
+
+    for footprint in footprints:
+        feature = template.Clone()
+        if valueIndex >= 0:
+            feature.SetField(valueIndex, footprint['value'])
+        feature.SetGeometryDirectly(ogr.CreateGeometryFromWkb(footprint['wkb']))
+        outLayer.CreateFeature(feature)
+        feature = None
+
+    outLayer.CommitTransaction()
+
+    template = None
+    outLayer = None
+    outDS = None
+
+    return len(footprints)
+
+## ===================================================================================
+def getMergeDriver(outPath):
+    """ OGR driver name of a merged footprint file from its extension """
+
+    ext = os.path.splitext(outPath)[1].lower()
+    if ext == '.fgb':
+        return 'FlatGeobuf'
+    if ext == '.shp':
+        return 'ESRI Shapefile'
+    return 'GPKG'
+
+## ===================================================================================
+def readFootprintFile(inPath, valueField='rastValue'):
+    """ Reads a per-DEM footprint file (writeFootprints) back into the (attributes, footprints)
+        that mergeFootprints takes; used to merge footprints written by earlier runs.
+        The attributes are read from the first feature. """
+
+    ds = ogr.Open(inPath)
+    layer = ds.GetLayer(0)
+    layerDefn = layer.GetLayerDefn()
+    valueIndex = layerDefn.GetFieldIndex(valueField)
+
+    attributes = dict()
+    footprints = list()
+
+    for feature in layer:
+        if not attributes:
+            attributes = {layerDefn.GetFieldDefn(i).GetName():feature.GetField(i)
+                          for i in range(layerDefn.GetFieldCount()) if i != valueIndex}
+        footprints.append({'value':feature.GetField(valueIndex) if valueIndex >= 0 else None,
+                           'wkb':bytes(feature.GetGeometryRef().ExportToWkb())})
+
+    layer = None
+    ds = None
+
+    return attributes, footprints
+
+## ===================================================================================
+def mergeFootprints(outPath, tileFootprints, srs, fields=None, valueField='rastValue', transactionSize=100000):
+    """ Streams the footprints of many DEMs into 1 GeoPackage (.gpkg) or FlatGeobuf (.fgb).
+        tileFootprints is consumed as it is produced so the footprints can come straight
+        from workers as they finish.
+
+        tileFootprints  - iterable of (attributes, footprints); attributes are the catalog
+                          record of the DEM, footprints are the polygons of createFootprint
+                          in srs
+        srs             - WKT or EPSG code of the footprints
+        fields          - {field name: OGR type}; defaults to catalogFields
+        transactionSize - features written per transaction
+
+        The spatial index is not maintained while features are written: GeoPackage builds
+        its R-tree with CreateSpatialIndex after the last feature and FlatGeobuf writes its
+        packed Hilbert R-tree when the file is closed.
+
+        returns {'path','tiles','features','seconds'}
+    """
+
+    start = time.time()
+    fields = catalogFields if fields is None else fields
+    driverName = getMergeDriver(outPath)
+    layerName = os.path.splitext(os.path.basename(outPath))[0]
+
+    driver = ogr.GetDriverByName(driverName)
+    if os.path.exists(outPath):
+        driver.DeleteDataSource(outPath)
+
+    outDS = driver.CreateDataSource(outPath)
+    outLayer = outDS.CreateLayer(layerName, srs=getSpatialReference(srs), geom_type=ogr.wkbPolygon,
+                                 options=['SPATIAL_INDEX=NO'] if driverName == 'GPKG' else [])
+
+    for fieldName,fieldType in fields.items():
+        outLayer.CreateField(ogr.FieldDefn(fieldName, fieldType))
+    if valueField:
+        outLayer.CreateField(ogr.FieldDefn(valueField, ogr.OFTInteger))
+
+    outLayerDefn = outLayer.GetLayerDefn()
+    valueIndex = outLayerDefn.GetFieldIndex(valueField) if valueField else -1
+    bTransactions = outDS.TestCapability(ogr.ODsCTransactions)
+
+    tiles = 0
+    features = 0
+    pending = 0
+
+    try:
+        if bTransactions:
+            outDS.StartTransaction()
+
+        for attributes,footprints in tileFootprints:
+            template = createFootprintFeature(outLayerDefn, attributes, list(fields))
+
+            for footprint in footprints:
+                feature = template.Clone()
+                if valueIndex >= 0:
+                    feature.SetField(valueIndex, footprint['value'])
+                feature.SetGeometryDirectly(ogr.CreateGeometryFromWkb(footprint['wkb']))
+                outLayer.CreateFeature(feature)
+                feature = None
+                pending += 1
+
+            tiles += 1
+            features += len(footprints)
+
+            if bTransactions and pending >= transactionSize:
+                outDS.CommitTransaction()
+                outDS.StartTransaction()
+                pending = 0
+
+        if bTransactions:
+            outDS.CommitTransaction()
+
+        if driverName == 'GPKG':
+            geomColumn = outLayer.GetGeometryColumn() or 'geom'
+            outDS.ExecuteSQL(f"SELECT CreateSpatialIndex('{layerName}', '{geomColumn}')")
+
+    finally:
+        outLayer = None
+        outDS = None
+
+    return {'path':outPath, 'tiles':tiles, 'features':features, 'seconds':round(time.time() - start, 3)}
+
+## ===================================================================================
+def footprintEWKB(wkb, srid):
+    """ Little endian EWKB MultiPolygon with srid from the WKB of a Polygon or MultiPolygon
+        (polygonizeMask).  This is what the binary input of the PostGIS geometry type reads. """
+
+    byteOrder = '<' if wkb[0] == 1 else '>'
+    geomType = struct.unpack(f'{byteOrder}I', wkb[1:5])[0] % 1000
+
+    if geomType == 3:
+        # Polygon: MultiPolygon of 1 part; the part keeps its own WKB header
+        return struct.pack('<BIII', 1, 6 | EWKB_SRID_FLAG, int(srid), 1) + wkb
+
+    if geomType == 6:
+        numParts = struct.unpack(f'{byteOrder}I', wkb[5:9])[0]
+        return struct.pack('<BIII', 1, 6 | EWKB_SRID_FLAG, int(srid), numParts) + wkb[9:]
+
+    raise ValueError(f"Footprint geometry type {geomType} is not a Polygon or MultiPolygon")
+
+## ===================================================================================
+def footprintCopyRows(tileID, footprints, srid):
+    """ Binary COPY tuples (tile_id, "value", geom) of the footprint polygons of 1 DEM """
+
+    tileBytes = tileID.encode('utf-8')
+    tileField = struct.pack('!hi', 3, len(tileBytes)) + tileBytes
+
+    for footprint in footprints:
+        ewkb = footprintEWKB(footprint['wkb'], srid)
+        yield tileField + struct.pack('!iii', 4, footprint['value'], len(ewkb)) + ewkb
+
+## ===================================================================================
+def copyFootprintBatch(connPool, table, buffer, tileIDs, rows):
+    """ COPYs 1 buffer of binary tuples (footprintCopyRows) into table in 1 transaction.
+
+        returns {'tiles':[tileIDs],'rows','bytes','status':'Success'|'Error','seconds','error'}
+    """
+
+    start = time.time()
+    result = {'tiles':tileIDs, 'rows':rows, 'bytes':buffer.tell(), 'status':'Success', 'seconds':0, 'error':None}
+
+    buffer.write(COPY_TRAILER)
+    buffer.seek(0)
+
+    conn = connPool.getconn()
+    try:
+        with conn.cursor() as cursor:
+            cursor.copy_expert(f'COPY {table} (tile_id, "value", geom) FROM STDIN WITH (FORMAT binary)', buffer)
+        conn.commit()
+
+    except:
+        conn.rollback()
+        result.update({'status':'Error', 'rows':0, 'error':errorMsg(errorOption=2)})
+
+    finally:
+        connPool.putconn(conn)
+
+    result['seconds'] = round(time.time() - start, 3)
+    return result
+
+## ===================================================================================
+def loadFootprints(tileFootprints, dbParams, table, srid, batchBytes=8388608, connPool=None):
+    """ Generator that streams footprints into table (i.e. metadata.conus_elevation_1m_5070_footprint)
+        with binary COPY over 1 pooled connection.  Rows are flushed as 1 COPY every batchBytes.
+
+        tileFootprints - iterable of (tileID, footprints) i.e. consumed as workers finish;
+                         footprints are the polygons of createFootprint in srid
+        table          - footprint table with tile_id varchar, "value" integer and a
+                         MultiPolygon geom column in srid
+
+        yields 1 result dictionary per COPY (see copyFootprintBatch)
+    """
+
+    bClosePool = connPool is None
+    if bClosePool:
+        from DSHub_Raster_Loader import createConnectionPool
+        connPool = createConnectionPool(dbParams)
+
+    try:
+        buffer = io.BytesIO()
+        buffer.write(COPY_HEADER)
+        tileIDs = list()
+        rows = 0
+
+        for tileID,footprints in tileFootprints:
+            for row in footprintCopyRows(tileID, footprints, srid):
+                buffer.write(row)
+                rows += 1
+            tileIDs.append(tileID)
+
+            if buffer.tell() >= batchBytes:
+                yield copyFootprintBatch(connPool, table, buffer, tileIDs, rows)
+
+                buffer = io.BytesIO()
+                buffer.write(COPY_HEADER)
+                tileIDs = list()
+                rows = 0
+
+        if tileIDs:
+            yield copyFootprintBatch(connPool, table, buffer, tileIDs, rows)
+
+    finally:
+        if bClosePool:
+            connPool.closeall()
+
+## ===================================================================================
+def runFootprintTasks(func, argsList, executor='threads', maxWorkers=None, maxInFlight=None):
+    """ Generator that runs func(*args) for every args in argsList with executor and yields
+        the results in the order they finish.  At most maxInFlight tasks are submitted and not
+        yet yielded at a time so argsList can be a generator of millions of DEMs without
+        holding a future (or Ray ObjectRef) and its result for every one of them.
+
+        func        - module level function so it can be pickled for 'processes' and 'ray'
+        executor    - 'serial', 'threads' (ThreadPoolExecutor), 'processes' (ProcessPoolExecutor)
+                      or 'ray' (ray is initialized with maxWorkers CPUs if it isn't yet)
+        maxWorkers  - number of workers; cpu count by default
+        maxInFlight - tasks running or queued at a time; 2 x maxWorkers by default
+    """
+
+    if executor not in footprintExecutors:
+        raise ValueError(f"Unknown footprint executor: {executor}; use one of {footprintExecutors}")
+
+    maxWorkers = maxWorkers or os.cpu_count()
+    maxInFlight = maxInFlight or maxWorkers * 2
+    pending = iter(argsList)
+
+    if executor == 'serial':
+        for args in pending:
+            yield func(*args)
+
+    elif executor == 'ray':
+        import ray
+
+        if not ray.is_initialized():
+            ray.init(num_cpus=maxWorkers)
+
+        remoteFunc = ray.remote(func)
+        inFlight = list()
+
+        while True:
+            # Top up the window
+            while len(inFlight) < maxInFlight:
+                args = next(pending, None)
+                if args is None:
+                    break
+                inFlight.append(remoteFunc.remote(*args))
+
+            if not inFlight:
+                break
+
+            done, inFlight = ray.wait(inFlight, num_returns=1)
+            yield ray.get(done[0])
+
+    else:
+        poolExecutor = ThreadPoolExecutor if executor == 'threads' else ProcessPoolExecutor
+
+        with poolExecutor(max_workers=maxWorkers) as pool:
+            inFlight = set()
+
+            while True:
+                while len(inFlight) < maxInFlight:
+                    args = next(pending, None)
+                    if args is None:
+                        break
+                    inFlight.add(pool.submit(func, *args))
+
+                if not inFlight:
+                    break
+
+                done, inFlight = wait(inFlight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+## ===================================================================================
+def timeFootprint(demPath, footprintOptions):
+    """ createFootprint of 1 DEM for benchmarkExecutors.  Errors are returned instead of
+        raised so 1 bad DEM doesn't stop the benchmark.
+
+        returns {'dem','status','polygons','seconds','error'}
+    """
+
+    start = time.time()
+    try:
+        footprint = createFootprint(demPath, **footprintOptions)
+        return {'dem':demPath, 'status':'Success', 'polygons':len(footprint['footprints']),
+                'seconds':round(time.time() - start, 3), 'error':None}
+    except:
+        return {'dem':demPath, 'status':'Error', 'polygons':0,
+                'seconds':round(time.time() - start, 3), 'error':errorMsg(errorOption=2)}
+
+## ===================================================================================
+def benchmarkExecutors(demPaths, executors=footprintExecutors, maxWorkers=None, repeats=3, bWarmUp=True,
+                       seed=None, **footprintOptions):
+    """ Creates the footprints of demPaths (a sample of DEMs of 1 resolution) with every
+        executor and measures:
+            seconds      - median wall time of all DEMs over the repeats
+            runs         - wall time of every repeat
+            demsPerSecond
+            demSeconds   - mean time of 1 DEM inside its worker
+            polygons     - total footprint polygons (the same for every executor)
+            failed       - DEMs that raised an error
+
+        The sample is read once with 'threads' before anything is timed (bWarmUp) so the page
+        cache is equally warm for every executor, and the executors run in a random order
+        (random.Random(seed)) in every one of the repeats so none of them is always first or
+        last.  Ray is started before the timer so ray.init isn't charged to 'ray'.
+
+        footprintOptions are passed to createFootprint (outputEPSG, footprintRes ...)
+
+        returns a list of result dictionaries; 1 per executor
+    """
+
+    argsList = [(demPath, footprintOptions) for demPath in demPaths]
+    results = {executor: {'executor':executor, 'dems':len(demPaths), 'failed':0, 'polygons':0, 'seconds':0,
+                          'runs':list(), 'demsPerSecond':0, 'demSeconds':0, 'error':None} for executor in executors}
+    demSeconds = {executor: list() for executor in executors}
+
+    if bWarmUp:
+        list(runFootprintTasks(timeFootprint, argsList, 'threads', maxWorkers))
+
+    if 'ray' in executors:
+        try:
+            import ray
+            if not ray.is_initialized():
+                ray.init(num_cpus=maxWorkers or os.cpu_count())
+        except:
+            results['ray']['error'] = errorMsg(errorOption=2)
+
+    order = list(executors)
+    shuffle = random.Random(seed).shuffle
+
+    for i in range(repeats):
+        shuffle(order)
+
+        for executor in order:
+            result = results[executor]
+            if result['error']:
+                continue
+
+            start = time.time()
+            try:
+                demResults = list(runFootprintTasks(timeFootprint, argsList, executor, maxWorkers))
+                result['runs'].append(round(time.time() - start, 3))
+                result['failed'] = len([r for r in demResults if r['status'] == 'Error'])
+                result['polygons'] = sum(r['polygons'] for r in demResults)
+                demSeconds[executor] += [r['seconds'] for r in demResults]
+
+            except:
+                result['error'] = errorMsg(errorOption=2)
+
+    for executor, result in results.items():
+        if result['runs']:
+            runs = sorted(result['runs'])
+            mid = len(runs) // 2
+            result['seconds'] = runs[mid] if len(runs) % 2 else round((runs[mid - 1] + runs[mid]) / 2, 3)
+            result['demSeconds'] = round(sum(demSeconds[executor]) / max(len(demSeconds[executor]), 1), 3)
+            result['demsPerSecond'] = round(len(demPaths) / result['seconds'], 3) if result['seconds'] else 0
+
+    return list(results.values())
+
+## ===================================================================================
+def benchmarkSummary(results):
+    """ Returns a list of messages with 1 line per benchmarked executor; fastest first """
+
+    msgs = list()
+    for r in sorted(results, key=lambda r: (r['error'] is not None, r['seconds'])):
+        if r['error']:
+            msgs.append(f"\t{r['executor']:<10} FAILED: {r['error']}")
+            continue
+
+        msgs.append(f"\t{r['executor']:<10} DEMs: {r['dems']:<6,} Failed: {r['failed']:<6,} Seconds: {r['seconds']:<10} "
+                    f"DEMs/sec: {r['demsPerSecond']:<8} Mean DEM: {r['demSeconds']} sec  Polygons: {r['polygons']:,}  Runs: {r['runs']}")
+
+    return msgs
+
+## ====================================== Main Body ==================================
+def main(catalogFiles, sampleSize=50, executors=footprintExecutors, maxWorkers=None, outputEPSG=4326, footprintRes=None):
+    """ Benchmarks every executor on a random sample of sampleSize DEMs of each catalog
+        (master elevation) file; 1 catalog file per resolution. """
+
+    from DSHub_Registration_Jobs import readCatalogRecords
+
+    try:
+        for catalogFile in catalogFiles:
+            demPaths = [f"{record['dem_path']}{os.sep}{record['dem_name']}" for record in readCatalogRecords(catalogFile)]
+            demPaths = random.Random(1).sample(demPaths, min(sampleSize, len(demPaths)))
+
+            AddMsgAndPrint(f"\nBenchmarking footprint executors on {len(demPaths):,} DEMs of {os.path.basename(catalogFile)}")
+            results = benchmarkExecutors(demPaths, executors, maxWorkers, outputEPSG=outputEPSG, footprintRes=footprintRes)
+
+            for msg in benchmarkSummary(results):
+                AddMsgAndPrint(msg)
+
+    except:
+        errorMsg()
+
+if __name__ == '__main__':
+
+    # python DSHub_Footprints.py /data/USGS_3DEP_1M_Metadata_Elevation.txt /data/USGS_3DEP_3M_Metadata_Elevation.txt
+    main(sys.argv[1:])
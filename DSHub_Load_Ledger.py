@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+"""
+Script Name: DSHub_Load_Ledger.py
+Created on Mon Oct 19 2026
+
+@author: Adolfo.Diaz
+GIS Business Analyst
+USDA - NRCS - SPSD - Soil Services and Information
+email address: adolfo.diaz@usda.gov
+cell: 608.215.7291
+
+The purpose of this module is to keep a durable record of the load state of every DEM that
+USGS_3_Execute_raster2pgsql_fromFile (and its Ray variant) registers in the database so that
+a load that crashes or is killed mid-run can be restarted without re-running everything.
+Re-running a raster2pgsql -a command appends the tiles a second time so completed DEMs must
+be skipped and partially loaded DEMs must be cleaned up first.
+
+The ledger is a SQLite file that sits next to the raster2pgsql command file.  Every DEM is
+recorded by raster path and target table with one of the following states:
+    'loading'  - the DEM was handed to a loader; its rows may or may not be in the database
+    'complete' - the DEM loaded successfully; rows = number of tiles inserted
+    'failed'   - the loader reported an error; the DEM is retried on the next run
+
+How a restart works (filterLedgerJobs):
+    1) 'complete' DEMs are skipped.
+    2) New DEMs are loaded.
+    3) 'loading' and 'failed' DEMs are verified against the target table with 1 GROUP BY
+       query per table.  If the number of tiles in the table matches the number of tiles the
+       DEM creates the DEM is marked complete and skipped; if there are no tiles it is loaded;
+       if only some of the tiles made it the partial rows are deleted and the DEM is loaded
+       again.
+
+DEMs are marked 'loading' per batch right before the batch starts so only the batches that
+were running when a load stopped need to be verified.
+
+All functions are thread safe so they can be called from within ThreadPoolExecutor workers.
+"""
+
+## ========================================== Import modules ===============================================================
+import sys, os, traceback, sqlite3, threading
+from datetime import datetime
+
+import psycopg2
+
+from DSHub_Raster_Loader import getRasterHeader, getTileCount
+
+ledgerLock = threading.Lock()
+ledgerConn = None       # sqlite3 connection to the ledger file
+
+## ===================================================================================
+def AddMsgAndPrint(msg):
+
+    # Print message to python message console
+    print(msg)
+
+## ===================================================================================
+def errorMsg(errorOption=1):
+
+    """ By default, error messages will be printed immediately.
+        If errorOption is set to 2, return the message back to the function that it
+        was called from."""
+
+    try:
+
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        theMsg = "\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[1] + "\n\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[-1]
+
+        if errorOption==1:
+            AddMsgAndPrint(theMsg)
+        else:
+            return theMsg
+
+    except:
+        AddMsgAndPrint("Unhandled error in unHandledException method")
+        pass
+
+## ===================================================================================
+def openLoadLedger(ledgerFile):
+    """ Opens (creates if needed) the SQLite ledger file.  Returns the number of DEMs
+        already recorded in the ledger."""
+
+    global ledgerConn
+
+    with ledgerLock:
+        if ledgerConn is not None:
+            ledgerConn.close()
+
+        ledgerConn = sqlite3.connect(ledgerFile, check_same_thread=False)
+        ledgerConn.execute("PRAGMA journal_mode=WAL")
+        ledgerConn.execute("""CREATE TABLE IF NOT EXISTS load_ledger (
+                                  raster TEXT NOT NULL,
+                                  target TEXT NOT NULL,
+                                  state TEXT NOT NULL,
+                                  rows INTEGER DEFAULT 0,
+                                  expected_rows INTEGER,
+                                  attempts INTEGER DEFAULT 0,
+                                  cmd TEXT,
+                                  error TEXT,
+                                  updated TEXT,
+                                  PRIMARY KEY (raster, target))""")
+        ledgerConn.commit()
+
+        recCount = ledgerConn.execute("SELECT COUNT(*) FROM load_ledger").fetchone()[0]
+
+    AddMsgAndPrint(f"\tLoad Ledger: {ledgerFile} -- {recCount:,} DEMs recorded")
+    return recCount
+
+## ===================================================================================
+def closeLoadLedger():
+
+    global ledgerConn
+
+    with ledgerLock:
+        if ledgerConn is not None:
+            ledgerConn.close()
+            ledgerConn = None
+
+## ===================================================================================
+def getTarget(job):
+    """ 'schema.table' that a job loads into """
+
+    return f"{job['schema']}.{job['table']}"
+
+## ===================================================================================
+def getLedgerStates(jobs):
+    """ Returns the ledger record of every job that is in the ledger:
+        {(raster,target): {'state','rows','expected_rows','attempts'}}"""
+
+    ledgerDict = dict()
+
+    with ledgerLock:
+        for raster,target,state,rows,expectedRows,attempts in ledgerConn.execute(
+                "SELECT raster, target, state, rows, expected_rows, attempts FROM load_ledger"):
+            ledgerDict[(raster,target)] = {'state':state, 'rows':rows, 'expected_rows':expectedRows, 'attempts':attempts}
+
+    return {(job['raster'],getTarget(job)): ledgerDict[(job['raster'],getTarget(job))]
+            for job in jobs if (job['raster'],getTarget(job)) in ledgerDict}
+
+## ===================================================================================
+def markLoadStarted(jobs):
+    """ Records jobs as 'loading' and increments their number of attempts.  Must be called
+        right before the jobs are handed to a loader; per batch, so DEMs that never started
+        are not left 'loading' after a crash."""
+
+    now = datetime.now().isoformat(timespec='seconds')
+
+    with ledgerLock:
+        ledgerConn.executemany("""INSERT INTO load_ledger (raster, target, state, expected_rows, attempts, cmd, updated)
+                                  VALUES (?, ?, 'loading', ?, 1, ?, ?)
+                                  ON CONFLICT (raster, target) DO UPDATE SET
+                                      state = 'loading', attempts = attempts + 1, error = NULL,
+                                      expected_rows = COALESCE(excluded.expected_rows, expected_rows),
+                                      cmd = excluded.cmd, updated = excluded.updated""",
+                               [(job['raster'], getTarget(job), job.get('tiles'), job.get('cmd'), now) for job in jobs])
+        ledgerConn.commit()
+
+## ===================================================================================
+def markLoadFinished(job, status, rows=0, error=None):
+    """ Records the outcome of a job.  status is 'Success', 'Warning' or 'Error'; Success
+        and Warning are recorded as 'complete'."""
+
+    state = 'failed' if status == 'Error' else 'complete'
+    now = datetime.now().isoformat(timespec='seconds')
+
+    with ledgerLock:
+        ledgerConn.execute("""UPDATE load_ledger SET state = ?, rows = ?, error = ?, updated = ?
+                              WHERE raster = ? AND target = ?""",
+                           (state, rows, error, now, job['raster'], getTarget(job)))
+        ledgerConn.commit()
+
+## ===================================================================================
+def getTileKey(job):
+    """ Value that identifies the tiles of the DEM in job in the target table; the filename
+        column if the DEM was loaded with -F, otherwise the out-db band path. """
+
+    return os.path.basename(job['raster']) if job['filename'] else os.path.abspath(job['raster'])
+
+## ===================================================================================
+def countLoadedTiles(cursor, target, jobs):
+    """ Number of tiles of every DEM in jobs that are in target with 1 GROUP BY query.
+        All jobs must load into target the same way (job['filename']).
+
+        returns {tileKey: tiles}; DEMs without tiles are left out
+    """
+
+    tileKeys = [getTileKey(job) for job in jobs]
+    keyColumn = "filename" if jobs[0]['filename'] else "ST_BandPath(rast, 1)"
+
+    cursor.execute(f"SELECT {keyColumn}, COUNT(*) FROM {target} WHERE {keyColumn} = ANY(%s) GROUP BY 1", (tileKeys,))
+    return dict(cursor.fetchall())
+
+## ===================================================================================
+def deleteLoadedTiles(cursor, target, jobs):
+    """ Deletes the tiles of every DEM in jobs from target with 1 DELETE.  All jobs must load
+        into target the same way (job['filename']).  Returns the number of tiles deleted. """
+
+    tileKeys = [getTileKey(job) for job in jobs]
+    keyColumn = "filename" if jobs[0]['filename'] else "ST_BandPath(rast, 1)"
+
+    cursor.execute(f"DELETE FROM {target} WHERE {keyColumn} = ANY(%s)", (tileKeys,))
+    return cursor.rowcount
+
+## ===================================================================================
+def verifyPartialLoads(jobs):
+    """ Compares the tiles in the database of every 'loading' or 'failed' job against the
+        number of tiles the DEM creates.  The tiles are counted with 1 GROUP BY query per
+        target table.  Complete DEMs are marked complete; partially loaded DEMs have their
+        tiles deleted so they can be loaded again without duplicates.  DEMs that can't be
+        verified are left out of both lists (reloading them could duplicate their tiles) and
+        keep their ledger state so they are verified on the next run.
+
+        returns (completedJobs, reloadJobs, msgs)
+    """
+
+    completedJobs = list()
+    reloadJobs = list()
+    msgs = list()
+
+    # 1 connection per database; 1 count per target table
+    # {dbKey: [db, {(target,filename): [jobs]}]}
+    dbJobsDict = dict()
+    for job in jobs:
+        db = job['db']
+        dbKey = (db['host'],db['port'],db['user'],db['dbname'])
+        dbJobsDict.setdefault(dbKey, [db,{}])[1].setdefault((getTarget(job),bool(job['filename'])), []).append(job)
+
+    for db,targetJobs in dbJobsDict.values():
+        try:
+            conn = psycopg2.connect(**db)
+        except:
+            dbJobs = [job for tJobs in targetJobs.values() for job in tJobs]
+            msgs.append(f"\tUnable to connect to {db['dbname']} on {db['host']} to verify {len(dbJobs):,} partial loads; "
+                        f"they are not loaded and will be verified on the next run\n{errorMsg(errorOption=2)}")
+            continue
+
+        try:
+            for (target,bFilename),tJobs in targetJobs.items():
+                targetCompleted = list()
+                targetReload = list()
+
+                try:
+                    with conn.cursor() as cursor:
+                        loadedTiles = countLoadedTiles(cursor, target, tJobs)
+                        partialJobs = list()
+
+                        for job in tJobs:
+                            tiles = loadedTiles.get(getTileKey(job), 0)
+                            if not tiles:
+                                targetReload.append(job)
+                                continue
+
+                            # Only DEMs with tiles in the table need their expected tile count
+                            if not job.get('tiles'):
+                                job['tiles'] = getTileCount(getRasterHeader(job['raster'], job['band']), job['tileSize'])
+
+                            if tiles == job['tiles']:
+                                markLoadFinished(job, 'Success', tiles)
+                                targetCompleted.append(job)
+                            else:
+                                partialJobs.append(job)
+                                msgs.append(f"\tRemoving {tiles:,} of {job['tiles']:,} tiles of partially loaded {os.path.basename(job['raster'])}")
+
+                        if partialJobs:
+                            deleteLoadedTiles(cursor, target, partialJobs)
+                            targetReload.extend(partialJobs)
+
+                    conn.commit()
+
+                except:
+                    conn.rollback()
+                    msgs.append(f"\tUnable to verify {len(tJobs) - len(targetCompleted):,} DEMs of {target}; they are not loaded "
+                                f"and will be verified on the next run\n{errorMsg(errorOption=2)}")
+                    targetReload = list()
+
+                completedJobs.extend(targetCompleted)
+                reloadJobs.extend(targetReload)
+        finally:
+            conn.close()
+
+    return completedJobs, reloadJobs, msgs
+
+## ===================================================================================
+def filterLedgerJobs(jobs, bVerify=True):
+    """ Splits jobs into the ones that need to be loaded and the ones that the ledger
+        shows are already complete.  'loading' and 'failed' jobs may have committed some or
+        all of their tiles (a batch without a transaction can fail after some DEMs were
+        loaded) so they are verified against the database with verifyPartialLoads if bVerify
+        is True; otherwise they are reloaded.
+
+        returns (pendingJobs, skippedJobs, msgs)
+    """
+
+    ledgerStates = getLedgerStates(jobs)
+
+    pendingJobs = list()
+    skippedJobs = list()
+    partialJobs = list()
+
+    for job in jobs:
+        record = ledgerStates.get((job['raster'],getTarget(job)))
+
+        if record is None:
+            pendingJobs.append(job)
+        elif record['state'] == 'complete':
+            skippedJobs.append(job)
+        else:
+            if record['expected_rows'] and not job.get('tiles'):
+                job['tiles'] = record['expected_rows']
+            partialJobs.append(job)
+
+    msgs = list()
+    if partialJobs:
+        if bVerify:
+            msgs.append(f"\tVerifying {len(partialJobs):,} DEMs that were being loaded or failed when the last run stopped")
+            completedJobs,reloadJobs,verifyMsgs = verifyPartialLoads(partialJobs)
+            skippedJobs.extend(completedJobs)
+            pendingJobs.extend(reloadJobs)
+            msgs.extend(verifyMsgs)
+        else:
+            pendingJobs.extend(partialJobs)
+
+    if skippedJobs:
+        msgs.append(f"\tSkipping {len(skippedJobs):,} DEMs that are already loaded according to the load ledger")
+
+    return pendingJobs, skippedJobs, msgs
+
+## ===================================================================================
+def ledgerSummary():
+    """ Returns a list of messages with the number of DEMs and tiles in each state """
+
+    msgs = list()
+
+    with ledgerLock:
+        for target,state,demCount,tileCount in ledgerConn.execute(
+                "SELECT target, state, COUNT(*), SUM(rows) FROM load_ledger GROUP BY target, state ORDER BY target, state"):
+            msgs.append(f"\t{target:<40} {state:<10} DEMs: {demCount:<10,} Tiles: {tileCount or 0:,}")
+
+    return msgs
@@ -0,0 +1,1016 @@
+# -*- coding: utf-8 -*-
+"""
+Script Name: DSHub_Raster_Loader.py
+Created on Mon Oct 19 2026
+
+@author: Adolfo.Diaz
+GIS Business Analyst
+USDA - NRCS - SPSD - Soil Services and Information
+email address: adolfo.diaz@usda.gov
+cell: 608.215.7291
+
+The purpose of this module is to register DEMs as out-db rasters in PostGIS without spawning
+a 'raster2pgsql | psql' shell pipeline for every DEM.
+
+With -R, raster2pgsql does not store any pixels.  Every row is a tile header (upper left
+coordinate, scale, skew, srid, width, height) and a band header that points to the DEM file
+and band number.  All of that can be computed from the geotransform of the DEM so this module
+builds the same out-db tile rows in Python and streams them to the database with COPY over a
+pooled connection.  Registering 100k DEMs costs 1 connection and bulk COPY statements instead
+of 100k raster2pgsql and psql process pairs.
+
+Raster2pgsql options that are honored (everything the USGS_3 command files use):
+    -s <srid>   -b <band>   -t <width>x<height>   -F (filename column)   -a   -R
+
+Tiles are created in the same order and size as raster2pgsql: row by row from the upper left
+corner; the last column and row of tiles are truncated (no -P padding).
+
+Output table is expected to exist (-a) with the raster2pgsql columns:
+    rid serial, rast raster, filename text
+
+Batched raster2pgsql sessions (createLoadBatches, runRaster2pgsqlBatch):
+    As an alternative to the native loader, many DEMs that share the same options and target
+    table are passed to 1 raster2pgsql invocation piped into 1 psql session.  Batches are sized
+    by the number of tiles they create.  With bTransaction (default) raster2pgsql wraps the
+    batch in BEGIN/END and psql stops on the first error so a failure only rolls back that
+    batch; otherwise -e is used and every statement commits on its own.
+
+Bulk-load mode (beginBulkLoad, finishBulkLoads):
+    Before loading, autovacuum is turned off for every target table and its secondary indexes
+    and raster constraints are dropped so no insert pays for index or constraint maintenance.
+    After the last batch each table gets its GiST index on the rast envelopes
+    (ST_ConvexHull(rast)) and any dropped indexes back, AddRasterConstraints and ANALYZE, and
+    autovacuum is turned back on.  The phases of 1 table take conflicting locks so they run in
+    order; tables are finished in parallel.  Every phase is timed.
+
+Partitioned loading (preparePartitionedTargets, interleaveBatches):
+    Instead of appending every DEM to 1 heap (elevation.elevation_1m) the target table can be
+    a parent partitioned by EPSG (LIST) or by ranges of grid IDs (RANGE).  Jobs are pointed at
+    their partition so concurrent loaders write to separate partitions and bulk-load mode
+    builds the GiST index of every partition in parallel.
+
+Adaptive concurrency (createConcurrencyController, runAdaptive):
+    Instead of a fixed number of threads (cpu_count) every one holding a psql connection to
+    pgbouncer, loads are started through an AIMD controller.  The number of in-flight loads
+    grows by 1 after every window of successful loads whose per-tile latency stays within
+    latencyFactor of the best latency seen, and is halved when a load fails, the database
+    reports backpressure (lock timeouts, deadlocks, too many clients, pgbouncer wait timeouts)
+    or sessions are waiting on locks in pg_stat_activity.
+
+Load results (runLoadCommand, createResultRecords, summarizeLoadResults):
+    Loads are described by job dictionaries instead of shell strings and their outcome is
+    parsed into a result dictionary: exit status, tiles inserted, seconds, ERROR and WARNING
+    lines.  Results are appended to a JSONL results stream, 1 record per DEM, that the final
+    summary and the retry (FAILED) file are built from.
+"""
+
+## ========================================== Import modules ===============================================================
+import sys, os, traceback, time, struct, io, shlex, re, subprocess, json
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+
+from osgeo import gdal
+import psycopg2
+from psycopg2 import pool
+
+# PostGIS raster pixel types: GDAL data type --> (PostGIS pixtype code, struct format)
+pixelTypes = {gdal.GDT_Byte: (4,'B'),      # 8BUI
+              gdal.GDT_Int16: (5,'h'),     # 16BSI
+              gdal.GDT_UInt16: (6,'H'),    # 16BUI
+              gdal.GDT_Int32: (7,'i'),     # 32BSI
+              gdal.GDT_UInt32: (8,'I'),    # 32BUI
+              gdal.GDT_Float32: (10,'f'),  # 32BF
+              gdal.GDT_Float64: (11,'d')}  # 64BF
+
+# Band flags
+BANDTYPE_FLAG_OFFDB = 0x80
+BANDTYPE_FLAG_HASNODATA = 0x40
+
+## ===================================================================================
+def AddMsgAndPrint(msg):
+
+    # Print message to python message console
+    print(msg)
+
+## ===================================================================================
+def errorMsg(errorOption=1):
+
+    """ By default, error messages will be printed immediately.
+        If errorOption is set to 2, return the message back to the function that it
+        was called from.  This is used in functions that use multi-threading functionality"""
+
+    try:
+
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        theMsg = "\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[1] + "\n\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[-1]
+
+        if errorOption==1:
+            AddMsgAndPrint(theMsg)
+        else:
+            return theMsg
+
+    except:
+        AddMsgAndPrint("Unhandled error in unHandledException method")
+        pass
+
+## ================================================================================================================
+def tic():
+    """ Returns the current time """
+
+    return time.time()
+
+## ===================================================================================
+def parseRaster2pgsqlCommand(cmd):
+    """ Parses a raster2pgsql command line from a USGS_3 command file into a load job
+        dictionary and the database connection parameters of the psql side of the pipe.
+
+        raster2pgsql -s 5070 -b 1 -t 512x512 -F -a -R /data02/gisdata/elev/10m/0/USGS_13_n27w100_20201228_5070_slope.tif
+        slope.conus_slope_10m_5070 | PGPASSWORD=itsnotflat psql -U elevation -d elevation_derivatives -h 10.11.11.214 -p 6432
+
+        returns (job, dbParams) or (None, None) if the command cannot be parsed
+        job = {'raster','srid','band','tileSize':(w,h),'schema','table','filename','cmd','db'}
+    """
+
+    try:
+        r2pSide,psqlSide = cmd.split('|',1)
+        r2pItems = shlex.split(r2pSide.strip(), posix=(os.name != 'nt'))
+        psqlItems = shlex.split(psqlSide.strip(), posix=(os.name != 'nt'))
+
+        # Windows commands start with the full path to raster2pgsql.exe
+        while r2pItems and not r2pItems[0].lower().endswith(('raster2pgsql','raster2pgsql.exe')):
+            del r2pItems[0]
+        if not r2pItems:
+            return None,None
+
+        job = {'srid':0, 'band':1, 'tileSize':None, 'filename':False, 'cmd':cmd}
+        positional = list()
+
+        i = 1
+        while i < len(r2pItems):
+            item = r2pItems[i]
+
+            if item == '-s':
+                job['srid'] = int(r2pItems[i+1].split(':')[-1]); i+=1
+            elif item == '-b':
+                job['band'] = int(r2pItems[i+1].split(',')[0]); i+=1
+            elif item == '-t':
+                w,h = r2pItems[i+1].lower().split('x')
+                job['tileSize'] = (int(w),int(h)); i+=1
+            elif item == '-F':
+                job['filename'] = True
+            elif item in ('-a','-R','-I','-C','-M','-e','-Y'):
+                pass
+            elif item.startswith('-'):
+                # Option that takes a value i.e. -N, -f, -X
+                i+=1
+            else:
+                positional.append(item)
+            i+=1
+
+        # raster path(s) followed by schema.table
+        job['raster'] = positional[0]
+        schemaTable = positional[-1].split('.')
+        job['schema'] = schemaTable[0] if len(schemaTable) == 2 else 'public'
+        job['table'] = schemaTable[-1]
+
+        # psql side; PGPASSWORD may be set in front of psql
+        dbParams = {'host':'localhost','port':5432,'user':None,'password':None,'dbname':None}
+        psqlOptions = {'-U':'user','-d':'dbname','-h':'host','-p':'port'}
+
+        i = 0
+        while i < len(psqlItems):
+            item = psqlItems[i]
+            if item.startswith('PGPASSWORD='):
+                dbParams['password'] = item.split('=',1)[1]
+            elif item in psqlOptions:
+                dbParams[psqlOptions[item]] = psqlItems[i+1]; i+=1
+            i+=1
+
+        dbParams['port'] = int(dbParams['port'])
+        job['db'] = dbParams
+        return job,dbParams
+
+    except:
+        return None,None
+
+## ===================================================================================
+def getRasterHeader(rasterPath, band=1):
+    """ Returns the information needed to build out-db tiles of a raster without
+        reading any pixels:
+        {'cols','rows','geoTransform','pixType','pixFormat','noData'}
+    """
+
+    ds = gdal.Open(rasterPath)
+    rasterBand = ds.GetRasterBand(band)
+
+    if not rasterBand.DataType in pixelTypes:
+        raise TypeError(f"Unsupported pixel type {gdal.GetDataTypeName(rasterBand.DataType)} for {os.path.basename(rasterPath)}")
+
+    pixType,pixFormat = pixelTypes[rasterBand.DataType]
+
+    header = {'cols': ds.RasterXSize,
+              'rows': ds.RasterYSize,
+              'geoTransform': ds.GetGeoTransform(),
+              'pixType': pixType,
+              'pixFormat': pixFormat,
+              'noData': rasterBand.GetNoDataValue()}
+
+    ds = None
+    return header
+
+## ===================================================================================
+def getTileCount(header, tileSize):
+    """ Number of rows raster2pgsql creates for a raster; 1 row if no tile size is given."""
+
+    if not tileSize:
+        return 1
+
+    return -(-header['cols'] // tileSize[0]) * -(-header['rows'] // tileSize[1])
+
+## ===================================================================================
+def outdbTileHex(header, srid, band, path, xoff, yoff, width, height):
+    """ Returns the hex WKB of a 1-band out-db raster tile that starts at pixel xoff,yoff
+        of the raster described by header (see getRasterHeader).  Same layout as the
+        PostGIS raster WKB written by raster2pgsql -R."""
+
+    gt = header['geoTransform']
+
+    # upper left of the tile
+    ipX = gt[0] + xoff * gt[1] + yoff * gt[2]
+    ipY = gt[3] + xoff * gt[4] + yoff * gt[5]
+
+    # endian (1 = little), version, number of bands, scaleX, scaleY, ipX, ipY, skewX, skewY, srid, width, height
+    wkb = struct.pack('<BHHddddddiHH', 1, 0, 1, gt[1], gt[5], ipX, ipY, gt[2], gt[4], srid, width, height)
+
+    bandType = header['pixType'] | BANDTYPE_FLAG_OFFDB
+    noData = header['noData']
+    if noData is not None:
+        bandType |= BANDTYPE_FLAG_HASNODATA
+    else:
+        noData = 0
+
+    if header['pixFormat'] in ('f','d'):
+        noData = float(noData)
+    else:
+        noData = int(noData)
+
+    # band number is 0-based in the WKB; path is null terminated
+    wkb += struct.pack(f"<B{header['pixFormat']}B", bandType, noData, band - 1)
+    wkb += path.encode('utf-8') + b'\x00'
+
+    return wkb.hex().upper()
+
+## ===================================================================================
+def generateTileRows(job, header=None):
+    """ Yields a COPY text line for every out-db tile of the raster in job:
+        '<hex wkb>\\t<filename>\\n'  or '<hex wkb>\\n' if the filename column is not used"""
+
+    if header is None:
+        header = getRasterHeader(job['raster'], job['band'])
+
+    path = os.path.abspath(job['raster'])
+    fileName = os.path.basename(job['raster']).replace('\\','\\\\')
+
+    cols = header['cols']
+    rows = header['rows']
+    tileW,tileH = job['tileSize'] if job['tileSize'] else (cols,rows)
+
+    for yoff in range(0, rows, tileH):
+        height = min(tileH, rows - yoff)
+
+        for xoff in range(0, cols, tileW):
+            width = min(tileW, cols - xoff)
+            tileHex = outdbTileHex(header, job['srid'], job['band'], path, xoff, yoff, width, height)
+
+            if job['filename']:
+                yield f"{tileHex}\t{fileName}\n"
+            else:
+                yield f"{tileHex}\n"
+
+## ===================================================================================
+def createConnectionPool(dbParams, maxConnections=1):
+    """ Returns a psycopg2 ThreadedConnectionPool; 1 connection is opened right away."""
+
+    return pool.ThreadedConnectionPool(1, maxConnections, **dbParams)
+
+## ===================================================================================
+def copyRasterBatch(connPool, jobs):
+    """ Loads the out-db tiles of every raster in jobs with a single COPY per target table
+        in 1 transaction.  If the transaction fails every raster in the batch is failed.
+
+        returns a list of result dictionaries; 1 per job:
+        {'raster','status':'Success'|'Error','rows','seconds','batchSeconds','batchSize','error'}
+        The time of the batch (batchSeconds) is split evenly across its rasters (seconds) so
+        summing 'seconds' over the results counts the batch once.
+    """
+
+    start = tic()
+    results = list()
+    tableBuffers = dict()   # (schema,table,filename) --> StringIO
+
+    # Build the tile rows; a raster that can't be read fails on its own
+    for job in jobs:
+        try:
+            header = getRasterHeader(job['raster'], job['band'])
+            key = (job['schema'], job['table'], job['filename'])
+
+            if not key in tableBuffers:
+                tableBuffers[key] = io.StringIO()
+
+            tableBuffers[key].writelines(generateTileRows(job, header))
+            results.append({'raster':job['raster'], 'status':'Success', 'rows':getTileCount(header, job['tileSize']),
+                            'seconds':0, 'error':None})
+        except:
+            results.append({'raster':job['raster'], 'status':'Error', 'rows':0, 'seconds':0,
+                            'error':errorMsg(errorOption=2)})
+
+    conn = connPool.getconn()
+    try:
+        with conn.cursor() as cursor:
+            for (schema,table,bFilename),buffer in tableBuffers.items():
+                buffer.seek(0)
+                columns = "(rast, filename)" if bFilename else "(rast)"
+                cursor.copy_expert(f"COPY {schema}.{table} {columns} FROM STDIN", buffer)
+        conn.commit()
+
+    except:
+        conn.rollback()
+        error = errorMsg(errorOption=2)
+        for result in results:
+            if result['status'] == 'Success':
+                result.update({'status':'Error', 'rows':0, 'error':error})
+
+    finally:
+        connPool.putconn(conn)
+
+    seconds = round(time.time() - start, 3)
+    for result in results:
+        result.update({'seconds':round(seconds / len(results), 3), 'batchSeconds':seconds, 'batchSize':len(results)})
+
+    return results
+
+## ===================================================================================
+def loadRastersNative(jobs, dbParams, batchSize=500, connPool=None, onBatchStart=None):
+    """ Generator that registers every raster in jobs with copyRasterBatch in batches of
+        batchSize rasters over 1 pooled connection.  Yields a result dictionary per raster
+        as each batch completes (see copyRasterBatch).  onBatchStart(batchJobs) is called
+        right before each batch is loaded (i.e. DSHub_Load_Ledger.markLoadStarted)."""
+
+    bClosePool = connPool is None
+    if bClosePool:
+        connPool = createConnectionPool(dbParams)
+
+    try:
+        for i in range(0, len(jobs), batchSize):
+            batchJobs = jobs[i:i + batchSize]
+            if onBatchStart:
+                onBatchStart(batchJobs)
+
+            for result in copyRasterBatch(connPool, batchJobs):
+                yield result
+    finally:
+        if bClosePool:
+            connPool.closeall()
+
+## ===================================================================================
+def createLoadBatches(jobs, maxTiles=50000, maxRasters=1000):
+    """ Groups jobs that can share 1 raster2pgsql invocation (same srid, band, tile size,
+        filename option, target table and database) into batches of at most maxTiles
+        tiles and maxRasters rasters.  The tile count of each raster is read from its
+        header and stored in job['tiles'].  A raster whose header can't be read is sized
+        as 1 tile; raster2pgsql will report it.
+
+        returns a list of batches; each batch is a list of jobs
+    """
+
+    groupDict = dict()
+    for job in jobs:
+        db = job.get('db') or dict()
+        key = (job['srid'], job['band'], job['tileSize'], job['filename'], job['schema'], job['table'],
+               db.get('host'), db.get('port'), db.get('user'), db.get('dbname'))
+
+        if key in groupDict:
+            groupDict[key].append(job)
+        else:
+            groupDict[key] = [job]
+
+    batches = list()
+    for groupJobs in groupDict.values():
+        batch = list()
+        batchTiles = 0
+
+        for job in groupJobs:
+            if not 'tiles' in job:
+                try:
+                    job['tiles'] = getTileCount(getRasterHeader(job['raster'], job['band']), job['tileSize'])
+                except:
+                    job['tiles'] = 1
+
+            if batch and (batchTiles + job['tiles'] > maxTiles or len(batch) >= maxRasters):
+                batches.append(batch)
+                batch = list()
+                batchTiles = 0
+
+            batch.append(job)
+            batchTiles += job['tiles']
+
+        if batch:
+            batches.append(batch)
+
+    return batches
+
+## ===================================================================================
+def buildBatchCommand(batch, bTransaction=True):
+    """ Returns 1 'raster2pgsql ... | psql' command line that loads every raster in batch.
+        All jobs in batch must share the options grouped by createLoadBatches.
+
+        raster2pgsql -s 5070 -b 1 -t 512x512 -F -a -R <dem1> <dem2> ... slope.conus_slope_10m_5070 |
+        PGPASSWORD=itsnotflat psql -v ON_ERROR_STOP=1 -U elevation -d elevation_derivatives -h 10.11.11.214 -p 6432
+    """
+
+    job = batch[0]
+    db = job['db']
+
+    r2pOptions = f"-s {job['srid']} -b {job['band']}"
+    if job['tileSize']:
+        r2pOptions += f" -t {job['tileSize'][0]}x{job['tileSize'][1]}"
+    if job['filename']:
+        r2pOptions += " -F"
+    r2pOptions += " -a -R"
+
+    # -e executes each statement individually without a transaction
+    if not bTransaction:
+        r2pOptions += " -e"
+
+    rasters = ' '.join(shlex.quote(j['raster']) for j in batch)
+    password = f"PGPASSWORD={db['password']} " if db.get('password') else ""
+
+    return (f"raster2pgsql {r2pOptions} {rasters} {job['schema']}.{job['table']} | "
+            f"{password}psql -v ON_ERROR_STOP=1 -U {db['user']} -d {db['dbname']} -h {db['host']} -p {db['port']}")
+
+## ===================================================================================
+def runLoadCommand(cmd, rasters, expectedRows=0, env=None, maxMessages=5):
+    """ Executes a 'raster2pgsql | psql' command line and parses the outcome from the exit
+        status of the pipeline and the lines psql and raster2pgsql write instead of keyword
+        searching the whole stderr:
+            rows     - number of 'INSERT 0 <n>' lines psql writes to stdout
+            error    - first maxMessages lines of stderr starting with ERROR or FATAL
+            warnings - first maxMessages unique lines of stderr containing WARNING
+        The load is successful if the pipeline exits with 0, there are no ERROR/FATAL lines and
+        every expected tile was inserted.  It is a 'Warning' if it was successful but warnings
+        were reported.
+
+        returns {'rasters':[raster paths],'status':'Success'|'Warning'|'Error','rows','expectedRows',
+                 'returncode','seconds','error','warnings':[]}
+    """
+
+    start = tic()
+    result = {'rasters':list(rasters), 'status':'Error', 'rows':0, 'expectedRows':expectedRows,
+              'returncode':None, 'seconds':0, 'error':None, 'warnings':list()}
+
+    try:
+        # pipefail so that a raster2pgsql failure is not hidden by the exit status of psql
+        if os.name == 'nt':
+            execCmd = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, env=env)
+        else:
+            execCmd = subprocess.Popen(['bash', '-o', 'pipefail', '-c', cmd], stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, env=env)
+
+        # returns a tuple (stdout_data, stderr_data)
+        msgs, errors = execCmd.communicate()
+        result['returncode'] = execCmd.returncode
+        result['rows'] = sum(int(n) for n in re.findall(r'^INSERT 0 (\d+)$', msgs, re.MULTILINE))
+
+        errorLines = list()
+        for line in errors.splitlines():
+            upperLine = line.lstrip().upper()
+            if upperLine.startswith(('ERROR','FATAL','PSQL: ERROR','PSQL: FATAL')):
+                if len(errorLines) < maxMessages:
+                    errorLines.append(line.strip())
+            elif 'WARNING' in upperLine and len(result['warnings']) < maxMessages and not line.strip() in result['warnings']:
+                result['warnings'].append(line.strip())
+
+        if execCmd.returncode == 0 and not errorLines and result['rows'] >= expectedRows:
+            result['status'] = 'Warning' if result['warnings'] else 'Success'
+
+        elif errorLines:
+            result['error'] = ','.join(errorLines)
+        elif execCmd.returncode != 0:
+            result['error'] = f"Exit status {execCmd.returncode}: {errors.strip()[:500]}"
+        else:
+            result['error'] = f"{result['rows']:,} of {expectedRows:,} tiles were inserted"
+
+    except:
+        result['error'] = errorMsg(errorOption=2)
+
+    result['seconds'] = round(time.time() - start, 3)
+    return result
+
+## ===================================================================================
+def runRaster2pgsqlBatch(batch, bTransaction=True, env=None):
+    """ Executes 1 batch of rasters with buildBatchCommand in 1 raster2pgsql and 1 psql
+        process.  See runLoadCommand for the result dictionary."""
+
+    try:
+        cmd = buildBatchCommand(batch, bTransaction)
+    except:
+        return {'rasters':[job['raster'] for job in batch], 'status':'Error', 'rows':0, 'expectedRows':0,
+                'returncode':None, 'seconds':0, 'error':errorMsg(errorOption=2), 'warnings':list()}
+
+    return runLoadCommand(cmd, [job['raster'] for job in batch], sum(job.get('tiles',0) for job in batch), env)
+
+## ===================================================================================
+def runLoadJob(job, env=None):
+    """ Executes the raster2pgsql command of 1 load job (the original command line if the
+        job was parsed from one).  See runLoadCommand for the result dictionary."""
+
+    cmd = job['cmd'] if job.get('cmd') else buildBatchCommand([job])
+    return runLoadCommand(cmd, [job['raster']], job.get('tiles',0), env)
+
+## ===================================================================================
+def createResultRecords(jobs, result, mode, runID=None):
+    """ Splits the result of a load (runLoadCommand, copyRasterBatch) into 1 JSON serializable
+        record per DEM for the results stream.  A successful batch credits every DEM with its
+        own tile count; a failed batch fails every DEM in it.  The time of a batch is split
+        evenly across its DEMs; a copyRasterBatch result is already split per raster and
+        carries its own batchSeconds and batchSize."""
+
+    records = list()
+    timeStamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+
+    for job in jobs:
+        if len(jobs) == 1:
+            rows = result['rows']
+        else:
+            rows = job.get('tiles',0) if result['status'] != 'Error' else 0
+
+        records.append({'run':runID, 'time':timeStamp, 'mode':mode, 'raster':job['raster'],
+                        'target':f"{job['schema']}.{job['table']}", 'cmd':job.get('cmd'),
+                        'status':result['status'], 'rows':rows, 'expectedRows':job.get('tiles'),
+                        'returncode':result.get('returncode'), 'seconds':round(result['seconds'] / len(jobs), 3),
+                        'batchSeconds':result.get('batchSeconds', result['seconds']), 'batchSize':result.get('batchSize', len(jobs)), 'error':result.get('error'), 'warnings':result.get('warnings',[])})
+
+    return records
+
+## ===================================================================================
+def writeResultRecords(resultsFile, records):
+    """ Appends records to the JSONL results stream; 1 JSON object per line """
+
+    with open(resultsFile, 'a+') as fp:
+        for record in records:
+            fp.write(json.dumps(record) + '\n')
+
+## ===================================================================================
+def summarizeLoadResults(resultsFile, runID=None):
+    """ Reads the JSONL results stream (records of runID only if given) and returns a
+        summary.  The last record of a DEM wins so a DEM that failed and then loaded on a
+        retry counts as loaded.
+
+        returns {'Success','Warning','Error':DEM counts,'rows','seconds','retry':[cmds of failed DEMs]}
+    """
+
+    lastRecords = dict()
+
+    with open(resultsFile, 'r') as fp:
+        for line in fp:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+
+            if runID is None or record.get('run') == runID:
+                lastRecords[(record['raster'],record['target'])] = record
+
+    summary = {'Success':0, 'Warning':0, 'Error':0, 'rows':0, 'seconds':0, 'retry':list()}
+    for record in lastRecords.values():
+        summary[record['status']] += 1
+        summary['rows'] += record['rows'] or 0
+        summary['seconds'] += record['seconds'] or 0
+
+        if record['status'] == 'Error' and record.get('cmd'):
+            summary['retry'].append(record['cmd'])
+
+    return summary
+
+## ===================================================================================
+def getLoadTargets(jobs):
+    """ Returns the unique target tables of jobs:
+        {(host,port,dbname,schema,table): {'db':dbParams,'schema','table'}}"""
+
+    targets = dict()
+    for job in jobs:
+        db = job['db']
+        key = (db['host'], db['port'], db['dbname'], job['schema'], job['table'])
+        if not key in targets:
+            targets[key] = {'db':db, 'schema':job['schema'], 'table':job['table']}
+
+    return targets
+
+## ===================================================================================
+def beginBulkLoad(target, bDropIndexes=True, bDropConstraints=True):
+    """ Puts a target table (see getLoadTargets) in bulk-load mode: autovacuum is turned
+        off, secondary indexes and raster constraints are dropped.  The definitions of the
+        dropped indexes are stored in target['indexes'] so finishBulkLoad can rebuild them.
+
+        returns a list of messages
+    """
+
+    msgs = list()
+    schema = target['schema']
+    table = target['table']
+    target['indexes'] = list()
+
+    conn = psycopg2.connect(**target['db'])
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"ALTER TABLE {schema}.{table} SET (autovacuum_enabled = false, toast.autovacuum_enabled = false)")
+            msgs.append(f"\t{schema}.{table}: autovacuum disabled")
+
+            if bDropIndexes:
+                # Indexes that don't back a primary key or unique constraint and aren't a partition of
+                # an index on a partitioned parent (those can't be dropped on their own)
+                cursor.execute("""SELECT i.indexname, i.indexdef FROM pg_indexes i
+                                  WHERE i.schemaname = %s AND i.tablename = %s
+                                  AND NOT EXISTS (SELECT 1 FROM pg_constraint c
+                                                  WHERE c.conname = i.indexname
+                                                  AND c.connamespace = %s::regnamespace)
+                                  AND NOT EXISTS (SELECT 1 FROM pg_inherits h
+                                                  WHERE h.inhrelid = format('%%I.%%I', i.schemaname, i.indexname)::regclass)""", (schema, table, schema))
+
+                for indexName,indexDef in cursor.fetchall():
+                    cursor.execute(f"DROP INDEX {schema}.{indexName}")
+                    target['indexes'].append((indexName,indexDef))
+                    msgs.append(f"\t{schema}.{table}: dropped index {indexName} until the load is finished")
+
+            if bDropConstraints:
+                cursor.execute("SELECT COUNT(*) FROM raster_columns WHERE r_table_schema = %s AND r_table_name = %s AND srid <> 0",
+                               (schema, table))
+                if cursor.fetchone()[0]:
+                    cursor.execute("SELECT DropRasterConstraints(%s, %s, 'rast')", (schema, table))
+                    msgs.append(f"\t{schema}.{table}: dropped raster constraints until the load is finished")
+
+        conn.commit()
+
+    except:
+        conn.rollback()
+        msgs.append(f"\t{schema}.{table}: unable to set bulk-load mode\n{errorMsg(errorOption=2)}")
+
+    finally:
+        conn.close()
+
+    return msgs
+
+## ===================================================================================
+def finishBulkLoad(target, bConstraints=True, maintenanceWorkMem='2GB'):
+    """ Takes a target table out of bulk-load mode.  Phases run in order because they
+        take conflicting locks on the table:
+            1) CREATE INDEX <table>_rast_gist USING GIST (ST_ConvexHull(rast)) and rebuild
+               the indexes dropped by beginBulkLoad
+            2) AddRasterConstraints
+            3) ANALYZE
+            4) turn autovacuum back on
+
+        returns {'target','phases':{phase: seconds},'msgs'}
+    """
+
+    schema = target['schema']
+    table = target['table']
+    result = {'target':f"{schema}.{table}", 'phases':dict(), 'msgs':list()}
+
+    conn = psycopg2.connect(**target['db'])
+    conn.autocommit = True
+
+    def runPhase(phase, sqlList):
+        start = tic()
+        try:
+            with conn.cursor() as cursor:
+                for sql in sqlList:
+                    cursor.execute(sql)
+            result['phases'][phase] = round(time.time() - start, 1)
+        except:
+            result['phases'][phase] = None
+            result['msgs'].append(f"\t{schema}.{table}: {phase} failed\n{errorMsg(errorOption=2)}")
+
+    try:
+        with conn.cursor() as cursor:
+            cursor.execute(f"SET maintenance_work_mem = '{maintenanceWorkMem}'")
+
+        indexSQL = [f"CREATE INDEX IF NOT EXISTS {table}_rast_gist ON {schema}.{table} USING GIST (ST_ConvexHull(rast))"]
+        for indexName,indexDef in target.get('indexes',[]):
+            if indexName != f"{table}_rast_gist":
+                indexSQL.append(indexDef.replace('CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1))
+        runPhase('index', indexSQL)
+
+        if bConstraints:
+            runPhase('constraints', [f"SELECT AddRasterConstraints('{schema}', '{table}', 'rast')"])
+
+        runPhase('analyze', [f"ANALYZE {schema}.{table}"])
+        runPhase('autovacuum', [f"ALTER TABLE {schema}.{table} RESET (autovacuum_enabled, toast.autovacuum_enabled)"])
+
+    finally:
+        conn.close()
+
+    return result
+
+## ===================================================================================
+def finishBulkLoads(targets, bConstraints=True, maxWorkers=4):
+    """ Runs finishBulkLoad on every target table in parallel.
+
+        returns a list of messages with the timing of every phase of every table
+    """
+
+    msgs = list()
+
+    with ThreadPoolExecutor(max_workers=maxWorkers) as executor:
+        finishTarget = [executor.submit(finishBulkLoad, target, bConstraints) for target in targets]
+
+        for future in as_completed(finishTarget):
+            result = future.result()
+            msgs.extend(result['msgs'])
+
+            phaseTimes = ', '.join(f"{phase}: {'FAILED' if seconds is None else f'{seconds} secs'}"
+                                   for phase,seconds in result['phases'].items())
+            msgs.append(f"\t{result['target']} -- {phaseTimes}")
+
+    return msgs
+
+# Partitioning methods: partition key column, column type and partition type
+partitionMethods = {'srid': ('srid', 'integer', 'LIST'),       # 1 partition per EPSG (region)
+                    'grid': ('grid_id', 'bigint', 'RANGE')}    # ranges of grid IDs
+
+## ===================================================================================
+def getPartitionKey(job, partitionBy):
+    """ Partition key value of a job; None if it can't be determined (default partition).
+        'srid' - EPSG code of the DEM (5070 conus, 3338 ak, 32161 prvi, 4326 pb)
+        'grid' - job['gridID'] or the grid ID in the file name i.e. grid1234_dsh3m.tif
+    """
+
+    if partitionBy == 'srid':
+        return int(job['srid'])
+
+    if job.get('gridID') is not None:
+        return int(job['gridID'])
+
+    gridMatch = re.search(r'grid_?(\d+)', os.path.basename(job['raster']), re.IGNORECASE)
+    return int(gridMatch.group(1)) if gridMatch else None
+
+## ===================================================================================
+def preparePartitionedTargets(jobs, partitionBy='srid', gridRange=1000):
+    """ Loads every target table of jobs through partitions instead of 1 heap.
+
+        The target table becomes the parent of a partitioned table (created if it doesn't
+        exist) with 1 partition per key value:
+            'srid' - LIST partitions <table>_<srid>
+            'grid' - RANGE partitions <table>_g<low>_<high> of gridRange grid IDs
+        plus a <table>_default partition for DEMs without a key.  The key column of every
+        partition defaults to its own key value so raster2pgsql -a and COPY can write to a
+        partition directly without knowing about the key.
+
+        job['table'] is changed to the partition the DEM is written to (job['parent'] keeps
+        the parent) so batches, bulk-load mode, indexes and the load ledger all work per
+        partition: loaders write to separate heaps at the same time and finishBulkLoads builds
+        the index of every partition in parallel.  Queries that filter on the key column
+        (WHERE srid = 5070) only scan that partition.
+
+        An existing target table that is not partitioned is loaded as is.
+
+        returns a list of messages
+    """
+
+    msgs = list()
+    keyColumn,keyType,partitionType = partitionMethods[partitionBy]
+
+    # {(host,port,dbname,schema,table): {'db','schema','table','jobs':[]}}
+    parents = dict()
+    for job in jobs:
+        db = job['db']
+        key = (db['host'], db['port'], db['dbname'], job['schema'], job['table'])
+        parents.setdefault(key, {'db':db, 'schema':job['schema'], 'table':job['table'], 'jobs':[]})['jobs'].append(job)
+
+    for parent in parents.values():
+        schema = parent['schema']
+        table = parent['table']
+
+        # partition name --> (FOR VALUES clause, key value)
+        partitions = dict()
+        partitionJobs = list()
+        for job in parent['jobs']:
+            try:
+                keyValue = getPartitionKey(job, partitionBy)
+            except:
+                keyValue = None
+
+            if keyValue is None:
+                name = f"{table}_default"
+                partitions[name] = ("DEFAULT", None)
+            elif partitionType == 'LIST':
+                name = f"{table}_{keyValue}"
+                partitions[name] = (f"FOR VALUES IN ({keyValue})", keyValue)
+            else:
+                low = keyValue // gridRange * gridRange
+                name = f"{table}_g{low}_{low + gridRange}"
+                partitions[name] = (f"FOR VALUES FROM ({low}) TO ({low + gridRange})", low)
+
+            partitionJobs.append((job, name))
+
+        conn = psycopg2.connect(**parent['db'])
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT c.relkind FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                               "WHERE n.nspname = %s AND c.relname = %s", (schema, table))
+                relKind = cursor.fetchone()
+
+                if relKind and relKind[0] != 'p':
+                    msgs.append(f"\t{schema}.{table} is not a partitioned table; loading it as 1 table")
+                    continue
+
+                if not relKind:
+                    cursor.execute(f"""CREATE TABLE {schema}.{table} (rid serial, rast raster, filename text, {keyColumn} {keyType})
+                                       PARTITION BY {partitionType} ({keyColumn})""")
+                    msgs.append(f"\tCreated {schema}.{table} partitioned by {partitionType} ({keyColumn})")
+
+                for name,(bounds,keyValue) in partitions.items():
+                    cursor.execute("SELECT 1 FROM pg_class c JOIN pg_namespace n ON n.oid = c.relnamespace "
+                                   "WHERE n.nspname = %s AND c.relname = %s", (schema, name))
+                    if cursor.fetchone():
+                        continue
+
+                    cursor.execute(f"CREATE TABLE {schema}.{name} PARTITION OF {schema}.{table} {bounds}")
+                    if keyValue is not None:
+                        cursor.execute(f"ALTER TABLE {schema}.{name} ALTER COLUMN {keyColumn} SET DEFAULT {keyValue}")
+                    msgs.append(f"\tCreated partition {schema}.{name}")
+
+            conn.commit()
+
+            # The original raster2pgsql command points at the parent; rebuild it for the partition
+            for job,name in partitionJobs:
+                job['parent'] = table
+                job['table'] = name
+                if job.get('cmd'):
+                    job['cmd'] = buildBatchCommand([job])
+
+            msgs.append(f"\t{schema}.{table}: {len(parent['jobs']):,} DEMs in {len(partitions):,} partitions")
+
+        except:
+            conn.rollback()
+            msgs.append(f"\t{schema}.{table}: unable to create partitions; loading it as 1 table\n{errorMsg(errorOption=2)}")
+
+        finally:
+            conn.close()
+
+    return msgs
+
+## ===================================================================================
+def interleaveBatches(batches):
+    """ Reorders batches round robin by target table so that the loaders running at the
+        same time write to different partitions instead of queuing on the same one."""
+
+    targetBatches = dict()
+    for batch in batches:
+        targetBatches.setdefault((batch[0]['schema'], batch[0]['table']), []).append(batch)
+
+    interleaved = list()
+    queues = list(targetBatches.values())
+    while queues:
+        for queue in queues:
+            interleaved.append(queue.pop(0))
+        queues = [queue for queue in queues if queue]
+
+    return interleaved
+
+# Error text that means the database or pgbouncer is overloaded rather than the load being bad
+backpressureErrors = re.compile(r"lock timeout|lock_timeout|deadlock detected|could not obtain lock|"
+                                r"too many clients|no more connections allowed|query_wait_timeout|"
+                                r"server_login_retry|statement timeout|out of shared memory", re.IGNORECASE)
+
+## ===================================================================================
+def createConcurrencyController(dbParams=None, initialLimit=4, minLimit=1, maxLimit=None, latencyFactor=2.0,
+                                lockWaitLimit=5, lockPollSeconds=15):
+    """ Returns the state of an AIMD concurrency controller used by runAdaptive.
+
+        dbParams        - database to poll pg_stat_activity for sessions waiting on locks; None to skip
+        initialLimit    - number of loads in-flight to start with
+        minLimit        - never fewer loads in-flight than this
+        maxLimit        - never more loads in-flight than this; defaults to 2 x cpu_count
+        latencyFactor   - a load whose per-tile latency is more than latencyFactor x the best
+                          per-tile latency seen counts as congestion
+        lockWaitLimit   - number of sessions waiting on locks that counts as congestion
+        lockPollSeconds - minimum number of seconds between pg_stat_activity polls
+    """
+
+    if maxLimit is None:
+        maxLimit = 2 * (os.cpu_count() or 4)
+
+    return {'limit': max(minLimit, min(initialLimit, maxLimit)), 'minLimit': minLimit, 'maxLimit': maxLimit,
+            'latencyFactor': latencyFactor, 'bestLatency': None, 'successes': 0,
+            'dbParams': dbParams, 'lockWaitLimit': lockWaitLimit, 'lockPollSeconds': lockPollSeconds,
+            'lastLockPoll': 0, 'history': list()}
+
+## ===================================================================================
+def getLockWaits(dbParams):
+    """ Number of sessions of the database waiting on a lock; None if it can't be read """
+
+    try:
+        conn = psycopg2.connect(**dbParams)
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT COUNT(*) FROM pg_stat_activity WHERE datname = %s AND wait_event_type = 'Lock'",
+                               (dbParams['dbname'],))
+                return cursor.fetchone()[0]
+        finally:
+            conn.close()
+    except:
+        return None
+
+## ===================================================================================
+def updateConcurrency(controller, seconds, units=1, error=None):
+    """ Updates the in-flight limit of controller with the outcome of 1 load.
+        seconds is the latency of the load, units the amount of work in it (tiles) and
+        error the error text of a failed load.  Returns the new limit."""
+
+    limit = controller['limit']
+    bCongested = False
+    reason = None
+
+    if error:
+        bCongested = True
+        reason = 'backpressure' if backpressureErrors.search(str(error)) else 'error'
+
+    else:
+        latency = seconds / max(units, 1)
+        best = controller['bestLatency']
+
+        if best is None or latency < best:
+            controller['bestLatency'] = latency
+        elif latency > best * controller['latencyFactor']:
+            bCongested = True
+            reason = 'latency'
+
+            # Let the baseline drift up so 1 unusually fast load doesn't throttle forever
+            controller['bestLatency'] = best * 1.1
+
+    # Sessions waiting on locks; polled at most once every lockPollSeconds
+    if not bCongested and controller['dbParams'] and time.time() - controller['lastLockPoll'] >= controller['lockPollSeconds']:
+        controller['lastLockPoll'] = time.time()
+        lockWaits = getLockWaits(controller['dbParams'])
+        if lockWaits is not None and lockWaits >= controller['lockWaitLimit']:
+            bCongested = True
+            reason = 'lock waits'
+
+    # Multiplicative decrease
+    if bCongested:
+        controller['limit'] = max(controller['minLimit'], limit // 2)
+        controller['successes'] = 0
+
+    # Additive increase once a full window of loads succeeds
+    else:
+        controller['successes'] += 1
+        if controller['successes'] >= limit:
+            controller['limit'] = min(controller['maxLimit'], limit + 1)
+            controller['successes'] = 0
+
+    if controller['limit'] != limit:
+        controller['history'].append((round(time.time(), 1), limit, controller['limit'], reason or 'growth'))
+
+    return controller['limit']
+
+## ===================================================================================
+def runAdaptive(func, argsList, controller, resultSignal=None):
+    """ Generator that runs func(*args) for every args in argsList in a thread pool while
+        keeping the number of in-flight calls at the limit of controller (see
+        createConcurrencyController).  resultSignal(result) returns (units, error) of a
+        result; by default every result is 1 unit with no error.
+
+        Yields (args, result) as each call completes.
+    """
+
+    if resultSignal is None:
+        resultSignal = lambda result: (1, None)
+
+    def timedCall(args):
+        start = tic()
+        result = func(*args)
+        return result, time.time() - start
+
+    pending = list(argsList)
+    pending.reverse()
+    inFlight = dict()
+
+    with ThreadPoolExecutor(max_workers=controller['maxLimit']) as executor:
+        while pending or inFlight:
+
+            while pending and len(inFlight) < controller['limit']:
+                args = pending.pop()
+                inFlight[executor.submit(timedCall, args)] = args
+
+            done,notDone = wait(inFlight, return_when=FIRST_COMPLETED)
+
+            for future in done:
+                args = inFlight.pop(future)
+
+                try:
+                    result,seconds = future.result()
+                    units,error = resultSignal(result)
+                except:
+                    result,seconds,units,error = None, 0, 1, errorMsg(errorOption=2)
+
+                updateConcurrency(controller, seconds, units, error)
+                yield args, result
@@ -0,0 +1,276 @@
+# -*- coding: utf-8 -*-
+"""
+Script Name: DSHub_Registration_Jobs.py
+Created on Mon Oct 19 2026
+
+@author: Adolfo.Diaz
+GIS Business Analyst
+USDA - NRCS - SPSD - Soil Services and Information
+email address: adolfo.diaz@usda.gov
+cell: 608.215.7291
+
+The purpose of this module is to generate out-db registration (raster2pgsql) jobs directly from
+an elevation metadata (catalog) file.  It replaces the createRaster2pgSQLFile functions that were
+copied into USGS_2, USGS_2A, USGS_2C, USGS_5 and DSHub_Create_Raster2pgsql_File.  Each of those
+read the master file 2-3 times just to count lines and wrote 1 shell line per DEM that USGS_3
+then re-read and re-validated by scanning for '#' and 'None'.
+
+A registration job is the same dictionary the DSHub_Raster_Loader functions work with:
+    {'raster','srid','band','tileSize':(w,h),'schema','table','filename','cmd','db':dbParams}
+
+Jobs are validated once when they are created (validateJob) and can be handed to the loader
+(USGS_3_Execute_raster2pgsql_fromFile.main(jobs=...)) in memory.  Writing a raster2pgsql text
+file (exportRaster2pgsqlFile) is kept as an option for running USGS_3 separately.
+
+The database, table and tile size of each workflow are kept in registrationProfiles.  Table
+names are templates that are filled in with the resolution, region and EPSG of each DEM.
+A tile size of 'auto' uses DSHub_Tile_Advisor to align the tiles to the block size of the DEMs.
+"""
+
+## ========================================== Import modules ===============================================================
+import sys, os, traceback
+
+registrationProfiles = {
+    # USGS_2 - elevation.elevation_3m
+    'elevation': {'schema':'elevation', 'table':'elevation_{resolution}', 'tileSize':(256,256),
+                  'db':{'host':'10.11.11.10', 'port':6432, 'user':'elevation', 'password':'itsnotflat', 'dbname':'elevation'}},
+
+    # USGS_2A - original 3M load
+    'elevation_3m': {'schema':'elevation', 'table':'elevation_3m', 'tileSize':(507,507),
+                     'db':{'host':'10.11.11.10', 'port':5432, 'user':'elevation', 'password':'itsnotflat', 'dbname':'elevation'}},
+
+    # USGS_2C - elevation.conus_elevation_3m_5070
+    'elevation_regional': {'schema':'elevation', 'table':'{region}_elevation_{resolution}_{epsg}', 'tileSize':(256,256),
+                           'db':{'host':'10.11.11.214', 'port':6432, 'user':'elevation', 'password':'itsnotflat', 'dbname':'elevation'}},
+
+    # USGS_5 - elevation.elevation_DSH3M
+    'dsh3m': {'schema':'elevation', 'table':'elevation_DSH3M', 'tileSize':(507,507),
+              'db':{'host':'10.11.11.10', 'port':6432, 'user':'elevation', 'password':'itsnotflat', 'dbname':'elevation'}},
+
+    # DSHub_Create_Raster2pgsql_File - slope.conus_slope_10m_5070; schema and table are passed in
+    'derivatives': {'schema':None, 'table':None, 'tileSize':(512,512),
+                    'db':{'host':'10.11.11.214', 'port':6432, 'user':'elevation', 'password':'itsnotflat', 'dbname':'elevation_derivatives'}},
+}
+
+## ===================================================================================
+def AddMsgAndPrint(msg):
+
+    # Print message to python message console
+    print(msg)
+
+## ===================================================================================
+def errorMsg(errorOption=1):
+
+    """ By default, error messages will be printed immediately.
+        If errorOption is set to 2, return the message back to the function that it
+        was called from."""
+
+    try:
+
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        theMsg = "\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[1] + "\n\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[-1]
+
+        if errorOption==1:
+            AddMsgAndPrint(theMsg)
+        else:
+            return theMsg
+
+    except:
+        AddMsgAndPrint("Unhandled error in unHandledException method")
+        pass
+
+## ===================================================================================
+def getRegion(srid):
+    """ Region abbreviation used in table names for an EPSG code """
+
+    if srid == 5070:
+        return "conus"
+    elif srid == 3338:
+        return "ak"
+    elif srid == 32161:
+        return "prvi"
+    elif srid == 4326:
+        return "pb"
+    else:
+        return "unkown"
+
+## ===================================================================================
+def readCatalogRecords(catalogFile, fieldIndex=None, bSkipHeader=False):
+    """ Generator that reads an elevation metadata (catalog) file once and yields a
+        dictionary of every record.  The first line is the header unless fieldIndex
+        (i.e. {'dem_name':11,'dem_path':12,'epsg_code':21}) is given for files without a
+        header.  bSkipHeader skips the first line when fieldIndex is given for a file whose
+        header uses other field names (i.e. the USGS_2A master file: DEMname,DEMpath,EPSG).
+        Empty lines are skipped."""
+
+    with open(catalogFile, 'r') as fp:
+        if fieldIndex is None:
+            headers = fp.readline().rstrip().split(',')
+            fieldIndex = {field:i for i,field in enumerate(headers)}
+        elif bSkipHeader:
+            fp.readline()
+
+        for line in fp:
+            if not line.strip():
+                continue
+
+            items = line.rstrip('\n').split(',')
+            yield {field:(items[i].strip() if i < len(items) else None) for field,i in fieldIndex.items()}
+
+## ===================================================================================
+def validateJob(job, bCheckExists=False):
+    """ Returns None if job is a valid registration job; otherwise the reason it is not.
+        This is the only place jobs are validated. """
+
+    try:
+        if int(job['srid']) <= 0:
+            return f"Invalid SRID: {job['srid']}"
+    except:
+        return f"Invalid SRID: {job['srid']}"
+
+    demName = os.path.basename(job['raster'] or '')
+    if not demName or demName in ('#','None') or '#' in job['raster'] or 'None' in job['raster'].split(os.sep):
+        return f"Invalid DEM path: {job['raster']}"
+
+    if not job['schema'] or not job['table'] or 'None' in job['table'] or '#' in job['table']:
+        return f"Invalid target table: {job['schema']}.{job['table']}"
+
+    if bCheckExists and not os.path.exists(job['raster']):
+        return f"DEM does not exist: {job['raster']}"
+
+    return None
+
+## ===================================================================================
+def generateRegistrationJobs(records, profile='elevation', resolution=None, schema=None, table=None,
+                             tileSize=None, invalidJobs=None, bCheckExists=False):
+    """ Generator that yields 1 validated registration job per catalog record.
+
+        records     - dictionaries with 'dem_name','dem_path','epsg_code' (readCatalogRecords)
+        profile     - name of the registrationProfiles entry with the database, table and tile size
+        resolution  - resolution used in the table name template i.e. '3M'
+        schema      - overrides the schema of the profile
+        table       - overrides the table of the profile
+        tileSize    - overrides the tile size of the profile i.e. (256,256)
+        invalidJobs - list that (record, reason) of every invalid record is appended to
+    """
+
+    settings = registrationProfiles[profile]
+    schema = schema or settings['schema']
+    tableTemplate = table or settings['table']
+    tileSize = tileSize or settings['tileSize']
+
+    for record in records:
+        epsg = record.get('epsg_code')
+        raster = f"{record.get('dem_path')}{os.sep}{record.get('dem_name')}"
+
+        try:
+            region = getRegion(int(epsg))
+        except:
+            region = None
+
+        job = {'raster':raster, 'srid':epsg, 'band':1, 'tileSize':tuple(tileSize), 'schema':schema,
+               'table':(tableTemplate or '').format(resolution=(resolution or '').lower(), region=region, epsg=epsg),
+               'filename':True, 'cmd':None, 'db':dict(settings['db'])}
+
+        reason = validateJob(job, bCheckExists)
+        if reason:
+            if invalidJobs is not None:
+                invalidJobs.append((record, reason))
+            continue
+
+        job['srid'] = int(epsg)
+        job['cmd'] = formatRaster2pgsqlCommand(job)
+        yield job
+
+## ===================================================================================
+def createRegistrationJobs(catalogFile, profile='elevation', resolution=None, schema=None, table=None,
+                           tileSize=None, fieldIndex=None, bCheckExists=False, queryFootprint=(1,1), bSkipHeader=False):
+    """ Returns (jobs, invalidJobs) for every record of a catalog file.  Invalid records are
+        reported once here.
+
+        tileSize='auto' lets DSHub_Tile_Advisor pick the tile size from the block size
+        (blk_xsize, blk_ysize) of the DEMs and the expected query footprint in cells; the
+        tile size of the profile is used if the catalog has no block size information. """
+
+    records = readCatalogRecords(catalogFile, fieldIndex, bSkipHeader)
+
+    if tileSize == 'auto':
+        from DSHub_Tile_Advisor import adviseCatalogTileSize
+
+        records = list(records)
+        tileSize,blockAdvice = adviseCatalogTileSize(records, queryFootprint)
+
+        for blockSize,advice in blockAdvice.items():
+            AddMsgAndPrint(f"\tBlock size {blockSize[0]}x{blockSize[1]}: {advice['dems']:,} DEMs -- advised tile size {advice['tileSize'][0]}x{advice['tileSize'][1]}")
+
+        if tileSize:
+            AddMsgAndPrint(f"\tRegistering with a tile size of {tileSize[0]}x{tileSize[1]}")
+        else:
+            AddMsgAndPrint(f"\tNo block size information in {os.path.basename(catalogFile)}; using the {profile} tile size")
+
+    invalidJobs = list()
+    jobs = list(generateRegistrationJobs(records, profile, resolution, schema, table, tileSize,
+                                         invalidJobs, bCheckExists))
+
+    if invalidJobs:
+        AddMsgAndPrint(f"\n\tThere are {len(invalidJobs):,} catalog records that can't be registered:")
+        for record,reason in invalidJobs:
+            AddMsgAndPrint(f"\t\t{record.get('dem_name')}: {reason}")
+
+    return jobs, invalidJobs
+
+## ===================================================================================
+def formatRaster2pgsqlCommand(job):
+    """ raster2pgsql command line of 1 job in the format USGS_3 reads:
+
+        raster2pgsql -s 5070 -b 1 -t 256x256 -F -a -R /data02/gisdata/elev/3m/0/x.tif elevation.elevation_3m |
+        PGPASSWORD=itsnotflat psql -U elevation -d elevation -h 10.11.11.10 -p 6432
+    """
+
+    # Mutually exclusive options
+    # -a Append raster(s) to an existing table.
+
+    # Raster processing: Optional parameters used to manipulate input raster dataset
+    # -s - <SRID> Assign output raster with specified SRID.
+    # -b - Index (1-based) of band to extract from raster.
+    # -t - Tile Size; Cut raster into tiles to be inserted one per table row.
+    # -R - Register; Register the raster as a filesystem (out-db) raster.
+    #     Only the metadata of the raster and path location to the raster is
+    #     stored in the database (not the pixels).
+
+    # Optional parameters used to manipulate database objects
+    # -F - Add a column with the name of the file (necessary for elevation but not others)
+    #     This will be handy when you merge tilesets together
+    # -I - Create a GiST index on the raster column.  Not used; USGS_3 builds the index
+    #     once after the load.
+
+    # STDOUT parameters
+    # | - A pipe is a form of redirection in Linux used to connect the STDOUT
+    #     of one command into the STDIN of a second command.
+    # PGPASSWORD = itsnotflat
+    # -U elevation - user in the schemas
+    # -d elevation - database name
+    # -h 10.11.11.10 host - localhost
+    # -p port
+
+    db = job['db']
+    tileSize = f" -t {job['tileSize'][0]}x{job['tileSize'][1]}" if job['tileSize'] else ""
+    fileName = " -F" if job['filename'] else ""
+
+    return (f"raster2pgsql -s {job['srid']} -b {job['band']}{tileSize}{fileName} -a -R {job['raster']} {job['schema']}.{job['table']} | "
+            f"PGPASSWORD={db['password']} psql -U {db['user']} -d {db['dbname']} -h {db['host']} -p {db['port']}")
+
+## ===================================================================================
+def exportRaster2pgsqlFile(jobs, r2pgsqlFilePath, mode='w'):
+    """ Optional text export of jobs; 1 raster2pgsql command per line.
+        mode 'w' recreates the file, 'a+' appends to it.  Returns r2pgsqlFilePath """
+
+    # Lines are separated by newlines; there is no newline after the last line
+    bNewLine = mode.startswith('a') and os.path.exists(r2pgsqlFilePath) and os.path.getsize(r2pgsqlFilePath) > 0
+
+    with open(r2pgsqlFilePath, mode) as g:
+        if bNewLine and jobs:
+            g.write('\n')
+        g.write('\n'.join(job['cmd'] for job in jobs))
+
+    return r2pgsqlFilePath
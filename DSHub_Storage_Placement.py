@@ -0,0 +1,377 @@
+# -*- coding: utf-8 -*-
+"""
+Script Name: DSHub_Storage_Placement.py
+Created on Mon Oct 19 2026
+
+@author: Adolfo.Diaz
+GIS Business Analyst
+USDA - NRCS - SPSD - Soil Services and Information
+email address: adolfo.diaz@usda.gov
+cell: 608.215.7291
+
+The purpose of this module is to decide which EBS mount volume (/data02 ... /data09) a new
+file should be written to.  It replaces the 'last digit' sharding that was hardcoded in
+getEBSfolder (USGS_5), getDownloadFolder (DSHUB_GenerateDerivatives) and getDownloadFolder2
+(USGS_2).  The last digit of a tile name or ID has nothing to do with the size of the file
+or how full a volume is, which is why some volumes filled up while others sat half empty.
+
+How placement works:
+    1) Every placement is requested with a key (filename, gridID, huc) and the volumes that
+       are eligible for that product i.e. ['/data02/gisdata/elev','/data03/gisdata/elev']
+    2) If the key was placed before, the same volume is returned.  Placements are persisted
+       in a JSON placement map so that re-runs find their files in the same place.  New
+       placements are appended as 1 line to a journal next to the map (<mapFile>.journal)
+       instead of rewriting the whole map per key; the journal is folded into the map the
+       next time the map is loaded.
+    3) If the key is new but the file already exists on one of the volumes (placed by the old
+       last digit logic) that volume is adopted and recorded.
+    4) Otherwise a placement strategy picks the volume.  Strategies are looked up by name in
+       the placementStrategies dictionary so new ones can be plugged in:
+         - 'lastdigit' - original behavior of USGS_5.getEBSfolder; kept for reproducing old
+                         directory structures
+         - 'capacity'  - volume with the most free bytes after pending reservations
+         - 'balanced'  - (default) weighs the number of in-flight writers against the volume
+                         throughput and then the percent of the volume already used.  Parallel
+                         writers get spread across volumes to maximize aggregate I/O.
+    5) The caller calls releasePlacement when the write is done so the in-flight writer count
+       and the reserved bytes for that volume are decremented.
+
+Volume throughput weights can be set with setVolumeWeights; a volume with a weight of 2.0
+is expected to handle twice as many concurrent writers as a volume with a weight of 1.0.
+All functions are thread safe so they can be called from within ThreadPoolExecutor workers.
+"""
+
+## ========================================== Import modules ===============================================================
+import sys, os, traceback, json, shutil, threading
+
+placementLock = threading.Lock()
+placementMap = dict()      # 'namespace:key' -> volume root
+placementMapFile = None    # JSON file that placementMap is persisted to
+placementJournal = None    # open append handle of placementMapFile.journal
+inFlightWrites = dict()    # volume root -> number of writers currently writing to it
+reservedBytes = dict()     # volume root -> bytes promised to in-flight writers but not yet on disk
+volumeWeights = dict()     # volume root -> relative throughput; defaults to 1.0
+
+## ===================================================================================
+def AddMsgAndPrint(msg):
+
+    # Print message to python message console
+    print(msg)
+
+## ===================================================================================
+def errorMsg(errorOption=1):
+
+    """ By default, error messages will be printed immediately.
+        If errorOption is set to 2, return the message back to the function that it
+        was called from."""
+
+    try:
+
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        theMsg = "\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[1] + "\n\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[-1]
+
+        if errorOption==1:
+            AddMsgAndPrint(theMsg)
+        else:
+            return theMsg
+
+    except:
+        AddMsgAndPrint("Unhandled error in unHandledException method")
+        pass
+
+## ===================================================================================
+def loadPlacementMap(mapFile):
+    """ Load a previously persisted placement map so that keys are placed on the same
+        volume they were placed on before.  Placements journaled since the map was last
+        written are replayed, written to mapFile and the journal is emptied.  If the file
+        does not exist an empty map is started.
+        Returns the number of placements loaded."""
+
+    global placementMapFile, placementJournal
+
+    try:
+        with placementLock:
+            if placementJournal:
+                placementJournal.close()
+                placementJournal = None
+
+            placementMapFile = mapFile
+            placementMap.clear()
+
+            if os.path.exists(mapFile):
+                with open(mapFile, 'r') as fp:
+                    placementMap.update(json.load(fp))
+
+            journaled = 0
+            journalFile = f"{mapFile}.journal"
+            if os.path.exists(journalFile):
+                with open(journalFile, 'r') as fp:
+                    for line in fp:
+                        # A crash mid-append can leave a partial last line
+                        try:
+                            mapKey,root = json.loads(line)
+                        except ValueError:
+                            continue
+                        placementMap[mapKey] = root
+                        journaled += 1
+
+            if journaled:
+                savePlacementMap()
+
+            placementJournal = open(journalFile, 'a', buffering=1)
+
+        AddMsgAndPrint(f"\tPlacement Map: {mapFile} -- {len(placementMap):,} existing placements")
+        return len(placementMap)
+
+    except:
+        errorMsg()
+        return 0
+
+## ===================================================================================
+def savePlacementMap():
+    """ Write the whole placement map to placementMapFile and empty the journal.  The map is
+        written to a temp file first and then swapped in so a crash mid-write never leaves a
+        truncated map.  Must be called while holding placementLock."""
+
+    if not placementMapFile:
+        return
+
+    tmpFile = f"{placementMapFile}.tmp"
+    with open(tmpFile, 'w') as fp:
+        json.dump(placementMap, fp)
+    os.replace(tmpFile, placementMapFile)
+
+    if placementJournal:
+        placementJournal.truncate(0)
+    else:
+        open(f"{placementMapFile}.journal", 'w').close()
+
+## ===================================================================================
+def journalPlacement(mapKey, root):
+    """ Append 1 placement to the journal of placementMapFile (1 JSON line; the file is line
+        buffered so every placement is written through without rewriting the map).
+        Must be called while holding placementLock."""
+
+    if placementJournal:
+        placementJournal.write(json.dumps([mapKey, root]) + "\n")
+
+## ===================================================================================
+def setVolumeWeights(weightDict):
+    """ Set the relative throughput of each volume i.e. {'/data06/gisdata/elev': 2.0}
+        Volumes that are not listed keep a weight of 1.0"""
+
+    with placementLock:
+        volumeWeights.update(weightDict)
+
+## ===================================================================================
+def getVolumeStats(volumes):
+    """ Returns a dictionary of disk usage for every volume that is mounted:
+        {'/data02/gisdata/elev': {'total':bytes,'used':bytes,'free':bytes}}
+        Volumes that cannot be read are left out."""
+
+    volumeStats = dict()
+
+    for root in volumes:
+        try:
+            # The elev folder may not exist yet; usage is the same for the mount point
+            checkPath = root
+            while not os.path.exists(checkPath) and os.path.dirname(checkPath) != checkPath:
+                checkPath = os.path.dirname(checkPath)
+
+            usage = shutil.disk_usage(checkPath)
+            volumeStats[root] = {'total':usage.total, 'used':usage.used, 'free':usage.free}
+        except:
+            continue
+
+    return volumeStats
+
+## ===================================================================================
+def lastDigitStrategy(key, volumes, volumeStats, sizeInBytes):
+    """ Original sharding logic: volumes are assigned using the last digit found in key.
+        The 10 digits are dealt across the 4 volumes in the groups hardcoded in
+        USGS_5.getEBSfolder: ["1","9"],["2","7","8"],["3","6"],["4","5","0"]
+        (getDownloadFolder in DSHUB_GenerateDerivatives grouped "0" with "1","9"; files it
+        placed are found by the fileName adoption in getPlacementFolder).  Keys without a
+        digit or a volume list that isn't 4 long are spread by a checksum of the key."""
+
+    digitGroups = [["1","9"],["2","7","8"],["3","6"],["4","5","0"]]
+
+    ld = None
+    for char in reversed(str(key)):
+        if char.isdigit():
+            ld = char
+            break
+
+    if ld is None or len(volumes) != len(digitGroups):
+        return volumes[sum(ord(c) for c in str(key)) % len(volumes)]
+
+    for i,digits in enumerate(digitGroups):
+        if ld in digits:
+            return volumes[i]
+
+## ===================================================================================
+def capacityStrategy(key, volumes, volumeStats, sizeInBytes):
+    """ Volume with the most free bytes once bytes already reserved by in-flight
+        writers are subtracted."""
+
+    bestVolume = None
+    bestFree = None
+
+    for root in volumes:
+        if not root in volumeStats:
+            continue
+
+        free = volumeStats[root]['free'] - reservedBytes.get(root,0)
+        if bestFree is None or free > bestFree:
+            bestVolume = root
+            bestFree = free
+
+    return bestVolume
+
+## ===================================================================================
+def balancedStrategy(key, volumes, volumeStats, sizeInBytes):
+    """ Spread concurrent writers across volumes first and then fill volumes evenly.
+        Each volume is scored by:
+            1) in-flight writers / throughput weight  -- lower is better
+            2) (used + reserved + sizeInBytes) / total -- lower is better
+        Volumes that do not have room for sizeInBytes are skipped."""
+
+    candidates = list()
+
+    for root in volumes:
+        if not root in volumeStats:
+            continue
+
+        stats = volumeStats[root]
+        pending = reservedBytes.get(root,0) + sizeInBytes
+
+        if stats['free'] - pending <= 0:
+            continue
+
+        writeLoad = inFlightWrites.get(root,0) / volumeWeights.get(root,1.0)
+        usedFraction = (stats['used'] + pending) / stats['total']
+        candidates.append((writeLoad, usedFraction, root))
+
+    if not candidates:
+        return None
+
+    return min(candidates)[2]
+
+placementStrategies = {'lastdigit': lastDigitStrategy,
+                       'capacity': capacityStrategy,
+                       'balanced': balancedStrategy}
+
+## ===================================================================================
+def getPlacementFolder(key, subFolder, volumes, namespace='elev', strategy='balanced', sizeInBytes=0, fileName=None):
+    """ Returns the folder that a file identified by key should be written to and
+        registers an in-flight write against that volume.  releasePlacement must be
+        called with the returned folder once the write is finished.
+
+        key         - filename, gridID or huc that identifies the output
+        subFolder   - folder within the volume root i.e. 'dsh3m', 'Temp', '1m/2'
+        volumes     - list of eligible volume roots i.e. ['/data02/gisdata/elev',...]
+        namespace   - keeps keys from different products from colliding in the map
+        strategy    - name of a function in placementStrategies
+        sizeInBytes - expected size of the output; 0 if unknown
+        fileName    - if the file already exists in subFolder of one of the volumes
+                      that volume is adopted.
+
+        '/data07/gisdata/elev/dsh3m'
+    """
+
+    try:
+        mapKey = f"{namespace}:{key}"
+
+        with placementLock:
+            root = placementMap.get(mapKey)
+            if root is not None:
+                inFlightWrites[root] = inFlightWrites.get(root,0) + 1
+                reservedBytes[root] = reservedBytes.get(root,0) + sizeInBytes
+
+        if root is None:
+            # File checks and disk_usage are done outside of placementLock so threads placing
+            # other keys don't wait on the mounts
+            adopted = None
+            volumeStats = None
+
+            # Adopt volumes of files that were written before the placement map existed
+            if fileName:
+                for volume in volumes:
+                    if os.path.exists(os.path.join(volume, subFolder, fileName)):
+                        adopted = volume
+                        break
+
+            if adopted is None:
+                volumeStats = getVolumeStats(volumes)
+
+            with placementLock:
+                # Another thread may have placed the same key in the meantime
+                root = placementMap.get(mapKey) or adopted
+
+                if root is None:
+                    root = placementStrategies[strategy](key, volumes, volumeStats, sizeInBytes)
+
+                    # None of the volumes are mounted or have room
+                    if root is None:
+                        root = lastDigitStrategy(key, volumes, volumeStats, sizeInBytes)
+
+                if placementMap.get(mapKey) != root:
+                    placementMap[mapKey] = root
+                    journalPlacement(mapKey, root)
+
+                inFlightWrites[root] = inFlightWrites.get(root,0) + 1
+                reservedBytes[root] = reservedBytes.get(root,0) + sizeInBytes
+
+        folder = os.path.join(root, subFolder)
+
+        # In case another thread is creating the same directory
+        try:
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+        except:
+            pass
+
+        return folder
+
+    except:
+        errorMsg()
+        return False
+
+## ===================================================================================
+def releasePlacement(folder, sizeInBytes=0):
+    """ Mark the write to folder as finished.  folder is the value returned by
+        getPlacementFolder and sizeInBytes must match the size that was reserved."""
+
+    try:
+        with placementLock:
+            for root in inFlightWrites:
+                if folder.startswith(root):
+                    inFlightWrites[root] = max(inFlightWrites[root] - 1, 0)
+                    reservedBytes[root] = max(reservedBytes.get(root,0) - sizeInBytes, 0)
+                    break
+    except:
+        errorMsg()
+
+## ===================================================================================
+def placementSummary(volumes):
+    """ Returns a list of messages describing the number of placements, free space and
+        in-flight writers of each volume."""
+
+    msgs = list()
+    volumeStats = getVolumeStats(volumes)
+
+    with placementLock:
+        placedCounts = dict()
+        for root in placementMap.values():
+            placedCounts[root] = placedCounts.get(root,0) + 1
+
+        for root in volumes:
+            if not root in volumeStats:
+                msgs.append(f"\t{root:<25} not mounted")
+                continue
+
+            stats = volumeStats[root]
+            pctUsed = round(stats['used'] / stats['total'] * 100, 1)
+            msgs.append(f"\t{root:<25} Placed: {placedCounts.get(root,0):<10,} Used: {pctUsed}%  In-flight Writers: {inFlightWrites.get(root,0)}")
+
+    return msgs
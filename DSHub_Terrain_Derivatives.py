@@ -0,0 +1,490 @@
+# -*- coding: utf-8 -*-
+"""
+Script Name: DSHub_Terrain_Derivatives.py
+Created on Mon Oct 19 2026
+
+@author: Adolfo.Diaz
+GIS Business Analyst
+USDA - NRCS - SPSD - Soil Services and Information
+email address: adolfo.diaz@usda.gov
+cell: 608.215.7291
+
+The purpose of this script is to create the elevation derivatives (slope, aspect, tpi, tri and
+roughness) for the DS Hub in a single read pass of every DEM.  Previously each derivative was a
+separate gdaldem run over every 10m tile (20240123_203500_GDAL_SLOPE_FILES.txt,
+20240124_143057_GDAL_ASPECT_FILES.txt, etc.) so 5 derivatives meant reading every DEM 5 times.
+
+How it works:
+    1) The DEM is read in windows that are aligned to the native block size (blk_xsize/blk_ysize)
+       plus a 1-pixel halo on every side so that the 3x3 kernels are correct at window edges.
+    2) All requested derivatives are computed from the same window with vectorized NumPy.
+    3) Each derivative is written to its own output raster:
+            USGS_13_n27w100_20201228_5070.tif --> USGS_13_n27w100_20201228_5070_slope.tif
+
+Kernels (same as gdaldem defaults):
+    slope     - Horn (1981) slope in degrees
+    aspect    - Horn (1981) azimuth in degrees; 0 = North, clockwise. Flat cells are nodata
+    tpi       - center cell minus the mean of its 8 neighbors
+    tri       - Riley (1999) square root of the sum of squared differences to the 8 neighbors
+    roughness - largest minus smallest value of the 3x3 window
+
+Tile edges:
+    The halo pixels that fall outside of the DEM are filled by a halo reader.  By default they
+    are filled with nodata so edge cells become nodata, the same as gdaldem without -compute_edges.
+    bComputeEdges replicates the edge pixels instead (gdaldem -compute_edges).  A haloSource
+    function can be passed to fill the halo from the adjacent tiles so that outputs are seamless
+    across tile boundaries.
+
+Parameters (__main__):
+    1) demListFile - text file with the absolute path of 1 DEM per line
+    2) derivatives - comma separated list of derivatives i.e. slope,aspect,tpi
+    3) outputFolder - folder where derivatives will be written; blank = same folder as the DEM
+"""
+
+## ========================================== Import modules ===============================================================
+import sys, os, traceback, time, multiprocessing
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from osgeo import gdal
+
+derivativeList = ['slope','aspect','tpi','tri','roughness']
+outputNoData = -9999.0
+
+## ===================================================================================
+def AddMsgAndPrint(msg,msgList=list()):
+
+    # Print message to python message console
+    try:
+        if msgList:
+            for msg in msgList:
+                print(msg)
+        else:
+            print(msg)
+    except:
+        pass
+
+## ===================================================================================
+def errorMsg(errorOption=1):
+
+    """ By default, error messages will be printed and logged immediately.
+        If errorOption is set to 2, return the message back to the function that it
+        was called from.  This is used in functions that use multi-threading functionality"""
+
+    try:
+
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        theMsg = "\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[1] + "\n\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[-1]
+
+        if errorOption==1:
+            AddMsgAndPrint(theMsg)
+        else:
+            return theMsg
+
+    except:
+        AddMsgAndPrint("Unhandled error in unHandledException method")
+        pass
+
+## ================================================================================================================
+def tic():
+    """ Returns the current time """
+
+    return time.time()
+
+## ================================================================================================================
+def toc(_start_time):
+    """ Returns the total time by subtracting the start time - finish time"""
+
+    try:
+
+        t_sec = round(time.time() - _start_time)
+        (t_min, t_sec) = divmod(t_sec,60)
+        (t_hour,t_min) = divmod(t_min,60)
+
+        if t_hour:
+            return ('{} hour(s): {} minute(s): {} second(s)'.format(int(t_hour),int(t_min),int(t_sec)))
+        elif t_min:
+            return ('{} minute(s): {} second(s)'.format(int(t_min),int(t_sec)))
+        else:
+            return ('{} second(s)'.format(int(t_sec)))
+
+    except:
+        errorMsg()
+
+## ================================================================================================================
+def computeDerivatives(z, xRes, yRes, derivatives, scale=1.0):
+    """ Computes the requested derivatives from a window that includes a 1-pixel halo.
+        z must be a float array of (rows+2, cols+2) with nodata cells set to NaN.
+        xRes and yRes are the absolute cell sizes.  scale is the ratio of horizontal
+        units to elevation units (111120 for geographic DEMs in meters).
+
+        returns a dictionary of derivative name: float32 array (rows, cols) with NaN as nodata
+    """
+
+    # 3x3 neighborhood of every cell
+    # a b c
+    # d e f
+    # g h i
+    a = z[:-2,:-2];  b = z[:-2,1:-1];  c = z[:-2,2:]
+    d = z[1:-1,:-2]; e = z[1:-1,1:-1]; f = z[1:-1,2:]
+    g = z[2:,:-2];   h = z[2:,1:-1];   i = z[2:,2:]
+
+    results = dict()
+
+    if 'slope' in derivatives or 'aspect' in derivatives:
+        dx = ((c + 2*f + i) - (a + 2*d + g)) / (8.0 * xRes * scale)
+        dy = ((g + 2*h + i) - (a + 2*b + c)) / (8.0 * yRes * scale)
+
+        if 'slope' in derivatives:
+            results['slope'] = np.degrees(np.arctan(np.sqrt(dx*dx + dy*dy)))
+
+        if 'aspect' in derivatives:
+            aspect = np.degrees(np.arctan2(dy, -dx))
+            aspect = np.where(aspect > 90.0, 450.0 - aspect, 90.0 - aspect)
+            aspect[aspect == 360.0] = 0.0
+            aspect[(dx == 0) & (dy == 0)] = np.nan
+            results['aspect'] = aspect
+
+    neighbors = (a,b,c,d,f,g,h,i)
+
+    if 'tpi' in derivatives:
+        results['tpi'] = e - sum(neighbors) / 8.0
+
+    if 'tri' in derivatives:
+        results['tri'] = np.sqrt(sum((n - e)**2 for n in neighbors))
+
+    if 'roughness' in derivatives:
+        stack = np.stack(neighbors + (e,))
+        results['roughness'] = stack.max(axis=0) - stack.min(axis=0)
+
+    # NaN in any of the 9 cells propagates; cast once for writing
+    for deriv in results:
+        results[deriv] = results[deriv].astype(np.float32)
+
+    return results
+
+## ================================================================================================================
+def readWindowWithHalo(band, noData, xoff, yoff, xsize, ysize, bComputeEdges=False, neighborReader=None):
+    """ Reads a window from band with a 1-pixel halo on every side.  The part of the halo
+        that falls outside of the raster is filled by neighborReader if given, otherwise with
+        the replicated edge pixels (bComputeEdges) or NaN.
+
+        neighborReader(xoff, yoff, xsize, ysize) must return a float array of (ysize, xsize) in
+        the pixel space of band with NaN where no neighbor exists.
+
+        returns a float64 array of (ysize+2, xsize+2) with nodata cells set to NaN
+    """
+
+    cols = band.XSize
+    rows = band.YSize
+
+    # halo window clipped to the raster
+    readX0 = max(xoff - 1, 0)
+    readY0 = max(yoff - 1, 0)
+    readX1 = min(xoff + xsize + 1, cols)
+    readY1 = min(yoff + ysize + 1, rows)
+
+    data = band.ReadAsArray(readX0, readY0, readX1 - readX0, readY1 - readY0).astype(np.float64)
+    if noData is not None:
+        data[data == noData] = np.nan
+
+    # Position of the data within the padded window
+    padLeft = readX0 - (xoff - 1)
+    padTop = readY0 - (yoff - 1)
+    padRight = (xoff + xsize + 1) - readX1
+    padBottom = (yoff + ysize + 1) - readY1
+
+    if not (padLeft or padTop or padRight or padBottom):
+        return data
+
+    padding = ((padTop,padBottom),(padLeft,padRight))
+    if bComputeEdges:
+        z = np.pad(data, padding, mode='edge')
+    else:
+        z = np.pad(data, padding, mode='constant', constant_values=np.nan)
+
+    # Halo pixels from adjacent tiles; pixels without a neighbor keep the edge behavior
+    if neighborReader:
+        neighbors = neighborReader(xoff - 1, yoff - 1, xsize + 2, ysize + 2)
+        neighbors[padTop:padTop + data.shape[0], padLeft:padLeft + data.shape[1]] = data
+        z = np.where(np.isnan(neighbors), z, neighbors)
+
+    return z
+
+## ================================================================================================================
+def createNeighborReader(demPath, neighborDEMs):
+    """ Returns a neighborReader function (see readWindowWithHalo) that fills the halo of
+        demPath from the DEMs in neighborDEMs using windowed reads only.  Neighbors must have
+        the same resolution and coordinate system as demPath; pixel offsets are rounded to the
+        nearest pixel.  Only the pixels that fall outside of demPath are read from the neighbors.
+        The first neighbor that has valid data for a pixel wins.
+
+        neighborDEMs is a list of DEM paths, typically the adjacent tiles from the catalog.
+    """
+
+    demDS = gdal.Open(demPath)
+    demGT = demDS.GetGeoTransform()
+    cols = demDS.RasterXSize
+    rows = demDS.RasterYSize
+    demDS = None
+
+    # Open every neighbor once; [(band, noData, colOffset, rowOffset, cols, rows)]
+    # colOffset/rowOffset is the position of the neighbor origin in the pixel space of demPath
+    neighborList = list()
+    for neighbor in neighborDEMs:
+        try:
+            nDS = gdal.Open(neighbor)
+            nGT = nDS.GetGeoTransform()
+
+            if abs(nGT[1] - demGT[1]) > abs(demGT[1]) * 0.001 or abs(nGT[5] - demGT[5]) > abs(demGT[5]) * 0.001:
+                continue
+
+            colOffset = int(round((nGT[0] - demGT[0]) / demGT[1]))
+            rowOffset = int(round((nGT[3] - demGT[3]) / demGT[5]))
+            nBand = nDS.GetRasterBand(1)
+            neighborList.append((nDS, nBand, nBand.GetNoDataValue(), colOffset, rowOffset, nDS.RasterXSize, nDS.RasterYSize))
+        except:
+            continue
+
+    def neighborReader(xoff, yoff, xsize, ysize):
+
+        window = np.full((ysize, xsize), np.nan)
+
+        # Strips of the window that are outside of demPath (x0, y0, x1, y1)
+        strips = [(xoff, yoff, xoff + xsize, 0),                          # top
+                  (xoff, rows, xoff + xsize, yoff + ysize),               # bottom
+                  (xoff, max(yoff,0), 0, min(yoff + ysize, rows)),        # left
+                  (cols, max(yoff,0), xoff + xsize, min(yoff + ysize, rows))]   # right
+
+        for sx0,sy0,sx1,sy1 in strips:
+            if sx1 <= sx0 or sy1 <= sy0:
+                continue
+
+            for nDS,nBand,nNoData,colOffset,rowOffset,nCols,nRows in neighborList:
+
+                # strip clipped to the neighbor extent in the pixel space of demPath
+                rx0 = max(sx0, colOffset); rx1 = min(sx1, colOffset + nCols)
+                ry0 = max(sy0, rowOffset); ry1 = min(sy1, rowOffset + nRows)
+                if rx1 <= rx0 or ry1 <= ry0:
+                    continue
+
+                data = nBand.ReadAsArray(rx0 - colOffset, ry0 - rowOffset, rx1 - rx0, ry1 - ry0).astype(np.float64)
+                if nNoData is not None:
+                    data[data == nNoData] = np.nan
+
+                target = window[ry0 - yoff:ry1 - yoff, rx0 - xoff:rx1 - xoff]
+                np.copyto(target, data, where=np.isnan(target))
+
+        return window
+
+    return neighborReader
+
+## ================================================================================================================
+def getWindowSize(band, minSize=1024):
+    """ Returns a window size (xsize, ysize) that is a multiple of the native block size
+        and at least minSize pixels on each side (or the full raster).  Reading along the
+        block size avoids decompressing the same TIFF block twice."""
+
+    blkX,blkY = band.GetBlockSize()
+
+    winX = blkX * max(1, -(-minSize // blkX))
+    winY = blkY * max(1, -(-minSize // blkY))
+
+    return min(winX, band.XSize), min(winY, band.YSize)
+
+## ================================================================================================================
+def createDerivatives(demPath, derivatives, outputFolder=None, bReplace=False, bComputeEdges=False, haloSource=None, scale=1.0):
+    """ This function will create all requested derivatives for a DEM in 1 read pass.
+        Outputs are written next to the DEM unless outputFolder is given:
+           /data02/gisdata/elev/10m/0/USGS_13_n27w100_20201228_5070.tif -->
+           /data02/gisdata/elev/10m/0/USGS_13_n27w100_20201228_5070_slope.tif
+
+        haloSource is a function that takes the DEM path and returns a neighborReader for it
+        (see readWindowWithHalo) or None.  Without it, tile edges follow bComputeEdges.
+
+        Returns a dictionary with messages, derivatives created and failed DEMs like extractDEMs
+    """
+
+    try:
+        derivStart = tic()
+
+        returnDict = dict()
+        returnDict['msgs'] = []
+        returnDict['rast'] = dict()     # derivative: output raster
+        returnDict['fail'] = []
+        returnDict['pTime'] = []
+
+        demName = os.path.basename(demPath)
+        returnDict['msgs'].append(f"\n\tCreating {', '.join(derivatives)} for {demName}")
+
+        if outputFolder is None:
+            outputFolder = os.path.dirname(demPath)
+
+        # Determine outputs that need to be created
+        outputDict = dict()
+        for deriv in derivatives:
+            outRaster = os.path.join(outputFolder, f"{os.path.splitext(demName)[0]}_{deriv}.tif")
+
+            if os.path.exists(outRaster):
+                if bReplace:
+                    gdal.GetDriverByName('GTiff').Delete(outRaster)
+                else:
+                    returnDict['msgs'].append(f"\t\t{'Derivative Exists:':<20} {os.path.basename(outRaster):<60}")
+                    returnDict['rast'][deriv] = outRaster
+                    continue
+
+            outputDict[deriv] = outRaster
+
+        if not outputDict:
+            return returnDict
+
+        demDS = gdal.Open(demPath)
+        band = demDS.GetRasterBand(1)
+        noData = band.GetNoDataValue()
+        geoTransform = demDS.GetGeoTransform()
+        xRes = abs(geoTransform[1])
+        yRes = abs(geoTransform[5])
+        cols = demDS.RasterXSize
+        rows = demDS.RasterYSize
+
+        neighborReader = haloSource(demPath) if haloSource else None
+
+        # Create 1 output per derivative
+        driver = gdal.GetDriverByName('GTiff')
+        outDSDict = dict()
+        for deriv,outRaster in outputDict.items():
+            outDS = driver.Create(outRaster, cols, rows, 1, gdal.GDT_Float32,
+                                  options=["COMPRESS=DEFLATE","TILED=YES","PREDICTOR=3","BIGTIFF=IF_SAFER"])
+            outDS.SetGeoTransform(geoTransform)
+            outDS.SetProjection(demDS.GetProjection())
+            outDS.GetRasterBand(1).SetNoDataValue(outputNoData)
+            outDSDict[deriv] = outDS
+
+        # Read every window of the DEM once and compute all derivatives from it
+        winX,winY = getWindowSize(band)
+        for yoff in range(0, rows, winY):
+            ysize = min(winY, rows - yoff)
+
+            for xoff in range(0, cols, winX):
+                xsize = min(winX, cols - xoff)
+
+                z = readWindowWithHalo(band, noData, xoff, yoff, xsize, ysize, bComputeEdges, neighborReader)
+                results = computeDerivatives(z, xRes, yRes, list(outputDict), scale)
+
+                for deriv,arr in results.items():
+                    arr[np.isnan(arr)] = outputNoData
+                    outDSDict[deriv].GetRasterBand(1).WriteArray(arr, xoff, yoff)
+
+        for deriv,outDS in outDSDict.items():
+            outDS.FlushCache()
+            outDSDict[deriv] = None
+            returnDict['rast'][deriv] = outputDict[deriv]
+            returnDict['msgs'].append(f"\t\t{'Output File:':<20} {outputDict[deriv]}")
+
+        demDS = None
+
+        returnDict['msgs'].append(f"\t\tProcessing Time: {toc(derivStart)}")
+        returnDict['pTime'].append(f"{toc(derivStart)}")
+        return returnDict
+
+    except:
+        returnDict['msgs'].append(errorMsg(errorOption=2))
+        returnDict['msgs'].append(f"\t\t-Process Time: {toc(derivStart)}")
+        returnDict['fail'].append(demPath)
+        return returnDict
+
+## ===================================================================================
+def main(demList, derivatives, outputFolder=None, bReplace=False, bComputeEdges=False, haloSource=None, scale=1.0, listFolder=None):
+    """ Creates derivatives for every DEM in demList in multi-threading mode and writes
+        a list file of outputs per derivative that can be passed to DSHub_Create_Raster2pgsql_File:
+            20240123_203500_DSHUB_SLOPE_FILES.txt
+
+        returns a dictionary of derivative: list of output rasters
+    """
+
+    try:
+        startTime = tic()
+
+        derivativeFiles = {deriv: list() for deriv in derivatives}
+        failedDEMs = list()
+        tracker = 0
+
+        AddMsgAndPrint(f"\nCreating {', '.join(derivatives)} for {len(demList):,} DEMs - Multi-threading Mode")
+
+        with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
+            derivProcessing = {executor.submit(createDerivatives, dem, derivatives, outputFolder, bReplace, bComputeEdges, haloSource, scale): dem for dem in demList}
+
+            for future in as_completed(derivProcessing):
+                returnDict = future.result()
+                tracker+=1
+
+                batchMsgs = list()
+                for j,printMessage in enumerate(returnDict['msgs']):
+                    if j==0:
+                        batchMsgs.append(f"{printMessage} -- ({tracker:,} of {len(demList):,})")
+                    else:
+                        batchMsgs.append(printMessage)
+                AddMsgAndPrint(None,msgList=batchMsgs)
+
+                for deriv,outRaster in returnDict['rast'].items():
+                    derivativeFiles[deriv].append(outRaster)
+                if returnDict['fail']:
+                    failedDEMs.append(returnDict['fail'][0])
+
+        # Write list of files per derivative
+        if listFolder:
+            today = datetime.today().strftime('%Y%m%d_%H%M%S')
+            for deriv,files in derivativeFiles.items():
+                listFile = f"{listFolder}{os.sep}{today}_DSHUB_{deriv.upper()}_FILES.txt"
+                with open(listFile, 'w') as fp:
+                    fp.write('\n'.join(files))
+                AddMsgAndPrint(f"\n\t{deriv} File List: {listFile}")
+
+        AddMsgAndPrint(f"\n{'-'*40}SUMMARY{'-'*40}")
+        AddMsgAndPrint(f"Total Processing Time: {toc(startTime)}")
+        for deriv,files in derivativeFiles.items():
+            AddMsgAndPrint(f"\t{deriv:<12} {len(files):,} of {len(demList):,} DEMs")
+        if failedDEMs:
+            AddMsgAndPrint(f"\nThere were {len(failedDEMs):,} DEMs that failed:")
+            for dem in failedDEMs:
+                AddMsgAndPrint(f"\t{dem}")
+
+        return derivativeFiles
+
+    except:
+        errorMsg()
+        return False
+
+## ===================================================================================
+if __name__ == '__main__':
+
+    try:
+        gdal.UseExceptions()
+
+        # PARAM#1 -- File containing list of DEMs
+        demListFile = input("\nEnter full path of File containing list of DEMs: ")
+        while not os.path.exists(demListFile):
+            print(f"{demListFile} does NOT exist. Try Again")
+            demListFile = input("\nEnter full path of File containing list of DEMs: ")
+
+        # PARAM#2 -- Derivatives to create
+        derivatives = input(f"\nEnter derivatives to create ({','.join(derivativeList)}): ")
+        derivatives = [d.strip().lower() for d in derivatives.split(',') if d.strip()]
+        while not derivatives or not all(d in derivativeList for d in derivatives):
+            print(f"Derivatives must be one or more of {','.join(derivativeList)}. Try Again")
+            derivatives = input(f"\nEnter derivatives to create ({','.join(derivativeList)}): ")
+            derivatives = [d.strip().lower() for d in derivatives.split(',') if d.strip()]
+
+        # PARAM#3 -- Output folder
+        outputFolder = input("\nEnter output folder (leave blank to write next to each DEM): ")
+        if not outputFolder:
+            outputFolder = None
+
+        with open(demListFile, 'r') as fp:
+            demList = [line.strip() for line in fp if line.strip()]
+
+        main(demList, derivatives, outputFolder, listFolder=os.path.dirname(demListFile))
+
+    except:
+        errorMsg()
@@ -0,0 +1,478 @@
+# -*- coding: utf-8 -*-
+"""
+Script Name: DSHub_Tile_Advisor.py
+Created on Mon Oct 19 2026
+
+@author: Adolfo.Diaz
+GIS Business Analyst
+USDA - NRCS - SPSD - Soil Services and Information
+email address: adolfo.diaz@usda.gov
+cell: 608.215.7291
+
+The purpose of this module is to choose the raster2pgsql tile size (-t) of an out-db
+registration instead of hardcoding 256x256 for DEMs and 512x512 for derivatives.
+
+With -R every tile is a row that points back to the DEM so the tile size controls:
+    - the number of rows and the size of the GiST index (smaller tiles = more rows)
+    - how many rows a query touches (larger tiles = fewer rows per query)
+    - how many TIFF blocks GDAL reads to answer a query.  A tile edge that does not line up
+      with the internal block size (blk_xsize, blk_ysize recorded by getRasterInformation_MT)
+      makes neighboring tiles read the same blocks twice.
+
+How the advisor works:
+    1) candidateTileSizes - tile sizes that are multiples of the block size (or of the strip
+       height for striped TIFFs) between minSize and maxSize.
+    2) estimateTileCost - analytic estimate of rows per DEM, rows touched and TIFF blocks read
+       by a query of queryFootprint cells (1x1 = ST_Value; e.g. 256x256 = ST_Clip of an AOI).
+    3) recommendTileSize / adviseCatalogTileSize - candidate with the lowest estimated cost for
+       1 block size or for the dominant block size of a catalog (master elevation) file.
+    4) benchmarkTileSizes - the estimate is only a model; the benchmark registers a sample of
+       DEMs on a local PostGIS at every candidate tile size and measures the number of rows,
+       table and index size and ST_Value / ST_Clip latency.  pickMeasuredTileSize picks the
+       tile size from the measurements.
+    5) measureCatalogTileSize / main - runs the benchmark on a sample of the DEMs of a catalog
+       file (dominant block size and EPSG) and registers the catalog with the measured tile
+       size through DSHub_Registration_Jobs.createRegistrationJobs:
+           python DSHub_Tile_Advisor.py <catalogFile> <resolution> [raster2pgsqlFile]
+"""
+
+## ========================================== Import modules ===============================================================
+import sys, os, traceback, time, random, statistics
+
+from osgeo import gdal
+import psycopg2
+
+from DSHub_Raster_Loader import getRasterHeader, getTileCount, runRaster2pgsqlBatch
+from DSHub_Registration_Jobs import readCatalogRecords, createRegistrationJobs, exportRaster2pgsqlFile
+
+# Cost of touching 1 row (index lookup, detoast, opening the out-db file) expressed in the
+# number of pixels that could be read in the same time.  Calibrate with benchmarkTileSizes.
+rowCostPixels = 65536
+
+# Part of the pixels of a touched row that a query pays for no matter how few it reads
+# (ST_Clip and ST_Value work on the extent of the whole tile).
+tilePixelCost = 0.05
+
+## ===================================================================================
+def AddMsgAndPrint(msg):
+
+    # Print message to python message console
+    print(msg)
+
+## ===================================================================================
+def errorMsg(errorOption=1):
+
+    """ By default, error messages will be printed immediately.
+        If errorOption is set to 2, return the message back to the function that it
+        was called from."""
+
+    try:
+
+        exc_type, exc_value, exc_traceback = sys.exc_info()
+        theMsg = "\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[1] + "\n\t" + traceback.format_exception(exc_type, exc_value, exc_traceback)[-1]
+
+        if errorOption==1:
+            AddMsgAndPrint(theMsg)
+        else:
+            return theMsg
+
+    except:
+        AddMsgAndPrint("Unhandled error in unHandledException method")
+        pass
+
+## ===================================================================================
+def getBlockSize(rasterPath, band=1):
+    """ Internal block size (blk_xsize, blk_ysize) and size (columns, rows) of a raster """
+
+    ds = gdal.Open(rasterPath)
+    blockSize = tuple(ds.GetRasterBand(band).GetBlockSize())
+    rasterSize = (ds.RasterXSize, ds.RasterYSize)
+    ds = None
+
+    return blockSize, rasterSize
+
+## ===================================================================================
+def candidateTileSizes(blockSize, rasterSize=None, minSize=128, maxSize=1024):
+    """ Square tile sizes aligned to the block size of a raster.
+
+        Tiled TIFF  (i.e. 256x256 blocks)  - multiples of the block: 256, 512, 768, 1024
+        Striped TIFF (block is 1 row or a few rows the width of the raster) - multiples of
+            the strip height; every tile reads whole strips no matter what so only the height matters
+
+        A block larger than maxSize is returned as is.  Sizes larger than the raster are skipped.
+        returns a list of (width, height)
+    """
+
+    blkX,blkY = blockSize
+    bStriped = rasterSize is not None and blkX >= rasterSize[0]
+    step = blkY if bStriped else max(blkX, blkY)
+
+    if step >= maxSize:
+        return [(step,step)]
+
+    sizes = list()
+    size = step
+    while size <= maxSize:
+        if size >= minSize and (rasterSize is None or size <= max(rasterSize)):
+            sizes.append((size,size))
+        size += step
+
+    # Striped rasters with 1 row strips would create hundreds of candidates
+    if bStriped and len(sizes) > 8:
+        sizes = [s for s in sizes if s[0] & (s[0] - 1) == 0] or sizes[-1:]
+
+    return sizes or [(step,step)]
+
+## ===================================================================================
+def estimateTileCost(tileSize, blockSize, rasterSize, queryFootprint=(1,1)):
+    """ Analytic estimate of what a query of queryFootprint (columns, rows) cells costs
+        at tileSize.
+
+        rows        - rows 1 DEM creates
+        rowsTouched - expected number of rows a randomly placed query intersects
+        blocksRead  - expected number of TIFF blocks read to answer the query.  A block that
+                      straddles 2 tiles is read once for each tile.
+        cost        - rowsTouched * (rowCostPixels + tilePixelCost * tile pixels) + pixels read
+    """
+
+    tileX,tileY = tileSize
+    blkX,blkY = blockSize
+    queryX,queryY = queryFootprint
+
+    # Striped TIFF: a block is a strip that spans the raster
+    blkX = min(blkX, rasterSize[0])
+
+    rows = getTileCount({'cols':rasterSize[0], 'rows':rasterSize[1]}, tileSize)
+
+    # A window of q cells placed at random crosses (q - 1) / t tile edges on average
+    tilesX = 1 + (queryX - 1) / tileX
+    tilesY = 1 + (queryY - 1) / tileY
+
+    # Blocks the query window touches; a misaligned tile edge inside the window splits a
+    # block that is then read once for each tile
+    alignedX = tileX % blkX == 0
+    alignedY = tileY % blkY == 0
+    blocksX = 1 + (queryX - 1) / blkX + (0 if alignedX else tilesX - 1)
+    blocksY = 1 + (queryY - 1) / blkY + (0 if alignedY else tilesY - 1)
+
+    rowsTouched = tilesX * tilesY
+    blocksRead = blocksX * blocksY
+    pixelsRead = blocksRead * blkX * blkY
+    rowCost = rowCostPixels + tilePixelCost * tileX * tileY
+
+    return {'tileSize':tuple(tileSize), 'rows':rows, 'rowsTouched':round(rowsTouched,2), 'blocksRead':round(blocksRead,2),
+            'pixelsRead':round(pixelsRead), 'aligned':alignedX and alignedY,
+            'cost':round(rowsTouched * rowCost + pixelsRead)}
+
+## ===================================================================================
+def recommendTileSize(blockSize, rasterSize, queryFootprint=(1,1), minSize=128, maxSize=1024):
+    """ Candidate tile size with the lowest estimated cost for queryFootprint.  Ties go to
+        the larger tile (fewer rows and a smaller index).
+
+        returns (tileSize, [estimates of every candidate])
+    """
+
+    estimates = [estimateTileCost(tileSize, blockSize, rasterSize, queryFootprint)
+                 for tileSize in candidateTileSizes(blockSize, rasterSize, minSize, maxSize)]
+
+    best = min(estimates, key=lambda e: (e['cost'], -e['tileSize'][0] * e['tileSize'][1]))
+    return best['tileSize'], estimates
+
+## ===================================================================================
+def adviseCatalogTileSize(records, queryFootprint=(1,1), minSize=128, maxSize=1024):
+    """ Recommends 1 tile size for the DEMs of a catalog (master elevation file) from the
+        blk_xsize, blk_ysize, rds_column and rds_rows fields that getRasterInformation_MT
+        records.  A table should have 1 tile size so the recommendation is made for the
+        most common block size.
+
+        records - dictionaries i.e. DSHub_Registration_Jobs.readCatalogRecords
+
+        returns (tileSize, {blockSize: {'dems','rasterSize','tileSize'}}) or (None, {}) if
+        the records have no block size information
+    """
+
+    blockGroups = dict()
+
+    for record in records:
+        try:
+            blockSize = (int(record['blk_xsize']), int(record['blk_ysize']))
+            rasterSize = (int(record['rds_column']), int(record['rds_rows']))
+        except:
+            continue
+
+        group = blockGroups.setdefault(blockSize, {'dems':0, 'columns':0, 'rows':0})
+        group['dems'] += 1
+        group['columns'] += rasterSize[0]
+        group['rows'] += rasterSize[1]
+
+    blockAdvice = dict()
+    for blockSize,group in blockGroups.items():
+        rasterSize = (group['columns'] // group['dems'], group['rows'] // group['dems'])
+        tileSize,estimates = recommendTileSize(blockSize, rasterSize, queryFootprint, minSize, maxSize)
+        blockAdvice[blockSize] = {'dems':group['dems'], 'rasterSize':rasterSize, 'tileSize':tileSize}
+
+    if not blockAdvice:
+        return None, blockAdvice
+
+    dominant = max(blockAdvice, key=lambda b: blockAdvice[b]['dems'])
+    return blockAdvice[dominant]['tileSize'], blockAdvice
+
+## ===================================================================================
+def getQueryPoints(headers, count, seed=1):
+    """ count random (x, y) coordinates that fall within the extent of the sampled DEMs.
+        The same seed gives the same points for every tile size."""
+
+    rand = random.Random(seed)
+    points = list()
+
+    for i in range(count):
+        header = headers[i % len(headers)]
+        ulx,xres,xskew,uly,yskew,yres = header['geoTransform']
+        col = rand.uniform(0, header['cols'])
+        row = rand.uniform(0, header['rows'])
+        points.append((ulx + col * xres, uly + row * yres, header))
+
+    return points
+
+## ===================================================================================
+def measureLatency(cursor, sql, paramsList):
+    """ Executes sql once per params and returns {'p50','p95','max'} in milliseconds """
+
+    times = list()
+    for params in paramsList:
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        times.append((time.perf_counter() - start) * 1000)
+
+    times.sort()
+    return {'p50':round(statistics.median(times),2),
+            'p95':round(times[min(int(len(times) * 0.95), len(times) - 1)],2),
+            'max':round(times[-1],2)}
+
+## ===================================================================================
+def benchmarkTileSizes(rasters, tileSizes, dbParams, srid, schema='public', queryFootprint=(256,256),
+                       samples=200, bKeepTables=False):
+    """ Registers rasters (a sample of DEMs) out-db at every tile size in tileSizes on a local
+        PostGIS database and measures:
+            rows          - rows in the table
+            tableMB       - size of the table (pg_table_size)
+            indexMB       - size of the GiST index on ST_ConvexHull(rast)
+            loadSeconds   - raster2pgsql registration time
+            value         - ST_Value latency of samples random points (p50, p95, max ms)
+            clip          - ST_Clip latency of samples random windows of queryFootprint cells
+
+        Every tile size is queried with the same points and windows.  Benchmark tables are
+        named tile_advisor_<w>x<h> and are dropped unless bKeepTables is True.
+
+        returns a list of result dictionaries; 1 per tile size
+    """
+
+    headers = list()
+    for raster in rasters:
+        try:
+            header = getRasterHeader(raster)
+            header['raster'] = raster
+            headers.append(header)
+        except:
+            AddMsgAndPrint(f"\tUnable to read {os.path.basename(raster)}; left out of the benchmark")
+
+    if not headers:
+        return list()
+
+    points = getQueryPoints(headers, samples)
+    valueParams = [(x, y, srid) * 2 for x,y,header in points]
+
+    # Windows of queryFootprint cells centered on the same points
+    clipParams = list()
+    for x,y,header in points:
+        halfX = abs(header['geoTransform'][1]) * queryFootprint[0] / 2
+        halfY = abs(header['geoTransform'][5]) * queryFootprint[1] / 2
+        clipParams.append((x - halfX, y - halfY, x + halfX, y + halfY, srid) * 2)
+
+    results = list()
+    conn = psycopg2.connect(**dbParams)
+    conn.autocommit = True
+
+    try:
+        for tileSize in tileSizes:
+            table = f"tile_advisor_{tileSize[0]}x{tileSize[1]}"
+            result = {'tileSize':tuple(tileSize), 'table':f"{schema}.{table}", 'rasters':len(headers)}
+            AddMsgAndPrint(f"\tBenchmarking {tileSize[0]}x{tileSize[1]} tiles")
+
+            try:
+                with conn.cursor() as cursor:
+                    cursor.execute(f"DROP TABLE IF EXISTS {schema}.{table}")
+                    cursor.execute(f"CREATE TABLE {schema}.{table} (rid serial PRIMARY KEY, rast raster, filename text)")
+
+                batch = [{'raster':h['raster'], 'srid':srid, 'band':1, 'tileSize':tuple(tileSize), 'schema':schema,
+                          'table':table, 'filename':True, 'cmd':None, 'db':dbParams,
+                          'tiles':getTileCount(h, tileSize)} for h in headers]
+
+                loadResult = runRaster2pgsqlBatch(batch)
+                result['loadSeconds'] = loadResult['seconds']
+                if loadResult['status'] == 'Error':
+                    result['error'] = loadResult['error']
+                    results.append(result)
+                    continue
+
+                with conn.cursor() as cursor:
+                    cursor.execute(f"CREATE INDEX {table}_rast_gist ON {schema}.{table} USING GIST (ST_ConvexHull(rast))")
+                    cursor.execute(f"ANALYZE {schema}.{table}")
+
+                    cursor.execute(f"""SELECT COUNT(*), pg_table_size('{schema}.{table}'),
+                                       pg_relation_size('{schema}.{table}_rast_gist') FROM {schema}.{table}""")
+                    rows,tableBytes,indexBytes = cursor.fetchone()
+                    result['rows'] = rows
+                    result['tableMB'] = round(tableBytes / 1048576, 2)
+                    result['indexMB'] = round(indexBytes / 1048576, 2)
+
+                    result['value'] = measureLatency(cursor,
+                        f"""SELECT ST_Value(rast, 1, ST_SetSRID(ST_Point(%s, %s), %s)) FROM {schema}.{table}
+                            WHERE ST_Intersects(ST_ConvexHull(rast), ST_SetSRID(ST_Point(%s, %s), %s))""", valueParams)
+
+                    result['clip'] = measureLatency(cursor,
+                        f"""SELECT SUM(ST_Count(ST_Clip(rast, 1, env, true))) FROM {schema}.{table},
+                                   ST_MakeEnvelope(%s, %s, %s, %s, %s) env
+                            WHERE ST_ConvexHull(rast) && ST_MakeEnvelope(%s, %s, %s, %s, %s)""", clipParams)
+
+            except:
+                result['error'] = errorMsg(errorOption=2)
+
+            finally:
+                if not bKeepTables:
+                    with conn.cursor() as cursor:
+                        cursor.execute(f"DROP TABLE IF EXISTS {schema}.{table}")
+
+            results.append(result)
+
+    finally:
+        conn.close()
+
+    return results
+
+## ===================================================================================
+def pickMeasuredTileSize(results, queryMix=None):
+    """ Tile size with the lowest weighted p50 latency.  queryMix weighs the query types
+        i.e. {'value':0.8,'clip':0.2} for a point query API.  Ties go to fewer rows."""
+
+    queryMix = queryMix or {'value':0.5, 'clip':0.5}
+    measured = [r for r in results if not r.get('error')]
+
+    if not measured:
+        return None
+
+    best = min(measured, key=lambda r: (sum(r[query]['p50'] * weight for query,weight in queryMix.items()), r['rows']))
+    return best['tileSize']
+
+## ===================================================================================
+def benchmarkSummary(results):
+    """ Returns a list of messages with 1 line per benchmarked tile size """
+
+    msgs = list()
+    for r in results:
+        size = f"{r['tileSize'][0]}x{r['tileSize'][1]}"
+        if r.get('error'):
+            msgs.append(f"\t{size:<10} FAILED: {r['error']}")
+            continue
+
+        msgs.append(f"\t{size:<10} Rows: {r['rows']:<10,} Table: {r['tableMB']:<8} MB Index: {r['indexMB']:<8} MB "
+                    f"ST_Value p50/p95: {r['value']['p50']}/{r['value']['p95']} ms  "
+                    f"ST_Clip p50/p95: {r['clip']['p50']}/{r['clip']['p95']} ms")
+
+    return msgs
+
+## ===================================================================================
+def measureCatalogTileSize(catalogFile, dbParams, sampleSize=20, queryFootprint=(256,256), queryMix=None,
+                           minSize=128, maxSize=1024, seed=1):
+    """ Benchmarks the candidate tile sizes of a catalog (master elevation) file on
+        sampleSize DEMs and returns the measured tile size.  The sample is drawn from the DEMs
+        of the dominant block size (adviseCatalogTileSize) and of their most common EPSG so
+        every DEM can be registered in the same benchmark table.  The analytic tile size is
+        returned if none of the tile sizes could be measured.
+
+        returns (tileSize, [benchmarkTileSizes results]) or (None, []) if the catalog has no
+        block size information
+    """
+
+    records = list(readCatalogRecords(catalogFile))
+    tileSize,blockAdvice = adviseCatalogTileSize(records, queryFootprint, minSize, maxSize)
+
+    if not blockAdvice:
+        return None, list()
+
+    blockSize = max(blockAdvice, key=lambda b: blockAdvice[b]['dems'])
+    rasterSize = blockAdvice[blockSize]['rasterSize']
+
+    epsgCounts = dict()
+    blockRecords = list()
+    for record in records:
+        try:
+            if (int(record['blk_xsize']), int(record['blk_ysize'])) != blockSize:
+                continue
+            epsg = int(record['epsg_code'])
+        except:
+            continue
+        epsgCounts[epsg] = epsgCounts.get(epsg, 0) + 1
+        blockRecords.append((epsg, f"{record['dem_path']}{os.sep}{record['dem_name']}"))
+
+    srid = max(epsgCounts, key=epsgCounts.get)
+    rasters = [raster for epsg,raster in blockRecords if epsg == srid]
+    rasters = random.Random(seed).sample(rasters, min(sampleSize, len(rasters)))
+
+    tileSizes = candidateTileSizes(blockSize, rasterSize, minSize, maxSize)
+    AddMsgAndPrint(f"\nBenchmarking {len(tileSizes)} tile sizes on {len(rasters):,} DEMs (EPSG:{srid}; "
+                   f"{blockSize[0]}x{blockSize[1]} blocks) of {os.path.basename(catalogFile)}")
+
+    results = benchmarkTileSizes(rasters, tileSizes, dbParams, srid, queryFootprint=queryFootprint)
+    measured = pickMeasuredTileSize(results, queryMix)
+
+    if measured is None:
+        AddMsgAndPrint(f"\tNo tile size could be measured; using the estimated {tileSize[0]}x{tileSize[1]}")
+        return tileSize, results
+
+    return measured, results
+
+## ====================================== Main Body ==================================
+def main(catalogFile, dbParams, resolution, profile='elevation', r2pgsqlFile=None, sampleSize=20,
+         queryFootprint=(256,256), queryMix=None):
+    """ Picks the tile size of catalogFile with measureCatalogTileSize and creates the
+        registration jobs of the catalog with it.  The jobs are written to r2pgsqlFile when
+        given.  dbParams is the (local) PostGIS database the benchmark tables are made in.
+
+        returns (tileSize, jobs) """
+
+    try:
+        tileSize,results = measureCatalogTileSize(catalogFile, dbParams, sampleSize, queryFootprint, queryMix)
+
+        for msg in benchmarkSummary(results):
+            AddMsgAndPrint(msg)
+
+        if tileSize:
+            AddMsgAndPrint(f"\n\tMeasured tile size: {tileSize[0]}x{tileSize[1]}")
+        else:
+            AddMsgAndPrint(f"\n\tNo block size information in {os.path.basename(catalogFile)}; using the {profile} tile size")
+
+        jobs,invalidJobs = createRegistrationJobs(catalogFile, profile, resolution, tileSize=tileSize)
+
+        if r2pgsqlFile:
+            exportRaster2pgsqlFile(jobs, r2pgsqlFile)
+            AddMsgAndPrint(f"\tSuccessfully wrote {len(jobs):,} raster2pgsql commands to {r2pgsqlFile}")
+
+        return tileSize, jobs
+
+    except:
+        errorMsg()
+        return None, list()
+
+if __name__ == '__main__':
+
+    # python DSHub_Tile_Advisor.py /data/USGS_3DEP_3M_Step2_Elevation_Metadata.txt 3M /data/USGS_3DEP_3M_RASTER2PGSQL.txt
+    catalogFile = sys.argv[1]
+    resolution = sys.argv[2]
+    r2pgsqlFile = sys.argv[3] if len(sys.argv) > 3 else None
+
+    # Local PostGIS the benchmark tables are created in and dropped from
+    dbParams = {'host':'localhost', 'port':5432, 'user':'elevation', 'password':'itsnotflat', 'dbname':'elevation'}
+
+    main(catalogFile, dbParams, resolution, r2pgsqlFile=r2pgsqlFile)
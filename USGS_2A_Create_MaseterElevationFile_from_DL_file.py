@@ -17,6 +17,7 @@ from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_compl
 from datetime import datetime
 from osgeo import gdal
 from osgeo import osr
+from DSHub_Registration_Jobs import createRegistrationJobs, exportRaster2pgsqlFile
 
 ## ===================================================================================
 def errorMsg(errorOption=1):
@@ -370,111 +371,32 @@ def getRasterInformationLINUX(raster):
                       top,left,right,bottom,minStat,meanStat,maxStat,stDevStat,blockXsize,blockYsize]
 
 ## ===================================================================================
-def createRaster2pgSQLFile(masterElevFile):
-
-    # Mutually exclusive options
-    # -a Append raster(s) to an existing table.
-
-    # Raster processing: Optional parameters used to manipulate input raster dataset
-    # -s - <SRID> Assign output raster with specified SRID.
-    # -b - Index (1-based) of band to extract from raster.
-    # -t - Tile Size; Cut raster into tiles to be inserted one per table row.
-    # -R - Register; Register the raster as a filesystem (out-db) raster.
-
-    # Optional parameters used to manipulate database objects
-    # -F - Add a column with the name of the file (necessary for elevation but not others)
-    #     This will be handy when you merge tilesets together
-    # -I - Create a GiST index on the raster column.
-    # -R  Register the raster as a filesystem (out-db) raster.
-    #     Only the metadata of the raster and path location to the raster is
-    #     stored in the database (not the pixels).
-
-    # STDOUT parameters
-    # | - A pipe is a form of redirection in Linux used to connect the STDOUT
-    #     of one command into the STDIN of a second command.
-    # PGPASSWORD = itsnotflat
-    # -U elevation - user in the schemas
-    # -d elevation - database name
-    # -h 10.11.11.10 host - localhost
-    # -p port
-
-    # raster2pgsql -s 4269 -b 1 -t 507x507 -F -R -I /data03/gisdata/dsmgroup/aspct_16.tif elevation.$name | PGPASSWORD=itsnotflat psql -U elevation -d elevation -h 10.11.11.10 -p 5432
-
-    # raster2pgsql -s 5070 -b 1 -I -t 560x560 -F -R /data03/gisdata/dsmgroup/aspct_16.tif
-    # covariate.conus_aspect_16 | PGPASSWORD=itsnotflat psql -U covariate -d elevation -h 10.11.11.10 -p 5432
-
-    # Before
+def createRaster2pgSQLFile(masterElevFile, jobs=None):
+    """ Appends the raster2pgsql commands of the DEMs in the master elevation file to the
+        raster2pgsql file.  Registration jobs come from DSHub_Registration_Jobs. """
 
     try:
-        masterElevRecCount = len(open(masterElevFile).readlines())
-
-        recCount = 0
         r2pgsqlFileName = os.path.basename(downloadFile).split('.')[0] + "_RASTER2PGSQL.txt"
         r2pgsqlFilePath = f"{os.path.dirname(downloadFile)}{os.sep}{r2pgsqlFileName}"
-        g = open(r2pgsqlFilePath,'a+')
-
-        total = sum(1 for line in open(masterElevFile)) -1
-        label = "Generating Raster2PGSQL Statements"
 
-        """ ------------------- Open Master Elevation File and write raster2pgsql statements ---------------------"""
-        with open(masterElevFile, 'r') as fp:
-            for line in fp:
+        if jobs is None:
+            # The master file header uses DEMname, DEMpath and EPSG (see createMasterDBfile)
+            jobs,invalidJobs = createRegistrationJobs(masterElevFile, 'elevation_3m',
+                                                      fieldIndex={'dem_name':9,'dem_path':10,'epsg_code':19},
+                                                      bSkipHeader=True)
 
-                bMissingData = False
+            # The invalid records are listed by createRegistrationJobs
+            if invalidJobs:
+                print(f"\tWARNING: {len(jobs):,} raster2pgsql commands were created for {len(jobs) + len(invalidJobs):,} DEMs in {os.path.basename(masterElevFile)}")
 
-                # Check for missing data that may impact raster2pgsql parameters
-                if line.find('#'):
-                    bMissingData = True
-
-                # Skip header line and empty lines
-                if recCount == 0 or line == "\n":
-                    recCount+=1
-                    continue
-
-                items = line.split(',')
-
-##
-##                if bMissingData:
-##                    posIndexList = list()
-##
-##                    for item in items:
-##                        if item == '#':
-##                            posIndexList.append(i)
-##                            i+=1
-##                            print(f"{item} -- {i}")
-##                            continue
-##                        i+=1
-
-                # Raster2pgsql parameters
-                srid = items[19]
-                tileSize = '507x507'
-                demPath = f"{items[10]}{os.sep}{items[9]}"
-                dbName = 'elevation'
-                dbTable = 'elevation_3m'
-                demName = items[9]
-                password = 'itsnotflat'
-                localHost = '10.11.11.10'
-                port = '5432'
-
-                r2pgsqlCommand = f"raster2pgsql -s {srid} -b 1 -t {tileSize} -F -a -R {demPath} {dbName}.{dbTable} | PGPASSWORD={password} psql -U {dbName} -d {dbName} -h {localHost} -p {port}"
-
-                if recCount == masterElevRecCount:
-                    g.write(r2pgsqlCommand)
-                else:
-                    g.write(r2pgsqlCommand + "\n")
-
-                print_progress_bar(recCount, total, label)
-                recCount+=1
-
-        g.close()
-        del masterElevRecCount
+        exportRaster2pgsqlFile(jobs, r2pgsqlFilePath, 'a+')
+        print(f"\tSuccessfully wrote {len(jobs):,} raster2pgsql commands")
 
         return r2pgsqlFilePath
 
     except:
         errorMsg()
 
-
 ## ===================================================================================
 if __name__ == '__main__':
 
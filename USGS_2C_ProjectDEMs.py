@@ -27,6 +27,7 @@ from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 from osgeo import gdal
 from osgeo import osr
+from DSHub_Registration_Jobs import createRegistrationJobs, exportRaster2pgsqlFile
 
 
 ## ===================================================================================
@@ -807,134 +808,26 @@ def getRasterInformation_MT(rasterItem):
         return rasterStatDict
     
 ## ===================================================================================
-def createRaster2pgSQLFile(masterElevFile):
-
-    # Mutually exclusive options
-    # -a Append raster(s) to an existing table.
-
-    # Raster processing: Optional parameters used to manipulate input raster dataset
-    # -s - <SRID> Assign output raster with specified SRID.
-    # -b - Index (1-based) of band to extract from raster.
-    # -t - Tile Size; Cut raster into tiles to be inserted one per table row.
-    # -R - Register; Register the raster as a filesystem (out-db) raster.
-
-    # Optional parameters used to manipulate database objects
-    # -F - Add a column with the name of the file (necessary for elevation but not others)
-    #     This will be handy when you merge tilesets together
-    # -I - Create a GiST index on the raster column.
-    # -R  Register the raster as a filesystem (out-db) raster.
-    #     Only the metadata of the raster and path location to the raster is
-    #     stored in the database (not the pixels).
-
-    # STDOUT parameters
-    # | - A pipe is a form of redirection in Linux used to connect the STDOUT
-    #     of one command into the STDIN of a second command.
-    # PGPASSWORD = itsnotflat
-    # -U elevation - user in the schemas
-    # -d elevation - database name
-    # -h 10.11.11.10 host - localhost
-    # -p port
-
-    # raster2pgsql -s 4269 -b 1 -t 507x507 -F -R -I /data03/gisdata/dsmgroup/aspct_16.tif elevation.$name | PGPASSWORD=itsnotflat psql -U elevation -d elevation -h 10.11.11.10 -p 5432
-
-    # raster2pgsql -s 5070 -b 1 -I -t 560x560 -F -R /data03/gisdata/dsmgroup/aspct_16.tif
-    # covariate.conus_aspect_16 | PGPASSWORD=itsnotflat psql -U covariate -d elevation -h 10.11.11.10 -p 5432
-
-    # Before
+def createRaster2pgSQLFile(masterElevFile, jobs=None):
+    """ Writes the raster2pgsql file of the re-projected DEMs.  DEMs are registered to
+        elevation.<region>_elevation_<res>_<epsg> i.e. conus_elevation_3m_5070.  Registration
+        jobs come from DSHub_Registration_Jobs. """
 
     try:
-        global resolution
-        masterElevRecCount = len(open(masterElevFile).readlines()) - 1  # subtract header
-
-        recCount = 0
-        
         r2pgsqlFilePath = f"{os.path.dirname(elevationMetadataFile)}{os.sep}USGS_3DEP_{resolution}_Step2C_RASTER2PGSQL_reproject.txt"
 
-        # Recreates raster2pgsql file b/c metadata file is passed over; don't want to double up
-        g = open(r2pgsqlFilePath,'w')
-
-        total = sum(1 for line in open(masterElevFile)) -1
-        #label = "Generating Raster2PGSQL Statements"
-
-        invalidCommands = list()
-        
-        def getRegion(srid):
-            if srid == 5070:
-                return "conus"
-            elif srid == 3338:
-                return "ak"
-            elif srid == 32161:
-                return "prvi"
-            elif srid == 4326:
-                return "pb"
-            else:
-                return "unkown"
-          
-        # Header value Index Positions
-        epsgIdx = headerValues.index("epsg_code")
-        demNameIdx = headerValues.index("dem_name")
-        demPathIdx = headerValues.index("dem_path")
-        
-        """ ------------------- Open Master Elevation File and write raster2pgsql statements ---------------------"""
-        with open(masterElevFile, 'r') as fp:
-            for line in fp:
-
-                # Skip header line and empty lines
-                if recCount == 0 or line == "\n":
-                    recCount+=1
-                    continue
-
-                items = line.split(',')
-
-                # Raster2pgsql parameters
-                epsg = items[epsgIdx]
-                demPath = f"{items[demPathIdx]}{os.sep}{items[demNameIdx]}"
-                
-                try:
-                    region = getRegion(int(epsg))
-                except:
-                    invalidCommands.append(f"{demPath} --> raster2pgsql -s {epsg}")
-                    continue
-                    
-                tileSize = '256x256'
-                dbName = 'elevation'
-                dbTable = f"{region}_elevation_{resolution.lower()}_{epsg}"  # conus_elevation_3m_5070
-                demName = items[demNameIdx]
-                password = 'itsnotflat'
-                localHost = '10.11.11.214'
-                port = '6432'
-
-                r2pgsqlCommand = f"raster2pgsql -s {epsg} -b 1 -t {tileSize} -F -a -R {demPath} {dbName}.{dbTable} | PGPASSWORD={password} psql -U {dbName} -d {dbName} -h {localHost} -p {port}"
-
-                # Add check to look for # in r2pgsqlCommand
-                if r2pgsqlCommand.find('#') > -1 or r2pgsqlCommand.find('None') > -1:
-                    invalidCommands.append(r2pgsqlCommand)
+        if jobs is None:
+            jobs,invalidJobs = createRegistrationJobs(masterElevFile, 'elevation_regional', resolution)
 
-                if recCount == masterElevRecCount:
-                    g.write(r2pgsqlCommand)
-                else:
-                    g.write(f"{r2pgsqlCommand}\n")
-
-                print(f"\t\tSuccessfully wrote raster2pgsql command for {demName} -- ({recCount:,} of {total:,})")
-                recCount+=1
-
-        g.close()
-        del masterElevRecCount
-
-        # Inform user about invalid raster2pgsql commands so that they can be fixed.
-        numOfInvalidCommands = len(invalidCommands)
-        if numOfInvalidCommands:
-            AddMsgAndPrint(f"\n\tThere are {numOfInvalidCommands:,} invalid raster2pgsql commands or that contain invalid parameters:")
-            for invalidCmd in invalidCommands:
-                AddMsgAndPrint(f"\t\t{invalidCmd}")
+        # Recreates raster2pgsql file b/c metadata file is passed over; don't want to double up
+        exportRaster2pgsqlFile(jobs, r2pgsqlFilePath, 'w')
+        AddMsgAndPrint(f"\tSuccessfully created raster2pgsql file with {len(jobs):,} commands")
 
-        else:
-            AddMsgAndPrint("\tSuccessfully created raster2pgsql file")
         return r2pgsqlFilePath
 
     except:
         errorMsg()
-    
+
 #### ===================================================================================
 if __name__ == '__main__':
     
@@ -222,6 +222,13 @@ from osgeo import osr
 
 from urllib.request import urlopen, URLError
 from urllib.error import HTTPError
+
+from DSHub_Storage_Placement import getPlacementFolder, releasePlacement, loadPlacementMap, placementSummary
+from DSHub_Registration_Jobs import createRegistrationJobs, exportRaster2pgsqlFile
+
+# EBS volumes eligible by resolution; 1M and 30M have their own set of volumes
+elevVolumes = ["/data02/gisdata/elev","/data03/gisdata/elev","/data04/gisdata/elev","/data05/gisdata/elev"]
+elevVolumes_1m30m = ["/data06/gisdata/elev","/data07/gisdata/elev","/data08/gisdata/elev","/data09/gisdata/elev"]
 urllibEncode = urllib.parse.urlencode
 
 
@@ -380,6 +387,11 @@ def getDownloadFolder2(filename):
          - 30M: isolate 1-x1 degree block and take the last digit
                'USGS_1_n07e158_20130911.tif' --> n07e158 --> 0
          - Other: take the last digit
+
+        The digit is only used as a sub directory ('1m/2') to keep directories small.
+        The EBS volume is picked by DSHub_Storage_Placement based on free space and the
+        number of in-flight downloads.  Files that already exist on a volume keep that
+        volume.  releasePlacement must be called once the download is finished.
     """
 
     try:
@@ -500,7 +512,7 @@ def getDownloadFolder2(filename):
                     ld = c
                     break
                 
-            # assign random drive
+            # assign random sub directory
             if ld is None:
                 dataDrives = [2,3,4,5,6,7,8,9]
                 ld = random.choice(dataDrives)
@@ -517,56 +529,30 @@ def getDownloadFolder2(filename):
                     ld = char
                     break
 
-            # assign random drive
+            # assign random sub directory
             if ld is None:
                 dataDrives = [2,3,4,5,6,7,8,9]
                 ld = random.choice(dataDrives)
             res = resolution.lower()
 
-        # last digit
-        if ld in ["1","9","0"]:
-            if res in ('1m','30m'):
-                drive = '06'
-            else:
-                drive = '02'
-
-        elif ld in ["2","7","8"]:
-            if res in ('1m','30m'):
-                drive = '07'
-            else:
-                drive = '03'
-
-        elif ld in ["3","6"]:
-            if res in ('1m','30m'):
-                drive = '08'
-            else:
-                drive = '04'
-
-        elif ld in ["4","5"]:
-            if res in ('1m','30m'):
-                drive = '09'
-            else:
-                drive = '05'
-
+        if res in ('1m','30m'):
+            volumes = elevVolumes_1m30m
         else:
-            AddMsgAndPrint("\t\t\tLook into download directory for {filename}")
-            drive = '09'
+            volumes = elevVolumes
 
-        root = f"{os.sep}data{drive}{os.sep}gisdata{os.sep}elev"
-        downloadFolder = f"{root}{os.sep}{res}{os.sep}{ld}"
+        if ld in (None,''):
+            AddMsgAndPrint(f"\t\t\tLook into download directory for {filename}")
+            ld = 'other'
 
-        # In case another multi-thread is creating the same directory
-        try:
-            if not os.path.exists(downloadFolder):
-                os.makedirs(downloadFolder)
-        except:
-            pass
+        downloadFolder = getPlacementFolder(filename, f"{res}{os.sep}{ld}", volumes, namespace='usgs_dl', fileName=filename)
+        if not downloadFolder:
+            return False
 
         return downloadFolder
 
     except:
         errorMsg()
-        AddMsgAndPrint("\t\t\tFailed to determine download directory for {filename}")
+        AddMsgAndPrint(f"\t\t\tFailed to determine download directory for {filename}")
         return False
 
 ## ===================================================================================
@@ -594,6 +580,7 @@ def DownloadElevationTile(itemCollection):
 
     try:
         messageList = list()
+        downloadFolder = None
         global dlZipFileDict     # dict containing zip files that will be unzipped; sourceID:filepath
         global dlImgFileDict     # dict containing DEM files; sourceID:filepath
         global totalDownloadSize
@@ -769,6 +756,11 @@ def DownloadElevationTile(itemCollection):
         messageList.append(f"\t{theTab}{errorMsg(errorOption=2)}")
         return messageList
 
+    finally:
+        # Release the in-flight download registered against the EBS volume
+        if not dlFolder and downloadFolder:
+            releasePlacement(downloadFolder)
+
 
 
 ## ===================================================================================
@@ -1197,102 +1189,20 @@ def getRasterInformation_MT(rasterItem):
         return rasterStatDict
 
 ## ===================================================================================
-def createRaster2pgSQLFile(masterElevFile):
-
-    # Mutually exclusive options
-    # -a Append raster(s) to an existing table.
-
-    # Raster processing: Optional parameters used to manipulate input raster dataset
-    # -s - <SRID> Assign output raster with specified SRID.
-    # -b - Index (1-based) of band to extract from raster.
-    # -t - Tile Size; Cut raster into tiles to be inserted one per table row.
-    # -R - Register; Register the raster as a filesystem (out-db) raster.
-
-    # Optional parameters used to manipulate database objects
-    # -F - Add a column with the name of the file (necessary for elevation but not others)
-    #     This will be handy when you merge tilesets together
-    # -I - Create a GiST index on the raster column.
-    # -R  Register the raster as a filesystem (out-db) raster.
-    #     Only the metadata of the raster and path location to the raster is
-    #     stored in the database (not the pixels).
-
-    # STDOUT parameters
-    # | - A pipe is a form of redirection in Linux used to connect the STDOUT
-    #     of one command into the STDIN of a second command.
-    # PGPASSWORD = itsnotflat
-    # -U elevation - user in the schemas
-    # -d elevation - database name
-    # -h 10.11.11.10 host - localhost
-    # -p port
-
-    # raster2pgsql -s 4269 -b 1 -t 507x507 -F -R -I /data03/gisdata/dsmgroup/aspct_16.tif elevation.$name | PGPASSWORD=itsnotflat psql -U elevation -d elevation -h 10.11.11.10 -p 5432
-
-    # raster2pgsql -s 5070 -b 1 -I -t 560x560 -F -R /data03/gisdata/dsmgroup/aspct_16.tif
-    # covariate.conus_aspect_16 | PGPASSWORD=itsnotflat psql -U covariate -d elevation -h 10.11.11.10 -p 5432
-
-    # Before
+def createRaster2pgSQLFile(masterElevFile, jobs=None):
+    """ Writes the raster2pgsql file that USGS_3 executes.  The registration jobs are generated
+        from the master elevation file by DSHub_Registration_Jobs (validated once) unless they
+        were already generated and passed in.  Returns the path to the raster2pgsql file. """
 
     try:
-        global resolution
-        masterElevRecCount = len(open(masterElevFile).readlines()) - 1  # subtract header
-        headers = open(masterElevFile).readline().rstrip().split(',')
-
-        recCount = 0
         r2pgsqlFilePath = f"{os.path.dirname(downloadFile)}{os.sep}USGS_3DEP_{resolution}_Step2_RASTER2PGSQL.txt"
 
-        # Recreates raster2pgsql file b/c metadata file is passed over; don't want to double up
-        g = open(r2pgsqlFilePath,'w')
-
-        total = sum(1 for line in open(masterElevFile)) -1
-        #label = "Generating Raster2PGSQL Statements"
-
-        invalidCommands = list()
-
-        """ ------------------- Open Master Elevation File and write raster2pgsql statements ---------------------"""
-        with open(masterElevFile, 'r') as fp:
-            for line in fp:
-
-                # Skip header line and empty lines
-                if recCount == 0 or line == "\n":
-                    recCount+=1
-                    continue
-
-                items = line.split(',')
-
-                # Raster2pgsql parameters
-                srid = items[headers.index('epsg_code')]
-                tileSize = '256x256'
-                demPath = f"{items[headers.index('dem_path')]}{os.sep}{items[headers.index('dem_name')]}"
-                dbName = 'elevation'
-                dbTable = f"elevation_{resolution.lower()}"  # elevation_3m
-                demName = items[headers.index('dem_name')]
-                password = 'itsnotflat'
-                localHost = '10.11.11.10'
-                port = '6432'
-
-                r2pgsqlCommand = f"raster2pgsql -s {srid} -b 1 -t {tileSize} -F -a -R {demPath} {dbName}.{dbTable} | PGPASSWORD={password} psql -U {dbName} -d {dbName} -h {localHost} -p {port}"
-
-                # Add check to look for # in r2pgsqlCommand
-                if r2pgsqlCommand.find('#') > -1 or r2pgsqlCommand.find('None') > -1:
-                    invalidCommands.append(r2pgsqlCommand)
-
-                if recCount == masterElevRecCount:
-                    g.write(r2pgsqlCommand)
-                else:
-                    g.write(f"{r2pgsqlCommand}\n")
+        if jobs is None:
+            jobs,invalidJobs = createRegistrationJobs(masterElevFile, 'elevation', resolution)
 
-                print(f"\t\tSuccessfully wrote raster2pgsql command for {demName} -- ({recCount:,} of {total:,})")
-                recCount+=1
-
-        g.close()
-        del masterElevRecCount
-
-        # Inform user about invalid raster2pgsql commands so that they can be fixed.
-        numOfInvalidCommands = len(invalidCommands)
-        if numOfInvalidCommands:
-            AddMsgAndPrint(f"\n\tThere are {numOfInvalidCommands:,} invalid raster2pgsql commands or that contain invalid parameters:")
-            for invalidCmd in invalidCommands:
-                AddMsgAndPrint(f"\t\t{invalidCmd}")
+        # Recreates raster2pgsql file b/c metadata file is passed over; don't want to double up
+        exportRaster2pgsqlFile(jobs, r2pgsqlFilePath, 'w')
+        AddMsgAndPrint(f"\tSuccessfully wrote {len(jobs):,} raster2pgsql commands")
 
         return r2pgsqlFilePath
 
@@ -1365,6 +1275,8 @@ def main(dlFile,dlDir,bReplace):
         bReplaceData = bReplace
         bUnzipFiles = True
         bDeleteZipFiles = False
+        bExportRaster2pgsqlFile = True  # Write the raster2pgsql file for USGS_3
+        bRegisterDEMs = False           # Register the downloaded DEMs now instead of running USGS_3 separately
 
         # Pull elevation resolution from file name
         # USGS_3DEP_5M_AK_DSM_Step1B_ElevationDL_07262023.txt --> 5M_AK_DSM
@@ -1446,6 +1358,10 @@ def main(dlFile,dlDir,bReplace):
         h.write(f"\tLog File Path: {msgLogFile}\n")
         h.close()
 
+        # Downloads are placed on the EBS volumes using a persisted placement map
+        if not dlFolder:
+            loadPlacementMap(f"{os.path.dirname(downloadFile)}{os.sep}USGS_3DEP_{resolution}_Step2_PlacementMap.json")
+
         AddMsgAndPrint(f"\n{'='*125}")
         AddMsgAndPrint((f"Total Number of files to download: {recCount:,}"))
 
@@ -1551,13 +1467,22 @@ def main(dlFile,dlDir,bReplace):
             dlMasterFileStop = toc(dlMasterFileStart)
             bMasterFile = True
 
-            """ ----------------------------- Create Raster2pgsql File ---------------------------------- """
+            """ ----------------------------- Create Registration Jobs / Raster2pgsql File ---------------------------------- """
             if os.path.exists(dlMasterFile):
-                AddMsgAndPrint("\nCreating Raster2pgsql File")
+                AddMsgAndPrint("\nCreating Registration Jobs from the Elevation Metadata File")
                 r2pgsqlStart = tic()
-                r2pgsqlFile = createRaster2pgSQLFile(dlMasterFile)
-                AddMsgAndPrint(f"\n\tRaster2pgsql File Path: {r2pgsqlFile}")
-                AddMsgAndPrint(f"\tIMPORTANT: Make sure dbTable variable (elevation_{resolution.lower()}) is correct in Raster2pgsql file!!")
+                registrationJobs,invalidJobs = createRegistrationJobs(dlMasterFile, 'elevation', resolution)
+
+                # Text export is only needed if USGS_3 is run separately
+                if bExportRaster2pgsqlFile:
+                    r2pgsqlFile = createRaster2pgSQLFile(dlMasterFile, registrationJobs)
+                    AddMsgAndPrint(f"\n\tRaster2pgsql File Path: {r2pgsqlFile}")
+                    AddMsgAndPrint(f"\tIMPORTANT: Make sure dbTable variable (elevation_{resolution.lower()}) is correct in Raster2pgsql file!!")
+
+                # Hand the jobs to the USGS_3 loader in memory
+                if bRegisterDEMs:
+                    from USGS_3_Execute_raster2pgsql_fromFile import main as registerDEMs
+                    registerDEMs(jobs=registrationJobs, resolution=resolution, outputFolder=os.path.dirname(dlMasterFile))
                 r2pgsqlStop = toc(r2pgsqlStart)
             else:
                 AddMsgAndPrint("\nRaster2pgsql File will NOT be created")
@@ -1580,6 +1505,11 @@ def main(dlFile,dlDir,bReplace):
         if totalDownloadSize > 0:
             AddMsgAndPrint(f"\nTotal Download Size: {convert_bytes(totalDownloadSize)}")
 
+        if not dlFolder:
+            AddMsgAndPrint("\nEBS Volume Placement:")
+            for placementMsg in placementSummary(elevVolumes + elevVolumes_1m30m):
+                AddMsgAndPrint(placementMsg)
+
         # Report number of DEMs downloaded
         if len(dlImgFileDict) == recCount:
             AddMsgAndPrint(f"\nSuccessfully Downloaded ALL {len(dlImgFileDict):,} DEM files")
@@ -33,6 +33,40 @@ This is script #3 in the USGS Elevation acquisition workflow developed for the D
       'warning: this file used to have optimizations in its layout, but thoseartly, invalidated
        by later changes'
 
+10/19/2026
+    - Added native load mode (bNativeLoad).  raster2pgsql commands are parsed into load jobs and
+      the out-db tile rows are computed from the geotransform of each DEM and streamed to the
+      database with COPY over 1 pooled connection (DSHub_Raster_Loader) instead of spawning a
+      raster2pgsql | psql pipeline per DEM.
+    - Added batch load mode (bBatchLoad).  DEMs that share the same raster2pgsql options and target
+      table are grouped into batches sized by tile count and loaded with 1 raster2pgsql | psql
+      session per batch.  Each batch is 1 transaction so a failure only rolls back that batch
+      and the DEMs of that batch are written to the FAILED file to be rerun.
+    - Added a load ledger (bLoadLedger).  The load state and tile count of every DEM is recorded in
+      USGS_3DEP_<res>_Step3_LoadLedger.sqlite (DSHub_Load_Ledger).  A rerun with the same command
+      file skips DEMs that are complete and verifies DEMs that were still loading or failed when the
+      last run stopped; partially loaded DEMs have their tiles deleted and are reloaded.  DEMs are
+      marked loading per batch when the batch starts.
+    - Added bulk-load mode (bBulkLoadMode); off by default and meant for initial and large loads
+      (at least bulkLoadMinDEMs DEMs).  Target tables have autovacuum turned off and their
+      indexes and raster constraints dropped during the load.  After the last DEM is loaded the GiST
+      index on the rast envelopes, AddRasterConstraints and ANALYZE are run once per table, tables in
+      parallel, and the time of every phase is reported.  Queries against the target tables run
+      without their indexes while the load is running.
+    - Added adaptive concurrency (bAdaptiveConcurrency).  Instead of a fixed cpu_count threads the
+      number of raster2pgsql sessions in-flight grows and shrinks AIMD-style with load latency,
+      errors and lock waits reported by the database (DSHub_Raster_Loader.runAdaptive).
+    - raster2pgsql commands are parsed into load jobs up front and every load returns a structured
+      result (exit status, tiles inserted, seconds, ERROR/WARNING lines) instead of keyword searching
+      stderr and splitting the command on spaces to find the DEM name.  1 JSON record per DEM is
+      appended to USGS_3DEP_<res>_Step3_Exec_RASTER2PGSQL_Results.jsonl; the summary and the FAILED
+      (retry) file are built from it.
+    - Converted to a main function so that registration jobs generated straight from the catalog
+      (DSHub_Registration_Jobs) can be passed in memory: main(jobs=jobs, resolution=..., outputFolder=...)
+    - Added partitioned loading (partitionBy).  Target tables can be partitioned by EPSG ('srid') or by
+      ranges of grid IDs ('grid'); every DEM is loaded straight into its partition, batches are
+      interleaved across partitions and the indexes of all partitions are built in parallel.
+
 Things to consider/do:
     - Warning messages are assumed to be duplicated.  If there are multiple warnings I should compare
       them to see if they are unique.
@@ -42,10 +76,17 @@ Things to consider/do:
 
 #-------------------------------------------------------------------------------
 
-import subprocess, traceback, os, sys, time, re
+import traceback, os, sys, time
 from datetime import datetime
-import threading, multiprocessing
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from DSHub_Raster_Loader import parseRaster2pgsqlCommand, loadRastersNative, createLoadBatches, runRaster2pgsqlBatch
+from DSHub_Raster_Loader import getLoadTargets, beginBulkLoad, finishBulkLoads
+from DSHub_Raster_Loader import preparePartitionedTargets, interleaveBatches
+from DSHub_Raster_Loader import createConcurrencyController, runAdaptive
+from DSHub_Raster_Loader import runLoadJob, createResultRecords, writeResultRecords, summarizeLoadResults
+from DSHub_Load_Ledger import openLoadLedger, closeLoadLedger, filterLedgerJobs, markLoadStarted, markLoadFinished, ledgerSummary
 
 ## ===================================================================================
 def AddMsgAndPrint(msg):
@@ -125,105 +166,160 @@ def print_progress_bar(index, total, label):
 # """
 
 ## ===================================================================================
-def runRaster2pgsql(cmd):
-    """ This function was desinged to execute raster2pgsql commands via a subprocess to OS
-        
-    """
+def recordResults(jobs, result, mode):
+    """ Records the result of a load (1 DEM or a batch of DEMs) in the JSONL results stream
+        and the load ledger and reports every DEM to the console and log file. """
+
+    global r2pTracker
 
     try:
-        cmdItems = cmd.split(' ')
-        DEMname = os.path.basename(cmdItems[11 if os.name == 'nt' else 10])
-
-        msgDict = dict()
-        errorList = ['error','failed','fail','uncommit','aborted','notice','memory',
-                     'warning','unable','not recognized','inoperable','syntax', 'cannot']
-        words_re = re.compile("|".join(errorList))
-        
-        # Windows (nt) vs Linux (posix)
-        if os.name == 'nt':
-            env={'PGPASSWORD':"ilovesql",
-                 'PGHOST' : 'localhost',
-                 'PGPORT' : '5432',
-                 'PGUSER' : 'postgres',
-                 'PGDATABASE' : "elevation",
-                 'SYSTEMROOT': os.environ['SYSTEMROOT'],
-                 'PROJ_LIB': r"C:\Program Files\PostgreSQL\15\share\contrib\postgis-3.3\proj"}
-            
-            # Send command to operating system
-            execCmd = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,universal_newlines=True, env=env)
-        
-        else:
-            # Send command to operating system
-            execCmd = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,universal_newlines=True)
-            #execCmd = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,universal_newlines=True)
-            #execCmd = subprocess.run(rasterLine, shell=True, check=True) # alternate method
-
-        # returns a tuple (stdout_data, stderr_data)
-        msgs, errors = execCmd.communicate()
-        errors = ','.join(errors.strip().split('\n')).lower()  # some errors return mutliple carriage returns
-
-        # Collect messages
-        # 0 = completed, however there may be warnings
-        errorResults = words_re.search(errors)
-
-        if errorResults:
-            errorGroup = errorResults.group()
-
-            # Warning messages
-            if errorGroup in ('warning') and execCmd.returncode == 0:
-
-                # number of warnings; isolate 1 message
-                # If there are multiple warnings I should compare them to see if they are unique;
-                # Assumption is that the warnings are duplicated
-                warningCounts = re.findall(r'\b(?:' + '|'.join(['warning']) + r')\b', errors)
-                warningIndices = [m.start() for m in re.finditer(r"\bwarning\b", errors)]
-
-                # Extract warning message
-                if len(warningCounts) > 1:
-                    warningMessage = errors[warningIndices[0]:warningIndices[1]]
+        records = createResultRecords(jobs, result, mode, runID)
+        writeResultRecords(raster2pgsqlResultsFile, records)
+
+        with open(raster2pgsqlLogFile,'a+') as f:
+            for record in records:
+                r2pTracker+=1
+                DEMname = os.path.basename(record['raster'])
+
+                if record['status'] == 'Error':
+                    msg = f"\n\tFailed: {DEMname}: ERROR: {record['error']} -- ({r2pTracker:,} of {recCount:,})"
+                elif record['status'] == 'Warning':
+                    msg = f"\tLoaded {DEMname} but with the following Warning: {record['warnings'][0]} -- ({r2pTracker:,} of {recCount:,})"
                 else:
-                    warningMessage = errors[warningIndices[0]:]
+                    msg = f"\tSuccessfully loaded {DEMname} -- {record['rows']:,} tiles -- ({r2pTracker:,} of {recCount:,})"
 
-                msgDict['Warning'] = f"Loaded {DEMname} but with the following Warning: {warningMessage}\n"
+                f.write(msg)
+                print(msg)
 
-            # Error messages; What is the error group here? Investigate after more errors arise
-            else:
-                msgDict['Error'] = f"{cmd}: ERROR: {errors}\n"
+        if bLoadLedger:
+            for job,record in zip(jobs,records):
+                markLoadFinished(job, record['status'], record['rows'], record['error'])
 
-        else:
-            msgDict['Success'] = f"Successfully loaded {DEMname}"
+    except:
+        errorMsg()
 
-        return msgDict
+## ===================================================================================
+def startLoad(func, jobs, args):
+    """ Marks jobs 'loading' in the load ledger right before func(*args) loads them so DEMs
+        that are still waiting for a thread are not 'loading' if the run stops. """
 
-    except:
-        msgDict['Error'] = f"\"{cmd}\"\n\t{errorMsg(errorOption=2)}"
-        return msgDict
+    if bLoadLedger:
+        markLoadStarted(jobs)
+
+    return func(*args)
 
 ## ===================================================================================
-if __name__ == '__main__':
+def executeLoads(func, argsList, resultSignal, jobsOf):
+    """ Generator that runs func(*args) for every args in argsList and yields (args, result)
+        as each load completes.  With bAdaptiveConcurrency the number of loads in-flight is set
+        by concurrencyController; otherwise cpu_count threads are used.
+        resultSignal(result) returns (units of work, error text or None) of a result.
+        jobsOf(args) returns the jobs that func(*args) loads (marked 'loading' when it starts). """
+
+    ledgerArgs = [(func, jobsOf(args), args) for args in argsList]
+
+    if bAdaptiveConcurrency:
+        for (loadFunc,loadJobs,args),result in runAdaptive(startLoad, ledgerArgs, concurrencyController, resultSignal):
+            yield args,result
+
+    else:
+        with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
+
+            # use a set comprehension to start all tasks.  This creates a future object
+            runLoad = {executor.submit(startLoad, *largs): largs[2] for largs in ledgerArgs}
+
+            # yield future objects as they are done.
+            for future in as_completed(runLoad):
+                yield runLoad[future], future.result()
+
+## ===================================================================================
+def runRaster2pgsql(job):
+    """ This function was desinged to execute the raster2pgsql command of a load job via a
+        subprocess to OS.  Returns the structured result of DSHub_Raster_Loader.runLoadJob:
+        {'rasters','status':'Success'|'Warning'|'Error','rows','expectedRows','returncode',
+         'seconds','error','warnings'}
+    """
+
+    # Windows (nt) vs Linux (posix)
+    if os.name == 'nt':
+        env={'PGPASSWORD':"ilovesql",
+             'PGHOST' : 'localhost',
+             'PGPORT' : '5432',
+             'PGUSER' : 'postgres',
+             'PGDATABASE' : "elevation",
+             'SYSTEMROOT': os.environ['SYSTEMROOT'],
+             'PROJ_LIB': r"C:\Program Files\PostgreSQL\15\share\contrib\postgis-3.3\proj"}
+    else:
+        env = None
+
+    return runLoadJob(job, env)
+
+## ===================================================================================
+def main(raster2pgsqlFile=None, jobs=None, resolution=None, outputFolder=None):
+    """ Registers DEMs in the database.  The DEMs come from either:
+            raster2pgsqlFile - text file of raster2pgsql commands (USGS_2 Step 2 output)
+            jobs             - list of registration jobs generated straight from the catalog
+                               (DSHub_Registration_Jobs.createRegistrationJobs); resolution and
+                               outputFolder (where the log, results and ledger files are written)
+                               must be given as well.
+    """
 
     try:
+        global raster2pgsqlLogFile, raster2pgsqlResultsFile, recCount, runID, r2pTracker
+        global bLoadLedger, bAdaptiveConcurrency, concurrencyController
+
         start = tic()
 
-        # raster2pgsql FILE
-        raster2pgsqlFile = input("\nEnter full path of text file containing RASTER2PGSQL statements: ")
-        while not os.path.exists(raster2pgsqlFile):
-            print(f"{raster2pgsqlFile} does NOT exist. Try Again")
-            raster2pgsqlFile = input("Enter full path to Raster2pgsql File: ")
+        if jobs is None:
+            resolution = raster2pgsqlFile.split(os.sep)[-1].split('_')[2]
+            outputFolder = os.path.dirname(raster2pgsqlFile)
+
+        # Register DEMs with COPY over 1 pooled connection instead of raster2pgsql | psql per DEM
+        bNativeLoad = True
+        nativeBatchSize = 500   # Number of DEMs per COPY transaction
+
+        # If not loading natively, load DEMs in multi-raster raster2pgsql sessions instead of 1 per DEM
+        bBatchLoad = True
+        batchMaxTiles = 50000       # Max number of tiles per raster2pgsql session
+        bBatchTransaction = True    # 1 transaction per batch; False uses raster2pgsql -e
+
+        # Record the load state of every DEM so that an interrupted load can be restarted
+        bLoadLedger = True
+        bVerifyPartialLoads = True  # Verify DEMs that were loading when the last run stopped
 
-        resolution = raster2pgsqlFile.split(os.sep)[-1].split('_')[2]
+        # Drop indexes/constraints and turn off autovacuum during the load; build them once at the end.
+        # Opt-in for initial and large loads only: the indexes of the whole target table are dropped
+        # (queries lose them until the load finishes) and the GiST index is rebuilt over every row.
+        bBulkLoadMode = False
+        bulkLoadMinDEMs = 5000      # Bulk-load mode is skipped when fewer DEMs than this are loaded
+        bAddRasterConstraints = True
+        indexWorkers = multiprocessing.cpu_count()  # Tables/partitions whose indexes are built at the same time
+
+        # Load target tables through partitions; 'srid' (LIST by EPSG), 'grid' (RANGE of grid IDs) or None
+        partitionBy = None
+        gridPartitionRange = 1000   # Number of grid IDs per partition when partitionBy = 'grid'
+
+        # Grow/shrink the number of concurrent raster2pgsql sessions with database backpressure
+        bAdaptiveConcurrency = True
+        initialConcurrency = 4
+        maxConcurrency = multiprocessing.cpu_count() * 2
 
         """ ---------------------------- Establish Console LOG FILE ---------------------------------------------------"""
-        raster2pgsqlLogFile = f"{os.path.dirname(raster2pgsqlFile)}{os.sep}USGS_3DEP_{resolution}_Step3_Exec_RASTER2PGSQL_ConsoleMsgs.txt"
-        raster2pgsqlErrorFile = f"{os.path.dirname(raster2pgsqlFile)}{os.sep}USGS_3DEP_{resolution}_Step3_Exec_RASTER2PGSQL_FAILED.txt"
+        raster2pgsqlLogFile = f"{outputFolder}{os.sep}USGS_3DEP_{resolution}_Step3_Exec_RASTER2PGSQL_ConsoleMsgs.txt"
+        raster2pgsqlErrorFile = f"{outputFolder}{os.sep}USGS_3DEP_{resolution}_Step3_Exec_RASTER2PGSQL_FAILED.txt"
+        loadLedgerFile = f"{outputFolder}{os.sep}USGS_3DEP_{resolution}_Step3_LoadLedger.sqlite"
+        raster2pgsqlResultsFile = f"{outputFolder}{os.sep}USGS_3DEP_{resolution}_Step3_Exec_RASTER2PGSQL_Results.jsonl"
 
-        recCount = sum(1 for line in open(raster2pgsqlFile))
+        if jobs is None:
+            recCount = sum(1 for line in open(raster2pgsqlFile))
+        else:
+            recCount = len(jobs)
 
         h = open(raster2pgsqlLogFile,'a+')
         today = datetime.today().strftime('%m%d%Y')
         h.write(f"Executing: USGS_3_Execute_raster2pgsql_fromFile.py {today}\n")
         h.write("\nUser Selected Parameters:")
-        h.write(f"\tRaster2pgsql File: {raster2pgsqlFile})")
+        h.write(f"\tRaster2pgsql File: {raster2pgsqlFile if jobs is None else 'Registration jobs passed in memory'})")
         h.write(f"\tNumber of Raster2pgsql records: {recCount:,}")
         h.write(f"\n{'='*125}")
         h.close()
@@ -232,112 +328,225 @@ if __name__ == '__main__':
         raster2pgsqlList = list() # List of commnands to run in multi-thread
         invalidCommands = list() # List of invalid commands or that contain an unknown parameter ('#')
 
-        """ ---------------------------- Inspect and report raster2pgsql statements ---------------------------------------------------"""
-        # Look for '#' in raster2pgsql commands; Likely added from script#2
-        AddMsgAndPrint("Checking Raster2pgsql Statements")
-        with open(raster2pgsqlFile, 'r') as fp:
-            for rasterLine in fp:
-
-                # The command to be executed
-                # raster2pgsql -s 4269 -b 1 -I -t 507x507 -F -R /data05/gisdata/elev/07/0708/070802/07080205/3m/ned19_n42x00_w091x75_ia_central_eastcentral_2008.zip
-                # elevation.ned19_n42x00_w091x75_ia_central_eastcentral_2008.zip | PGPASSWORD=itsnotflat psql -U elevation -d elevation -h 10.11.11.10 -p 5432
-                cmd = rasterLine.strip()
-                cmdItems = cmd.split(' ')
-
-                # windows = "C:\Program Files\PostgreSQL\15\bin\raster2pgsql.exe"
-                # linux = raster2pgsl
-                if cmd.find('#') > -1 or not cmdItems[1 if os.name == 'nt' else 0].find('raster2pgsql') > -1:
-                    AddMsgAndPrint(f"\tRecord #{iCount:,} is an invalid raster2pgsql command or contains invalid parameters. Skipping")
-                    #AddMsgAndPrint(f"\tLine #{iCount:,} contains an invalid 'raster2pgsql' parameter. Skipping")
-                    invalidCommands.append(cmd)
+        # Jobs generated from the catalog (DSHub_Registration_Jobs) were validated when they were created
+        if jobs is not None:
+            AddMsgAndPrint(f"Registering {recCount:,} catalog registration jobs")
+
+        else:
+            """ ---------------------------- Inspect and report raster2pgsql statements ---------------------------------------------------"""
+            # Look for '#' in raster2pgsql commands; Likely added from script#2
+            AddMsgAndPrint("Checking Raster2pgsql Statements")
+            with open(raster2pgsqlFile, 'r') as fp:
+                for rasterLine in fp:
+
+                    # The command to be executed
+                    # raster2pgsql -s 4269 -b 1 -I -t 507x507 -F -R /data05/gisdata/elev/07/0708/070802/07080205/3m/ned19_n42x00_w091x75_ia_central_eastcentral_2008.zip
+                    # elevation.ned19_n42x00_w091x75_ia_central_eastcentral_2008.zip | PGPASSWORD=itsnotflat psql -U elevation -d elevation -h 10.11.11.10 -p 5432
+                    cmd = rasterLine.strip()
+                    cmdItems = cmd.split(' ')
+
+                    # windows = "C:\Program Files\PostgreSQL\15\bin\raster2pgsql.exe"
+                    # linux = raster2pgsl
+                    if cmd.find('#') > -1 or not cmdItems[1 if os.name == 'nt' else 0].find('raster2pgsql') > -1:
+                        AddMsgAndPrint(f"\tRecord #{iCount:,} is an invalid raster2pgsql command or contains invalid parameters. Skipping")
+                        #AddMsgAndPrint(f"\tLine #{iCount:,} contains an invalid 'raster2pgsql' parameter. Skipping")
+                        invalidCommands.append(cmd)
+                        iCount+=1
+                        continue
+
                     iCount+=1
+                    raster2pgsqlList.append(cmd)
+
+            # Report invalid commands
+            numOfInvalidCommands = len(invalidCommands)
+            if numOfInvalidCommands:
+                AddMsgAndPrint(f"\tThere are {numOfInvalidCommands:,} invalid raster2pgsql command or that contain invalid parameters:")
+                logError = open(raster2pgsqlErrorFile,'a+')
+                for invalidCmd in invalidCommands:
+                    logError.write(f"\n{invalidCmd}")
+                logError.close
+                del logError
+
+            # ---------------------------- Describe raster2pgsql commands as load jobs ---------------------------------------------------
+            jobs = list()
+            for cmd in raster2pgsqlList:
+                job,dbParams = parseRaster2pgsqlCommand(cmd)
+
+                if job is None:
+                    AddMsgAndPrint(f"\tUnable to parse raster2pgsql command: {cmd}")
+                    invalidCommands.append(cmd)
+                    logError = open(raster2pgsqlErrorFile,'a+')
+                    logError.write(f"\n{cmd}")
+                    logError.close()
                     continue
+                jobs.append(job)
+
+        # ---------------------------- Point jobs at the partitions of their target tables ---------------------------------------------------
+        if partitionBy and len(jobs):
+            AddMsgAndPrint(f"\nPartitioning target tables by {partitionBy}")
+            for msg in preparePartitionedTargets(jobs, partitionBy, gridPartitionRange):
+                AddMsgAndPrint(msg)
+
+        # ---------------------------- Skip DEMs that the Load Ledger shows are loaded ---------------------------------------------------
+        ledgerSkipped = 0
+        if bLoadLedger and len(jobs):
+            AddMsgAndPrint("\nChecking Load Ledger")
+            openLoadLedger(loadLedgerFile)
+
+            jobs,skippedJobs,ledgerMsgs = filterLedgerJobs(jobs, bVerifyPartialLoads)
+            for msg in ledgerMsgs:
+                AddMsgAndPrint(msg)
+
+            ledgerSkipped = len(skippedJobs)
+
+        # ---------------------------- Put target tables in bulk-load mode ---------------------------------------------------
+        loadTargets = list()
+        if bBulkLoadMode and len(jobs) < bulkLoadMinDEMs:
+            AddMsgAndPrint(f"\nBulk-load mode skipped; {len(jobs):,} DEMs is less than {bulkLoadMinDEMs:,}")
+        elif bBulkLoadMode and len(jobs):
+            AddMsgAndPrint("\nSetting target tables to bulk-load mode")
+            loadTargets = list(getLoadTargets(jobs).values())
+            for target in loadTargets:
+                for msg in beginBulkLoad(target):
+                    AddMsgAndPrint(msg)
+        loadTime = None
+
+        # Sessions waiting on locks are polled from the database of the first DEM
+        lockPollDB = jobs[0]['db'] if jobs else None
+        concurrencyController = createConcurrencyController(lockPollDB, initialConcurrency, 1, maxConcurrency)
+
+        # units of work and error of a load result for the concurrency controller
+        resultSignal = lambda result: (result['rows'], result['error'])
+
+        runID = datetime.now().strftime('%Y%m%d_%H%M%S')
+        r2pTracker = 0
+
+        """ ---------------------------- Execute load jobs in Native mode ---------------------------------------------------"""
+        if len(jobs) and bNativeLoad:
+            AddMsgAndPrint(f"\nRegistering {len(jobs):,} DEM files - Native COPY Mode")
+
+            # Group load jobs by database; 1 pooled connection per database
+            # {(host,port,user,dbname): [dbParams,[jobs]]}
+            dbJobsDict = dict()
+            for job in jobs:
+                dbParams = job['db']
+                dbKey = (dbParams['host'],dbParams['port'],dbParams['user'],dbParams['dbname'])
+                if dbKey in dbJobsDict:
+                    dbJobsDict[dbKey][1].append(job)
+                else:
+                    dbJobsDict[dbKey] = [dbParams,[job]]
 
-                iCount+=1
-                raster2pgsqlList.append(cmd)
+            for dbKey,(dbParams,dbJobs) in dbJobsDict.items():
+                jobByRaster = {job['raster']:job for job in dbJobs}
 
-        # Report invalid commands
-        numOfInvalidCommands = len(invalidCommands)
-        if numOfInvalidCommands:
-            AddMsgAndPrint(f"\tThere are {numOfInvalidCommands:,} invalid raster2pgsql command or that contain invalid parameters:")
-            logError = open(raster2pgsqlErrorFile,'a+')
-            for invalidCmd in invalidCommands:
-                logError.write(f"\n{invalidCmd}")
-            logError.close
-            del logError
-            
-        """ ---------------------------- Execute raster2pgsql statements in MT mode ---------------------------------------------------"""
-        # Run commands in multi-threading mode
-        if len(raster2pgsqlList):
-            AddMsgAndPrint(f"\nRunning raster2pgsql on {len(raster2pgsqlList):,} DEM files")
-            r2pTracker = 0
-            successCount = 0
-            warningCount = 0
-            failedCount = 0
-
-            with open(raster2pgsqlLogFile,'a+') as f:
-                with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
-    
-                    # use a set comprehension to start all tasks.  This creates a future object
-                    runR2pgsqlCmd = {executor.submit(runRaster2pgsql, cmd): cmd for cmd in raster2pgsqlList}
-    
-                    # yield future objects as they are done.
-                    for future in as_completed(runR2pgsqlCmd):
-                        msgs = future.result()
-    
-                        for status in msgs:
-                            r2pTracker+=1
-    
-                            if status == 'Error':
-                                f.write(f"\n\tFailed: {msgs['Error']} -- ({r2pTracker:,} of {recCount:,})")
-                                print(f"\n\tFailed: {msgs['Error']} -- ({r2pTracker:,} of {recCount:,})")
-                                failedCount+=1
-    
-                                isolatedCommand = msgs['Error'].split('\n')[0]
-                                logError = open(raster2pgsqlErrorFile,'a+')
-                                logError.write(f"\n{isolatedCommand}")
-                                logError.close
-                                del logError
-    
-                            elif status == 'Warning':
-                                f.write(f"\t{msgs['Warning']} -- ({r2pTracker:,} of {recCount:,})")
-                                print(f"\t{msgs['Warning']} -- ({r2pTracker:,} of {recCount:,})")
-                                warningCount+=1
-    
-                            elif status == 'Success':
-                                f.write(f"\t{msgs['Success']} -- ({r2pTracker:,} of {recCount:,})")
-                                print(f"\t{msgs['Success']} -- ({r2pTracker:,} of {recCount:,})")
-                                successCount+=1
-                            else:
-                                f.write("\tStatus message not returned by raster2pgsql function")
-                                print("\tStatus message not returned by raster2pgsql function")
+                for result in loadRastersNative(dbJobs, dbParams, nativeBatchSize,
+                                                onBatchStart=markLoadStarted if bLoadLedger else None):
+                    recordResults([jobByRaster[result['raster']]], result, 'native')
+
+        # ---------------------------- Execute load jobs in Batch mode ---------------------------------------------------
+        elif len(jobs) and bBatchLoad:
+            # Round robin by table so concurrent sessions write to different partitions
+            batches = interleaveBatches(createLoadBatches(jobs, batchMaxTiles))
+            AddMsgAndPrint(f"\nRunning raster2pgsql on {len(jobs):,} DEM files in {len(batches):,} batches")
+
+            batchArgs = [(batch, bBatchTransaction) for batch in batches]
+            for (batch,bTransaction),result in executeLoads(runRaster2pgsqlBatch, batchArgs, resultSignal, lambda args: args[0]):
+                recordResults(batch, result, 'batch')
+
+        # ---------------------------- Execute load jobs in MT mode ---------------------------------------------------
+        # Run 1 raster2pgsql command per DEM in multi-threading mode
+        elif len(jobs):
+            AddMsgAndPrint(f"\nRunning raster2pgsql on {len(jobs):,} DEM files")
+
+            for (job,),result in executeLoads(runRaster2pgsql, [(job,) for job in jobs], resultSignal, lambda args: [args[0]]):
+                recordResults([job], result, 'single')
+
+        elif ledgerSkipped:
+            AddMsgAndPrint(f"\nAll {ledgerSkipped:,} valid 'RASTER2PGSQL' records were already loaded according to the Load Ledger.  EXITING!")
+            return
 
         else:
             AddMsgAndPrint(f"\nThere were no valid 'RASTER2PGSQL' records to execute.  EXITING!")
-            sys.exit()
+            return
+
+        # ---------------------------- Build indexes and constraints once after the load ---------------------------------------------------
+        if loadTargets:
+            loadTime = toc(start)
+            AddMsgAndPrint(f"\nBuilding indexes, raster constraints and statistics for {len(loadTargets):,} tables")
+            bulkStart = tic()
+            bulkLoadMsgs = finishBulkLoads(loadTargets, bAddRasterConstraints, indexWorkers)
+            for msg in bulkLoadMsgs:
+                AddMsgAndPrint(msg)
+            bulkTime = toc(bulkStart)
 
         """ ------------------------------------ SUMMARY -------------------------------------- """
         end = toc(start)
         AddMsgAndPrint(f"\n{'-'*40}SUMMARY{'-'*40}")
         AddMsgAndPrint(f"Total raster2pgsql DEM Loading Time: {end}")
 
+        if bAdaptiveConcurrency and not bNativeLoad:
+            history = concurrencyController['history']
+            AddMsgAndPrint(f"\tAdaptive Concurrency: final {concurrencyController['limit']} in-flight loads; "
+                           f"peak {max([concurrencyController['limit']] + [h[2] for h in history])}; "
+                           f"{sum(1 for h in history if h[2] < h[1]):,} reductions")
+
+        if loadTime:
+            AddMsgAndPrint(f"\tLoad Phase: {loadTime}")
+            AddMsgAndPrint(f"\tIndex/Constraint/Analyze Phase: {bulkTime}")
+            for msg in bulkLoadMsgs:
+                AddMsgAndPrint(msg)
+
         # Invalid RASTER2PGSQL command
         if len(invalidCommands):
             AddMsgAndPrint(f"\nThere were {len(invalidCommands):,} of {recCount:,} records that were invalid")
 
+        if ledgerSkipped:
+            AddMsgAndPrint(f"\n{ledgerSkipped:,} of {recCount:,} DEMs were skipped because they were already loaded")
+
+        if bLoadLedger:
+            AddMsgAndPrint(f"\nLoad Ledger: {loadLedgerFile}")
+            for msg in ledgerSummary():
+                AddMsgAndPrint(msg)
+            closeLoadLedger()
+
+        # Summary and retry queue come from the results stream of this run
+        loadSummary = summarizeLoadResults(raster2pgsqlResultsFile, runID)
+        successCount = loadSummary['Success'] + loadSummary['Warning']
+        warningCount = loadSummary['Warning']
+        failedCount = loadSummary['Error']
+
+        AddMsgAndPrint(f"\nResults: {raster2pgsqlResultsFile} -- {loadSummary['rows']:,} tiles inserted")
+
+        if loadSummary['retry']:
+            logError = open(raster2pgsqlErrorFile,'a+')
+            for cmd in loadSummary['retry']:
+                logError.write(f"\n{cmd}")
+            logError.close()
+
         # All rasters loaded successfully
-        if successCount == recCount:
+        if successCount + ledgerSkipped == recCount:
             AddMsgAndPrint(f"\nALL {recCount:,} DEMs were successfully loaded to the database")
 
         else:
             if successCount > 0:
-                AddMsgAndPrint(f"\nThere were {successCount:,} of {len(raster2pgsqlList):,} DEMs were successfully loaded.")
+                AddMsgAndPrint(f"\nThere were {successCount:,} of {len(jobs):,} DEMs were successfully loaded.")
 
             if warningCount > 0:
-                AddMsgAndPrint(f"\nThere were {warningCount:,} of {len(raster2pgsqlList):,} DEMS that loaded with warnings.")
+                AddMsgAndPrint(f"\nThere were {warningCount:,} of {len(jobs):,} DEMS that loaded with warnings.")
 
             if failedCount > 0:
-                AddMsgAndPrint(f"\nThere were {failedCount:,} of {len(raster2pgsqlList):,} DEMS that failed loading process.")
+                AddMsgAndPrint(f"\nThere were {failedCount:,} of {len(jobs):,} DEMS that failed loading process.")
 
     except:
-        errorMsg()
\ No newline at end of file
+        errorMsg()
+
+## ===================================================================================
+if __name__ == '__main__':
+
+    # raster2pgsql FILE
+    raster2pgsqlFile = input("\nEnter full path of text file containing RASTER2PGSQL statements: ")
+    while not os.path.exists(raster2pgsqlFile):
+        print(f"{raster2pgsqlFile} does NOT exist. Try Again")
+        raster2pgsqlFile = input("Enter full path to Raster2pgsql File: ")
+
+    main(raster2pgsqlFile)
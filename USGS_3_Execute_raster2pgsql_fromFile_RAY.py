@@ -37,6 +37,20 @@ This is script #3 in the USGS Elevation acquisition workflow developed for the D
     -Made a copy of this script to switch from multithreading to ray.  Following changes were made:
         1) created a main function
 
+10/19/2026
+    - Added a load ledger (bLoadLedger).  The load state of every DEM is recorded in
+      USGS_3DEP_<res>_Step3_LoadLedger.sqlite (DSHub_Load_Ledger) so a rerun skips DEMs that are
+      complete and verifies DEMs that were still loading or failed when the last run stopped.
+      DEMs are marked loading per batch when the batch is submitted.
+    - raster2pgsql commands are parsed into load jobs and every load returns a structured result
+      (exit status, tiles inserted, seconds, ERROR/WARNING lines) instead of keyword searching stderr.
+      1 JSON record per DEM is appended to USGS_3DEP_<res>_Step3_Exec_RASTER2PGSQL_Results.jsonl;
+      the summary and the FAILED (retry) file are built from it.
+    - Ray tasks load batches of DEMs (bBatchLoad) instead of 1 task per command.  At most maxInFlight
+      tasks are submitted at a time and results are collected with ray.wait as they complete so the
+      log, results stream and ledger are updated while the load runs.  Ray is started locally
+      when it is not already running so the script runs the same on 1 machine or a cluster.
+
 Things to consider/do:
     - Warning messages are assumed to be duplicated.  If there are multiple warnings I should compare
       them to see if they are unique.
@@ -46,10 +60,14 @@ Things to consider/do:
 
 #-------------------------------------------------------------------------------
 
-import subprocess, traceback, os, sys, time, re
+import traceback, os, sys, time
 from datetime import datetime
 import ray
 
+from DSHub_Raster_Loader import preparePartitionedTargets, interleaveBatches
+from DSHub_Raster_Loader import parseRaster2pgsqlCommand, createLoadBatches, runRaster2pgsqlBatch, runLoadJob, createResultRecords, writeResultRecords, summarizeLoadResults
+from DSHub_Load_Ledger import openLoadLedger, closeLoadLedger, filterLedgerJobs, markLoadStarted, markLoadFinished, ledgerSummary
+
 ## ===================================================================================
 def AddMsgAndPrint(msg):
 
@@ -119,85 +137,116 @@ def print_progress_bar(index, total, label):
 
 ## ===================================================================================
 @ray.remote
-def runRaster2pgsql(cmd):
-    """ This function was desinged to execute raster2pgsql commands via a subprocess to OS
-        
+def runRaster2pgsql(batch, bTransaction=True):
+    """ This function was desinged to execute the raster2pgsql command of a batch of load jobs
+        via a subprocess to OS.  A batch of 1 job runs its original command; a batch of many jobs
+        runs in 1 raster2pgsql and 1 psql process (DSHub_Raster_Loader.runRaster2pgsqlBatch).
+        Returns the structured result of DSHub_Raster_Loader.runLoadCommand:
+        {'rasters','status':'Success'|'Warning'|'Error','rows','expectedRows','returncode',
+         'seconds','error','warnings'}
     """
 
-    try:
-        cmdItems = cmd.split(' ')
-        DEMname = os.path.basename(cmdItems[11 if os.name == 'nt' else 10])
-
-        msgDict = dict()
-        errorList = ['error','failed','fail','uncommit','aborted','notice','memory',
-                     'warning','unable','not recognized','inoperable','syntax', 'cannot']
-        words_re = re.compile("|".join(errorList))
-        
-        # Windows (nt) vs Linux (posix)
-        if os.name == 'nt':
-            env={'PGPASSWORD':"ilovesql",
-                 'PGHOST' : 'localhost',
-                 'PGPORT' : '5432',
-                 'PGUSER' : 'postgres',
-                 'PGDATABASE' : "elevation",
-                 'SYSTEMROOT': os.environ['SYSTEMROOT'],
-                 'PROJ_LIB': r"C:\Program Files\PostgreSQL\15\share\contrib\postgis-3.3\proj"}
-            
-            # Send command to operating system
-            execCmd = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,universal_newlines=True, env=env)
-        
-        else:
-            # Send command to operating system
-            execCmd = subprocess.Popen(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,universal_newlines=True)
-            #execCmd = subprocess.run(cmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,universal_newlines=True)
-            #execCmd = subprocess.run(rasterLine, shell=True, check=True) # alternate method
-
-        # returns a tuple (stdout_data, stderr_data)
-        msgs, errors = execCmd.communicate()
-        errors = ','.join(errors.strip().split('\n')).lower()  # some errors return mutliple carriage returns
+    # Windows (nt) vs Linux (posix)
+    if os.name == 'nt':
+        env={'PGPASSWORD':"ilovesql",
+             'PGHOST' : 'localhost',
+             'PGPORT' : '5432',
+             'PGUSER' : 'postgres',
+             'PGDATABASE' : "elevation",
+             'SYSTEMROOT': os.environ['SYSTEMROOT'],
+             'PROJ_LIB': r"C:\Program Files\PostgreSQL\15\share\contrib\postgis-3.3\proj"}
+    else:
+        env = None
 
-        # Collect messages
-        # 0 = completed, however there may be warnings
-        errorResults = words_re.search(errors)
+    if len(batch) == 1:
+        return runLoadJob(batch[0], env)
 
-        if errorResults:
-            errorGroup = errorResults.group()
+    return runRaster2pgsqlBatch(batch, bTransaction, env)
 
-            # Warning messages
-            if errorGroup in ('warning') and execCmd.returncode == 0:
+## ===================================================================================
+def recordResults(batch, result, bLoadLedger=True):
+    """ Records the result of 1 batch as soon as it completes: 1 record per DEM in the JSONL
+        results stream, the console and log file, and the load ledger. """
 
-                # number of warnings; isolate 1 message
-                # If there are multiple warnings I should compare them to see if they are unique;
-                # Assumption is that the warnings are duplicated
-                warningCounts = re.findall(r'\b(?:' + '|'.join(['warning']) + r')\b', errors)
-                warningIndices = [m.start() for m in re.finditer(r"\bwarning\b", errors)]
+    global r2pTracker
 
-                # Extract warning message
-                if len(warningCounts) > 1:
-                    warningMessage = errors[warningIndices[0]:warningIndices[1]]
-                else:
-                    warningMessage = errors[warningIndices[0]:]
+    try:
+        records = createResultRecords(batch, result, 'ray', runID)
+        writeResultRecords(raster2pgsqlResultsFile, records)
 
-                msgDict['Warning'] = f"Loaded {DEMname} but with the following Warning: {warningMessage}\n"
+        for job,record in zip(batch,records):
+            r2pTracker+=1
+            DEMname = os.path.basename(record['raster'])
 
-            # Error messages; What is the error group here? Investigate after more errors arise
+            if record['status'] == 'Error':
+                AddMsgAndPrint(f"\n\tFailed: {DEMname}: ERROR: {record['error']} -- ({r2pTracker:,} of {recCount:,})")
+            elif record['status'] == 'Warning':
+                AddMsgAndPrint(f"\tLoaded {DEMname} but with the following Warning: {record['warnings'][0]} -- ({r2pTracker:,} of {recCount:,})")
             else:
-                msgDict['Error'] = f"{cmd}: ERROR: {errors}\n"
-
-        else:
-            msgDict['Success'] = f"Successfully loaded {DEMname}"
+                AddMsgAndPrint(f"\tSuccessfully loaded {DEMname} -- {record['rows']:,} tiles -- ({r2pTracker:,} of {recCount:,})")
 
-        return msgDict
+            if bLoadLedger:
+                markLoadFinished(job, record['status'], record['rows'], record['error'])
 
     except:
-        msgDict['Error'] = f"\"{cmd}\"\n\t{errorMsg(errorOption=2)}"
-        return msgDict
-    
+        errorMsg()
+
+## ===================================================================================
+def executeBatches(batches, maxInFlight, bTransaction=True, bLoadLedger=True):
+    """ Generator that submits 1 Ray task per batch with at most maxInFlight tasks running or
+        queued at a time and yields (batch, result) as each task completes (ray.wait) instead of
+        blocking on 1 ray.get of every task.  Only the results of the in-flight window are held
+        in memory.  A task that raises (worker died, object lost) is returned as an Error result
+        for every DEM in its batch so it ends up in the retry file.  The DEMs of a batch are
+        marked 'loading' in the load ledger when the batch is submitted."""
+
+    pending = iter(batches)
+    inFlight = dict()   # ObjectRef -> batch
+
+    while True:
+        # Top up the window
+        while len(inFlight) < maxInFlight:
+            batch = next(pending, None)
+            if batch is None:
+                break
+            if bLoadLedger:
+                markLoadStarted(batch)
+            inFlight[runRaster2pgsql.remote(batch, bTransaction)] = batch
+
+        if not inFlight:
+            break
+
+        done, notDone = ray.wait(list(inFlight), num_returns=1)
+        for ref in done:
+            batch = inFlight.pop(ref)
+            try:
+                result = ray.get(ref)
+            except:
+                result = {'rasters':[job['raster'] for job in batch], 'status':'Error', 'rows':0, 'expectedRows':0,
+                          'returncode':None, 'seconds':0, 'error':errorMsg(errorOption=2), 'warnings':list()}
+            yield batch, result
+
 ## ===================================================================================
-def main(raster2pgsqlFile):
-    
+def main(raster2pgsqlFile, bLoadLedger=True, bBatchLoad=True, batchMaxTiles=50000, batchMaxRasters=200,
+         bBatchTransaction=True, maxInFlight=None, partitionBy=None):
+    """ raster2pgsqlFile  - text file of raster2pgsql commands
+        bLoadLedger       - skip DEMs that are already loaded and record every outcome in the load ledger
+        bBatchLoad        - run many DEMs per Ray task (1 raster2pgsql and 1 psql process per task);
+                            otherwise every DEM is its own task
+        batchMaxTiles     - maximum number of tiles per batch
+        batchMaxRasters   - maximum number of DEMs per batch
+        bBatchTransaction - load each batch in 1 transaction
+        maxInFlight       - maximum number of Ray tasks submitted at a time; defaults to 2 x the
+                            CPUs of the Ray cluster (the local machine if Ray runs on 1 node)
+        partitionBy       - 'srid' or 'grid' to load target tables through partitions
+    """
+
     try:
-        global raster2pgsqlLogFile
+        global raster2pgsqlLogFile, raster2pgsqlResultsFile, runID, recCount, r2pTracker
+
+        # Starts a local single node Ray unless RAY_ADDRESS points to a cluster
+        if not ray.is_initialized():
+            ray.init()
         
         start = tic()
         resolution = raster2pgsqlFile.split(os.sep)[-1].split('_')[2]
@@ -205,6 +254,8 @@ def main(raster2pgsqlFile):
         """ ---------------------------- Establish Console LOG FILE ---------------------------------------------------"""
         raster2pgsqlLogFile = f"{os.path.dirname(raster2pgsqlFile)}{os.sep}USGS_3DEP_{resolution}_Step3_Exec_RASTER2PGSQL_ConsoleMsgs.txt"
         raster2pgsqlErrorFile = f"{os.path.dirname(raster2pgsqlFile)}{os.sep}USGS_3DEP_{resolution}_Step3_Exec_RASTER2PGSQL_FAILED.txt"
+        loadLedgerFile = f"{os.path.dirname(raster2pgsqlFile)}{os.sep}USGS_3DEP_{resolution}_Step3_LoadLedger.sqlite"
+        raster2pgsqlResultsFile = f"{os.path.dirname(raster2pgsqlFile)}{os.sep}USGS_3DEP_{resolution}_Step3_Exec_RASTER2PGSQL_Results.jsonl"
 
         recCount = sum(1 for line in open(raster2pgsqlFile))
         
@@ -254,76 +305,61 @@ def main(raster2pgsqlFile):
                 logError.write(f"\n{invalidCmd}")
             logError.close
             del logError
-            
-        """ ---------------------------- Execute raster2pgsql statements in MT mode ---------------------------------------------------"""
-        # Run commands in multi-threading mode
-        if len(raster2pgsqlList):
-            AddMsgAndPrint(f"\nRunning raster2pgsql on {len(raster2pgsqlList):,} DEM files")
+
+        # ---------------------------- Describe raster2pgsql commands as load jobs ---------------------------------------------------
+        jobs = list()
+        for cmd in raster2pgsqlList:
+            job,dbParams = parseRaster2pgsqlCommand(cmd)
+
+            if job is None:
+                AddMsgAndPrint(f"\tUnable to parse raster2pgsql command: {cmd}")
+                invalidCommands.append(cmd)
+                logError = open(raster2pgsqlErrorFile,'a+')
+                logError.write(f"\n{cmd}")
+                logError.close()
+                continue
+            jobs.append(job)
+
+        # ---------------------------- Point jobs at the partitions of their target tables ---------------------------------------------------
+        if partitionBy and len(jobs):
+            AddMsgAndPrint(f"\nPartitioning target tables by {partitionBy}")
+            for msg in preparePartitionedTargets(jobs, partitionBy):
+                AddMsgAndPrint(msg)
+
+        # ---------------------------- Skip DEMs that the Load Ledger shows are loaded ---------------------------------------------------
+        ledgerSkipped = 0
+        if bLoadLedger and len(jobs):
+            AddMsgAndPrint("\nChecking Load Ledger")
+            openLoadLedger(loadLedgerFile)
+
+            jobs,skippedJobs,ledgerMsgs = filterLedgerJobs(jobs)
+            for msg in ledgerMsgs:
+                AddMsgAndPrint(msg)
+
+            ledgerSkipped = len(skippedJobs)
+
+        runID = datetime.now().strftime('%Y%m%d_%H%M%S')
+
+        """ ---------------------------- Execute load jobs in Ray ---------------------------------------------------"""
+        if len(jobs):
+            if bBatchLoad:
+                batches = interleaveBatches(createLoadBatches(jobs, batchMaxTiles, batchMaxRasters))
+            else:
+                batches = [[job] for job in jobs]
+
+            if not maxInFlight:
+                maxInFlight = max(int(ray.cluster_resources().get('CPU',1)) * 2, 1)
+
+            AddMsgAndPrint(f"\nRunning raster2pgsql on {len(jobs):,} DEM files in {len(batches):,} Ray tasks -- {maxInFlight:,} in-flight")
             r2pTracker = 0
-            successCount = 0
-            warningCount = 0
-            failedCount = 0
-
-            runR2pgsqlCmd = [runRaster2pgsql.remote(cmd) for cmd in raster2pgsqlList]
-            msgResults = ray.get(runR2pgsqlCmd)
-            
-            # yield future objects as they are done.
-            for msgs in msgResults:
-
-                for status in msgs:
-                    r2pTracker+=1
-
-                    if status == 'Error':
-                        AddMsgAndPrint(f"\n\tFailed: {msgs['Error']} -- ({r2pTracker:,} of {recCount:,})")
-                        failedCount+=1
-
-                        isolatedCommand = msgs['Error'].split('\n')[0]
-                        logError = open(raster2pgsqlErrorFile,'a+')
-                        logError.write(f"\n{isolatedCommand}")
-                        logError.close
-                        del logError
-
-                    elif status == 'Warning':
-                        AddMsgAndPrint(f"\t{msgs['Warning']} -- ({r2pTracker:,} of {recCount:,})")
-                        warningCount+=1
-
-                    elif status == 'Success':
-                        AddMsgAndPrint(f"\t{msgs['Success']} -- ({r2pTracker:,} of {recCount:,})")
-                        successCount+=1
-                    else:
-                        AddMsgAndPrint("\tStatus message not returned by raster2pgsql function")
-            
-            # with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
-
-            #     # use a set comprehension to start all tasks.  This creates a future object
-            #     runR2pgsqlCmd = {executor.submit(runRaster2pgsql, cmd): cmd for cmd in raster2pgsqlList}
-
-            #     # yield future objects as they are done.
-            #     for future in as_completed(runR2pgsqlCmd):
-            #         msgs = future.result()
-
-            #         for status in msgs:
-            #             r2pTracker+=1
-
-            #             if status == 'Error':
-            #                 AddMsgAndPrint(f"\n\tFailed: {msgs['Error']} -- ({r2pTracker:,} of {recCount:,})")
-            #                 failedCount+=1
-
-            #                 isolatedCommand = msgs['Error'].split('\n')[0]
-            #                 logError = open(raster2pgsqlErrorFile,'a+')
-            #                 logError.write(f"\n{isolatedCommand}")
-            #                 logError.close
-            #                 del logError
-
-            #             elif status == 'Warning':
-            #                 AddMsgAndPrint(f"\t{msgs['Warning']} -- ({r2pTracker:,} of {recCount:,})")
-            #                 warningCount+=1
-
-            #             elif status == 'Success':
-            #                 AddMsgAndPrint(f"\t{msgs['Success']} -- ({r2pTracker:,} of {recCount:,})")
-            #                 successCount+=1
-            #             else:
-            #                 AddMsgAndPrint("\tStatus message not returned by raster2pgsql function")
+
+            # Results are recorded in the results stream, log and ledger as each task completes
+            for batch,result in executeBatches(batches, maxInFlight, bBatchTransaction, bLoadLedger):
+                recordResults(batch, result, bLoadLedger)
+
+        elif ledgerSkipped:
+            AddMsgAndPrint(f"\nAll {ledgerSkipped:,} valid 'RASTER2PGSQL' records were already loaded according to the Load Ledger.  EXITING!")
+            sys.exit()
 
         else:
             AddMsgAndPrint("\nThere were no valid 'RASTER2PGSQL' records to execute.  EXITING!")
@@ -338,19 +374,42 @@ def main(raster2pgsqlFile):
         if len(invalidCommands):
             AddMsgAndPrint(f"\nThere were {len(invalidCommands):,} of {recCount:,} records that were invalid")
 
+        if ledgerSkipped:
+            AddMsgAndPrint(f"\n{ledgerSkipped:,} of {recCount:,} DEMs were skipped because they were already loaded")
+
+        if bLoadLedger:
+            AddMsgAndPrint(f"\nLoad Ledger: {loadLedgerFile}")
+            for msg in ledgerSummary():
+                AddMsgAndPrint(msg)
+            closeLoadLedger()
+
+        # Summary and retry queue come from the results stream of this run
+        loadSummary = summarizeLoadResults(raster2pgsqlResultsFile, runID)
+        successCount = loadSummary['Success'] + loadSummary['Warning']
+        warningCount = loadSummary['Warning']
+        failedCount = loadSummary['Error']
+
+        AddMsgAndPrint(f"\nResults: {raster2pgsqlResultsFile} -- {loadSummary['rows']:,} tiles inserted")
+
+        if loadSummary['retry']:
+            logError = open(raster2pgsqlErrorFile,'a+')
+            for cmd in loadSummary['retry']:
+                logError.write(f"\n{cmd}")
+            logError.close()
+
         # All rasters loaded successfully
-        if successCount == recCount:
+        if successCount + ledgerSkipped == recCount:
             AddMsgAndPrint(f"\nALL {recCount:,} DEMs were successfully loaded to the database")
 
         else:
             if successCount > 0:
-                AddMsgAndPrint(f"\nThere were {successCount:,} of {len(raster2pgsqlList):,} DEMs were successfully loaded.")
+                AddMsgAndPrint(f"\nThere were {successCount:,} of {len(jobs):,} DEMs were successfully loaded.")
 
             if warningCount > 0:
-                AddMsgAndPrint(f"\nThere were {warningCount:,} of {len(raster2pgsqlList):,} DEMS that loaded with warnings.")
+                AddMsgAndPrint(f"\nThere were {warningCount:,} of {len(jobs):,} DEMS that loaded with warnings.")
 
             if failedCount > 0:
-                AddMsgAndPrint(f"\nThere were {failedCount:,} of {len(raster2pgsqlList):,} DEMS that failed loading process.")
+                AddMsgAndPrint(f"\nThere were {failedCount:,} of {len(jobs):,} DEMS that failed loading process.")
 
     except:
         errorMsg()
@@ -22,13 +22,29 @@ Parameters:
     4) outFpDir - boolean indicator to replace download file
     5) bDeleteZipFiles - boolean to delete or leave downloaded zipped files (only relevant if dl files are zip files)
                          set to False by default but can be overwritten in main.
+
+---------------- UPDATES
+10/19/2026
+    - The data mask is vectorized into an OGR Memory layer and reprojected to outputSRS in
+      process (DSHub_Footprints.polygonizeMask) instead of writing a temp EPSG shapefile and
+      reprojecting it with an ogr2ogr subprocess.  The WGS84 footprint shapefile is the only
+      file written and its catalog attributes are set when each polygon is created.
+    - The WGS84 footprint shapefiles are merged into 1 GeoPackage (DSHub_Footprints.mergeFootprints)
+      in large transactions with the spatial index built at the end instead of appending them
+      to a merged shapefile with a SyncToDisk after every feature.
+    - The data mask is thresholded in process (DSHub_Footprints.createFootprint; block by block
+      into a /vsimem/ mask) with the same calcValue (rds_min floored to the nearest 100 or the
+      nodata value) instead of launching a gdal_calc.py interpreter per DEM that wrote a temp
+      tif next to the DEM.  footprintRes builds the mask at a coarser cell size.
+    - DEMs are spread over threads with DSHub_Footprints.runFootprintTasks (bounded in-flight
+      window) instead of submitting every DEM to a ThreadPoolExecutor up front.
 """
 
-import os, subprocess, sys, traceback, re, glob, math, time, fnmatch, psutil
+import os, sys, traceback, glob, math, time, fnmatch, psutil
 from datetime import datetime
-from osgeo import gdal
-from osgeo import ogr, osr
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from osgeo import ogr
+
+from DSHub_Footprints import createFootprint, writeFootprints, readFootprintFile, mergeFootprints, runFootprintTasks
 
 ## ===================================================================================
 def AddMsgAndPrint(msg):
@@ -232,7 +248,6 @@ def createFootPrint(items):
         # Positions of item elements
         demName = rasterRecord[headerValues.index("dem_name")]
         demDir = rasterRecord[headerValues.index("dem_path")]
-        EPSG = int(rasterRecord[headerValues.index("epsg_code")])
         noData = float(rasterRecord[headerValues.index("nodataval")])
         minStat = float(rasterRecord[headerValues.index("rds_min")])
 
@@ -273,186 +288,28 @@ def createFootPrint(items):
             calcValue = noData
         #messageList.append(f"\t\tThreshold Value: {calcValue}")
 
-        # Temp Tiff that will be created and used to vectorize
         demPath = f"{demDir}{os.sep}{demName}"
-        fileExt = demPath.split('.')[1] # tif, img
-        tempTif = f"{demPath.split('.')[0]}_TEMP.{fileExt}"
-
-        # Delete TEMP raster layer
-        for tmpFile in glob.glob(f"{tempTif.split('.')[0]}*"):
-            os.remove(tmpFile)
-            #messageList.append(f"\t\tSuccessfully Deleted temp tiff: {os.path.basename(tmpFile)}")
-
-        """ ------------------------- Create Raster Data Mask ----------------------------------- """
-        if os.name == 'nt':
-            gdal_calc = f"gdal_calc -A {demPath} --outfile={tempTif} --type=Byte --calc=\"A>{calcValue}\" --NoDataValue=0"
-        else:
-            #gdal_calc = f"gdal_calc -A {demPath} --A_band=1 --outfile={tempTif} --type=Byte --calc=\"A>{calcValue}\" --NoDataValue=0"
-            gdal_calc = f"python3 /bin/gdal_calc.py -A {demPath} --outfile={tempTif} --type=Byte --calc=\"A>{calcValue}\" --NoDataValue=0"
-
-        # Collect messages from subprocess
-        errorList = ['error','failed','fail','uncommit','aborted','notice','memory',
-                     'unable','not recognized','inoperable','syntax']
-        words_re = re.compile("|".join(errorList))
-
-        # Send gdal command to os
-        execCmd = subprocess.Popen(gdal_calc, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,universal_newlines=True)
-
-        # returns a tuple (stdout_data, stderr_data)
-        msgs, errors = execCmd.communicate()
-        errors = ','.join(errors.strip().split('\n'))  # some errors return mutliple carriage returns
-
-        if words_re.search(errors.lower()) or not execCmd.returncode == 0:
-            #msgDict['Error'] = f"{gdal_calc}\n\t{errors}"
-            messageList.append(f"\t\t-Errors creating 'data' mask: {errors}")
-        else:
-            #msgDict['Success'] = f"Successfully created 'data' mask"
-            messageList.append(f"\t\t-Successfully created 'data' mask using values >= {calcValue}")
-
-        """ ------------------------- Create Footprint Shapefile ----------------------------------- """
-        # List of field names to add to shapefile
-        fieldNames = {'poly_code':ogr.OFTString,
-                      'prod_title':ogr.OFTString,
-                      'pub_date':ogr.OFTDate,
-                      'lastupdate':ogr.OFTDate,
-                      'rds_size':ogr.OFTInteger,
-                      'format':ogr.OFTString,
-                      'sourceid':ogr.OFTString,
-                      'meta_url':ogr.OFTString,
-                      'downld_url':ogr.OFTString,
-                      'dem_name':ogr.OFTString,
-                      'dem_path':ogr.OFTString,
-                      'rds_column':ogr.OFTInteger,
-                      'rds_rows':ogr.OFTInteger,
-                      'bandCount':ogr.OFTInteger,
-                      'cellSize':ogr.OFTReal,
-                      'rdsformat':ogr.OFTString,
-                      'bitdepth':ogr.OFTString,
-                      'nodataval':ogr.OFTReal,
-                      'srs_type':ogr.OFTString,
-                      'epsg_code':ogr.OFTInteger,
-                      'srs_name':ogr.OFTString,
-                      'rds_top':ogr.OFTReal,
-                      'rds_left':ogr.OFTReal,
-                      'rds_right':ogr.OFTReal,
-                      'rds_bottom':ogr.OFTReal,
-                      'rds_min':ogr.OFTReal,
-                      'rds_mean':ogr.OFTReal,
-                      'rds_max':ogr.OFTReal,
-                      'rds_stdev':ogr.OFTReal,
-                      'blk_xsize':ogr.OFTInteger,
-                      'blk_ysize':ogr.OFTInteger,
-                      "rastValue":ogr.OFTInteger}
-
-        # Set up the shapefile driver
-        outDriver = ogr.GetDriverByName("ESRI Shapefile")
-
-        fpLyrName = f"{demName[:-4]}_FP"                    # New shapefile name - no ext
-        fpShpPath = f"{outFpDir}{os.sep}{fpLyrName}.shp"    # New shapefile footprint path
-
-        # Remove output shapefile if it already exists
-        if os.path.exists(fpShpPath):
-            outDriver.DeleteDataSource(fpShpPath)
-            messageList.append(f"\t\t-Successfully deleted existing Shp: {fpLyrName}.shp")
-
-        # set the spatial reference for the shapefile; same as input raster
-        sp_ref = osr.SpatialReference()
-        sp_ref.ImportFromEPSG(EPSG)
-        #sp_ref.SetFromUserInput(f"EPSG:{EPSG}")
-
-        # set the destination of the data source
-        outDataSource = outDriver.CreateDataSource(outFpDir)
-        outLayer = outDataSource.CreateLayer(fpLyrName, srs=sp_ref, geom_type=ogr.wkbPolygon)
-
-        # Add new Fields to the output shapefile
-        for fld in fieldNames.items():
-            fldname = fld[0]
-            fldType = fld[1]
-            gdalFld = ogr.FieldDefn(fldname, fldType)
-
-            # Getting warning messages with nodata val
-            if fldname == 'noDataVal':
-                gdalFld.SetWidth(90)
-                gdalFld.SetPrecision(60)
-
-            outLayer.CreateField(gdalFld)
-
-        # Get the output Layer's Feature Definition
-        outLayerDefn = outLayer.GetLayerDefn()
-
-        """ ------------------------- Vectorize Mask ----------------------------------- """
-        # Value from raster after
-        rast_field = outLayer.GetLayerDefn().GetFieldIndex("rastValue")
-
-        # Open raster to pass a band object to polygonize function
-        ds = gdal.Open(tempTif)
-        band = ds.GetRasterBand(1)
-
-        # vectorize mask
-        #result = gdal.Polygonize(band, None if , outLayer, rast_field, [], callback=None)
-        result = gdal.Polygonize(band, band, outLayer, rast_field, [], callback=None)
-        assert result == 0, AddMsgAndPrint(f"\tPolygonize failed")
-        messageList.append(f"\t\t-Successfully vectorized mask into: {fpLyrName}.shp")
-
-        # populate the shapefile fields after polygons exist
-        for i in range(0, outLayer.GetFeatureCount()):
-            feature = outLayer.GetFeature(i)
-            for j in range(0,outLayerDefn.GetFieldCount()-1):
-                feature.SetField(outLayerDefn.GetFieldDefn(j).GetName(),rasterRecord[j])
-                #AddMsgAndPrint(f"{outLayerDefn.GetFieldDefn(j).GetName()} -- {rasterRecord[j]}")
-                test = outLayer.SetFeature(feature)
-
-        # close the shapefile and workspace
-        outDataSource.FlushCache()
-        outDataSource.Destroy()
-
-        del outDataSource, outLayer, ds, band
-
-        """ ------------------------- Project Mask to WGS84 ----------------------------------- """
-        #inDriver = ogr.GetDriverByName("ESRI Shapefile")
-        #shape = inDriver.Open(fpShpPath,0)
-        #layer = shape.GetLayer()
-
-        # projected output Shapefile
-        prjShape = f"{fpShpPath.split('.')[0]}_WGS84.shp"
-
-        # Delete if projected shp exists
-        if os.path.exists(prjShape):
-            outDriver.DeleteDataSource(prjShape)
-
-        prjCmd = f"ogr2ogr -f \"ESRI Shapefile\" {prjShape} {fpShpPath} -t_srs EPSG:4326 -s_srs EPSG:{EPSG} "# -lco ENCODING=UTF-8"
 
-        # Create 4326 prj file if not created; not sure why the prj is not automatically created.
-        prjFile = f"{prjShape[0:-4]}.prj"
-        if not os.path.exists(prjFile):
-            spatialRef = osr.SpatialReference()
-            spatialRef.ImportFromEPSG(4326)
-            spatialRef.MorphToESRI()
-            file = open(prjFile, 'w')
-            file.write(spatialRef.ExportToWkt())
-            file.close()
-            messageList.append(f"\t\t-Successfully Created WGS84 PRJ File: {prjFile}")
-
-        execCmd = subprocess.Popen(prjCmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,universal_newlines=True)
-        msgs, errors = execCmd.communicate()
-        errors = ','.join(errors.strip().split('\n'))  # some errors return mutliple carriage returns
+        """ ------------------------- Create and Vectorize Raster Data Mask in memory ----------------------------------- """
+        # Pixels > calcValue are DATA=1, everything else NODATA=0 (gdal_calc --calc="A>calcValue").
+        # The DEM is thresholded block by block into a /vsimem/ mask that is polygonized into an
+        # OGR Memory layer and reprojected to outputSRS in process; no gdal_calc subprocess,
+        # no temp tif and no temp EPSG shapefile.
+        footprint = createFootprint(demPath, outputSRS, threshold=calcValue, dataValue=1, nodataValue=0, bDataOnly=True,
+                                    footprintRes=footprintRes)
+        footprints = footprint['footprints']
+        srsWkt = footprint['srs']
+        messageList.append(f"\t\t-Successfully created 'data' mask using values > {calcValue}")
+        messageList.append(f"\t\t-Successfully vectorized mask into {len(footprints):,} polygons")
+
+        """ ------------------------- Write WGS84 Footprint Shapefile ----------------------------------- """
+        # projected output Shapefile; catalog attributes are set when each polygon is created
+        prjShape = f"{outFpDir}{os.sep}{demName[:-4]}_FP_WGS84.shp"
+        attributes = dict(zip(headerValues, [value.strip() for value in rasterRecord]))
+        writeFootprints(prjShape, footprints, srsWkt, attributes)
 
         fpShapes.append(prjShape)
-
-        # Close datasource
-        #shape = None
-        #del inDriver,shape,layer,prjShape
-        messageList.append(f"\t\t-Successfully Projected: {os.path.basename(fpShpPath)} to WGS84")
-
-        """ ------------------------- Delete Temp Raster Files ----------------------------------- """
-        # Delete TEMP raster layer
-        for tmpFile in glob.glob(f"{tempTif.split('.')[0]}*"):
-            os.remove(tmpFile)
-            messageList.append(f"\t\t-Successfully Deleted temp: {os.path.basename(tmpFile)}")
-
-        # Delete TEMP raster layer
-        outDriver.DeleteDataSource(fpShpPath)
-        messageList.append(f"\t\t-Successfully Deleted temp: {os.path.basename(fpShpPath)}")
+        messageList.append(f"\t\t-Successfully created WGS84 Footprint: {os.path.basename(prjShape)}")
 
         messageList.append(f"\t\t-Process Time: {toc(filestart)}")
         return messageList
@@ -464,94 +321,27 @@ def createFootPrint(items):
         return messageList
 
 #### ===================================================================================
-def mergeFootPrints(outDir,shapefiles):
+def mergeFootPrints(outDir,shapefiles,mergeFormat='gpkg'):
 
     try:
         AddMsgAndPrint(f"\nMerging Shapefile Spatial Footprints")
 
-        """ ------------------  Create new shapefile and add fields -------------------------------"""
-        # Create a new shapefile to store the merged data
-        mergeShape = f"USGS_3DEP_{resolution}_FootPrints_WGS84"
-        mergeShapePath = f"{outDir}{os.sep}{mergeShape}.shp"
-        AddMsgAndPrint(f"\n\tCreating Merged Shapefile: {mergeShapePath}")
-
-        outDriver = ogr.GetDriverByName("ESRI Shapefile")
+        """ ------------------  Append WGS84 FP shapefiles to 1 GeoPackage/FlatGeobuf -------------------------------"""
+        # Features are written in large transactions and the spatial index is built once at the end
+        mergePath = f"{outDir}{os.sep}USGS_3DEP_{resolution}_FootPrints_WGS84.{mergeFormat}"
+        AddMsgAndPrint(f"\n\tAppending {len(shapefiles)} WGS84 Footprint Shapefiles to: {mergePath}")
 
-        if os.path.exists(mergeShapePath):
-            outDriver.DeleteDataSource(mergeShapePath)
-            AddMsgAndPrint(f"\t\t{os.path.basename(mergeShapePath)} Exists.  Successfully Deleted")
+        mergeInfo = mergeFootprints(mergePath, (readFootprintFile(shapefile) for shapefile in shapefiles), 4326)
+        AddMsgAndPrint(f"\n\t\tSuccessfully Appended {mergeInfo['tiles']:,} footprint Shapefiles ({mergeInfo['features']:,} polygons) to: {os.path.basename(mergePath)}")
 
-        # set the spatial reference for the shapefile; same as input raster
-        sp_ref = osr.SpatialReference()
-        sp_ref.SetFromUserInput(f"EPSG:4326")
-
-        # set the destination of the data source
-        outDataSource = outDriver.CreateDataSource(outDir)
-        outLayer = outDataSource.CreateLayer(mergeShape, srs=sp_ref, geom_type=ogr.wkbPolygon)
-
-        # Grab first shape in list just to get the field names
-        daShapefile = shapefiles[0]
-
-        dataSource = ogr.Open(daShapefile)
-        daLayer = dataSource.GetLayer(0)
-        inLayerDefn = daLayer.GetLayerDefn()
-
-        # Add field names to newly created target shapefile
-        for i in range(inLayerDefn.GetFieldCount()):
-            fieldDefn = inLayerDefn.GetFieldDefn(i)
-            outLayer.CreateField(fieldDefn)
-
-        del daShapefile,dataSource,daLayer,inLayerDefn,outDriver
-
-        """ ------------------  Append WGS84 FP shapefiles to new shapefile -------------------------------"""
-        AddMsgAndPrint(f"\n\tAppending {len(shapefiles)} WGS84 Footprint Shapefiles to: {mergeShapePath}")
-        appendCnt = 0
-
-        # Add each shapefile to the merged layer
-        for shapefile in shapefiles:
-            print(f"\t\tAppending: {os.path.basename(shapefile)}")
-
-            # Layer of Source Shp
-            inDriver = ogr.GetDriverByName("ESRI Shapefile")
-            ds_source = inDriver.Open(shapefile,0)
-
-            if ds_source is None:
-                AddMsgAndPrint(f"{shapefile} is empty")
-                continue
-
-            sourceLyr = ds_source.GetLayer()
-            sourceLyrDef = sourceLyr.GetLayerDefn()
-
-            # Append Geometry
-            for feat in sourceLyr:
-                out_feat = ogr.Feature(outLayer.GetLayerDefn())
-
-                # Get all attributes related to this geometry record
-                for i in range(0, sourceLyrDef.GetFieldCount()):
-                    out_feat.SetField(sourceLyrDef.GetFieldDefn(i).GetNameRef(),feat.GetField(i))
-
-                out_feat.SetGeometry(feat.GetGeometryRef().Clone())
-                outLayer.CreateFeature(out_feat)
-                out_feat = None
-                outLayer.SyncToDisk()
-
-            ds_source = None
-            del inDriver,ds_source,sourceLyr,sourceLyrDef
-            appendCnt+=1
-
-        del shapefile
-        AddMsgAndPrint(f"\n\t\tSuccessfully Appended {appendCnt:,} footprint Shapefiles to: {os.path.basename(mergeShapePath)}")
-
-        """ ------------------  Delete Temp Projected Files -------------------------------"""
+        """ ------------------  Delete WGS84 FP shapefiles -------------------------------"""
         AddMsgAndPrint(f"\n\tDeleting {len(shapefiles)} Projected Shapefiles")
         deleteCnt = 0
 
-        # Add each shapefile to the merged layer
         driver = ogr.GetDriverByName("ESRI Shapefile")
         for shapefile in shapefiles:
             if os.path.exists(shapefile):
                 driver.DeleteDataSource(shapefile)
-                print(f"\t\tSuccessfully Deleted {os.path.basename(shapefile)}")
                 deleteCnt+=1
 
         AddMsgAndPrint(f"\t\tSuccessfully Deleted {deleteCnt:,} Projected Shapefiles")
@@ -568,6 +358,7 @@ if __name__ == '__main__':
     elevationMetadataFile = r'E:\GIS_Projects\DS_Hub\Elevation\DSHub_Elevation\USGS_Text_Files\30M\20230801_windows\USGS_3DEP_30M_Step2_Elevation_Metadata_test.txt'
     outFpDir = r'D:\projects\DSHub\USGS_Spatial_Footprints\30M_test'
     outputSRS = '4326'
+    footprintRes = None     # mask cell size in DEM units i.e. 30 for 1M DEMs; None = full resolution
 
     """ ---------------------------- Establish Console LOG FILE ---------------------------------------------------"""
     tempList = elevationMetadataFile.split(os.sep)[-1].split('_')
@@ -614,20 +405,18 @@ if __name__ == '__main__':
     AddMsgAndPrint(f"\nCreating Spatial Footprints")
     numOfCores = psutil.cpu_count(logical = False)
 
-    # Execute in Multi-threading mode
-    with ThreadPoolExecutor(max_workers=numOfCores) as executor:
-        ndProcessing = {executor.submit(createFootPrint, rastItems): rastItems for rastItems in files.items()}
-
-        # yield future objects as they are done.
-        for future in as_completed(ndProcessing):
-            fpTracker +=1
-            j=1
-            for printMessage in future.result():
-                if j==1:
-                    AddMsgAndPrint(f"{printMessage} -- ({fpTracker:,} of {recCount:,})")
-                else:
-                    AddMsgAndPrint(printMessage)
-                j+=1
+    # Execute in Multi-threading mode; createFootPrint reads headerValues/outFpDir and appends to
+    # fpShapes as module globals so it can only run in this process ('threads' or 'serial').
+    # Use USGS_4 MP for 'processes' or 'ray'.
+    for messageList in runFootprintTasks(createFootPrint, ((rastItems,) for rastItems in files.items()), 'threads', numOfCores):
+        fpTracker +=1
+        j=1
+        for printMessage in messageList:
+            if j==1:
+                AddMsgAndPrint(f"{printMessage} -- ({fpTracker:,} of {recCount:,})")
+            else:
+                AddMsgAndPrint(printMessage)
+            j+=1
 
     rastFpStop = toc(rastFpStart)
 
@@ -22,13 +22,40 @@ Parameters:
     4) outFpDir - boolean indicator to replace download file
     5) bDeleteZipFiles - boolean to delete or leave downloaded zipped files (only relevant if dl files are zip files)
                          set to False by default but can be overwritten in main.
+
+---------------- UPDATES
+10/19/2026
+    - The data mask is vectorized into an OGR Memory layer and reprojected to outputSRS in
+      process (DSHub_Footprints.polygonizeMask) instead of writing a temp EPSG shapefile and
+      reprojecting it with an ogr2ogr subprocess.  The WGS84 footprint shapefile is the only
+      file written and its catalog attributes are set when each polygon is created.
+    - Footprints are streamed into 1 merged GeoPackage or FlatGeobuf (mergeFormat) as the
+      workers finish them (DSHub_Footprints.mergeFootprints) instead of writing a shapefile
+      per DEM and appending them to a merged shapefile with a SyncToDisk after every feature.
+      Features are written in large transactions and the spatial index is built at the end.
+      Per-DEM shapefiles are only written with createFootPrint(bTileShapefile=True).
+    - DEMs are spread over workers with DSHub_Footprints.runFootprintTasks; footprintExecutor
+      selects 'serial', 'threads', 'processes' or 'ray'.  Removed the stray return after the
+      gdal_calc Popen that returned before communicate() so the mask was never waited for,
+      checked or vectorized.
+    - The data mask is thresholded in process (DSHub_Footprints.createFootprint; block by block
+      into a /vsimem/ mask) with the same calcValue (rds_min floored to the nearest 100 or the
+      nodata value) instead of launching a gdal_calc.py interpreter per DEM that wrote a temp
+      tif next to the DEM.  The bGDAL option is gone; footprintRes builds the mask at a
+      coarser cell size.
+    - Two-tier footprints (validFraction): a catalog BBOX footprint of every DEM is written
+      before any DEM is opened (tier 1).  In the merged footprints, DEMs with at least
+      validFraction valid pixels (1 decimated read; DSHub_Footprints.validPixelFraction) keep
+      their catalog bbox and only the rest are polygonized (tier 2).
 """
 
-import os, subprocess, sys, traceback, re, glob, math, time, fnmatch, psutil, numpy
+import os, sys, traceback, glob, math, time, fnmatch, psutil
 from datetime import datetime
 from osgeo import gdal
-from osgeo import ogr, osr
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from osgeo import ogr
+
+from DSHub_Registration_Jobs import readCatalogRecords
+from DSHub_Footprints import createTieredFootprint, catalogBboxFootprints, writeFootprints, readFootprintFile, mergeFootprints, runFootprintTasks
 
 ## ===================================================================================
 def AddMsgAndPrint(msg,msgList=list()):
@@ -250,7 +277,7 @@ def convertMasterDBfileToDict(elevMetdataFile,outDir):
 
 
 #### ===================================================================================
-def createFootPrint(items, headerValues,outFpDir,bGDAL):
+def createFootPrint(items, headerValues,outFpDir,outputSRS=4326,bTileShapefile=False,footprintRes=None,validFraction=None):
     """        '63e7308bd34efa0476ae8401': ['11030005',
                               'USGS 1 Meter 14 x34y421 '
                               'KS_StatewideFordGray_2018_A18',
@@ -295,14 +322,15 @@ def createFootPrint(items, headerValues,outFpDir,bGDAL):
         returnDict = dict()
         returnDict['msgs'] = []
         returnDict['shp'] = []
+        returnDict['footprints'] = []
         returnDict['fail'] = []
         returnDict['pTime'] = []
+        returnDict['tier'] = []
 
         # Positions of item elements
         rasterRecord = items[1]
         demName = rasterRecord[headerValues.index("dem_name")]
         demDir = rasterRecord[headerValues.index("dem_path")]
-        EPSG = int(rasterRecord[headerValues.index("epsg_code")])
         noData = float(rasterRecord[headerValues.index("nodataval")])
         minStat = float(rasterRecord[headerValues.index("rds_min")])
         demPath = f"{demDir}{os.sep}{demName}"
@@ -318,215 +346,46 @@ def createFootPrint(items, headerValues,outFpDir,bGDAL):
             calcValue = noData
         #returnDict['msgs'].append(f"\t\tThreshold Value: {calcValue}")
 
-        # Temp Tiff that will be created and used to vectorize
-        tempTif = f"{demPath.split('.')[0]}_TEMP.tif"
+        attributes = dict(zip(headerValues, [value.strip() for value in rasterRecord]))
 
-        # Delete TEMP raster layer
-        for tmpFile in glob.glob(f"{tempTif.split('.')[0]}*"):
-            os.remove(tmpFile)
-            #returnDict['msgs'].append(f"\t\tSuccessfully Deleted temp tiff: {os.path.basename(tmpFile)}")
+        """ ------------------------- Create and Vectorize Raster Data Mask in memory ----------------------------------- """
+        # Pixels > calcValue are DATA=1, everything else NODATA=0 (gdal_calc --calc="A>calcValue").
+        # The DEM is thresholded block by block into a /vsimem/ mask that is polygonized
+        # into an OGR Memory layer and reprojected in process; no gdal_calc subprocess,
+        # no temp tif and no temp EPSG shapefile.
+        # DEMs with at least validFraction valid pixels skip the mask and get their catalog
+        # bbox as footprint (tier 1).
+        vectorStart = tic()
 
-        """ ------------------------- Create Raster Data Mask ----------------------------------- """
-        calcStart = tic()
-
-        if bGDAL:
-            if os.name == 'nt':
-                gdal_calc = f"gdal_calc -A {demPath} --outfile={tempTif} --type=Byte --calc=\"A>{calcValue}\" --NoDataValue=0"
-            else:
-                #gdal_calc = f"gdal_calc -A {demPath} --A_band=1 --outfile={tempTif} --type=Byte --calc=\"A>{calcValue}\" --NoDataValue=0"
-                gdal_calc = f"python3 /bin/gdal_calc.py -A {demPath} --outfile={tempTif} --type=Byte --calc=\"A>{calcValue}\" --NoDataValue=0"
+        footprint = createTieredFootprint(demPath, attributes, outputSRS, validFraction, threshold=calcValue, dataValue=1,
+                                          nodataValue=0, bDataOnly=True, footprintRes=footprintRes)
+        footprints = footprint['footprints']
+        srsWkt = footprint['srs']
+        returnDict['tier'].append(footprint['tier'])
 
+        validMsg = f" -- {footprint['validFraction']:.2%} valid pixels" if footprint['validFraction'] is not None else ""
+        if footprint['tier'] == 1:
+            returnDict['msgs'].append(f"\t\t-Catalog BBOX Footprint (Tier 1) Process Time: {toc(vectorStart)}{validMsg}")
         else:
-            # create binary raster NODATA=0, DATA = 1
-            numpyCalc = '"numpy.where(A > ' + str(calcValue) + ', 1, A)"'
-            gdal_calc = f"gdal_calc -A {demPath} --outfile={tempTif} --type=Byte --calc={numpyCalc} --NoDataValue=0"
+            returnDict['msgs'].append(f"\t\t-Create and Vectorize Mask (Tier 2) Process Time: {toc(vectorStart)} -- {len(footprints):,} polygons{validMsg}")
 
-        # Collect messages from subprocess
-        errorList = ['error','failed','fail','uncommit','aborted','notice','memory',
-                     'unable','not recognized','inoperable','syntax']
-        words_re = re.compile("|".join(errorList))
+        if bTileShapefile:
+            """ ------------------------- Write WGS84 Footprint Shapefile ----------------------------------- """
+            writeStart = tic()
 
-        # Send gdal command to os
-        execCmd = subprocess.Popen(gdal_calc, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,universal_newlines=True)
+            # projected output Shapefile; catalog attributes are set when each polygon is created
+            prjShape = f"{outFpDir}{os.sep}{demName[:-4]}_FP_WGS84.shp"
+            writeFootprints(prjShape, footprints, srsWkt, attributes)
 
-        returnDict['msgs'].append(f"\t\t-GDAL Calc Process Time: {toc(calcStart)}")
-        returnDict['msgs'].append(f"\t\t-Process Time: {toc(filestart)}")
-        return returnDict
-
-        # returns a tuple (stdout_data, stderr_data)
-        msgs, errors = execCmd.communicate()
-        errors = ','.join(errors.strip().split('\n'))  # some errors return mutliple carriage returns
-
-        if words_re.search(errors.lower()) or not execCmd.returncode == 0:
-            #msgDict['Error'] = f"{gdal_calc}\n\t{errors}"
-            returnDict['msgs'].append(f"\t\t-Errors creating 'data' mask: {errors}")
+            returnDict['shp'].append(prjShape)
+            returnDict['msgs'].append(f"\t\t-Write Shapefile Process Time: {toc(writeStart)}")
         else:
-            #msgDict['Success'] = f"Successfully created 'data' mask"
-            pass
-            ##returnDict['msgs'].append(f"\t\t-Successfully created 'data' mask using values >= {calcValue}")
-
-        returnDict['msgs'].append(f"\t\t-GDAL Calc Process Time: {toc(calcStart)}")
-
-        """ ------------------------- Create Empty Footprint Shapefile ----------------------------------- """
-        emptyShpStart = tic()
-
-        fpLyrName = f"{demName[:-4]}_FP"                    # New shapefile name - no ext
-        fpShpPath = f"{outFpDir}{os.sep}{fpLyrName}.shp"    # New shapefile footprint path - temporary
-
-        # Remove temp shapefile if it already exists
-        if os.path.exists(fpShpPath):
-            for tmpFile in glob.glob(f"{fpShpPath.split('.')[0]}*"):
-                os.remove(tmpFile)
-            ##returnDict['msgs'].append(f"\t\t-Successfully deleted existing Shp: {fpLyrName}.shp")
-
-        # set the spatial reference for the shapefile; same as input raster
-        sp_ref = osr.SpatialReference()
-        sp_ref.ImportFromEPSG(EPSG)
-
-        # set the shapefile driver and destination of the data source
-        outDriver = ogr.GetDriverByName("ESRI Shapefile")
-        outDataSource = outDriver.CreateDataSource(outFpDir)
-        outLayer = outDataSource.CreateLayer(fpLyrName, srs=sp_ref, geom_type=ogr.wkbPolygon)
-
-        # List of field names to add to shapefile
-        fieldNames = {'poly_code':ogr.OFTString,
-                      'prod_title':ogr.OFTString,
-                      'pub_date':ogr.OFTDate,
-                      'lastupdate':ogr.OFTDate,
-                      'rds_size':ogr.OFTInteger,
-                      'format':ogr.OFTString,
-                      'sourceid':ogr.OFTString,
-                      'meta_url':ogr.OFTString,
-                      'downld_url':ogr.OFTString,
-                      'dem_name':ogr.OFTString,
-                      'dem_path':ogr.OFTString,
-                      'rds_column':ogr.OFTInteger,
-                      'rds_rows':ogr.OFTInteger,
-                      'bandCount':ogr.OFTInteger,
-                      'cellSize':ogr.OFTReal,
-                      'rdsformat':ogr.OFTString,
-                      'bitdepth':ogr.OFTString,
-                      'nodataval':ogr.OFTReal,
-                      'srs_type':ogr.OFTString,
-                      'epsg_code':ogr.OFTInteger,
-                      'srs_name':ogr.OFTString,
-                      'rds_top':ogr.OFTReal,
-                      'rds_left':ogr.OFTReal,
-                      'rds_right':ogr.OFTReal,
-                      'rds_bottom':ogr.OFTReal,
-                      'rds_min':ogr.OFTReal,
-                      'rds_mean':ogr.OFTReal,
-                      'rds_max':ogr.OFTReal,
-                      'rds_stdev':ogr.OFTReal,
-                      'blk_xsize':ogr.OFTInteger,
-                      'blk_ysize':ogr.OFTInteger,
-                      "rastValue":ogr.OFTInteger}
-
-        # Add new Fields to the output shapefile
-        for fld in fieldNames.items():
-            fldname = fld[0]
-            fldType = fld[1]
-            gdalFld = ogr.FieldDefn(fldname, fldType)
-
-            # Getting warning messages with nodata val
-            if fldname == 'noDataVal':
-                gdalFld.SetWidth(90)
-                gdalFld.SetPrecision(60)
-
-            outLayer.CreateField(gdalFld)
-
-        # Get the output Layer's Feature Definition
-        outLayerDefn = outLayer.GetLayerDefn()
-
-        # Raster field that will be used to vectorize
-        rast_field = outLayer.GetLayerDefn().GetFieldIndex("rastValue")
-
-        returnDict['msgs'].append(f"\t\t-Create empty shapefile Process Time: {toc(emptyShpStart)}")
-
-        """ ------------------------- Vectorize Raster Data Mask ----------------------------------- """
-        vectorStart = tic()
-
-        # Open raster to pass a band object to polygonize function
-        ds = gdal.Open(tempTif, gdal.GA_ReadOnly)
-        band = ds.GetRasterBand(1)
-
-        # vectorize mask
-        #result = gdal.Polygonize(band, None if , outLayer, rast_field, [], callback=None)
-        result = gdal.Polygonize(band, band, outLayer, rast_field, [], callback=None)
-        assert result == 0, AddMsgAndPrint(f"\tPolygonize failed")
-        ##returnDict['msgs'].append(f"\t\t-Successfully vectorized mask into: {fpLyrName}.shp")
-
-        # Close the raster
-        ds = None
-        returnDict['msgs'].append(f"\t\t-Vectorize Mask Process Time: {toc(vectorStart)}")
-
-        updateAttributes = tic()
-        # populate the shapefile fields after polygons exist
-        for i in range(0, outLayer.GetFeatureCount()):
-            feature = outLayer.GetFeature(i)
-            for j in range(0,outLayerDefn.GetFieldCount()-1):
-                feature.SetField(outLayerDefn.GetFieldDefn(j).GetName(),rasterRecord[j])
-                #AddMsgAndPrint(f"{outLayerDefn.GetFieldDefn(j).GetName()} -- {rasterRecord[j]}")
-                test = outLayer.SetFeature(feature)
-
-        # close the shapefile and workspace
-        outDataSource.FlushCache()
-        outDataSource = None
-
-        del outLayer, ds, band
-        returnDict['msgs'].append(f"\t\t-Update Attribute Time: {toc(updateAttributes)}")
-
-        """ ------------------------- Project Mask Shapefile to WGS84 ----------------------------------- """
-        projectShpStart = tic()
-
-        # projected output Shapefile
-        prjShape = f"{outFpDir}{os.sep}{demName[:-4]}_FP_WGS84.shp"
-
-        # Remove prj shapefile if it already exists
-        if os.path.exists(prjShape):
-            print("EXISTS")
-            for tmpFile in glob.glob(f"{prjShape.split('.')[0]}*"):
-                os.remove(tmpFile)
-
-        prjCmd = f"ogr2ogr -f \"ESRI Shapefile\" {prjShape} {fpShpPath} -t_srs EPSG:4326 -s_srs EPSG:{EPSG} "# -lco ENCODING=UTF-8"
-
-        execCmd = subprocess.Popen(prjCmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,universal_newlines=True)
-        msgs, errors = execCmd.communicate()
-        errors = ','.join(errors.strip().split('\n'))  # some errors return mutliple carriage returns
-
-        # Create 4326 prj file if not created; not sure why the prj is not automatically created.
-        prjFile = f"{prjShape[0:-4]}.prj"
-        if not os.path.exists(prjFile):
-            spatialRef = osr.SpatialReference()
-            spatialRef.ImportFromEPSG(4326)
-            spatialRef.MorphToESRI()
-            file = open(prjFile, 'w')
-            file.write(spatialRef.ExportToWkt())
-            file.close()
-            ##returnDict['msgs'].append(f"\t\t-Successfully Created WGS84 PRJ File: {prjFile}")
-
-        returnDict['shp'].append(prjShape)
-        ##returnDict['msgs'].append(f"\t\t-Successfully Projected: {os.path.basename(fpShpPath)} to WGS84")
-
-        returnDict['msgs'].append(f"\t\t-Project Shapefile Process Time: {toc(projectShpStart)}")
-
-        """ ------------------------- Delete Temp Files ----------------------------------- """
-        # Delete TEMP raster layer
-        for tmpFile in glob.glob(f"{tempTif.split('.')[0]}*"):
-            os.remove(tmpFile)
-            ##returnDict['msgs'].append(f"\t\t-Successfully Deleted temp: {os.path.basename(tmpFile)}")
-
-        # Delete TEMP shapefile layer
-        if os.path.exists(fpShpPath):
-
-            for tmpFile in glob.glob(f"{fpShpPath.split('.')[0]}.*"):
-                os.remove(tmpFile)
-        ##returnDict['msgs'].append(f"\t\t-Successfully Deleted temp: {os.path.basename(fpShpPath)}")
+            # returned to main and streamed into the merged footprint file
+            returnDict['footprints'].append((attributes, footprints))
 
         returnDict['msgs'].append(f"\t\t-Process Time: {toc(filestart)}")
         returnDict['pTime'].append(toc(filestart,seconds=True))
 
-        del outDataSource
         return returnDict
 
     except:
@@ -536,85 +395,22 @@ def createFootPrint(items, headerValues,outFpDir,bGDAL):
         return returnDict
 
 #### ===================================================================================
-def mergeFootPrints(outDir,shapefiles):
+def mergeFootPrints(outDir,shapefiles,mergeFormat='gpkg'):
+    """ Merges existing WGS84 footprint shapefiles into 1 GeoPackage ('gpkg') or FlatGeobuf
+        ('fgb') in large transactions with the spatial index built at the end
+        (DSHub_Footprints.mergeFootprints).  Footprints created by this script are streamed
+        into the merged file as they finish instead; see main. """
 
     try:
         AddMsgAndPrint(f"\nMerging Shapefile Spatial Footprints")
 
-        """ ------------------  Create empty output merged shapefile -------------------------------"""
-        # Create a new shapefile to store the merged data
-        mergeShape = f"USGS_3DEP_{resolution}_FootPrints_WGS84"
-        mergeShapePath = f"{outDir}{os.sep}{mergeShape}.shp"
-        AddMsgAndPrint(f"\n\tCreating Merged Shapefile: {mergeShapePath}")
-
-        outDriver = ogr.GetDriverByName("ESRI Shapefile")
-
-        if os.path.exists(mergeShapePath):
-            outDriver.DeleteDataSource(mergeShapePath)
-            AddMsgAndPrint(f"\t\t{os.path.basename(mergeShapePath)} Exists.  Successfully Deleted")
-
-        # set the spatial reference for the shapefile; same as input raster
-        sp_ref = osr.SpatialReference()
-        sp_ref.SetFromUserInput(f"EPSG:4326")
-
-        # set the destination of the data source
-        outDataSource = outDriver.CreateDataSource(outDir)
-        outLayer = outDataSource.CreateLayer(mergeShape, srs=sp_ref, geom_type=ogr.wkbPolygon)
-
-        # Grab first shape in list just to get the field names
-        daShapefile = shapefiles[0]
-
-        dataSource = ogr.Open(daShapefile)
-        daLayer = dataSource.GetLayer(0)
-        inLayerDefn = daLayer.GetLayerDefn()
-
-        # Add field names to newly created target shapefile
-        for i in range(inLayerDefn.GetFieldCount()):
-            fieldDefn = inLayerDefn.GetFieldDefn(i)
-            outLayer.CreateField(fieldDefn)
-
-        del daShapefile,dataSource,daLayer,inLayerDefn,outDriver
-
-        """ ------------------  Append WGS84 FP shapefiles to new shapefile -------------------------------"""
-        AddMsgAndPrint(f"\n\tAppending {len(shapefiles)} WGS84 Footprint Shapefiles to: {mergeShapePath}")
-        appendCnt = 0
-
-        # Add each shapefile to the merged layer
-        for shapefile in shapefiles:
-            print(f"\t\tAppending: {os.path.basename(shapefile)}")
-
-            # Layer of Source Shp
-            inDriver = ogr.GetDriverByName("ESRI Shapefile")
-            ds_source = inDriver.Open(shapefile,0)
-
-            if ds_source is None:
-                AddMsgAndPrint(f"{shapefile} is empty")
-                continue
-
-            sourceLyr = ds_source.GetLayer()
-            sourceLyrDef = sourceLyr.GetLayerDefn()
-
-            # Append Geometry
-            for feat in sourceLyr:
-                out_feat = ogr.Feature(outLayer.GetLayerDefn())
+        mergePath = f"{outDir}{os.sep}USGS_3DEP_{resolution}_FootPrints_WGS84.{mergeFormat}"
+        AddMsgAndPrint(f"\n\tAppending {len(shapefiles)} WGS84 Footprint Shapefiles to: {mergePath}")
 
-                # Get all attributes related to this geometry record
-                for i in range(0, sourceLyrDef.GetFieldCount()):
-                    out_feat.SetField(sourceLyrDef.GetFieldDefn(i).GetNameRef(),feat.GetField(i))
+        mergeInfo = mergeFootprints(mergePath, (readFootprintFile(shapefile) for shapefile in shapefiles), 4326)
+        AddMsgAndPrint(f"\n\t\tSuccessfully Appended {mergeInfo['tiles']:,} footprint Shapefiles to: {os.path.basename(mergePath)}")
 
-                out_feat.SetGeometry(feat.GetGeometryRef().Clone())
-                outLayer.CreateFeature(out_feat)
-                out_feat = None
-                outLayer.SyncToDisk()
-
-            ds_source = None
-            del inDriver,ds_source,sourceLyr,sourceLyrDef
-            appendCnt+=1
-
-        del shapefile
-        AddMsgAndPrint(f"\n\t\tSuccessfully Appended {appendCnt:,} footprint Shapefiles to: {os.path.basename(mergeShapePath)}")
-
-        return mergeShapePath
+        return mergePath
 
     except:
         errorMsg()
@@ -642,9 +438,13 @@ if __name__ == '__main__':
     # Parameters
     elevationMetadataFile = r'E:\GIS_Projects\DS_Hub\Elevation\DSHub_Elevation\USGS_Text_Files\1M\20230728_windows\USGS_3DEP_1M_Step2_Elevation_Metadata_10.txt'
     outFpDir = r'D:\projects\DSHub\USGS_Spatial_Footprints\1M'
-    bMultiProcess = True
-    bGDAL = True
+    footprintExecutor = 'threads'   # 'serial','threads','processes' or 'ray' (DSHub_Footprints.footprintExecutors)
+    bMultiProcess = footprintExecutor != 'serial'
+    footprintRes = None             # mask cell size in DEM units i.e. 30 for 1M DEMs; None = full resolution
+    validFraction = 0.999           # DEMs with at least this fraction of valid pixels get their catalog bbox
+                                    # as footprint instead of being polygonized; None polygonizes every DEM
     outputSRS = 4326
+    mergeFormat = 'gpkg'        # merged footprint file: 'gpkg' (GeoPackage) or 'fgb' (FlatGeobuf)
 
     """ ---------------------------- Establish Console LOG FILE ---------------------------------------------------"""
     tempList = elevationMetadataFile.split(os.sep)[-1].split('_')
@@ -664,7 +464,8 @@ if __name__ == '__main__':
     h.write(f"\tElevation Metadata File: {elevationMetadataFile}\n")
     h.write(f"\tOutput Footprint Directory: {outFpDir}\n")
     h.write(f"\tOutput Spatial Reference EPSG: {outputSRS}\n")
-    h.write(f"\tProcessing Mode: {'Multi-Processing' if bMultiProcess else 'Single-Processing'}\n")
+    h.write(f"\tBBOX Footprint Valid Pixel Fraction: {validFraction}\n")
+    h.write(f"\tProcessing Mode: {'Multi-Processing' if bMultiProcess else 'Single-Processing'} ({footprintExecutor})\n")
     h.write(f"\tLog File Path: {msgLogFile}\n")
     h.close()
 
@@ -686,57 +487,40 @@ if __name__ == '__main__':
     fpTracker = 0
     failedFootprints = list()
     processTimes = list()
+    tierCounts = {1:0, 2:0}
 
-    """ ---------------------------- run createFootPrint in Mult-Process mode ---------------------------------------------------"""
-    rastFpStart = tic()
-    if bMultiProcess:
-
-        if os.name == 'nt':
-            numOfCores = int(psutil.cpu_count(logical = False))         # 16 workers
-        else:
-            numOfCores = int(psutil.cpu_count(logical = True) / 2)      # 32 workers
-        AddMsgAndPrint(f"\nCreating Spatial Footprints in Multi-Process Mode using {numOfCores} workers for {recCount:,} DEM files")
-
-        # Execute in Multi-processing mode
-        with ThreadPoolExecutor(max_workers=numOfCores) as executor:
-        #with ProcessPoolExecutor(max_workers=numOfCores) as executor:
-            ndProcessing = [executor.submit(createFootPrint, rastItems, headerValues, outFpDir, bGDAL) for rastItems in files.items()]
+    # Merged footprint file (GeoPackage or FlatGeobuf) that footprints are streamed into
+    mergedFootprints = f"{outFpDir}{os.sep}USGS_3DEP_{resolution}_FootPrints_WGS84.{mergeFormat}"
 
-            # yield future objects as they are done.
-            for future in as_completed(ndProcessing):
-                returnDict = future.result()
-                
-                fpTracker +=1
-                j=1
-                batchMsgs = list()
-                
-                for printMessage in returnDict['msgs']:
+    """ ---------------------------- run createFootPrint ---------------------------------------------------"""
+    def footprintResults():
+        """ Yields the returnDict of every DEM as createFootPrint finishes it """
 
-                    if j==1:
-                        batchMsgs.append(f"{printMessage} -- ({fpTracker:,} of {recCount:,})")
-                    else:
-                        batchMsgs.append(printMessage)
-                    j+=1
-
-                AddMsgAndPrint(None,msgList=batchMsgs)
-
-                if returnDict['shp']:
-                    fpShapes.append(returnDict['shp'][0])
-
-                if returnDict['fail']:
-                    failedFootprints.append(returnDict['fail'][0])
+        if bMultiProcess:
+            if os.name == 'nt':
+                numOfCores = int(psutil.cpu_count(logical = False))         # 16 workers
+            else:
+                numOfCores = int(psutil.cpu_count(logical = True) / 2)      # 32 workers
+            AddMsgAndPrint(f"\nCreating Spatial Footprints in Multi-Process Mode ({footprintExecutor}) using {numOfCores} workers for {recCount:,} DEM files")
+        else:
+            numOfCores = 1
+            AddMsgAndPrint(f"\nCreating Spatial Footprints in Single-Process Mode for {recCount:,} DEM files")
 
-                if returnDict['pTime']:
-                    processTimes.append(returnDict['pTime'][0])
+        # yield returnDicts as they are done.
+        argsList = [(rastItems, headerValues, outFpDir, outputSRS, False, footprintRes, validFraction) for rastItems in files.items()]
+        for returnDict in runFootprintTasks(createFootPrint, argsList, footprintExecutor, numOfCores):
+            yield returnDict
 
-        rastFpStop = toc(rastFpStart)
+    def finishedFootprints():
+        """ Yields (attributes, footprints) to mergeFootprints as DEMs finish; footprint
+            shapefiles left by earlier runs are merged first """
 
-    else:
-        AddMsgAndPrint(f"\nCreating Spatial Footprints in Single-Process Mode for {recCount:,} DEM files")
+        global fpTracker
 
-        for rastItems in files.items():
-            returnDict = createFootPrint(rastItems,headerValues,outFpDir,bGDAL)
+        for shapefile in fpShapes:
+            yield readFootprintFile(shapefile)
 
+        for returnDict in footprintResults():
             fpTracker +=1
             j=1
             batchMsgs = list()
@@ -750,33 +534,56 @@ if __name__ == '__main__':
 
             AddMsgAndPrint(None,msgList=batchMsgs)
 
-            if returnDict['shp']:
-                fpShapes.append(returnDict['shp'][0])
-
             if returnDict['fail']:
                 failedFootprints.append(returnDict['fail'][0])
 
             if returnDict['pTime']:
                 processTimes.append(returnDict['pTime'][0])
 
-        rastFpStop = toc(rastFpStart)
+            if returnDict['tier']:
+                tierCounts[returnDict['tier'][0]] += 1
+
+            if returnDict['footprints']:
+                yield returnDict['footprints'][0]
+
+    """ ---------------------------- Tier 1: Catalog BBOX Footprints of all DEMs ----------------------------"""
+    # Built from rds_left/right/top/bottom of the catalog without opening a DEM
+    bboxFootprints = False
+    if validFraction is not None:
+        bboxFootprints = f"{outFpDir}{os.sep}USGS_3DEP_{resolution}_FootPrints_BBOX_WGS84.{mergeFormat}"
+        AddMsgAndPrint(f"\nCreating Catalog BBOX Footprints of all DEMs: {bboxFootprints}")
+
+        try:
+            invalidRecords = list()
+            bboxInfo = mergeFootprints(bboxFootprints, catalogBboxFootprints(readCatalogRecords(elevationMetadataFile), outputSRS,
+                                                                             invalidRecords=invalidRecords), outputSRS)
+            AddMsgAndPrint(f"\tCreated {bboxInfo['tiles']:,} BBOX Footprints in {bboxInfo['seconds']} seconds")
+
+            for record,reason in invalidRecords:
+                AddMsgAndPrint(f"\t\t{record.get('dem_name')}: {reason}")
+        except:
+            errorMsg()
+            bboxFootprints = False
 
-    exit()
-    """ ---------------------------- Merge WGS84 Footprint Shapefiles ----------------------------"""
-    # Merge the WGS84 Footprint shapefiles created by the 'createFootprint' function
-    if len(fpShapes):
-        mergeStart = tic()
-        mergedShapefile = mergeFootPrints(outFpDir,fpShapes)
-        mergeStop = toc(mergeStart)
+    """ ---------------------------- Merge WGS84 Footprints as they finish ----------------------------"""
+    rastFpStart = tic()
+    AddMsgAndPrint(f"\n\tStreaming footprints into: {mergedFootprints}")
+
+    try:
+        mergeInfo = mergeFootprints(mergedFootprints, finishedFootprints(), outputSRS)
+        AddMsgAndPrint(f"\n\tMerged {mergeInfo['features']:,} footprint polygons of {mergeInfo['tiles']:,} DEMs into: {os.path.basename(mergedFootprints)}")
+    except:
+        errorMsg()
+        mergedFootprints = False
 
+    rastFpStop = toc(rastFpStart)
     funEnds = toc(funStarts)
 
-    """ ---------------------------- Delete WGS84 Footprint Shapefiles ----------------------------"""
-    if mergedShapefile:
+    """ ---------------------------- Delete WGS84 Footprint Shapefiles of earlier runs ----------------------------"""
+    if mergedFootprints and fpShapes:
         AddMsgAndPrint(f"\nDeleting {len(fpShapes):,} WGS84 Footprint Shapefiles")
         deleteCnt = 0
 
-        # Add each shapefile to the merged layer
         driver = ogr.GetDriverByName("ESRI Shapefile")
         for shapefile in fpShapes:
             if os.path.exists(shapefile):
@@ -784,25 +591,23 @@ if __name__ == '__main__':
                 print(f"\t\tSuccessfully Deleted {os.path.basename(shapefile)}")
                 deleteCnt+=1
 
-    ##        for tmpFile in glob.glob(f"{shapefile.split('.')[0]}*"):
-    ##            os.remove(tmpFile)
-    ##            if tmpFile.endswith('.shp'):
-    ##                print(f"\t\tSuccessfully Deleted {os.path.basename(shapefile)}")
-    ##                deleteCnt+=1
-
         AddMsgAndPrint(f"\n\t\tSuccessfully Deleted {deleteCnt:,} WGS84 Footprint Shapefiles")
-    else:
+    elif fpShapes:
         AddMsgAndPrint(f"\nMerge Failed so the {len(fpShapes):,} WGS84 Footprint Shapefiles will not be deleted")
 
     """ ------------------------------------ SUMMARY -------------------------------------------- """
     AddMsgAndPrint(f"\n{'-'*40}SUMMARY{'-'*40}")
 
-    AddMsgAndPrint(f"\nFinal Merged Footprint Path: {mergedShapefile}")
+    AddMsgAndPrint(f"\nFinal Merged Footprint Path: {mergedFootprints}")
+    if bboxFootprints:
+        AddMsgAndPrint(f"Catalog BBOX Footprint Path: {bboxFootprints}")
+    AddMsgAndPrint(f"\tTier 1 (Catalog BBOX) Footprints: {tierCounts[1]:,}")
+    AddMsgAndPrint(f"\tTier 2 (Exact) Footprints: {tierCounts[2]:,}")
 
     AddMsgAndPrint(f"\nTotal Processing Time: {funEnds}")
-    AddMsgAndPrint(f"\tCreate 'Data' Footprint Time: {rastFpStop}")
-    AddMsgAndPrint(f"\t\tAverage Processing Time per DEM file: {int(sum(processTimes) / len(processTimes))} seconds")
-    AddMsgAndPrint(f"\tMerge Footprint Time: {mergeStop}")
+    AddMsgAndPrint(f"\tCreate and Merge 'Data' Footprint Time: {rastFpStop}")
+    if processTimes:
+        AddMsgAndPrint(f"\t\tAverage Processing Time per DEM file: {int(sum(processTimes) / len(processTimes))} seconds")
 
     # Report number of DEMs processed
     if len(failedFootprints):
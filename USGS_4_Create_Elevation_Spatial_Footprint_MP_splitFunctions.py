@@ -22,17 +22,28 @@ Parameters:
     4) outFpDir - boolean indicator to replace download file
     5) bDeleteZipFiles - boolean to delete or leave downloaded zipped files (only relevant if dl files are zip files)
                          set to False by default but can be overwritten in main.
+
+---------------- UPDATES
+10/19/2026
+    - vectorizeFootPrint polygonizes the data mask into an OGR Memory layer and reprojects it to
+      outputSRS in process (DSHub_Footprints.polygonizeMask) instead of writing a temp EPSG
+      shapefile and reprojecting it with an ogr2ogr subprocess.  The WGS84 footprint shapefile
+      is the only file written and its catalog attributes are set when each polygon is created.
+    - createFootPrint thresholds the DEM in process (DSHub_Footprints.createDataMask; block by
+      block) instead of launching a gdal_calc.py interpreter per DEM.  The bGDAL option is gone.
+    - DEMs are spread over workers with DSHub_Footprints.runFootprintTasks; footprintExecutor
+      picks 'serial','threads','processes' or 'ray' instead of the hardcoded ray.get of every
+      DEM followed by the chunked ThreadPoolExecutor.  createFootPrint is no longer a
+      @ray.remote function.
 """
 
-import os, subprocess, sys, traceback, re, glob, math, time, fnmatch, psutil, numpy
+import os, sys, traceback, glob, time, fnmatch, psutil
 import matplotlib.pyplot as plt
-import numpy as np
 from datetime import datetime
 from osgeo import gdal
 from osgeo import ogr, osr
-import ray
 
-#from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from DSHub_Footprints import createDataMask, polygonizeMask, writeFootprints, runFootprintTasks
 
 ## ==================================================================================
 def AddMsgAndPrint(msg,msgList=list()):
@@ -254,8 +265,7 @@ def convertMasterDBfileToDict(elevMetdataFile,outDir):
 
 
 #### ===================================================================================
-@ray.remote
-def createFootPrint(items, headerValues,outFpDir,bGDAL):
+def createFootPrint(items, headerValues,outFpDir):
     """        '63e7308bd34efa0476ae8401': ['11030005',
                               'USGS 1 Meter 14 x34y421 '
                               'KS_StatewideFordGray_2018_A18',
@@ -333,58 +343,19 @@ def createFootPrint(items, headerValues,outFpDir,bGDAL):
             #returnDict['msgs'].append(f"\t\tSuccessfully Deleted temp tiff: {os.path.basename(tmpFile)}")
 
         """ ------------------------- Create Raster Data Mask ----------------------------------- """
+        # Pixels > calcValue are DATA=1, everything else NODATA=0 (gdal_calc --calc="A>calcValue").
+        # Thresholded in process 1 block at a time instead of a gdal_calc.py subprocess.
         calcValue = noData
-        if bGDAL:
-            if os.name == 'nt':
-                gdal_calc = f"gdal_calc -A {demPath} --outfile={tempTif} --type=Byte --calc=\"A>{calcValue}\" --NoDataValue=0 --co \"COMPRESS=DEFLATE\""
-            else:
-                #gdal_calc = f"gdal_calc -A {demPath} --A_band=1 --outfile={tempTif} --type=Byte --calc=\"A>{calcValue}\" --NoDataValue=0"
-                gdal_calc = f"python3 /bin/gdal_calc.py -A {demPath} --outfile={tempTif} --type=Byte --calc=\"A>{calcValue}\" --NoDataValue=0 --co \"COMPRESS=DEFLATE\" "
-
-        else:
-            # create binary raster NODATA=0, DATA = 1
-            numpyCalc = '"numpy.where(A > ' + str(calcValue) + ', 1, A)"'
-            gdal_calc = f"gdal_calc -A {demPath} --outfile={tempTif} --type=Byte --calc={numpyCalc} --NoDataValue=0 --co \"COMPRESS=DEFLATE\""
-
- 
-        # Send gdal command to os
-        execCmd = subprocess.Popen(gdal_calc, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,universal_newlines=True)
-        msgs, errors = execCmd.communicate()
+        createDataMask(demPath, tempTif, threshold=calcValue, dataValue=1, nodataValue=0,
+                       driverName='GTiff', creationOptions=['COMPRESS=DEFLATE'])
 
         returnDict['msgs'].append(f"\t\t-Temp Footprint File: {tempTif}")
-        returnDict['msgs'].append(f"\t\t-GDAL Calc Process Time: {toc(filestart)}")
+        returnDict['msgs'].append(f"\t\t-Data Mask Process Time: {toc(filestart)}")
         returnDict['pTime'].append(toc(filestart,True))
         returnDict['rast'].append(tempTif)
 
         return returnDict
 
-        # # Collect messages from subprocess
-        # errorList = ['error','failed','fail','uncommit','aborted','notice','memory',
-        #               'unable','not recognized','inoperable','syntax']
-        # words_re = re.compile("|".join(errorList))
-
-        # # Send gdal command to os
-        # execCmd = subprocess.Popen(gdal_calc, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,universal_newlines=True)
-
-        # # returns a tuple (stdout_data, stderr_data)
-        # msgs, errors = execCmd.communicate()
-        # errors = ','.join(errors.strip().split('\n'))  # some errors return mutliple carriage returns
-
-        # if words_re.search(errors.lower()) or not execCmd.returncode == 0:
-        #     #msgDict['Error'] = f"{gdal_calc}\n\t{errors}"
-        #     returnDict['msgs'].append(f"\t\t-Errors creating 'data' mask: {errors}")
-        # else:
-        #     #msgDict['Success'] = f"Successfully created 'data' mask"
-        #     pass
-        #     ##returnDict['msgs'].append(f"\t\t-Successfully created 'data' mask using values >= {calcValue}")
-
-        # returnDict['msgs'].append(f"\t\t-Temp Footprint File: {tempTif}")
-        # returnDict['msgs'].append(f"\t\t-GDAL Calc Process Time: {toc(filestart)}")
-        # returnDict['pTime'].append(toc(filestart,True))
-        # returnDict['rast'].append(tempTif)
-
-        # return returnDict
-
     except:
         returnDict['msgs'].append(errorMsg(errorOption=2))
         returnDict['msgs'].append(f"\t\t-Process Time: {toc(filestart)}")
@@ -392,169 +363,50 @@ def createFootPrint(items, headerValues,outFpDir,bGDAL):
         return returnDict
 
 #### ===================================================================================
-def vectorizeFootPrint(items, headerValues,outFpDir,bGDAL):
+def vectorizeFootPrint(items, headerValues,outFpDir,tempTif,outputSRS=4326):
+    """ Vectorizes the data mask (tempTif) created by createFootPrint into the WGS84 footprint
+        shapefile of the DEM.  The mask is polygonized into an OGR Memory layer and reprojected
+        to outputSRS in process; no temp EPSG shapefile and no ogr2ogr subprocess. """
 
     try:
-        """ ------------------------- Create Empty Footprint Shapefile ----------------------------------- """
-        emptyShpStart = tic()
-
-        fpLyrName = f"{demName[:-4]}_FP"                    # New shapefile name - no ext
-        fpShpPath = f"{outFpDir}{os.sep}{fpLyrName}.shp"    # New shapefile footprint path - temporary
+        # Start the timer
+        filestart = tic()
 
-        # Remove temp shapefile if it already exists
-        if os.path.exists(fpShpPath):
-            for tmpFile in glob.glob(f"{fpShpPath.split('.')[0]}*"):
-                os.remove(tmpFile)
-            ##returnDict['msgs'].append(f"\t\t-Successfully deleted existing Shp: {fpLyrName}.shp")
+        # Establish dict of contents to return
+        returnDict = dict()
+        returnDict['msgs'] = []
+        returnDict['shp'] = []
+        returnDict['fail'] = []
+        returnDict['pTime'] = []
 
-        # set the spatial reference for the shapefile; same as input raster
-        sp_ref = osr.SpatialReference()
-        sp_ref.ImportFromEPSG(EPSG)
+        rasterRecord = items
+        demName = rasterRecord[headerValues.index("dem_name")]
 
-        # set the shapefile driver and destination of the data source
-        outDriver = ogr.GetDriverByName("ESRI Shapefile")
-        outDataSource = outDriver.CreateDataSource(outFpDir)
-        outLayer = outDataSource.CreateLayer(fpLyrName, srs=sp_ref, geom_type=ogr.wkbPolygon)
-
-        # List of field names to add to shapefile
-        fieldNames = {'poly_code':ogr.OFTString,
-                      'prod_title':ogr.OFTString,
-                      'pub_date':ogr.OFTDate,
-                      'lastupdate':ogr.OFTDate,
-                      'rds_size':ogr.OFTInteger,
-                      'format':ogr.OFTString,
-                      'sourceid':ogr.OFTString,
-                      'meta_url':ogr.OFTString,
-                      'downld_url':ogr.OFTString,
-                      'dem_name':ogr.OFTString,
-                      'dem_path':ogr.OFTString,
-                      'rds_column':ogr.OFTInteger,
-                      'rds_rows':ogr.OFTInteger,
-                      'bandCount':ogr.OFTInteger,
-                      'cellSize':ogr.OFTReal,
-                      'rdsformat':ogr.OFTString,
-                      'bitdepth':ogr.OFTString,
-                      'nodataval':ogr.OFTReal,
-                      'srs_type':ogr.OFTString,
-                      'epsg_code':ogr.OFTInteger,
-                      'srs_name':ogr.OFTString,
-                      'rds_top':ogr.OFTReal,
-                      'rds_left':ogr.OFTReal,
-                      'rds_right':ogr.OFTReal,
-                      'rds_bottom':ogr.OFTReal,
-                      'rds_min':ogr.OFTReal,
-                      'rds_mean':ogr.OFTReal,
-                      'rds_max':ogr.OFTReal,
-                      'rds_stdev':ogr.OFTReal,
-                      'blk_xsize':ogr.OFTInteger,
-                      'blk_ysize':ogr.OFTInteger,
-                      "rastValue":ogr.OFTInteger}
-
-        # Add new Fields to the output shapefile
-        for fld in fieldNames.items():
-            fldname = fld[0]
-            fldType = fld[1]
-            gdalFld = ogr.FieldDefn(fldname, fldType)
-
-            # Getting warning messages with nodata val
-            if fldname == 'noDataVal':
-                gdalFld.SetWidth(90)
-                gdalFld.SetPrecision(60)
-
-            outLayer.CreateField(gdalFld)
-
-        # Get the output Layer's Feature Definition
-        outLayerDefn = outLayer.GetLayerDefn()
-
-        # Raster field that will be used to vectorize
-        rast_field = outLayer.GetLayerDefn().GetFieldIndex("rastValue")
-
-        returnDict['msgs'].append(f"\t\t-Create empty shapefile Process Time: {toc(emptyShpStart)}")
-
-        """ ------------------------- Vectorize Raster Data Mask ----------------------------------- """
+        """ ------------------------- Vectorize Raster Data Mask in memory ----------------------------------- """
         vectorStart = tic()
 
-        # Open raster to pass a band object to polygonize function
-        ds = gdal.Open(tempTif, gdal.GA_ReadOnly)
-        band = ds.GetRasterBand(1)
-
-        # vectorize mask
-        #result = gdal.Polygonize(band, None if , outLayer, rast_field, [], callback=None)
-        result = gdal.Polygonize(band, band, outLayer, rast_field, [], callback=None)
-        assert result == 0, AddMsgAndPrint(f"\tPolygonize failed")
-        ##returnDict['msgs'].append(f"\t\t-Successfully vectorized mask into: {fpLyrName}.shp")
-
-        # Close the raster
-        ds = None
-        returnDict['msgs'].append(f"\t\t-Vectorize Mask Process Time: {toc(vectorStart)}")
+        footprints,srsWkt = polygonizeMask(tempTif, outputSRS, bDataOnly=True)
+        returnDict['msgs'].append(f"\t\t-Vectorize Mask Process Time: {toc(vectorStart)} -- {len(footprints):,} polygons")
 
-        updateAttributes = tic()
-        # populate the shapefile fields after polygons exist
-        for i in range(0, outLayer.GetFeatureCount()):
-            feature = outLayer.GetFeature(i)
-            for j in range(0,outLayerDefn.GetFieldCount()-1):
-                feature.SetField(outLayerDefn.GetFieldDefn(j).GetName(),rasterRecord[j])
-                #AddMsgAndPrint(f"{outLayerDefn.GetFieldDefn(j).GetName()} -- {rasterRecord[j]}")
-                test = outLayer.SetFeature(feature)
+        """ ------------------------- Write WGS84 Footprint Shapefile ----------------------------------- """
+        writeStart = tic()
 
-        # close the shapefile and workspace
-        outDataSource.FlushCache()
-        outDataSource = None
-
-        del outLayer, ds, band
-        returnDict['msgs'].append(f"\t\t-Update Attribute Time: {toc(updateAttributes)}")
-
-        """ ------------------------- Project Mask Shapefile to WGS84 ----------------------------------- """
-        projectShpStart = tic()
-
-        # projected output Shapefile
+        # projected output Shapefile; catalog attributes are set when each polygon is created
         prjShape = f"{outFpDir}{os.sep}{demName[:-4]}_FP_WGS84.shp"
-
-        # Remove prj shapefile if it already exists
-        if os.path.exists(prjShape):
-            print("EXISTS")
-            for tmpFile in glob.glob(f"{prjShape.split('.')[0]}*"):
-                os.remove(tmpFile)
-
-        prjCmd = f"ogr2ogr -f \"ESRI Shapefile\" {prjShape} {fpShpPath} -t_srs EPSG:4326 -s_srs EPSG:{EPSG} "# -lco ENCODING=UTF-8"
-
-        execCmd = subprocess.Popen(prjCmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,universal_newlines=True)
-        msgs, errors = execCmd.communicate()
-        errors = ','.join(errors.strip().split('\n'))  # some errors return mutliple carriage returns
-
-        # Create 4326 prj file if not created; not sure why the prj is not automatically created.
-        prjFile = f"{prjShape[0:-4]}.prj"
-        if not os.path.exists(prjFile):
-            spatialRef = osr.SpatialReference()
-            spatialRef.ImportFromEPSG(4326)
-            spatialRef.MorphToESRI()
-            file = open(prjFile, 'w')
-            file.write(spatialRef.ExportToWkt())
-            file.close()
-            ##returnDict['msgs'].append(f"\t\t-Successfully Created WGS84 PRJ File: {prjFile}")
+        attributes = dict(zip(headerValues, [value.strip() for value in rasterRecord]))
+        writeFootprints(prjShape, footprints, srsWkt, attributes)
 
         returnDict['shp'].append(prjShape)
-        ##returnDict['msgs'].append(f"\t\t-Successfully Projected: {os.path.basename(fpShpPath)} to WGS84")
-
-        returnDict['msgs'].append(f"\t\t-Project Shapefile Process Time: {toc(projectShpStart)}")
+        returnDict['msgs'].append(f"\t\t-Write Shapefile Process Time: {toc(writeStart)}")
 
         """ ------------------------- Delete Temp Files ----------------------------------- """
         # Delete TEMP raster layer
         for tmpFile in glob.glob(f"{tempTif.split('.')[0]}*"):
             os.remove(tmpFile)
-            ##returnDict['msgs'].append(f"\t\t-Successfully Deleted temp: {os.path.basename(tmpFile)}")
-
-        # Delete TEMP shapefile layer
-        if os.path.exists(fpShpPath):
-
-            for tmpFile in glob.glob(f"{fpShpPath.split('.')[0]}.*"):
-                os.remove(tmpFile)
-        ##returnDict['msgs'].append(f"\t\t-Successfully Deleted temp: {os.path.basename(fpShpPath)}")
 
         returnDict['msgs'].append(f"\t\t-Process Time: {toc(filestart)}")
         returnDict['pTime'].append(toc(filestart,seconds=True))
 
-        del outDataSource
         return returnDict
 
     except:
@@ -670,8 +522,8 @@ funStarts = tic()
 # Parameters
 elevationMetadataFile = r'E:\GIS_Projects\DS_Hub\Elevation\DSHub_Elevation\USGS_Text_Files\1M\20230728_windows\USGS_3DEP_1M_Step2_Elevation_Metadata_10.txt'
 outFpDir = r'D:\projects\DSHub\USGS_Spatial_Footprints\1M'
-bMultiProcess = True
-bGDAL = False
+footprintExecutor = 'ray'       # 'serial','threads','processes' or 'ray' (DSHub_Footprints.footprintExecutors)
+bMultiProcess = footprintExecutor != 'serial'
 outputSRS = 4326
 
 """ ---------------------------- Establish Console LOG FILE ---------------------------------------------------"""
@@ -692,7 +544,7 @@ h.write(f"User Selected Parameters:\n")
 h.write(f"\tElevation Metadata File: {elevationMetadataFile}\n")
 h.write(f"\tOutput Footprint Directory: {outFpDir}\n")
 h.write(f"\tOutput Spatial Reference EPSG: {outputSRS}\n")
-h.write(f"\tProcessing Mode: {'Multi-Threading' if bMultiProcess else 'Single-Processing'}\n")
+h.write(f"\tProcessing Mode: {'Multi-Processing' if bMultiProcess else 'Single-Processing'} ({footprintExecutor})\n")
 h.write(f"\tLog File Path: {msgLogFile}\n")
 h.close()
 
@@ -721,20 +573,25 @@ returnDictList = list()
 """ ---------------------------- run createFootPrint in Mult-Process mode ---------------------------------------------------"""
 rastFpStart = tic()
 
-futures = [createFootPrint.remote(rastItems, headerValues, outFpDir, bGDAL) for rastItems in demInfoList]
-results = ray.get(futures)
+if os.name == 'nt':
+    numOfWorkers = int(psutil.cpu_count(logical = False)/2)         # 16 workers
+else:
+    numOfWorkers = int(psutil.cpu_count(logical = True) / 2)      # 32 workers
+AddMsgAndPrint(f"\nCreating Spatial Footprints in {'Multi-Process' if bMultiProcess else 'Single-Process'} Mode ({footprintExecutor}) using {numOfWorkers} workers for {recCount:,} DEM files")
 
-for returnDict 
+# DSHub_Footprints.runFootprintTasks keeps at most 2 x numOfWorkers DEMs in flight
+argsList = ((rastItems, headerValues, outFpDir) for rastItems in demInfoList)
+for returnDict in runFootprintTasks(createFootPrint, argsList, footprintExecutor, numOfWorkers):
     fpTracker +=1
     j=1
-    
+
     for printMessage in returnDict['msgs']:
         if j==1:
             batchMsgs.append(f"{printMessage} -- ({fpTracker:,} of {recCount:,})")
         else:
             batchMsgs.append(printMessage)
         j+=1
-    
+
     if returnDict['rast']:
         tempFootPrintRast.append(returnDict['rast'][0])
     if returnDict['fail']:
@@ -742,72 +599,26 @@ for returnDict
     if returnDict['pTime']:
         processTimes.append(returnDict['pTime'][0])
 
-sys.exit()
+AddMsgAndPrint(None,msgList=batchMsgs)
 
-if bMultiProcess:
-
-    if os.name == 'nt':
-        numOfWorkers = int(psutil.cpu_count(logical = False)/2)         # 16 workers
-    else:
-        numOfWorkers = int(psutil.cpu_count(logical = True) / 2)      # 32 workers
-    AddMsgAndPrint(f"\nCreating Spatial Footprints in Multi-Threading Mode using {numOfWorkers} workers for {recCount:,} DEM files")
-
-    chunkSize = int(numOfWorkers*3)
-    numOfChunks = 0
-    for i in range(0, len(demInfoList), chunkSize):
-        chunkList = demInfoList[i:i+chunkSize]
-
-        # Execute in Multi-processing mode
-        with ThreadPoolExecutor(max_workers=numOfWorkers) as executor:
-        #with ProcessPoolExecutor() as executor:
-            ndProcessing = {executor.submit(createFootPrint, rastItems, headerValues, outFpDir, bGDAL) for rastItems in chunkList}
-
-            # yield future objects as they are done.
-            for future in as_completed(ndProcessing):
-                returnDictList.append(future.result())
-            del ndProcessing
-            
-        numOfChunks +=1
-        del executor
-        
-    for returnDict in returnDictList:
-        fpTracker +=1
-        j=1
-    
-        for printMessage in returnDict['msgs']:
-            if j==1:
-                batchMsgs.append(f"{printMessage} -- ({fpTracker:,} of {recCount:,})")
-            else:
-                batchMsgs.append(printMessage)
-            j+=1
-    
-        if returnDict['rast']:
-            tempFootPrintRast.append(returnDict['rast'][0])
-        if returnDict['fail']:
-            failedFootprints.append(returnDict['fail'][0])
-        if returnDict['pTime']:
-            processTimes.append(returnDict['pTime'][0])
-    
-    AddMsgAndPrint(None,msgList=batchMsgs)
-        
-    rastFpStop = toc(rastFpStart)
-    average = sum(processTimes)/len(processTimes)
-
-    plt.plot(processTimes)
-    plt.ylabel('seconds')
-    plt.xlabel('# of Files')
-    plt.title(f"MT_CHUNKING - Avg: {average} Workers: {numOfWorkers} ChunkSize: {chunkSize}")
-    plt.show()
-
-    AddMsgAndPrint(f"\nTotal Processing Time: {rastFpStop}")
-    AddMsgAndPrint(f"\tAverage Processing Time (seconds) per file: {average}")
-    sys.exit()
+rastFpStop = toc(rastFpStart)
+average = sum(processTimes)/len(processTimes)
+
+plt.plot(processTimes)
+plt.ylabel('seconds')
+plt.xlabel('# of Files')
+plt.title(f"{footprintExecutor.upper()} - Avg: {average} Workers: {numOfWorkers}")
+plt.show()
+
+AddMsgAndPrint(f"\nTotal Processing Time: {rastFpStop}")
+AddMsgAndPrint(f"\tAverage Processing Time (seconds) per file: {average}")
+sys.exit()
 
 # else:
 #     AddMsgAndPrint(f"\nCreating Spatial Footprints in Single-Process Mode for {recCount:,} DEM files")
 
 #     for rastItems in demInfoList:
-#         returnDict = createFootPrint(rastItems,headerValues,outFpDir,bGDAL)
+#         returnDict = createFootPrint(rastItems,headerValues,outFpDir)
 
 #         fpTracker +=1
 #         j=1
@@ -82,6 +82,11 @@ from osgeo import gdal
 from osgeo import osr
 from osgeo import ogr
 from operator import itemgetter
+from DSHub_Storage_Placement import getPlacementFolder, releasePlacement, loadPlacementMap, placementSummary
+from DSHub_Registration_Jobs import createRegistrationJobs, exportRaster2pgsqlFile
+
+# EBS volumes eligible for merged DSH3M grids
+dsh3mVolumes = ["/data02/gisdata/elev","/data03/gisdata/elev","/data04/gisdata/elev","/data05/gisdata/elev"]
 
 ## ===================================================================================
 def AddMsgAndPrint(msg):
@@ -290,27 +295,16 @@ def createMultiResolutionOverlay(idx,grid):
         return False,False
 
 ## ===================================================================================
-def getEBSfolder(gridID):
-    # /data03/gisdata/elev/09/0904/090400/09040004/
+def getEBSfolder(gridID,fileName=None,sizeInBytes=0):
+    # /data03/gisdata/elev/dsh3m
+    # The volume used to be picked by the last digit of the gridID.  It is now picked by
+    # DSHub_Storage_Placement using free space and the number of in-flight writers; the
+    # same gridID always returns the same volume.  releasePlacement must be called once
+    # the merged DEM has been written.
 
     try:
-
-        # last digit
-        ld = str(gridID)[-1]
-
-        if ld in ["1","9",]:
-            folder = "/data02/gisdata/elev/dsh3m"
-        elif ld in ["2","7","8"]:
-            folder = "/data03/gisdata/elev/dsh3m"
-        elif ld in ["3","6"]:
-            folder = "/data04/gisdata/elev/dsh3m"
-        elif ld in ["4","5","0"]:
-            folder = "/data05/gisdata/elev/dsh3m"
-
-        if not os.path.exists(folder):
-            os.makedirs(folder)
-
-        return folder
+        return getPlacementFolder(gridID, 'dsh3m', dsh3mVolumes, namespace='dsh3m',
+                                  sizeInBytes=sizeInBytes, fileName=fileName)
 
     except:
         errorMsg()
@@ -605,10 +599,13 @@ def mergeGridDEMs(itemCollection):
         for raster in dateSorted:
             mosaicList.append(raster[2])
 
+        # Sum of the input DEMs is used as the size reservation on the output volume
+        estSize = sum(os.path.getsize(r) for r in mosaicList if os.path.exists(r))
+
         if os.name == 'nt':
             gridFolder = outputDir
         else:
-            gridFolder = getEBSfolder(gridID)
+            gridFolder = getEBSfolder(gridID,f"grid{gridName}_dsh3m.tif",estSize)
 
         mergeRaster = os.path.join(gridFolder,f"grid{gridName}_dsh3m.tif")
 
@@ -621,9 +618,11 @@ def mergeGridDEMs(itemCollection):
                     messageList.append(f"\t\t{'Merged DEM Exists:':<15} {os.path.basename(mergeRaster):<60}")
                     #messageList.append(f"\t\tGathering Statists for {os.path.basename(mergeRaster)}")
                     #rasterStatList = getRasterInformation_MT((gridID,mergeRaster),csv=False)
+                    releasePlacement(gridFolder,estSize)
                     return (messageList,{gridName:mergeRaster})
             except:
                 messageList.append(f"\t\t{'Failed to Delete':<35} {mergeRaster:<60}")
+                releasePlacement(gridFolder,estSize)
                 return (messageList,False)
 
         clipExtent = gridExtentDict[gridID]
@@ -661,6 +660,7 @@ def mergeGridDEMs(itemCollection):
 
         g = gdal.Warp(mergeRaster,mosaicList,options=args)
         g = None
+        releasePlacement(gridFolder,estSize)
 
         mergeStop = toc(mergeStart)
         messageList.append(f"\t\tSuccessfully Merged. Merge Time: {mergeStop}")
@@ -674,6 +674,8 @@ def mergeGridDEMs(itemCollection):
         
     except:
         messageList.append(errorMsg(errorOption=2))
+        if 'gridFolder' in locals() and gridFolder:
+            releasePlacement(gridFolder,estSize)
         return (messageList,False)
     
 ## ===================================================================================
@@ -1051,106 +1053,18 @@ def getRasterInformation_MT(rasterItem,mosaic=False):
         return rasterStatDict
 
 ## ===================================================================================
-def createRaster2pgSQLFile(masterElevFile):
-
-    # Mutually exclusive options
-    # -a Append raster(s) to an existing table.
-
-    # Raster processing: Optional parameters used to manipulate input raster dataset
-    # -s - <SRID> Assign output raster with specified SRID.
-    # -b - Index (1-based) of band to extract from raster.
-    # -t - Tile Size; Cut raster into tiles to be inserted one per table row.
-    # -R - Register; Register the raster as a filesystem (out-db) raster.
-
-    # Optional parameters used to manipulate database objects
-    # -F - Add a column with the name of the file (necessary for elevation but not others)
-    #     This will be handy when you merge tilesets together
-    # -I - Create a GiST index on the raster column.
-    # -R  Register the raster as a filesystem (out-db) raster.
-    #     Only the metadata of the raster and path location to the raster is
-    #     stored in the database (not the pixels).
-
-    # STDOUT parameters
-    # | - A pipe is a form of redirection in Linux used to connect the STDOUT
-    #     of one command into the STDIN of a second command.
-    # PGPASSWORD = itsnotflat
-    # -U elevation - user in the schemas
-    # -d elevation - database name
-    # -h 10.11.11.10 host - localhost
-    # -p port
-
-    # raster2pgsql -s 4269 -b 1 -t 507x507 -F -R -I /data03/gisdata/dsmgroup/aspct_16.tif elevation.$name | PGPASSWORD=itsnotflat psql -U elevation -d elevation -h 10.11.11.10 -p 5432
-
-    # raster2pgsql -s 5070 -b 1 -I -t 560x560 -F -R /data03/gisdata/dsmgroup/aspct_16.tif
-    # covariate.conus_aspect_16 | PGPASSWORD=itsnotflat psql -U covariate -d elevation -h 10.11.11.10 -p 5432
-
-    # Before
+def createRaster2pgSQLFile(masterElevFile, jobs=None):
+    """ Appends the raster2pgsql commands of the DSH3M mosaics to the raster2pgsql file.
+        Registration jobs come from DSHub_Registration_Jobs. """
 
     try:
-        masterElevRecCount = len(open(masterElevFile).readlines()) - 1  # subtract header
-
-        recCount = 0
         r2pgsqlFilePath = f"{outputDir}{os.sep}USGS_3DEP_DSH3M_Step5_Mosaic_RASTER2PGSQL.txt"
 
-        g = open(r2pgsqlFilePath,'a+')
-
-        total = sum(1 for line in open(masterElevFile)) -1
-        headerValues = open(masterElevFile).readline().rstrip().split(',')
-
-        invalidCommands = list()
+        if jobs is None:
+            jobs,invalidJobs = createRegistrationJobs(masterElevFile, 'dsh3m')
 
-        sridPos = headerValues.index('epsg_code')
-        demNamePos = headerValues.index('dem_name')
-        demPathPos = headerValues.index('dem_path')
-
-        """ ------------------- Open Master Elevation File and write raster2pgsql statements ---------------------"""
-        with open(masterElevFile, 'r') as fp:
-            for line in fp:
-
-                # Skip header line and empty lines
-                if recCount == 0 or line == "\n":
-                    recCount+=1
-                    continue
-
-                items = line.split(',')
-
-                # Raster2pgsql parameters
-                srid = items[sridPos]
-                tileSize = '507x507'
-                demPath = f"{items[demPathPos]}{os.sep}{items[demNamePos]}"
-                dbName = 'elevation'
-                dbTable = "elevation_DSH3M"  # elevation_3m
-                demName = items[demNamePos]
-                password = 'itsnotflat'
-                localHost = '10.11.11.10'
-                port = '6432'
-
-                r2pgsqlCommand = f"raster2pgsql -s {srid} -b 1 -t {tileSize} -F -a -R {demPath} {dbName}.{dbTable} | PGPASSWORD={password} psql -U {dbName} -d {dbName} -h {localHost} -p {port}"
-
-                # Add check to look for # in r2pgsqlCommand
-                if r2pgsqlCommand.find('#') > -1:
-                    invalidCommands.append(r2pgsqlCommand)
-
-                if recCount == masterElevRecCount:
-                    g.write(r2pgsqlCommand)
-                else:
-                    g.write(r2pgsqlCommand + "\n")
-
-                # No need to log status to file
-                print(f"\t\tSuccessfully wrote raster2pgsql command -- ({recCount:,} of {total:,})")
-                recCount+=1
-
-        g.close()
-        del masterElevRecCount
-
-        # Inform user about invalid raster2pgsql commands so that they can be fixed.
-        numOfInvalidCommands = len(invalidCommands)
-        if numOfInvalidCommands:
-            AddMsgAndPrint(f"\tThere are {numOfInvalidCommands:,} invalid raster2pgsql commands or that contain invalid parameters:")
-            for invalidCmd in invalidCommands:
-                AddMsgAndPrint(f"\t\t{invalidCmd}")
-        else:
-            AddMsgAndPrint(f"\tSuccessfully created RASTER2PGSQL commands for {total:,} DEM files")
+        exportRaster2pgsqlFile(jobs, r2pgsqlFilePath, 'a+')
+        AddMsgAndPrint(f"\tSuccessfully created RASTER2PGSQL commands for {len(jobs):,} DEM files")
 
         return r2pgsqlFilePath
 
@@ -1195,6 +1109,10 @@ def main(dsh3mFootPrintLry, gridDriverLyr, outputDir, bReplace, bReplaceMerge, b
         h.write(f"\tVerbose Mode: {bDetails}\n")
         h.close()
 
+        # Merged grids are placed on the EBS volumes using a persisted placement map
+        if os.name != 'nt':
+            loadPlacementMap(f"{outputDir}{os.sep}USGS_3DEP_DSH3M_Step5_PlacementMap.json")
+
         """ ---------------- STEP 1: Intersect Elevation Index and Grid  -----------------"""
         # Get Headers from USGS index layer
         # ['huc_digit','prod_title','pub_date','last_updated','size','format'] ...etc
@@ -1392,6 +1310,11 @@ def main(dsh3mFootPrintLry, gridDriverLyr, outputDir, bReplace, bReplaceMerge, b
                  
         stopMerge = toc(startMerge)
         AddMsgAndPrint(f"\n\tTotal Merging Time: {stopMerge}")
+
+        if os.name != 'nt':
+            AddMsgAndPrint("\n\tDSH3M Volume Placement:")
+            for placementMsg in placementSummary(dsh3mVolumes):
+                AddMsgAndPrint(placementMsg)
         
         """ ----------------------------- Step 4: Create Mosaic Tile Elevation Metadata ----------------------------- """
         if len(dsh3mMosaicDict):
@@ -10,18 +10,24 @@ Update on Mon Sep 25 1:24:50 2023
 import os
 
 os.environ["OPENBLAS_NUM_THREADS"] = "1"
+# GDAL block cache (MB) per worker; the data mask is built 1 block window at a time
+# in /vsimem/ and polygonized in memory
+os.environ.setdefault("GDAL_CACHEMAX", "64")
 
 import argparse
 import datetime
-import subprocess
 import sys
 from getpass import getpass
 from pathlib import Path
 
-import numpy as np
 import ray
-from osgeo import gdal, ogr, osr
+from osgeo import gdal
 
+from DSHub_Footprints import createFootprint as create_footprint_polygons
+from DSHub_Footprints import loadFootprints as copy_footprints
+from DSHub_Footprints import footprintExecutors
+from DSHub_Footprints import runFootprintTasks as run_footprint_tasks
+from DSHub_Coverage import updateCoverage as update_coverage
 from utils import clean, db_params, execute_query, get_db_connection, list_meta_tables
 
 gdal.UseExceptions()
@@ -101,6 +107,9 @@ def generate_q1(srctable, region, resolution, epsg):
                 'metadata',
                 '{region}_elevation_{resolution}_{epsg}_footprint',
                 'geom', {epsg}, 'MULTIPOLYGON', 2);"""
+        + f"""DROP TABLE IF EXISTS metadata.{region}_elevation_{resolution}_{epsg}_footprint_stage;"""
+        + f"""CREATE UNLOGGED TABLE metadata.{region}_elevation_{resolution}_{epsg}_footprint_stage
+                (tile_id varchar, "value" integer, geom geometry(MULTIPOLYGON, {epsg}));"""
         + f"""SELECT concat_ws('/', dem_path, dem_name) as filepath
                 FROM metadata.{srctable};"""
     )
@@ -108,22 +117,14 @@ def generate_q1(srctable, region, resolution, epsg):
 
 
 def generate_q2(srctable, region, resolution, epsg):
+    # catalog attributes are joined to the staged footprints in 1 INSERT ... SELECT;
+    # the footprint table has the columns of srctable followed by tile_id, value, geom
     query = (
-        f"""UPDATE metadata.{region}_elevation_{resolution}_{epsg}_footprint fp
-                SET (poly_code,prod_title,pub_date,lastupdate,rds_size,format,
-                    sourceid,meta_url,downld_url,dem_name,dem_path,rds_column,
-                    rds_rows,bandcount,cellsize,rdsformat,bitdepth,nodataval,
-                    srs_type,epsg_code,srs_name,rds_top,rds_left,rds_right,
-                    rds_bottom,rds_min,rds_mean,rds_max,rds_stdev,blk_xsize,
-                    blk_ysize) = 
-                    (org.poly_code,org.prod_title,org.pub_date,org.lastupdate,org.rds_size,org.format,
-                    org.sourceid,org.meta_url,org.downld_url,org.dem_name,org.dem_path,org.rds_column,
-                    org.rds_rows,org.bandcount,org.cellsize,org.rdsformat,org.bitdepth,org.nodataval,
-                    org.srs_type,org.epsg_code,org.srs_name,org.rds_top,org.rds_left,org.rds_right,
-                    org.rds_bottom,org.rds_min,org.rds_mean,org.rds_max,org.rds_stdev,org.blk_xsize,
-                    org.blk_ysize)
-                FROM metadata.{srctable} org
-                WHERE fp.tile_id = org.dem_name;"""
+        f"""INSERT INTO metadata.{region}_elevation_{resolution}_{epsg}_footprint
+                SELECT org.*, fp.tile_id, fp."value", fp.geom
+                FROM metadata.{region}_elevation_{resolution}_{epsg}_footprint_stage fp
+                LEFT JOIN metadata.{srctable} org ON fp.tile_id = org.dem_name;"""
+        + f"""DROP TABLE metadata.{region}_elevation_{resolution}_{epsg}_footprint_stage;"""
         + f"""CREATE INDEX fp{region}_{resolution}_{epsg}_idx 
                 ON metadata.{region}_elevation_{resolution}_{epsg}_footprint 
                 USING GIST (geom);"""
@@ -138,21 +139,32 @@ def generate_q2(srctable, region, resolution, epsg):
     return query
 
 
-def create_binary_file(input_raster_file: str, output_raster_file: str):
+def create_footprint(input_raster_file: str, epsg: str, footprint_res: float = None):
     """
-    Create a binary raster (.tif) consisting of NODATA=1, DATA=2
+    Create the NODATA=1, DATA=2 polygons of a raster in memory. The binary
+    mask is written to /vsimem/, polygonized into an OGR Memory layer and
+    reprojected to `epsg` in process; no intermediate .tif or shapefile is
+    written next to the raster.
 
     Parameters
     ----------
     input_raster_file : str
         Input GeoTiff raster file
-    output_raster_file : str
-        Output GeoTiff raster file
+    epsg : str
+        EPSG code of the footprint table
+    footprint_res : float, optional
+        Cell size of the mask in raster units, i.e. 30 for a 1m raster. The
+        raster is read decimated (from its overviews when it has them) and
+        every polygon is simplified topology-preserving by 1 mask cell on its
+        own, so DATA and NODATA polygons may overlap or leave gaps of up to
+        1 mask cell along their shared edges. By default the mask is built
+        at the full resolution of the raster.
 
     Returns
     -------
-    dict
-        msgs dictionary for file
+    tuple[dict, list]
+        msgs dictionary for file and the footprint polygons as
+        [{'value', 'wkb'}]
 
     Raises
     ------
@@ -165,109 +177,46 @@ def create_binary_file(input_raster_file: str, output_raster_file: str):
         )
 
     msgs = dict()
+    footprints = list()
 
     try:
-        ds = gdal.Open(input_raster_file)
-        nd = ds.GetRasterBand(1).GetNoDataValue()
-        rows, cols = ds.RasterYSize, ds.RasterXSize
-        arr = ds.GetRasterBand(1).ReadAsArray()
-        #  create the output data set
-        ods = ds.GetDriver().Create(output_raster_file, cols, rows, 1, gdal.GDT_Byte)
-        ods.SetGeoTransform(ds.GetGeoTransform())
-        ods.SetProjection(ds.GetProjection())
-        #  create binary array, NODATA:1, DATA:2
-        oband = ods.GetRasterBand(1)
-        binary_array = np.where(arr > nd, 2, 1)
-        oband.WriteArray(binary_array, 0, 0)
-        # clean up
-        oband.FlushCache()
-        ods.FlushCache()
-        del ods
-        del ds
+        # NODATA:1, DATA:2; read along the block size of the raster so memory
+        # stays at 1 window per worker
+        footprint = create_footprint_polygons(
+            input_raster_file,
+            outputEPSG=int(epsg),
+            dataValue=2,
+            nodataValue=1,
+            bDataOnly=False,
+            footprintRes=footprint_res,
+        )
+        footprints = footprint["footprints"]
         msgs["3.NODATA"] = "SUCCESS"
+        msgs["4.POLYGONIZE"] = f"SUCCESS - {len(footprints)} polygons"
     except Exception as nde:
         msgs["3.NODATA"] = f"FAIL - {nde}"
+        msgs["4.POLYGONIZE"] = "FAIL - no data mask"
 
-    return msgs
+    return msgs, footprints
 
 
-def polygonize_binary_file(
-    input_raster_file: str, binary_raster: str, dirname: str, layername: str
+def load_footprints(
+    nodata_results, params: dict, region: str, resolution: str, epsg: str
 ):
     """
-    Polygonzie binary raster as a shapefile
+    Stream footprint polygons into the footprint staging table of the metadata
+    schema as the `nodata` tasks finish. Only tile_id, value and geom are
+    loaded; the catalog attributes are joined in bulk by `generate_q2()`. The polygons are written as EWKB with a
+    binary COPY over 1 pooled connection and flushed in batches by size,
+    instead of a shp2pgsql | psql subprocess and connection per raster.
 
     Parameters
     ----------
-    input_raster_file : str
-        Original GeoTiff raster file
-    binary_raster : str
-        Binary GeoTiff raster file created via `create_binary_file()`
-    dirname : str
-        Directory to store shapefile
-    layername : str
-        Filename for shapefile
-
-    Returns
-    -------
-    dict
-        msgs dictionary for file
-
-    Raises
-    ------
-    TypeError
-        Binary raster does not exist
-    """
-    msgs = dict()
-
-    if Path(binary_raster).exists() == False:
-        msgs["4.POLYGONIZE"] = f"FAIL - Raster file {binary_raster} does not exist"
-    else:
-        try:
-            ds = gdal.Open(binary_raster)
-            band = ds.GetRasterBand(1)
-            proj = osr.SpatialReference(ds.GetProjection()).Clone()
-            # srcSRS = proj.GetAttrValue("AUTHORITY", 1)
-            drv = ogr.GetDriverByName("ESRI Shapefile")
-            dst_ds = drv.CreateDataSource(dirname)
-            # srs is the full projedsction obj from reprojected raster
-            dst_layer = dst_ds.CreateLayer(
-                layername, srs=proj, geom_type=ogr.wkbPolygon
-            )
-            fld = ogr.FieldDefn("value", ogr.OFTInteger)
-            dst_layer.CreateField(fld)
-            dst_field = dst_layer.GetLayerDefn().GetFieldIndex("value")
-            gdal.Polygonize(band, None, dst_layer, dst_field, [], callback=None)
-            # add the tile name / id to the attribute table
-            field_name = ogr.FieldDefn("tile_id", ogr.OFTString)
-            dst_layer.CreateField(field_name)
-            field_name.SetWidth(200)
-            for i in range(0, dst_layer.GetFeatureCount()):
-                feature = dst_layer.GetFeature(i)
-                feature.SetField("tile_id", os.path.basename(input_raster_file))
-                dst_layer.SetFeature(feature)
-            dst_ds.FlushCache()
-            del dst_layer
-            del ds
-            msgs["4.POLYGONIZE"] = "SUCCESS"
-        except Exception as e:
-            msgs["4.POLYGONIZE"] = f"FAIL - {e}"
-
-    return msgs
-
-
-def shp2sql(
-    input_raster_file: str, shapefile: str, region: str, resolution: str, epsg: str
-):
-    """
-    Load shapefile into Postgres, reprojecting the shapefile before load.
-
-    Parameters
-    ----------
-    input_raster_file : str
-        Original GeoTiff filepath
-    shapefile : str
-        Shapefile filepath
+    nodata_results : iterable
+        (msgs, footprints) of `nodata` tasks in the order they finish, i.e.
+        from `run_footprint_tasks()`
+    params : dict
+        database connection parameters of the footprint table
     region : str
         region parsed from metadata table name
     resolution : str
@@ -277,68 +226,62 @@ def shp2sql(
 
     Returns
     -------
-    dict
-        msgs dictionary for file
+    list
+        msgs dictionary of every file
     """
-    msgs = dict()
-
-    if Path(shapefile).exists() == False:
-        msgs["5.SHP2PG"] = f"FAIL - Shapefile {shapefile} does not exist"
-    else:
-        env = {"PGPASSWORD": pwd}
-        ds = gdal.Open(input_raster_file)
-        proj = osr.SpatialReference(ds.GetProjection()).Clone()
-        srcSRS = proj.GetAttrValue("AUTHORITY", 1)
-        del ds
-
-        shp2pgsql = f"/usr/bin/shp2pgsql -a -s {srcSRS}:{epsg} -i {shapefile} \
-            metadata.{region}_elevation_{resolution}_{epsg}_footprint \
-            | /usr/bin/psql -d elevation -h 10.11.11.214 -p 6432 -U elevation"
-
-        try:
-            subprocess.run(
-                ["/bin/bash", "-c", shp2pgsql],
-                env=env,
-                check=True,
-                stderr=subprocess.DEVNULL,
-                stdout=subprocess.DEVNULL,
-            )
-            msgs["5.SHP2PG"] = "SUCCESS"
-        except subprocess.CalledProcessError as e:
-            msgs["5.SHP2PG"] = f"FAIL - {e}"
+    table = f"metadata.{region}_elevation_{resolution}_{epsg}_footprint_stage"
+    nodata_result = dict()
+
+    def finished_footprints():
+        for msgs, footprints in nodata_results:
+            tile_id = os.path.basename(msgs["1.FILE"])
+            nodata_result[tile_id] = msgs
+            if not footprints:
+                msgs["5.LOAD"] = "FAIL - no footprint polygons"
+            yield tile_id, footprints
+
+    for batch in copy_footprints(finished_footprints(), params, table, int(epsg)):
+        for tile_id in batch["tiles"]:
+            if "5.LOAD" in nodata_result[tile_id]:
+                continue
+            if batch["status"] == "Success":
+                nodata_result[tile_id]["5.LOAD"] = "SUCCESS"
+            else:
+                nodata_result[tile_id]["5.LOAD"] = f"FAIL - {batch['error'].strip()}"
+        print(
+            f"[*] COPY {len(batch['tiles'])} files, {batch['rows']} polygons, "
+            f"{batch['bytes'] / 1048576:.1f} MB: {batch['status']} ({batch['seconds']} seconds)"
+        )
 
-    return msgs
+    return list(nodata_result.values())
 
 
-@ray.remote
-def nodata(input_raster: str, random_id: str, region: str, resolution: str, epsg: str):
+def nodata(input_raster: str, epsg: str, footprint_res: float):
     msgs = dict()
     msgs["1.FILE"] = input_raster
     start = datetime.datetime.now()
     msgs["2.START"] = f"{start.strftime('%Y-%m-%d %H:%M:%S')}"
 
-    dirname = os.path.dirname(input_raster)
-    fname = os.path.basename(input_raster)[:-4]
-    layername = f"{fname}_{random_id}"
-    output_raster = os.path.join(dirname, f"{layername}.tif")
-    shapefile = os.path.join(dirname, f"{layername}.shp")
-
-    binary_dict = create_binary_file(input_raster, output_raster)
-    polygonize_dict = polygonize_binary_file(
-        input_raster, output_raster, dirname, layername
-    )
-    shp2sql_dict = shp2sql(input_raster, shapefile, region, resolution, epsg)
+    footprint_dict, footprints = create_footprint(input_raster, epsg, footprint_res)
 
-    msgs.update(**binary_dict, **polygonize_dict, **shp2sql_dict)
+    msgs.update(**footprint_dict)
     stop = datetime.datetime.now()
     msgs["6.STOP"] = f"{stop.strftime('%Y-%m-%d %H:%M:%S')}"
     ftime = stop - start
     msgs["7.FILETIME"] = str(ftime)
 
-    return msgs
+    return msgs, footprints
 
 
-def main(srctable: str, random_id: str, cleanup: bool, limit: int):
+def main(
+    srctable: str,
+    random_id: str,
+    cleanup: bool,
+    limit: int,
+    footprint_res: float,
+    coverage_cell: float,
+    executor: str,
+):
     params = db_params(
         host="10.11.11.214", user="elevation", password=pwd, dbname="elevation"
     )
@@ -371,11 +314,12 @@ def main(srctable: str, random_id: str, cleanup: bool, limit: int):
     ### process
     print("[*] RUNNING PROCESS: nodata")
     fstart = datetime.datetime.now()
-    nodata_futures = [
-        nodata.remote(file, random_id, region, resolution, epsg) for file in files
-    ]
-    nodata_result = ray.get(nodata_futures)
-    ray.shutdown()
+    nodata_tasks = run_footprint_tasks(
+        nodata, [(file, epsg, footprint_res) for file in files], executor
+    )
+    nodata_result = load_footprints(nodata_tasks, params, region, resolution, epsg)
+    if executor == "ray":
+        ray.shutdown()
     fstop = datetime.datetime.now()
 
     ### log results
@@ -396,7 +340,7 @@ def main(srctable: str, random_id: str, cleanup: bool, limit: int):
     nodata_log_file_path = os.path.join(wdir, nodata_log_file_name)
     with open(nodata_log_file_path, mode="w") as f:
         for i in nodata_result:
-            for k, v in i.items():
+            for k, v in sorted(i.items()):
                 f.write(k + ": " + v + "\n")
             f.write("\n")
         f.write(f"{begin}{end}{run}{proc}{fps}\n[*]\n[*]")
@@ -407,6 +351,17 @@ def main(srctable: str, random_id: str, cleanup: bool, limit: int):
     q2 = generate_q2(srctable, region, resolution, epsg)
     execute_query(conn, query=q2, return_results=False)
 
+    ### add the new tiles to the dissolved coverage of this resolution
+    if coverage_cell:
+        print("[*] UPDATING COVERAGE")
+        coverage = update_coverage(params, region, resolution, epsg, cellSize=coverage_cell)
+        if coverage["status"] == "Success":
+            print(
+                f"[*] COVERAGE: {coverage['tiles']} tiles added in {coverage['seconds']} seconds"
+            )
+        else:
+            print(f"[*] COVERAGE FAILED: {coverage['error']}")
+
     ### clean up intermediate files from this run
     if cleanup == True:
         q0 = f"""SELECT DISTINCT dem_path as dirpath FROM metadata.{srctable};"""
@@ -434,7 +389,7 @@ if __name__ == "__main__":
         "--random_id",
         type=str,
         default="NODATA_60586972",
-        help="Random ID appended to intermediate file names",
+        help="Random ID of intermediate file names left by previous runs",
     )
     parser.add_argument(
         "-c",
@@ -450,8 +405,38 @@ if __name__ == "__main__":
         default=None,
         help="Limit the number of files to process. Only use for testing",
     )
+    parser.add_argument(
+        "-f",
+        "--footprint_res",
+        type=float,
+        default=None,
+        help="Footprint mask cell size in raster units, i.e. 30 for 1m rasters. Default is full resolution",
+    )
+    parser.add_argument(
+        "-g",
+        "--coverage_cell",
+        type=float,
+        default=None,
+        help="Grid cell size in units of the EPSG used to dissolve the new footprints into the resolution coverage, i.e. 100000. Default is no coverage update",
+    )
+    parser.add_argument(
+        "-e",
+        "--executor",
+        type=str,
+        default="ray",
+        choices=footprintExecutors,
+        help="How rasters are spread over the CPUs",
+    )
     args = parser.parse_args()
 
     pwd = getpass("Postgres Password:")
 
-    main(args.table, args.random_id, args.clean, args.limit)
+    main(
+        args.table,
+        args.random_id,
+        args.clean,
+        args.limit,
+        args.footprint_res,
+        args.coverage_cell,
+        args.executor,
+    )
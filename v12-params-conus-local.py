@@ -8,8 +8,8 @@ Created on Wed Apr 12 12:48:16 2023
 # this function reads a raster ->
 # makes it a vrt (set no data an actual value) ->
 # translates to tif ->
-# gdal calc to identify data/nodata ->
-# polygonizes the result
+# data/nodata mask in /vsimem/ ->
+# polygonizes the result in memory
 # appends the polygons and srs to list 
 def ndras(ras, arg):
     
@@ -24,200 +24,32 @@ def ndras(ras, arg):
         # ras = r'D:\GIS\PROJECT_23\AK-ELEV\R\USGS_OPR_AK_MatSuBorough_2019_B19_BE_6VUP96856.tif'
         # ras = r'D:\\GIS\\PROJECT_23\\DS-HUB\\TEST\\USGS_1M_16_x39y388_AL_17County_2020_B20.tif'
         
-        dirname = os.path.dirname(ras)
-        fname = os.path.basename(ras)[:-4]
-        rid = 'fp-60586972'
-        
-        layername = rid + fname
-        
-        # check to see if the shapefile had been created in prev run
-        extensions = ['.shp', '.shx', '.dbf','.prj']
-        components = [os.path.join(dirname, layername + x) for x in extensions]
-        
-        try:
-            for c in components:
-                if os.path.exists(c):
-                    os.remove(c)
-        except OSError as e:
-            print(e)
-            
-        
-        # orgRas = gdal.Open(ras)
-        
-        #dest = os.path.join(os.path.dirname(ras), 'rpj_' + os.path.basename(ras))
-        # dest = os.path.join(os.path.dirname(ras), rid + os.path.basename(ras))
-        
-        # # imnportant, don't rely on the epsg code, use the full sr object
-        # # warp the input raster to 3338 to get a working epsg code
-        # orgProj = osr.SpatialReference(orgRas.GetProjection()).Clone()
-        # wo = gdal.WarpOptions(srcSRS=orgProj, creationOptions=["COMPRESS=LZW"])
-        # gdal.Warp(dest, ras, dstSRS="EPSG:3338", warpOptions=wo)
-        
-        # orgRas is None
-        
-        # use the reprojected raster to build footprint from
+        # use the input raster to build footprint from
         ds = gdal.Open(ras)
-        
-        # proj = osr.SpatialReference(wkt=ds.GetProjection())
-        proj = osr.SpatialReference(ds.GetProjection()).Clone()
-        srcSRS = proj.GetAttrValue('AUTHORITY',1)
-        print(srcSRS)
-        
-        
         band = ds.GetRasterBand(1)
         nd = band.GetNoDataValue()
-        
+        del band, ds
+
         msgs['01.NoData'] = str(nd)
-        
-        #  create the file name to save to
-        dstBIN = os.path.join(dirname, fname + "_" + rid + '_bin.tif')
-        
+
         # create binary raster NODATA=0, DATA = 1
-        calc = '"numpy.where(A > ' + str(nd) + ', 1, A)"'
-        # calcOrg = '"numpy.where(A>=887, 1, A)"'
-        gdal_calc = r'python C:\OSGeo4W\apps\Python39\Lib\site-packages\osgeo_utils\gdal_calc.py ' \
-                    ' -A {0} ' \
-                    '--outfile={1} ' \
-                    '--calc={2} ' \
-                    '--type=Byte ' \
-                    '--co "COMPRESS=LZW" ' \
-                    '--overwrite'.format(ras, dstBIN, calc)
-                    # '--overwrite'.format(dstTIF, dstBIN, calc)
-                    
-        # print(gdal_calc) 
-        # subprocess.run(gdal_calc, shell=True, stdout=subprocess.DEVNULL)
-        calcres = subprocess.Popen(gdal_calc, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,universal_newlines=True)
-        
-        calcmsgs, calcerrors = calcres.communicate()
-        calcerrors = ','.join(calcerrors.strip().split('\n'))  # some errors return mutliple carriage returns
-        
-        # if not calcerrors is None or not calcres.returncode == 0:
-        if not calcerrors == '':
-        
-            msgs['02.gdal_calc'] = 'Fail-' + calcerrors
-        
-        else:
-            
-            msgs['02.gdal_calc'] = 'Success'
-        
-        del ds
-        
-        # polygonize DATA / NODATA
-        # there was an attempt to stuff this into pg raster
-        # gdal returned message saying this is not possible
-        ds = gdal.Open(dstBIN)
-        band = ds.GetRasterBand(1)
-    
-        # layername = rid + fname
-        
-        # # check to see if the shapefile had been created in prev run
-        # extensions = ['.shp', '.shx', '.dbf','.prj']
-        # components = [os.path.join(dirname, layername + x) for x in extensions]
-        
-        # try:
-        #     for c in components:
-        #         # print('attempting delete of ' + c)
-        #         if os.path.exists(c):
-        #             os.remove(c)
-        # except OSError as e:
-        #     print(e)
-        #     print('unbale to delete ' + c)
-        #     pass
-        
-        drv = ogr.GetDriverByName("ESRI Shapefile")
-        dst_ds = drv.CreateDataSource(dirname)    
-        
-        # srs is the full projection obj from reprojected raster
-        dst_layer = dst_ds.CreateLayer(layername, srs = proj, geom_type = ogr.wkbPolygon)
-        fld = ogr.FieldDefn("value", ogr.OFTInteger)
-        dst_layer.CreateField(fld)
-        dst_field = dst_layer.GetLayerDefn().GetFieldIndex("value")
-        
-        gdal.Polygonize(band, None, dst_layer, dst_field, [], callback=None)
-        
-        # add the tile name / id to the attribute table
-        field_name = ogr.FieldDefn("tile_id", ogr.OFTString)
-        dst_layer.CreateField(field_name)
-        field_name.SetWidth(200)
-        
-        for i in range(0, dst_layer.GetFeatureCount()):
-            feature = dst_layer.GetFeature(i)
-            feature.SetField("tile_id", os.path.basename(ras))
-            dst_layer.SetFeature(feature)
-            
-            
-        dst_ds.FlushCache()        
-    
-        # gather a collection of shapefile
-        shape = os.path.join(dirname, rid + fname + '.shp')
-        
-        # clean up
+        # done in process, block by block, to /vsimem/ and polygonized
+        # into an OGR Memory layer reprojected to epsg; no _bin.tif,
+        # no shapefile, no shp2pgsql
         try:
-            os.remove(dstBIN)
-    
-        except:
-            pass
-        
-        # run the command, note the reprojection from srcSRS to epsg
-        env={'PGPASSWORD':pwd,
-             'PGHOST' : 'localhost',
-             'PGPORT' : '5432',
-             'PGUSER' : 'postgres',
-             'PGDATABASE' : 'metadata',
-             'SYSTEMROOT': os.environ['SYSTEMROOT']}
-        
-        print('Assembling shp2pgsql')
-        
-        # '-s ' + str(srcSRS) + ':' + str(epsg) + \
-        # '-s 0:' + str(epsg) + \
-        shp2pgsql =  r'"C:\Program Files\PostgreSQL\15\bin\shp2pgsql.exe" ' \
-                    '-a ' \
-                    '-s ' + srcSRS + ':' + str(epsg) + \
-                    ' -i ' \
-                    + shape + \
-                    ' metadata.footprint_' + reg + """_""" + argv1 + """_""" + epsg + '_meta | ' \
-                    r'"C:\Program Files\PostgreSQL\15\bin\psql.exe" ' \
-                    '-d  metadata ' \
-                    '-h localhost ' \
-                    '-p 5432 ' \
-                    '-U postgres'
-        
-        # print(shp2pgsql)
-        
-        shp2 = subprocess.Popen(shp2pgsql, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, universal_newlines=True)
-       
-        shp2msgs, shp2errors = shp2.communicate()
-        shp2errors = ','.join(shp2errors.strip().split('\n'))  # some errors return mutliple carriage returns
-        
-        # subprocess.run(shp2pgsql, shell=True, env=env)
-        
-        # if not shp2errors is None or not shp2.returncode == 0:
-        if not shp2.returncode == 0:
-        
-            msgs['03.shp2pg'] = 'Fail-' + shp2errors
-        
-        else:
-            
-            msgs['03.shp2pg'] = 'Success'
-        
-        del ds
-        # clean up
-        #shpdir = os.path.dirname(shape)
-        #shpid =  os.path.basename(shape)[:-4]
-    
-        #os.remove(os.path.join(shpdir, shpid + '.shp'))
-        #os.remove(os.path.join(shpdir, shpid + '.shx'))
-        #os.remove(os.path.join(shpdir, shpid + '.dbf'))
-        #os.remove(os.path.join(shpdir, shpid + '.prj'))
-        
-        # too verbose for debugging only
-        # result = subprocess.run(shp2pgsql, capture_output=True, text=True, env=env, shell=True)
-        # print("stdout:", result.stdout)
-        # print("stderr:", result.stderr)
-        
+            footprint = createFootprint(ras, int(epsg), nd, dataValue=1, nodataValue=0, bDataOnly=False, footprintRes=footprintRes)
+            msgs['02.DataMask'] = 'Success'
+
+        except Exception as e:
+
+            msgs['02.DataMask'] = 'Fail-' + str(e)
+            raise
+
         msgs['04.function'] = 'Success'
         
-        return 'function success', msgs
+        # the polygons are returned to main and loaded
+        # with a binary COPY over 1 connection
+        return 'function success', msgs, footprint['footprints']
 
     except Exception as e:
         
@@ -225,17 +57,16 @@ def ndras(ras, arg):
         
         print(e)
         
-        return 'Function failure', msgs
+        return 'Function failure', msgs, []
         
         
 
 
 from contextlib import closing
-import os, psycopg2, datetime, subprocess, sys
+import os, psycopg2, datetime, sys
+from DSHub_Footprints import createFootprint, loadFootprints, runFootprintTasks
 from osgeo import gdal
-from osgeo import ogr, osr
 import threading, multiprocessing
-from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 
 os.environ['OPENBLAS_NUM_THREADS'] = '1'
 
@@ -246,6 +77,15 @@ gdal.UseExceptions()
 srcTable = 'conus_elevation_1m_5070_meta'
 pwd = '!0694Turds'
 
+# footprint mask cell size in raster units i.e. 30 for 1m rasters
+# the raster is read decimated (from overviews if it has them) and the
+# polygons are simplified by 1 mask cell; None = full resolution
+footprintRes = None
+
+# how rasters are spread over the cpus
+# 'serial', 'threads', 'processes' or 'ray'
+footprintExecutor = 'threads'
+
 srcCount = srcTable.count("_")
 if not srcCount == 4:
     err = """Inappropriate table name.  Must include vlaues for
@@ -292,6 +132,10 @@ ADD COLUMN "value" integer;
 
 SELECT AddGeometryColumn('metadata', 'footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta', 'geom', """ + epsg + """, 'MULTIPOLYGON', 2);
 
+DROP TABLE IF EXISTS metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta_stage;
+
+CREATE UNLOGGED TABLE metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta_stage (tile_id varchar, "value" integer, geom geometry(MULTIPOLYGON, """ + epsg + """));
+
 SELECT concat_ws('\\', dem_path, dem_name) as filepath FROM metadata.""" + srcTable + """;"""
 
 with closing(psycopg2.connect(host='localhost', user='postgres', \
@@ -314,22 +158,38 @@ with open(os.path.join(wdir, reg + '_nodata-logger_' + argv1 + '.log'), mode='w'
     jobs = str(len(files))
     job = 0
     # for raster in files:
-    with ThreadPoolExecutor(max_workers=multiprocessing.cpu_count()) as executor:
-        future = {executor.submit(ndras, raster, argv1): raster for raster in files}
+    # the executor runs ndras on every raster and hands
+    # back the results as they finish
+    tasks = runFootprintTasks(ndras, [(raster, argv1) for raster in files], footprintExecutor, multiprocessing.cpu_count())
+
+    # polygons are streamed into the footprint table as the
+    # jobs finish with a binary COPY over 1 connection,
+    # flushed every ~8 MB
+    results = dict()
+
+    def finishedFootprints():
+        global job
+        for resp, ans, footprints in tasks:
 
-        # use a set comprehension to start all tasks.  This creates a future object
-        # runR2pgsqlCmd = {executor.submit(runRaster2pgsql, cmd): cmd for cmd in raster2pgsqlList}
-        
-        for response in as_completed(future):
-            
-            resp, ans = response.result()
             print(resp)
-            for k,v in ans.items():
-                f.write(k + ': ' + v + '\n')
-            f.write('\n')
-            
+            results[os.path.basename(ans['00.File'])] = ans
+
             job +=1
             print('completed job ' + str(job) + ' of ' + jobs)
+
+            yield os.path.basename(ans['00.File']), footprints
+
+    dbParams = {'host':'localhost', 'user':'postgres', 'password':pwd, 'dbname':'metadata', 'port':5432}
+    fpTable = 'metadata.footprint_' + reg + '_' + argv1 + '_' + epsg + '_meta_stage'
+
+    for batch in loadFootprints(finishedFootprints(), dbParams, fpTable, int(epsg)):
+        for tileID in batch['tiles']:
+            results[tileID]['03.load'] = batch['status'] if batch['status'] == 'Success' else 'Fail-' + batch['error'].strip()
+
+    for ans in results.values():
+        for k,v in sorted(ans.items()):
+            f.write(k + ': ' + v + '\n')
+        f.write('\n')
     
     finish = datetime.datetime.now()
     
@@ -340,10 +200,12 @@ with open(os.path.join(wdir, reg + '_nodata-logger_' + argv1 + '.log'), mode='w'
 
 # ALTER TABLE metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta ADD COLUMN "source_res" smallint DEFAULT """ + source_res + """;
 
-q2 = """UPDATE metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta fp
-SET (poly_code,prod_title,pub_date,lastupdate,rds_size,format,sourceid,meta_url,downld_url,dem_name,dem_path,rds_column,rds_rows,bandcount,cellsize,rdsformat,bitdepth,nodataval,srs_type,epsg_code,srs_name,rds_top,rds_left,rds_right,rds_bottom,rds_min,rds_mean,rds_max,rds_stdev,blk_xsize,blk_ysize) = (org.poly_code,org.prod_title,org.pub_date,org.lastupdate,org.rds_size,org.format,org.sourceid,org.meta_url,org.downld_url,org.dem_name,org.dem_path,org.rds_column,org.rds_rows,org.bandcount,org.cellsize,org.rdsformat,org.bitdepth,org.nodataval,org.srs_type,org.epsg_code,org.srs_name,org.rds_top,org.rds_left,org.rds_right,org.rds_bottom,org.rds_min,org.rds_mean,org.rds_max,org.rds_stdev,org.blk_xsize,org.blk_ysize)
-FROM metadata.""" + srcTable + """ org
-WHERE fp.tile_id = org.dem_name;
+q2 = """INSERT INTO metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta
+SELECT org.*, fp.tile_id, fp."value", fp.geom
+FROM metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta_stage fp
+LEFT JOIN metadata.""" + srcTable + """ org ON fp.tile_id = org.dem_name;
+
+DROP TABLE metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta_stage;
 
 CREATE INDEX fp""" + reg + """_""" + argv1 + """_""" + epsg + """_idx ON metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta USING GIST (geom);
 
@@ -9,12 +9,11 @@ Created on Wed Apr 12 12:48:16 2023
 # takes input raster ->
 # extracts to array ->
 # numpy.where data/nodat ->
-# writes binary data/nodata to new raster ->
-# 'polygonize' to shapefile ->
-# append shapefile to postgis table
+# writes binary data/nodata to /vsimem/ raster ->
+# 'polygonize' to in-memory layer ->
+# return polygons to main ->
+# COPY polygons into postgis table
 
-import ray
-@ray.remote
 def ndras(ras, arg):
     
     # fstart and ffininsh are variables 
@@ -26,159 +25,30 @@ def ndras(ras, arg):
        
     try:
         
-        dirname = os.path.dirname(ras)
-        fname = os.path.basename(ras)[:-4]
-        
-        # random sequence to find 
-        # for intermediate steps
-        # for future deletes
-        rid = 'fp-60586972'
-        
-        layername = rid + fname
-        
-        # # imnportant, don't rely on the epsg code, use the full sr object
-        # # warp the input raster to 3338 to get a working epsg code
-        # orgProj = osr.SpatialReference(orgRas.GetProjection()).Clone()
-        # wo = gdal.WarpOptions(srcSRS=orgProj, creationOptions=["COMPRESS=LZW"])
-        # gdal.Warp(dest, ras, dstSRS="EPSG:3338", warpOptions=wo)
-        
-        # orgRas is None
-        
-        # use the reprojected raster to build footprint from
+        # use the input raster to build footprint from
         ds = gdal.Open(ras)
-        
-        # proj = osr.SpatialReference(wkt=ds.GetProjection())
-        proj = osr.SpatialReference(ds.GetProjection()).Clone()
-        srcSRS = proj.GetAttrValue('AUTHORITY',1)
-        
         band = ds.GetRasterBand(1)
         nd = band.GetNoDataValue()
-        rows, cols = ds.RasterYSize, ds.RasterXSize
-        
-        #  create the output data set
-        dstBIN = os.path.join(dirname, fname + "_" + rid + '_bin.tif')
-        driver = ds.GetDriver()
-
-        ods = driver.Create(dstBIN, cols, rows, 1, gdal.GDT_Byte)
-        oband = ods.GetRasterBand(1)
-        
-        arr = band.ReadAsArray()
+        del band, ds
 
         # Data =2, NoData =1
-        arr = np.where(arr > nd, 2, 1)
-        
-        oband.WriteArray(arr, 0, 0)
-        oband.FlushCache()
-        
-        ods.SetGeoTransform(ds.GetGeoTransform())
-        ods.SetProjection(ds.GetProjection())
-        ods.FlushCache()
-        ods is None
-        del ods
-                
+        # the mask is read and written block by block to /vsimem/,
+        # polygonized into an OGR Memory layer and reprojected to epsg
+        # in memory; no _bin.tif, no shapefile, no shp2pgsql
+        footprint = createFootprint(ras, int(epsg), nd, dataValue=2, nodataValue=1, bDataOnly=False, footprintRes=footprintRes)
+
         msgs['01.NoData'] = str(nd)
-            
-        # polygonize DATA / NODATA = 1 /2
-        # there was an attempt to stuff this into pg raster
-        # gdal returned message saying this is not possible
-        ds = gdal.Open(dstBIN)
-        band = ds.GetRasterBand(1)
-        
-        drv = ogr.GetDriverByName("ESRI Shapefile")
-        dst_ds = drv.CreateDataSource(dirname)    
-        
-        # srs is the full projection object from input raster
-        # remember in AK we have to reproject to 3338
-        dst_layer = dst_ds.CreateLayer(layername, srs = proj, geom_type = ogr.wkbPolygon)
-        fld = ogr.FieldDefn("value", ogr.OFTInteger)
-        dst_layer.CreateField(fld)
-        dst_field = dst_layer.GetLayerDefn().GetFieldIndex("value")
-        
-        gdal.Polygonize(band, None, dst_layer, dst_field, [], callback=None)
-        
-        # add the tile name / id to the attribute table
-        field_name = ogr.FieldDefn("tile_id", ogr.OFTString)
-        dst_layer.CreateField(field_name)
-        field_name.SetWidth(200)
-        
-        for i in range(0, dst_layer.GetFeatureCount()):
-            feature = dst_layer.GetFeature(i)
-            feature.SetField("tile_id", os.path.basename(ras))
-            dst_layer.SetFeature(feature)
-            
-        dst_ds.FlushCache()
-        dst_ds is None        
-    
-        # gather the shapefile from polygonize
-        shape = os.path.join(dirname, rid + fname + '.shp')
-        
-        # clean up
-        # doesn't seem to work
-        # henece try statement
-        try:
-            dstBIN.FlushCache()            
-            os.remove(dstBIN)
-        except:
-            pass
-        
-        # run the command, note the reprojection from srcSRS to epsg
-        env={'PGPASSWORD':pwd,
-             'PGHOST' : 'localhost',
-             'PGPORT' : '5432',
-             'PGUSER' : 'postgres',
-             'PGDATABASE' : 'metadata',
-             'SYSTEMROOT': os.environ['SYSTEMROOT']}
-        
-        
-        # note we are appending (-a flag)
-        # to a table created in main
-        # '-s ' + str(srcSRS) + ':' + str(epsg) + \
-        # '-s 0:' + str(epsg) + \
-        shp2pgsql =  r'"C:\Program Files\PostgreSQL\15\bin\shp2pgsql.exe" ' \
-                    '-a ' \
-                    '-s ' + srcSRS + ':' + str(epsg) + \
-                    ' -i ' \
-                    + shape + \
-                    ' metadata.footprint_' + reg + """_""" + argv1 + """_""" + epsg + '_meta | ' \
-                    r'"C:\Program Files\PostgreSQL\15\bin\psql.exe" ' \
-                    '-d  metadata ' \
-                    '-h localhost ' \
-                    '-p 5432 ' \
-                    '-U postgres'
-        
-        # print to debug in DOS, if needed
-        # print(shp2pgsql)
-        
-        shp2 = subprocess.Popen(shp2pgsql, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE, env=env, universal_newlines=True)
-       
-        shp2msgs, shp2errors = shp2.communicate()
-        shp2errors = ','.join(shp2errors.strip().split('\n'))  # some errors return mutliple carriage returns
-        
-        # subprocess.run(shp2pgsql, shell=True, env=env)
-        
-        # if not shp2errors is None or not shp2.returncode == 0:
-        if not shp2.returncode == 0:
-        
-            msgs['03.shp2pg'] = 'Fail-' + shp2errors
-        
-        else:
-            
-            msgs['03.shp2pg'] = 'Success'
-        
-        del ds
-        
-        # too verbose for debugging only
-        # result = subprocess.run(shp2pgsql, capture_output=True, text=True, env=env, shell=True)
-        # print("stdout:", result.stdout)
-        # print("stderr:", result.stderr)
-        
+        msgs['02.polygonize'] = str(len(footprint['footprints'])) + ' polygons'
+
         msgs['04.function'] = 'Success'
         
         ffinish = datetime.datetime.now()
         ftime = ffinish-fstart
         msgs['05.filetime'] = str(ftime)
         
-        return 'function success', msgs
+        # the polygons are returned to main and loaded
+        # with a binary COPY over 1 connection
+        return 'function success', msgs, footprint['footprints']
 
     except Exception as e:
         
@@ -190,14 +60,14 @@ def ndras(ras, arg):
         
         print(e)
         
-        return 'function failure', msgs
+        return 'function failure', msgs, []
         
         
 from contextlib import closing
-import ray, numpy as np
-import os, psycopg2, datetime, subprocess, sys
+import ray
+from DSHub_Footprints import createFootprint, loadFootprints, runFootprintTasks
+import os, psycopg2, datetime, sys
 from osgeo import gdal
-from osgeo import ogr, osr
 
 # srcTable is used to read
 # dem_path and dem_name
@@ -206,6 +76,15 @@ from osgeo import ogr, osr
 srcTable = 'us_elevation_1m_5070_meta'
 pwd = input('Enter database password:')
 
+# footprint mask cell size in raster units i.e. 30 for 1m rasters
+# the raster is read decimated (from overviews if it has them) and the
+# polygons are simplified by 1 mask cell; None = full resolution
+footprintRes = None
+
+# how rasters are spread over the cpus
+# 'serial', 'threads', 'processes' or 'ray'
+footprintExecutor = 'ray'
+
 #  can't remember but think this was something multiprocessor needed on Windows
 # obsolete with ray???
 os.environ['OPENBLAS_NUM_THREADS'] = '1'
@@ -273,6 +152,10 @@ ADD COLUMN "value" integer;
 
 SELECT AddGeometryColumn('metadata', 'footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta', 'geom', """ + epsg + """, 'MULTIPOLYGON', 2);
 
+DROP TABLE IF EXISTS metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta_stage;
+
+CREATE UNLOGGED TABLE metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta_stage (tile_id varchar, "value" integer, geom geometry(MULTIPOLYGON, """ + epsg + """));
+
 SELECT concat_ws('\\', dem_path, dem_name) as filepath, rds_size FROM metadata.""" + srcTable + """;""" #"ORDER BY rds_size;"""
 
 with closing(psycopg2.connect(host='localhost', user='postgres', \
@@ -303,29 +186,39 @@ with open(os.path.join(wdir, reg + '_nodata-logger_' + argv1 + '.log'), mode='w'
     # for split in splits:
     #     aslist = split.tolist()
     
-    # ray builds the jobs here
-    futures = [ndras.remote(file, argv1) for file in files]        
-    
-    # the return is a list of tuples
-    # [
-    #     ('function success/function failure', {msgs dict}),
-    #     ('function success/function failure', {msgs dict}),
-    #     ('function success/function failure', {msgs dict}),
-    #     ...
-    # ]
-    # they aren't accessible until all 
-    # jobs (futures) are finished
-    results = ray.get(futures)
+    # the executor builds the jobs here
+    tasks = runFootprintTasks(ndras, [(file, argv1) for file in files], footprintExecutor)
     
-    for r in results:
-        
+    # each job returns a tuple
+    # ('function success/function failure', {msgs dict}, [footprint polygons])
+    # jobs are consumed as they finish and their polygons are
+    # streamed into the footprint table with a binary COPY
+    # over 1 connection, flushed every ~8 MB
+    results = dict()
+
+    def finishedFootprints():
+        for status, msgs, footprints in tasks:
+            results[os.path.basename(msgs['00.File'])] = msgs
+            yield os.path.basename(msgs['00.File']), footprints
+
+    dbParams = {'host':'localhost', 'user':'postgres', 'password':pwd, 'dbname':'metadata', 'port':5432}
+    fpTable = 'metadata.footprint_' + reg + '_' + argv1 + '_' + epsg + '_meta_stage'
+
+    for batch in loadFootprints(finishedFootprints(), dbParams, fpTable, int(epsg)):
+        for tileID in batch['tiles']:
+            results[tileID]['03.load'] = batch['status'] if batch['status'] == 'Success' else 'Fail-' + batch['error'].strip()
+        print('COPY ' + str(len(batch['tiles'])) + ' files, ' + str(batch['rows']) + ' polygons: ' + batch['status'])
+
+    for msgs in results.values():
+
         # get msgs dict
         # write to log file
-        for k,v in r[1].items():
+        for k,v in sorted(msgs.items()):
             f.write(k + ': ' + v + '\n')
         f.write('\n')
     
-    ray.shutdown()
+    if footprintExecutor == 'ray':
+        ray.shutdown()
     # job +=1
     # print('completed job ' + str(job) + ' of ' + jobs)        
     
@@ -335,16 +228,18 @@ with open(os.path.join(wdir, reg + '_nodata-logger_' + argv1 + '.log'), mode='w'
     print(run)
     f.write(run)
 
-# these queries update the spatial footprint table
-# created in q1 that we've been appending to 
-# using srcTable to populate all footprint attributes
+# these queries fill the spatial footprint table
+# created in q1 from the staging table we've been
+# COPYing to, joining srcTable attributes in bulk
 # based on the footprint file_id and metadata dem_name 
 # a new table dshub_data... is created
 # carrying geometries witha value of Data (2), NoData (1) is dropped
-q2 = """UPDATE metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta fp
-SET (poly_code,prod_title,pub_date,lastupdate,rds_size,format,sourceid,meta_url,downld_url,dem_name,dem_path,rds_column,rds_rows,bandcount,cellsize,rdsformat,bitdepth,nodataval,srs_type,epsg_code,srs_name,rds_top,rds_left,rds_right,rds_bottom,rds_min,rds_mean,rds_max,rds_stdev,blk_xsize,blk_ysize) = (org.poly_code,org.prod_title,org.pub_date,org.lastupdate,org.rds_size,org.format,org.sourceid,org.meta_url,org.downld_url,org.dem_name,org.dem_path,org.rds_column,org.rds_rows,org.bandcount,org.cellsize,org.rdsformat,org.bitdepth,org.nodataval,org.srs_type,org.epsg_code,org.srs_name,org.rds_top,org.rds_left,org.rds_right,org.rds_bottom,org.rds_min,org.rds_mean,org.rds_max,org.rds_stdev,org.blk_xsize,org.blk_ysize)
-FROM metadata.""" + srcTable + """ org
-WHERE fp.tile_id = org.dem_name;
+q2 = """INSERT INTO metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta
+SELECT org.*, fp.tile_id, fp."value", fp.geom
+FROM metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta_stage fp
+LEFT JOIN metadata.""" + srcTable + """ org ON fp.tile_id = org.dem_name;
+
+DROP TABLE metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta_stage;
 
 CREATE INDEX fp""" + reg + """_""" + argv1 + """_""" + epsg + """_idx ON metadata.footprint_""" + reg + """_""" + argv1 + """_""" + epsg + """_meta USING GIST (geom);
 